@@ -0,0 +1,335 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2019 atrain_match developers
+#
+# This file is part of atrain_match.
+#
+# atrain_match is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# atrain_match is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with atrain_match.  If not, see <http://www.gnu.org/licenses/>.
+"""Time the matching and statistics on synthetic scenes.
+
+Run with:
+
+    python -m atrain_match.benchmarks.run_benchmarks --resolutions 1 5
+
+No input data is needed, the imager scene, CALIPSO files and CloudSat
+track are generated, see synthetic.py. For each step the best wall
+time of the repeats, the throughput and the peak memory allocated
+during the step are reported.
+
+The RESOLUTION is read from the environment when atrain_match is
+imported, so each resolution is run in a separate process.
+
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+import argparse
+import subprocess
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime
+import numpy as np
+import atrain_match.config as config
+
+logger = logging.getLogger(__name__)
+
+BENCHMARKS = ['match_lonlat',
+              'imager_track_from_matched',
+              'get_calipso_matchups',
+              'match_cloudsat_imager',
+              'write_match_objects',
+              'read_files',
+              'calculate_statistics',
+              'compile_stats']
+#  Part of an orbit for the imager scene, a full 1 km orbit does not fit
+#  in the memory of a laptop.
+ORBIT_FRACTION = {1: 0.1, 5: 1.0}
+N_COMPILED_FILES = 50
+
+
+class BenchmarkResult(object):
+    """Timing of one benchmark."""
+
+    def __init__(self, name, resolution, n_items, unit, times, peak_mb):
+        self.name = name
+        self.resolution = resolution
+        self.n_items = n_items
+        self.unit = unit
+        self.times = times
+        self.peak_mb = peak_mb
+
+    @property
+    def best(self):
+        return min(self.times)
+
+    @property
+    def throughput(self):
+        return self.n_items / max(self.best, 1e-9)
+
+    def as_dict(self):
+        return {'name': self.name, 'resolution': self.resolution,
+                'n_items': self.n_items, 'unit': self.unit,
+                'times': self.times, 'best': self.best,
+                'throughput': self.throughput, 'peak_mb': self.peak_mb}
+
+
+def measure(func, setup=None, repeat=3):
+    """Time func(*setup()), *repeat* times, and find the peak memory use.
+
+    Returns the wall times and the peak memory (MB) allocated during
+    one extra call, traced with tracemalloc.
+
+    """
+    times = []
+    for dummy in range(repeat):
+        args = () if setup is None else setup()
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    args = () if setup is None else setup()
+    tracemalloc.start()
+    try:
+        func(*args)
+        dummy, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return times, peak / 1024.0 / 1024.0
+
+
+def get_settings():
+    """Settings from the atrain_match.cfg in the package, for PPS validation."""
+    from atrain_match.utils.runutils import read_config_info
+    config_file = os.path.join(config.ATRAIN_MATCH_CONFIG_PATH, config.ATRAIN_MATCH_CONFIG_FILE)
+    if not os.path.isfile(config_file):
+        config.ATRAIN_MATCH_CONFIG_PATH = os.path.join(os.path.dirname(config.__file__), 'etc')
+        config.ATRAIN_MATCH_CONFIG_FILE = 'atrain_match.cfg'
+    AM_PATHS, SETTINGS = read_config_info()
+    for name in ['CCI_CLOUD_VALIDATION', 'MAIA_VALIDATION', 'PATMOSX_VALIDATION',
+                 'OCA_VALIDATION']:
+        SETTINGS[name] = False
+    SETTINGS['PPS_VALIDATION'] = True
+    SETTINGS['CNN_PCKL_PATH'] = ''
+    SETTINGS['PLOT_MODES'] = []
+    return AM_PATHS, SETTINGS
+
+
+def make_scene(outdir, resolution, orbit_fraction):
+    """Generate the imager scene and the truths, and the settings."""
+    from atrain_match.benchmarks.synthetic import (make_synthetic_swath,
+                                                   write_synthetic_calipso_files,
+                                                   make_synthetic_cloudsat,
+                                                   get_synthetic_values)
+    # Measure decoding, not the caches
+    config.CALIPSO_CACHE_DIR = ''
+    config.CALIPSO_TIME_INDEX_FILE = ''
+    AM_PATHS, SETTINGS = get_settings()
+    start = time.perf_counter()
+    swath = make_synthetic_swath(datetime(2012, 6, 1, 12), resolution=resolution,
+                                 orbit_fraction=orbit_fraction)
+    scene = {'swath': swath,
+             'values': get_synthetic_values(swath),
+             'cloudsat': make_synthetic_cloudsat(swath),
+             'calipso_files': write_synthetic_calipso_files(outdir, swath, resolution=resolution),
+             'calipso_5km_files': None,
+             'outdir': outdir,
+             'AM_PATHS': AM_PATHS,
+             'SETTINGS': SETTINGS}
+    if resolution == 1:
+        scene['calipso_5km_files'] = write_synthetic_calipso_files(outdir, swath, resolution=5)
+    logger.info("Generated scene %s in %.1f s", swath.latitude.shape, time.perf_counter() - start)
+    return scene
+
+
+def run_benchmarks(scene, names=BENCHMARKS, repeat=3):
+    """Run the benchmarks *names* on *scene*, in pipeline order."""
+    from atrain_match.utils.match import match_lonlat
+    from atrain_match.utils.common import get_imager_neighbour_index
+    from atrain_match.libs.extract_imager_along_track import imager_track_from_matched
+    from atrain_match.libs.truth_imager_match import (get_calipso_matchups,
+                                                      add_elevation_corrected_imager_ctth)
+    from atrain_match.libs.truth_imager_make_statistics import add_validation_ctth
+    from atrain_match.libs.truth_imager_statistics_lib import calculate_statistics
+    from atrain_match.truths.cloudsat import match_cloudsat_imager
+    from atrain_match.matchobject_io import write_truth_imager_match_obj, read_files
+    from atrain_match.utils.stats_store import get_stats_store_filename
+    from atrain_match.compile_stats import compile_stats
+    from atrain_match.benchmarks.synthetic import make_synthetic_cloudsat
+
+    swath = scene['swath']
+    SETTINGS = scene['SETTINGS']
+    resolution = config.RESOLUTION
+    results = []
+
+    def add_result(name, func, setup, n_items, unit):
+        if name not in names:
+            return
+        times, peak_mb = measure(func, setup, repeat=repeat)
+        result = BenchmarkResult(name, resolution, n_items, unit, times, peak_mb)
+        logger.info("%s: %.3f s", name, result.best)
+        results.append(result)
+
+    n_pixels = swath.latitude.size
+    source = (swath.longitude.astype(np.float64), swath.latitude.astype(np.float64))
+
+    def match_calipso():
+        return get_calipso_matchups(scene['calipso_files'], scene['values'], swath,
+                                    scene['AM_PATHS'], SETTINGS,
+                                    cafiles5km=scene['calipso_5km_files'])
+
+    # The kd-tree over the swath is built once for all truths
+    get_imager_neighbour_index(swath)
+    match_calipso_obj = match_calipso()
+    target = (match_calipso_obj.calipso.longitude.astype(np.float64),
+              match_calipso_obj.calipso.latitude.astype(np.float64))
+    n_matched = len(match_calipso_obj.calipso.latitude)
+
+    add_result('match_lonlat',
+               lambda: match_lonlat(source, target, radius_of_influence=0.7 * resolution * 1000.0),
+               None, n_pixels, 'imager pixels')
+    add_result('imager_track_from_matched',
+               lambda: imager_track_from_matched(match_calipso_obj, SETTINGS, swath),
+               None, n_matched, 'matched pixels')
+    add_result('get_calipso_matchups', match_calipso, None, n_matched, 'matched pixels')
+    # match_cloudsat_imager crops the cloudsat object, use a new one each time
+    n_cloudsat = len(scene['cloudsat'].latitude)
+    add_result('match_cloudsat_imager',
+               lambda cloudsat: match_cloudsat_imager(cloudsat, swath, SETTINGS),
+               lambda: (make_synthetic_cloudsat(swath),), n_cloudsat, 'cloudsat profiles')
+
+    match_file = os.path.join(scene['outdir'], '{:d}km_{:s}_calipso_avhrr_match.h5'.format(
+        resolution, scene['values']['basename']))
+    add_result('write_match_objects',
+               lambda: write_truth_imager_match_obj(match_file, match_calipso_obj, SETTINGS,
+                                                    imager_obj_name='pps'),
+               None, n_matched, 'matched pixels')
+    if not os.path.isfile(match_file):
+        write_truth_imager_match_obj(match_file, match_calipso_obj, SETTINGS, imager_obj_name='pps')
+    add_result('read_files', lambda: read_files([match_file], truth='calipso'),
+               None, n_matched, 'matched pixels')
+
+    # As in truth_imager_make_statistics.run
+    match_obj = read_files([match_file], truth='calipso')
+    dummy, match_obj = add_validation_ctth(None, match_obj)
+    dummy, match_obj, dummy = add_elevation_corrected_imager_ctth(None, match_obj, None, SETTINGS)
+    statfilename = os.path.join(scene['outdir'], '{:d}km_{:s}_xxx_imager_stat.dat'.format(
+        resolution, scene['values']['basename']))
+    add_result('calculate_statistics',
+               lambda: calculate_statistics('BASIC', statfilename, match_obj, None, None, None,
+                                            None, SETTINGS),
+               None, n_matched, 'matched pixels')
+
+    # Compile the statistics of many scenes, copies of this scene
+    stat_file = statfilename.replace('xxx', 'calipso')
+    if not os.path.isfile(stat_file) and not os.path.isfile(get_stats_store_filename(stat_file)):
+        calculate_statistics('BASIC', statfilename, match_obj, None, None, None, None, SETTINGS)
+    if os.path.isfile(get_stats_store_filename(stat_file)):
+        stat_file = get_stats_store_filename(stat_file)
+    results_files = []
+    for ind in range(N_COMPILED_FILES):
+        filename = stat_file.replace(scene['values']['basename'],
+                                     "{:s}_{:03d}".format(scene['values']['basename'], ind))
+        shutil.copy(stat_file, filename)
+        results_files.append(filename)
+    compiled = os.path.join(scene['outdir'], 'compiled_stats_cfc_BASIC_calipso.txt')
+
+    def compile_quietly():
+        with redirect_stdout(io.StringIO()):
+            compile_stats(results_files, outfile_cfc=compiled, truth_sat='calipso')
+    add_result('compile_stats', compile_quietly, None, len(results_files), 'results files')
+    return results
+
+
+def format_results(results):
+    lines = ["{:28s} {:>3s} {:>10s} {:18s} {:>9s} {:>12s} {:>10s}".format(
+        "benchmark", "km", "items", "", "best [s]", "items/s", "peak [MB]")]
+    for result in results:
+        lines.append("{:28s} {:3d} {:10d} {:18s} {:9.3f} {:12.0f} {:10.1f}".format(
+            result['name'], result['resolution'], result['n_items'], result['unit'],
+            result['best'], result['throughput'], result['peak_mb']))
+    return "\n".join(lines)
+
+
+def run_resolution(resolution, options):
+    """Run the benchmarks for *resolution*, in a new process if needed."""
+    orbit_fraction = options.orbit_fraction or ORBIT_FRACTION[resolution]
+    if resolution == config.RESOLUTION:
+        outdir = tempfile.mkdtemp(prefix='atrain_match_benchmark_')
+        try:
+            scene = make_scene(outdir, resolution, orbit_fraction)
+            results = run_benchmarks(scene, names=options.benchmarks, repeat=options.repeat)
+        finally:
+            if not options.keep:
+                shutil.rmtree(outdir)
+            else:
+                logger.info("Keeping benchmark files in %s", outdir)
+        return [result.as_dict() for result in results]
+    handle, output = tempfile.mkstemp(suffix='.json')
+    os.close(handle)
+    env = dict(os.environ)
+    env['ATRAIN_RESOLUTION'] = str(resolution)
+    command = [sys.executable, '-m', 'atrain_match.benchmarks.run_benchmarks',
+               '--resolutions', str(resolution), '--repeat', str(options.repeat),
+               '--orbit-fraction', str(orbit_fraction), '--output', output,
+               '--benchmarks'] + options.benchmarks
+    if options.keep:
+        command.append('--keep')
+    try:
+        subprocess.check_call(command, env=env)
+        with open(output) as fhandle:
+            return json.load(fhandle)
+    finally:
+        os.remove(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resolutions', '-r', type=int, nargs='+', default=[1, 5],
+                        choices=[1, 5], help='Resolutions (km) to run')
+    parser.add_argument('--benchmarks', '-b', type=str, nargs='+', default=BENCHMARKS,
+                        choices=BENCHMARKS, help='Benchmarks to run (default all)')
+    parser.add_argument('--repeat', '-n', type=int, default=3,
+                        help='Number of timed runs of each benchmark')
+    parser.add_argument('--orbit-fraction', '-f', type=float, default=None,
+                        help='Part of an orbit in the imager scene '
+                        '(default {:s})'.format(str(ORBIT_FRACTION)))
+    parser.add_argument('--output', '-o', type=str, default=None,
+                        help='Write the results as json to this file')
+    parser.add_argument('--keep', '-k', const=True, nargs='?', default=False,
+                        help='Keep the generated files')
+    parser.add_argument('--verbose', '-v', const=True, nargs='?', default=False)
+    options = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING,
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    if options.verbose:
+        logger.setLevel(logging.INFO)
+
+    results = []
+    for resolution in options.resolutions:
+        results += run_resolution(resolution, options)
+    if options.output:
+        with open(options.output, 'w') as fhandle:
+            json.dump(results, fhandle, indent=1)
+    if len(options.resolutions) > 1 or options.resolutions[0] == config.RESOLUTION:
+        print(format_results(results))
+
+
+if __name__ == '__main__':
+    main()
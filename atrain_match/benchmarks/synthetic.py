@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2019 atrain_match developers
+#
+# This file is part of atrain_match.
+#
+# atrain_match is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# atrain_match is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with atrain_match.  If not, see <http://www.gnu.org/licenses/>.
+"""Synthetic imager swaths and truth tracks, for benchmarking.
+
+The imager is on a sun synchronous orbit and the CALIPSO and CloudSat
+tracks follow it inside the swath, as for the A-train imagers. The data
+are random but have realistic shapes, types and fill values, so that
+the same code paths as for real data are used:
+
+    >>> swath = make_synthetic_swath(datetime(2012, 6, 1, 12), resolution=5)
+    >>> files = write_synthetic_calipso_files(outdir, swath, resolution=5)
+    >>> cloudsat = make_synthetic_cloudsat(swath)
+
+"""
+
+import os
+import calendar
+import numpy as np
+from datetime import datetime
+from atrain_match.cloudproducts.read_pps import (AllImagerData, AuxiliaryObj, ImagerAngObj,
+                                                 NewImagerData, ImagerChannelData,
+                                                 CmaObj, CtypeObj, CtthObj, CppObj)
+from atrain_match.matchobject_io import CloudsatObject
+
+EARTH_RADIUS_KM = 6371.0
+ORBIT_PERIOD = 98.8 * 60.0  # s
+INCLINATION = 98.2  # degrees
+GROUND_SPEED = 2 * np.pi * EARTH_RADIUS_KM / ORBIT_PERIOD  # km/s
+EARTH_ROTATION = 2 * np.pi / 86164.0  # rad/s
+#  Seconds from 1970 to 1993, the start of CALIPSO and CloudSat (TAI) time
+TAI_1993 = calendar.timegm((1993, 1, 1, 0, 0, 0))
+#  Pixels per scan line, swath about 2000 km wide
+SWATH_PIXELS = {1: 2048, 5: 409}
+CALIPSO_FILL = -9999.0
+CALIPSO_MAX_LAYERS = 10
+CLOUDSAT_BINS = 125
+
+IMAGER_CHANNELS = ['ch_r06', 'ch_r09', 'ch_r16', 'ch_tb37', 'ch_tb11', 'ch_tb12']
+AUX_FIELDS = ['surftemp', 't500', 't700', 't850', 't950', 'ttro', 'ciwv', 'psur', 'ptro',
+              't2m', 'snowa', 'snowd', 'seaice', 'fractionofland', 'elevation',
+              'thr_t11ts', 'thr_t11t37', 'thr_t11t12', 'emis1', 'emis6', 'text_t11']
+
+
+def get_orbit_positions(sec, lon_ascending_node=0.0):
+    """Unit vectors (n, 3) of the sub satellite point and the flight direction.
+
+    *sec* are seconds after the ascending node.
+
+    """
+    angle = 2 * np.pi * np.asarray(sec, dtype=np.float64) / ORBIT_PERIOD
+    incl = np.deg2rad(INCLINATION)
+    position = np.stack([np.cos(angle),
+                         np.sin(angle) * np.cos(incl),
+                         np.sin(angle) * np.sin(incl)], axis=-1)
+    direction = np.stack([-np.sin(angle),
+                          np.cos(angle) * np.cos(incl),
+                          np.cos(angle) * np.sin(incl)], axis=-1)
+    # Rotate with the earth
+    rot = np.deg2rad(lon_ascending_node) - EARTH_ROTATION * np.asarray(sec, dtype=np.float64)
+    for vector in [position, direction]:
+        x_rot = np.cos(rot) * vector[:, 0] - np.sin(rot) * vector[:, 1]
+        vector[:, 1] = np.sin(rot) * vector[:, 0] + np.cos(rot) * vector[:, 1]
+        vector[:, 0] = x_rot
+    return position, direction
+
+
+def get_lonlat(x, y, z):
+    lat = np.rad2deg(np.arcsin(np.clip(z, -1, 1)))
+    lon = np.rad2deg(np.arctan2(y, x))
+    return lon, lat
+
+
+def get_smooth_field(rng, shape, scale):
+    """Random field in [0, 1) varying on length *scale* (elements)."""
+    coarse_shape = [max(int(np.ceil(size * 1.0 / scale)), 1) + 1 for size in shape]
+    coarse = rng.random_sample(coarse_shape)
+    field = coarse
+    for axis, size in enumerate(shape):
+        knots = np.arange(coarse_shape[axis]) * scale
+        position = np.arange(size)
+        lower = np.minimum(position // scale, coarse_shape[axis] - 2)
+        weight = ((position - knots[lower]) * 1.0 / scale).astype(np.float32)
+        weight_shape = [1] * len(shape)
+        weight_shape[axis] = size
+        weight = weight.reshape(weight_shape)
+        field = (np.take(field, lower, axis=axis) * (1 - weight) +
+                 np.take(field, lower + 1, axis=axis) * weight)
+    return field.astype(np.float32)
+
+
+def get_seconds_after_node(start_time):
+    """Place the scene start in the orbit, the same position for the same time."""
+    return calendar.timegm(start_time.timetuple()) % ORBIT_PERIOD
+
+
+def make_synthetic_swath(start_time, resolution=1, orbit_fraction=1.0, seed=1):
+    """Make a synthetic PPS imager scene with all products and auxiliary data.
+
+    The scene starts at *start_time* and covers *orbit_fraction* of an orbit,
+    with about *resolution* km between pixels and scan lines.
+
+    """
+    rng = np.random.RandomState(seed)
+    n_pixels = SWATH_PIXELS[resolution]
+    n_lines = int(orbit_fraction * ORBIT_PERIOD * GROUND_SPEED / resolution)
+    line_interval = resolution / GROUND_SPEED
+    sec1970_start = calendar.timegm(start_time.timetuple())
+    line_sec = np.arange(n_lines) * line_interval
+    position, direction = get_orbit_positions(get_seconds_after_node(start_time) + line_sec)
+    cross = np.cross(position, direction)
+    cross /= np.linalg.norm(cross, axis=1)[:, np.newaxis]
+    # Angular distance from nadir of the pixels
+    nadir_angle = (np.arange(n_pixels) - (n_pixels - 1) / 2.0) * resolution / EARTH_RADIUS_KM
+
+    shape = (n_lines, n_pixels)
+    longitude = np.empty(shape, dtype=np.float32)
+    latitude = np.empty(shape, dtype=np.float32)
+    block = 1000
+    for first in range(0, n_lines, block):
+        rows = slice(first, first + block)
+        xyz = [np.cos(nadir_angle)[np.newaxis, :] * position[rows, ind:ind + 1] +
+               np.sin(nadir_angle)[np.newaxis, :] * cross[rows, ind:ind + 1]
+               for ind in range(3)]
+        longitude[rows], latitude[rows] = get_lonlat(*xyz)
+
+    imager = AllImagerData()
+    imager.longitude = longitude
+    imager.latitude = latitude
+    imager.nodata = -999.0
+    imager.num_of_lines = n_lines
+    imager.sec1970_start = sec1970_start
+    imager.sec1970_end = sec1970_start + line_sec[-1]
+    imager.time = sec1970_start + line_sec
+    imager.instrument = 'avhrr'
+
+    # Clouds with structures of about 50 km
+    scale = max(50 // resolution, 2)
+    cloudiness = get_smooth_field(rng, shape, scale)
+    cloudy = cloudiness > 0.35
+    height = np.where(cloudy, 500 + 15000 * (cloudiness - 0.35) / 0.65, -9).astype(np.float32)
+    surftemp = (300 - 40 * np.abs(latitude) / 90.0 +
+                2 * rng.standard_normal(shape)).astype(np.float32)
+    temperature = np.where(cloudy, surftemp - 6.5 * height / 1000.0, -9).astype(np.float32)
+    pressure = np.where(cloudy, 1013.0 * np.exp(-height / 8000.0), -9).astype(np.float32)
+    sunz = np.abs(latitude - 23.0 * np.cos(np.deg2rad(longitude))) * 1.2
+    sunz = np.clip(sunz, 0, 180).astype(np.float32)
+    day = sunz < 80
+
+    imager.imager_angles = ImagerAngObj()
+    satz = np.abs(np.rad2deg(nadir_angle) * 7.3).astype(np.float32)
+    imager.imager_angles.satz.data = np.repeat(satz[np.newaxis, :], n_lines, axis=0)
+    imager.imager_angles.sunz.data = sunz
+    imager.imager_angles.azidiff.data = (180 * rng.random_sample(shape)).astype(np.float32)
+    imager.imager_angles.satazimuth.data = None
+    imager.imager_angles.sunazimuth.data = None
+
+    imager.imager_channeldata = NewImagerData()
+    imager.imager_channeldata.nodata = -999.0
+    imager.imager_channeldata.missing_data = -999.0
+    for id_tag in IMAGER_CHANNELS:
+        channel = ImagerChannelData()
+        channel.id_tag = id_tag
+        if 'tb' in id_tag:
+            channel.data = (np.where(cloudy, temperature, surftemp) +
+                            rng.standard_normal(shape)).astype(np.float32)
+        else:
+            channel.data = np.where(day, 5 + 70 * cloudy * cloudiness, -9).astype(np.float32)
+        imager.imager_channeldata.channel[id_tag] = channel
+
+    imager.cma = CmaObj()
+    imager.cma.cma_ext = np.where(cloudy, 1, 0).astype(np.int8)
+    imager.cma.cma_ext[(cloudiness > 0.3) & ~cloudy] = 2
+    imager.cma.cma_bin = np.where(imager.cma.cma_ext > 0, 1, 0).astype(np.int64)
+    imager.cma.cma_prob = (100 * cloudiness).astype(np.float32)
+    imager.cma.cma_quality = rng.randint(0, 2**10, shape).astype(np.uint16)
+    for ind in range(6):
+        setattr(imager.cma, 'cma_testlist{:d}'.format(ind),
+                rng.randint(0, 2**15, shape).astype(np.uint16))
+
+    imager.ctype = CtypeObj()
+    imager.ctype.cloudtype = np.where(cloudy, 5 + (height // 2500), 1).astype(np.uint8)
+    imager.ctype.ct_quality = rng.randint(0, 2**8, shape).astype(np.uint16)
+    imager.ctype.ct_conditions = rng.randint(0, 2**12, shape).astype(np.uint16)
+    imager.ctype.ct_statusflag = rng.randint(0, 2**8, shape).astype(np.uint16)
+
+    imager.ctth = CtthObj()
+    imager.ctth.height = height
+    imager.ctth.height_corr = height
+    imager.ctth.temperature = temperature
+    imager.ctth.pressure = pressure
+    imager.ctth.ctth_statusflag = rng.randint(0, 2**8, shape).astype(np.uint16)
+    imager.ctth.processingflag = rng.randint(0, 2**8, shape).astype(np.uint16)
+
+    imager.cpp = CppObj()
+    ice = temperature < 250
+    imager.cpp.cpp_phase = np.where(cloudy & day, np.where(ice, 2, 1), -1).astype(np.int8)
+    imager.cpp.cpp_cot = np.where(cloudy & day, 50 * cloudiness, -9).astype(np.float32)
+    imager.cpp.cpp_cwp = np.where(cloudy & day, 300 * cloudiness, -9).astype(np.float32)
+    imager.cpp.cpp_lwp = np.where(cloudy & day & ~ice, 300 * cloudiness, -9).astype(np.float32)
+    imager.cpp.cpp_iwp = np.where(cloudy & day & ice, 300 * cloudiness, -9).astype(np.float32)
+    imager.cpp.cpp_reff = np.where(cloudy & day, 20 * cloudiness * 1e-6, -9).astype(np.float32)
+
+    aux = {}
+    for name in AUX_FIELDS:
+        aux[name] = (surftemp + rng.standard_normal(shape)).astype(np.float32)
+    aux['psur'] = (1013 + 10 * rng.standard_normal(shape)).astype(np.float32)
+    aux['fractionofland'] = get_smooth_field(rng, shape, 4 * scale)
+    aux['elevation'] = np.where(aux['fractionofland'] > 0.5,
+                                3000 * (aux['fractionofland'] - 0.5), 0).astype(np.float32)
+    aux['landuse'] = rng.randint(1, 24, shape).astype(np.uint8)
+    aux['seaice'] = np.where(np.abs(latitude) > 70, 100, 0).astype(np.float32)
+    aux['snowa'] = np.where(np.abs(latitude) > 60, 1, 0).astype(np.float32)
+    imager.aux = AuxiliaryObj(aux)
+    return imager
+
+
+def get_truth_track(swath, sec_1970, time_lag, cross_track_km):
+    """Positions at *sec_1970* of a truth following the imager satellite.
+
+    The truth has the same ground track as the imager satellite
+    *time_lag* s earlier, shifted *cross_track_km* to the side.
+
+    """
+    start_time = datetime.utcfromtimestamp(swath.sec1970_start)
+    sec_after_node = get_seconds_after_node(start_time) + sec_1970 - swath.sec1970_start - time_lag
+    position, direction = get_orbit_positions(sec_after_node)
+    # Earth rotation during the time lag
+    rot = EARTH_ROTATION * time_lag
+    x_new = np.cos(rot) * position[:, 0] + np.sin(rot) * position[:, 1]
+    y_new = -np.sin(rot) * position[:, 0] + np.cos(rot) * position[:, 1]
+    position[:, 0] = x_new
+    position[:, 1] = y_new
+    cross = np.cross(position, direction)
+    cross /= np.linalg.norm(cross, axis=1)[:, np.newaxis]
+    angle = cross_track_km / EARTH_RADIUS_KM
+    xyz = [np.cos(angle) * position[:, ind] + np.sin(angle) * cross[:, ind] for ind in range(3)]
+    return get_lonlat(*xyz)
+
+
+def get_calipso_layers(rng, n_profiles, scale):
+    """Cloud layers (top first) for *n_profiles* CALIPSO profiles."""
+    cloudiness = get_smooth_field(rng, (n_profiles,), scale)
+    n_layers = np.where(cloudiness > 0.3,
+                        1 + (rng.random_sample(n_profiles) * 3).astype(np.int8), 0).astype(np.int8)
+    shape = (n_profiles, CALIPSO_MAX_LAYERS)
+    top = np.full(shape, CALIPSO_FILL, dtype=np.float32)
+    base = np.full(shape, CALIPSO_FILL, dtype=np.float32)
+    flags = np.ones(shape, dtype=np.uint16)
+    optical_depth = np.full(shape, CALIPSO_FILL, dtype=np.float32)
+    level = 1 + 15 * cloudiness
+    for layer in range(3):
+        has_layer = n_layers > layer
+        thickness = (0.2 + 2 * rng.random_sample(n_profiles)).astype(np.float32)
+        top[has_layer, layer] = level[has_layer]
+        base[has_layer, layer] = np.maximum(level[has_layer] - thickness[has_layer], 0.1)
+        level = base[:, layer] - 0.5
+        phase = np.where(top[:, layer] > 7, 1, 2)
+        subtype = rng.randint(0, 8, n_profiles)
+        # cloud, confident, phase, confident, subtype, 5 km averaging
+        flags[has_layer, layer] = (2 + (3 << 3) + (phase << 5) + (3 << 7) +
+                                   (subtype << 9) + (2 << 13))[has_layer]
+        optical_depth[has_layer, layer] = rng.lognormal(0, 1.5, n_profiles)[has_layer]
+    return n_layers, top, base, flags, optical_depth
+
+
+def write_calipso_granule(filename, sec_1970, lon, lat, resolution, rng):
+    """Write a CALIPSO version 4 layer product h5 file."""
+    import h5py
+    n_profiles = len(sec_1970)
+    n_layers, top, base, flags, optical_depth = get_calipso_layers(
+        rng, n_profiles, scale=max(50 // resolution, 2))
+    profile_time = sec_1970 - TAI_1993
+    if resolution == 5:
+        # first, middle and last 1 km profile
+        three = np.array([-2, 0, 2]) * (resolution / GROUND_SPEED) / 5.0
+        profile_time = profile_time[:, np.newaxis] + three[np.newaxis, :]
+        lon = np.repeat(lon[:, np.newaxis], 3, axis=1)
+        lat = np.repeat(lat[:, np.newaxis], 3, axis=1)
+        elevation = np.zeros((n_profiles, 4), dtype=np.float32)
+    else:
+        profile_time = profile_time[:, np.newaxis]
+        lon = lon[:, np.newaxis]
+        lat = lat[:, np.newaxis]
+        elevation = np.zeros((n_profiles, 1), dtype=np.float32)
+    one_column = (n_profiles, 1)
+    datasets = {
+        'Profile_Time': profile_time,
+        'Profile_UTC_Time': profile_time,
+        'Profile_ID': np.arange(n_profiles, dtype=np.int32).reshape(one_column),
+        'Longitude': lon.astype(np.float32),
+        'Latitude': lat.astype(np.float32),
+        'DEM_Surface_Elevation': elevation,
+        'Number_Layers_Found': n_layers.reshape(one_column),
+        'Layer_Top_Altitude': top,
+        'Layer_Base_Altitude': base,
+        'Layer_Top_Pressure': np.where(top > 0, 1013.0 * np.exp(-np.abs(top) / 8.0), CALIPSO_FILL),
+        'Layer_Base_Pressure': np.where(base > 0, 1013.0 * np.exp(-np.abs(base) / 8.0), CALIPSO_FILL),
+        'Layer_Top_Temperature': np.where(top > 0, 15 - 6.5 * top, CALIPSO_FILL),
+        'Midlayer_Temperature': np.where(top > 0, 15 - 6.5 * (top + base) / 2, CALIPSO_FILL),
+        'Feature_Classification_Flags': flags,
+        'IGBP_Surface_Type': rng.randint(1, 18, one_column).astype(np.int16),
+        'Snow_Ice_Surface_Type': rng.randint(0, 2, one_column).astype(np.uint8),
+        'Day_Night_Flag': np.zeros(one_column, dtype=np.int8),
+        'Tropopause_Height': np.full(one_column, 12.0, dtype=np.float32),
+        'Minimum_Laser_Energy_532': np.full(one_column, 0.1, dtype=np.float32)}
+    if resolution == 5:
+        datasets['Feature_Optical_Depth_532'] = optical_depth
+        for name in ['Column_Optical_Depth_Cloud_532',
+                     'Column_Optical_Depth_Cloud_Uncertainty_532',
+                     'Column_Optical_Depth_Tropospheric_Aerosols_532',
+                     'Column_Optical_Depth_Tropospheric_Aerosols_1064',
+                     'Column_Optical_Depth_Tropospheric_Aerosols_Uncertainty_532',
+                     'Column_Optical_Depth_Tropospheric_Aerosols_Uncertainty_1064']:
+            datasets[name] = rng.random_sample(one_column).astype(np.float32)
+    with h5py.File(filename, 'w') as h5file:
+        for name, data in datasets.items():
+            h5file.create_dataset(name, data=data)
+        if resolution == 5:
+            # 15 single shots for each 5 km profile
+            n_shots = 15 * n_profiles
+            group = h5file.create_group('Single_Shot_Detection')
+            shot_cloudy = np.repeat(n_layers > 0, 15) & (rng.random_sample(n_shots) > 0.2)
+            group.create_dataset('ssNumber_Layers_Found',
+                                 data=shot_cloudy.astype(np.int8).reshape(n_shots, 1))
+            for name, data in [('ssLayer_Base_Altitude', base[:, 0]),
+                               ('ssLayer_Top_Altitude', top[:, 0]),
+                               ('ssLayer_Top_Pressure', datasets['Layer_Top_Pressure'][:, 0])]:
+                data = np.where(shot_cloudy, np.repeat(data, 15), CALIPSO_FILL)
+                data = np.repeat(data[:, np.newaxis], 5, axis=1)
+                group.create_dataset(name, data=data.astype(np.float32))
+
+
+def write_synthetic_calipso_files(outdir, swath, resolution=5, margin=600, n_granules=2, seed=2):
+    """Write CALIPSO granules covering the *swath*, returns the filenames.
+
+    The 1 km and 5 km profiles are aligned, with five 1 km profiles for each
+    5 km profile, as in the real data.
+
+    """
+    rng = np.random.RandomState(seed + resolution)
+    sec_between = resolution / GROUND_SPEED
+    sec_1970 = np.arange(swath.sec1970_start - margin,
+                         swath.sec1970_end + margin, 5 / GROUND_SPEED)
+    if resolution == 1:
+        sec_1970 = (sec_1970[:, np.newaxis] +
+                    sec_between * np.arange(-2, 3)[np.newaxis, :]).ravel()
+    lon, lat = get_truth_track(swath, sec_1970, time_lag=75, cross_track_km=200)
+    filenames = []
+    n_5km = len(sec_1970) // (5 // resolution)
+    granule_5km = int(np.ceil(n_5km * 1.0 / n_granules))
+    step = granule_5km * (5 // resolution)
+    for first in range(0, len(sec_1970), step):
+        rows = slice(first, first + step)
+        start = datetime.utcfromtimestamp(sec_1970[first])
+        filename = os.path.join(
+            outdir, start.strftime("CAL_LID_L2_{:02d}kmCLay-Standard-V4-20."
+                                   "%Y-%m-%dT%H-%M-%SZD.h5".format(resolution)))
+        write_calipso_granule(filename, sec_1970[rows], lon[rows], lat[rows], resolution, rng)
+        filenames.append(filename)
+    return filenames
+
+
+def make_synthetic_cloudsat(swath, margin=600, seed=3):
+    """Make a CloudSat GEOPROF track following the imager satellite."""
+    rng = np.random.RandomState(seed)
+    sec_between = 1.1 / GROUND_SPEED
+    sec_1970 = np.arange(swath.sec1970_start - margin,
+                         swath.sec1970_end + margin, sec_between)
+    lon, lat = get_truth_track(swath, sec_1970, time_lag=90, cross_track_km=180)
+    n_profiles = len(sec_1970)
+    cloudiness = get_smooth_field(rng, (n_profiles,), 45)
+    height = np.repeat((240 * np.arange(CLOUDSAT_BINS)[::-1] - 5000)[np.newaxis, :].astype(np.int16),
+                       n_profiles, axis=0)
+    top = 1000 + 15000 * cloudiness
+    cloud_mask = np.where((height < top[:, np.newaxis]) &
+                          (height > top[:, np.newaxis] - 3000) &
+                          (cloudiness[:, np.newaxis] > 0.3), 40, 0).astype(np.int8)
+    cloudsat = CloudsatObject()
+    cloudsat.longitude = lon.astype(np.float32)
+    cloudsat.latitude = lat.astype(np.float32)
+    cloudsat.sec_1970 = sec_1970
+    cloudsat.Profile_time = (sec_1970 - sec_1970[0]).astype(np.float32)
+    cloudsat.TAI_start = np.array(sec_1970[0] - TAI_1993)
+    cloudsat.elevation = np.zeros(n_profiles, dtype=np.int16)
+    cloudsat.Height = height
+    cloudsat.CPR_Cloud_mask = cloud_mask
+    cloudsat.MODIS_Cloud_Fraction = (100 * cloudiness).astype(np.int8)
+    cloudsat.MODIS_cloud_flag = (cloudiness > 0.3).astype(np.int8)
+    cloudsat.RVOD_liq_water_path = np.where(cloudiness > 0.3, 200 * cloudiness, -9).astype(np.float32)
+    cloudsat.RVOD_ice_water_path = np.where(cloudiness > 0.6, 200 * cloudiness, -9).astype(np.float32)
+    cloudsat.RVOD_CWC_status = np.zeros(n_profiles, dtype=np.int32)
+    cloudsat.LO_RVOD_liquid_water_path = cloudsat.RVOD_liq_water_path.copy()
+    cloudsat.IO_RVOD_ice_water_path = cloudsat.RVOD_ice_water_path.copy()
+    return cloudsat
+
+
+def get_synthetic_values(swath):
+    """The *values* dict, as from the file name of the imager scene."""
+    start_time = datetime.utcfromtimestamp(swath.sec1970_start)
+    values = {"satellite": "npp",
+              "date_time": start_time,
+              "orbit": "12345",
+              "date": start_time.strftime("%Y%m%d"),
+              "year": start_time.year,
+              "month": "%02d" % (start_time.month),
+              "lines_lines": "*",
+              "time": start_time.strftime("%H%M%S"),
+              "ppsfilename": "synthetic"}
+    values['basename'] = "_".join([values["satellite"], values["date"],
+                                   values["time"], values["orbit"]])
+    return values
@@ -25,6 +25,7 @@ from atrain_match.cloudproducts.read_pps import (
     CtthObj, CmaObj,
     ImagerAngObj)
 from atrain_match.utils.runutils import do_some_geo_obj_logging
+from atrain_match.utils.common import split_imager_time
 import atrain_match.config as config
 import os
 import netCDF4
@@ -187,6 +188,8 @@ def read_cci_geoobj(cci_nc):
 
     cloudproducts.sec1970_start = np.min(cloudproducts.time)
     cloudproducts.sec1970_end = np.max(cloudproducts.time)
+    # Scanline time and column offset instead of time for each pixel
+    split_imager_time(cloudproducts)
     do_some_geo_obj_logging(cloudproducts)
     return cloudproducts
 
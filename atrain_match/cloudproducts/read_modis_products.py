@@ -15,7 +15,7 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with atrain_match.  If not, see <http://www.gnu.org/licenses/>.
-from atrain_match.libs.extract_imager_along_track import get_data_from_array
+from atrain_match.libs.extract_imager_along_track import AlongTrackGather
 from atrain_match.config import NODATA
 import numpy as np
 import os
@@ -48,21 +48,20 @@ def add_modis_06(ca_matchup, AM_PATHS, cross):
     row_matched = ca_matchup_truth_sat.imager_linnum
     col_matched = ca_matchup_truth_sat.imager_pixnum
 
-    index = {'row': row_matched,
-             'col': col_matched}
-    index_5km = {'row': np.floor(row_matched/5).astype(np.int),
-                 'col': np.floor(col_matched/5).astype(np.int)}
-
-    ca_matchup.modis_lvl2.height = get_data_from_array(modis_06.height, index)
-    ca_matchup.modis_lvl2.temperature = get_data_from_array(modis_06.temperature, index)
-    ca_matchup.modis_lvl2.pressure = get_data_from_array(modis_06.pressure, index)
-    ca_matchup.modis_lvl2.lwp = get_data_from_array(modis_06.lwp, index)
-    ca_matchup.modis_lvl2.cloud_emissivity = get_data_from_array(modis_06.cloud_emissivity, index)
-    ca_matchup.modis_lvl2.multilayer = get_data_from_array(modis_06.multilayer, index)
-    ca_matchup.modis_lvl2.optical_depth = get_data_from_array(modis_06.optical_depth, index)
-    ca_matchup.modis_lvl2.cloud_phase = get_data_from_array(modis_06.cloud_phase, index)
-    ca_matchup.modis_lvl2.latitude_5km = get_data_from_array(modis_06.latitude, index_5km)
-    ca_matchup.modis_lvl2.longitude_5km = get_data_from_array(modis_06.longitude, index_5km)
+    gather = AlongTrackGather(row_matched, col_matched)
+    gather_5km = AlongTrackGather(np.floor(row_matched/5).astype(np.int64),
+                                  np.floor(col_matched/5).astype(np.int64))
+
+    ca_matchup.modis_lvl2.height = gather(modis_06.height)
+    ca_matchup.modis_lvl2.temperature = gather(modis_06.temperature)
+    ca_matchup.modis_lvl2.pressure = gather(modis_06.pressure)
+    ca_matchup.modis_lvl2.lwp = gather(modis_06.lwp)
+    ca_matchup.modis_lvl2.cloud_emissivity = gather(modis_06.cloud_emissivity)
+    ca_matchup.modis_lvl2.multilayer = gather(modis_06.multilayer)
+    ca_matchup.modis_lvl2.optical_depth = gather(modis_06.optical_depth)
+    ca_matchup.modis_lvl2.cloud_phase = gather(modis_06.cloud_phase)
+    ca_matchup.modis_lvl2.latitude_5km = gather_5km(modis_06.latitude)
+    ca_matchup.modis_lvl2.longitude_5km = gather_5km(modis_06.longitude)
     return ca_matchup
 
 
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2019 atrain_match developers
+#
+# This file is part of atrain_match.
+#
+# atrain_match is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# atrain_match is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with atrain_match.  If not, see <http://www.gnu.org/licenses/>.
+"""Add NWP data from a GRIB file to the matchups of an imager scene.
+
+The GRIB file is decoded once for all truths: the positions of all
+matchups are interpolated in one request to pps_nwp, and the fields are
+split back to each matchup. pps_nwp interpolates while decoding, so the
+fields can only be reused for the same positions: if config.NWP_CACHE_DIR
+is set they are cached there, one file for each GRIB file and scene.
+
+"""
+
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+import atrain_match.config as config
+from atrain_match.libs.extract_imager_along_track import _interpolate_height_and_temperature_from_pressure
+
+logger = logging.getLogger(__name__)
+
+# Update if the content of the NWP cache files change
+NWP_CACHE_VERSION = 1
+# Matchup variable: (GRIBFile method, vertical profile)
+NWP_FIELDS = {'nwp_height': ('get_gh_vertical', True),
+              'nwp_surface_h': ('get_gh_surface', False),
+              'nwp_temperature': ('get_t_vertical', True),
+              'nwp_h2m': ('get_h_2meter', False),
+              'nwp_t2m': ('get_t_2meter', False),
+              'nwp_u10m': ('get_u_10meter', False),
+              'nwp_v10m': ('get_v_10meter', False),
+              'nwp_pressure': ('get_p_vertical', True),
+              'nwp_psur': ('get_p_surface', False)}
+
+
+def get_gribfile(nwp_file, lonlat):
+    """Open *nwp_file* with pps_nwp, for interpolation to *lonlat*."""
+    import pps_nwp
+    return pps_nwp.GRIBFile(nwp_file, lonlat)
+
+
+def decode_nwp_fields(nwp_file, lons, lats):
+    """Read the NWP_FIELDS from *nwp_file* at the positions *lons*, *lats*.
+
+    Profiles are (npoints, nlevels) and pressure is in hPa.
+
+    """
+    gribfile = get_gribfile(nwp_file, (lons, lats))
+    fields = {}
+    for name, (method, vertical) in NWP_FIELDS.items():
+        field = getattr(gribfile, method)()
+        scale = 0.01 if getattr(field, 'units', None) == 'Pa' else 1.0
+        if vertical:
+            data = np.asarray(field[0, :, :]).transpose()
+        else:
+            data = np.asarray(field[:]).ravel()
+        fields[name] = (scale * data).astype(np.float32)
+    return fields
+
+
+def get_positions_key(lons, lats):
+    """Key for the positions *lons*, *lats* in the NWP cache."""
+    positions = hashlib.sha1(np.ascontiguousarray(lons, dtype=np.float32).tobytes())
+    positions.update(np.ascontiguousarray(lats, dtype=np.float32).tobytes())
+    return positions.hexdigest()
+
+
+def get_nwp_cache_filename(nwp_file, lons, lats, cache_dir=None):
+    """Get the cache file for NWP data from *nwp_file* at *lons*, *lats*.
+
+    The name is a hash of the path and mtime of *nwp_file* and of the
+    positions. Returns None if no cache directory is configured.
+
+    """
+    if cache_dir is None:
+        cache_dir = config.NWP_CACHE_DIR
+    if not cache_dir:
+        return None
+    key = json.dumps([NWP_CACHE_VERSION, os.path.abspath(nwp_file), os.path.getmtime(nwp_file),
+                      get_positions_key(lons, lats)])
+    return os.path.join(cache_dir,
+                        "nwp_{:s}.h5".format(hashlib.sha1(key.encode('utf-8')).hexdigest()))
+
+
+def read_nwp_cache(filename):
+    """Read NWP fields from cache *filename*, None if not cached."""
+    import h5py
+    if filename is None or not os.path.isfile(filename):
+        return None
+    try:
+        with h5py.File(filename, 'r') as h5file:
+            fields = dict((name, h5file[name][...]) for name in NWP_FIELDS)
+    except (IOError, OSError, KeyError):
+        logger.warning("Could not read NWP cache %s", filename)
+        return None
+    logger.info("Read NWP data from cache %s", filename)
+    return fields
+
+
+def write_nwp_cache(filename, fields):
+    """Write NWP *fields* to cache *filename*."""
+    import h5py
+    if filename is None:
+        return
+    tmp_filename = "{:s}.{:d}.tmp".format(filename, os.getpid())
+    try:
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with h5py.File(tmp_filename, 'w') as h5file:
+            for name, data in fields.items():
+                h5file.create_dataset(name, data=data, compression=config.COMPRESS_LVL)
+        os.replace(tmp_filename, filename)
+    except (IOError, OSError, ValueError):
+        logger.warning("Could not write NWP cache %s", filename)
+        if os.path.isfile(tmp_filename):
+            os.remove(tmp_filename)
+
+
+def get_nwp_fields(nwp_file, lons, lats, cache_dir=None):
+    """Get the NWP fields at *lons*, *lats*, from the cache or *nwp_file*."""
+    cache_filename = get_nwp_cache_filename(nwp_file, lons, lats, cache_dir=cache_dir)
+    fields = read_nwp_cache(cache_filename)
+    if fields is None:
+        fields = decode_nwp_fields(nwp_file, lons, lats)
+        write_nwp_cache(cache_filename, fields)
+    return fields
+
+
+def add_nwp_to_matchups(matchups, nwp_file, SETTINGS, cache_dir=None):
+    """Add NWP data from *nwp_file* to the imager part of all *matchups*.
+
+    None in *matchups* are skipped. The GRIB file is decoded once, for
+    the positions of all matchups.
+
+    """
+    matchups = [matchup for matchup in matchups if matchup is not None]
+    if len(matchups) == 0:
+        return
+    lons = np.concatenate([np.ravel(matchup.imager.longitude) for matchup in matchups])
+    lats = np.concatenate([np.ravel(matchup.imager.latitude) for matchup in matchups])
+    fields = get_nwp_fields(nwp_file, lons, lats, cache_dir=cache_dir)
+    ends = np.cumsum([np.size(matchup.imager.latitude) for matchup in matchups])
+    for name, data in fields.items():
+        for matchup, part in zip(matchups, np.split(data, ends[:-1])):
+            setattr(matchup.imager, name, part)
+    for matchup in matchups:
+        data = _interpolate_height_and_temperature_from_pressure(matchup.imager, [440, 680])
+        setattr(matchup.imager, 'nwp_h440', data[:, 0])
+        setattr(matchup.imager, 'nwp_h680', data[:, 1])
+        if SETTINGS['OCA_VALIDATION'] and matchup.imager.ctth_height is None:
+            data = _interpolate_height_and_temperature_from_pressure(
+                matchup.imager, None, list_of_levels=matchup.imager.ctth_pressure)
+            data[matchup.imager.ctth_pressure < 0] = -9
+            setattr(matchup.imager, 'ctth_height', data)
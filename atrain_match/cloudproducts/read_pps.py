@@ -85,6 +85,30 @@ def create_imager_time(obt, values=None):
     return obt
 
 
+def get_row_slice(row_window=None):
+    """Get slice for the rows in *row_window* (first_row, end_row), or for all rows."""
+    if row_window is None:
+        return slice(None)
+    return slice(row_window[0], row_window[1])
+
+
+def crop_imager_rows(cloudproducts, row_window):
+    """Keep only the rows in *row_window* of the geolocation and time.
+
+    The kd-tree over the whole swath is built first, it is used for the
+    matching and the matched rows are moved with cloudproducts.row_offset.
+
+    """
+    from atrain_match.utils.common import get_imager_neighbour_index
+    get_imager_neighbour_index(cloudproducts)
+    rows = get_row_slice(row_window)
+    cloudproducts.latitude = cloudproducts.latitude[rows]
+    cloudproducts.longitude = cloudproducts.longitude[rows]
+    cloudproducts.time = cloudproducts.time[rows]
+    cloudproducts.row_offset = row_window[0]
+    return cloudproducts
+
+
 class AllImagerData(object):
     """Class to hold all imager cloudproduct data."""
 
@@ -107,15 +131,35 @@ class AllImagerData(object):
         self.aux = AuxiliaryObj({'surftemp': None})
         self.cpp = None
         self.nwp_segments = None
+        self.neighbour_index = None  # kd-tree over lat/lon, shared by all truths
+        self.row_offset = 0  # swath row of the first row read
         if array_dict is not None:
             self.__dict__.update(array_dict)
 
 
+class LazyAuxField(object):
+    """Auxiliary field that is read from file when it is first used."""
+
+    def __init__(self, read_function, *args):
+        """Read with read_function(*args)."""
+        self.read_function = read_function
+        self.args = args
+
+    def read(self):
+        return self.read_function(*self.args)
+
+
 class AuxiliaryObj(object):
-    """Class to hold auxiliary cloudproduct data."""
+    """Class to hold auxiliary cloudproduct data.
+
+    Values in *array_dict* can be LazyAuxField, those are read when the
+    attribute is first used.
+
+    """
 
     def __init__(self, array_dict):
         """Init with arrays from dictionary array_dict."""
+        self._lazy = {}
         self.surftemp = None
         self.t500 = None
         self.t700 = None
@@ -157,7 +201,26 @@ class AuxiliaryObj(object):
         self.landuse = None
         self.fractionofland = None
         self.elevation = None
-        self.__dict__.update(array_dict)
+        for name, value in array_dict.items():
+            if isinstance(value, LazyAuxField):
+                self.__dict__.pop(name, None)
+                self._lazy[name] = value
+            else:
+                setattr(self, name, value)
+
+    def __getattr__(self, name):
+        """Read lazy field *name*, only called for attributes not set."""
+        lazy = self.__dict__.get('_lazy', {})
+        if name not in lazy:
+            raise AttributeError(name)
+        data = lazy.pop(name).read()
+        setattr(self, name, data)
+        return data
+
+    def field_names(self):
+        """Names of all fields, read or not."""
+        names = [name for name in self.__dict__ if not name.startswith('_')]
+        return sorted(names + list(self._lazy.keys()))
 
 
 class SmallDataObject(object):
@@ -268,13 +331,14 @@ class CppObj:
         self.cpp_reff = None
 
 
-def read_ctth_h5(filename):
+def read_ctth_h5(filename, row_window=None):
+    rows = get_row_slice(row_window)
     h5file = h5py.File(filename, 'r')
     ctth = CtthObj()
-    ctth.height = h5file['ctth_alti'].value.astype(np.float)
-    ctth.temperature = h5file['ctth_tempe'].value.astype(np.float)
-    ctth.pressure = h5file['ctth_pres'].value.astype(np.float)
-    ctth.ctth_statusflag = h5file['ctth_status_flag'].value
+    ctth.height = h5file['ctth_alti'][rows].astype(np.float)
+    ctth.temperature = h5file['ctth_tempe'][rows].astype(np.float)
+    ctth.pressure = h5file['ctth_pres'][rows].astype(np.float)
+    ctth.ctth_statusflag = h5file['ctth_status_flag'][rows]
     ctth.h_gain = h5file['ctth_alti'].attrs['scale_factor']
     ctth.h_intercept = h5file['ctth_alti'].attrs['add_offset']
     ctth.t_gain = h5file['ctth_tempe'].attrs['scale_factor']
@@ -300,14 +364,15 @@ def read_ctth_h5(filename):
     return ctth
 
 
-def read_ctth_nc(filename):
+def read_ctth_nc(filename, row_window=None):
     """Read for PPS CTTH from netcdf file."""
+    rows = get_row_slice(row_window)
     pps_nc = netCDF4.Dataset(filename, 'r', format='NETCDF4')
     ctth = CtthObj()
-    ctth.height = pps_nc.variables['ctth_alti'][0, :, :].astype(np.float)
-    ctth.temperature = pps_nc.variables['ctth_tempe'][0, :, :].astype(np.float)
-    ctth.pressure = pps_nc.variables['ctth_pres'][0, :, :].astype(np.float)
-    ctth.ctth_statusflag = pps_nc.variables['ctth_status_flag'][0, :, :]
+    ctth.height = pps_nc.variables['ctth_alti'][0, rows, :].astype(np.float)
+    ctth.temperature = pps_nc.variables['ctth_tempe'][0, rows, :].astype(np.float)
+    ctth.pressure = pps_nc.variables['ctth_pres'][0, rows, :].astype(np.float)
+    ctth.ctth_statusflag = pps_nc.variables['ctth_status_flag'][0, rows, :]
     # Currently unpacked arrays later in calipso.py
     ctth.h_gain = 1.0
     ctth.h_intercept = 0.0
@@ -334,36 +399,39 @@ def read_ctth_nc(filename):
     return ctth
 
 
-def read_cloudtype_h5(filename):
+def read_cloudtype_h5(filename, row_window=None):
+    rows = get_row_slice(row_window)
     h5file = h5py.File(filename, 'r')
     ctype = CtypeObj()
-    ctype.cloudtype = h5file['ct'].value
-    ctype.ct_conditions = h5file['ct_conditions'].value
-    ctype.ct_statusflag = h5file['ct_status_flag'].value
-    ctype.ct_quality = h5file['ct_quality'].value
+    ctype.cloudtype = h5file['ct'][rows]
+    ctype.ct_conditions = h5file['ct_conditions'][rows]
+    ctype.ct_statusflag = h5file['ct_status_flag'][rows]
+    ctype.ct_quality = h5file['ct_quality'][rows]
     h5file.close()
     return ctype
 
 
-def read_cloudtype_nc(filename):
+def read_cloudtype_nc(filename, row_window=None):
     """Read for PPS cloud type from netcdf file."""
+    rows = get_row_slice(row_window)
     pps_nc = netCDF4.Dataset(filename, 'r', format='NETCDF4')
     ctype = CtypeObj()
-    ctype.cloudtype = pps_nc.variables['ct'][0, :, :]
-    ctype.ct_conditions = pps_nc.variables['ct_conditions'][0, :, :]
-    ctype.ct_statusflag = pps_nc.variables['ct_status_flag'][0, :, :]
-    ctype.ct_quality = pps_nc.variables['ct_quality'][0, :, :]
+    ctype.cloudtype = pps_nc.variables['ct'][0, rows, :]
+    ctype.ct_conditions = pps_nc.variables['ct_conditions'][0, rows, :]
+    ctype.ct_statusflag = pps_nc.variables['ct_status_flag'][0, rows, :]
+    ctype.ct_quality = pps_nc.variables['ct_quality'][0, rows, :]
     pps_nc.close()
     return ctype
 
 
-def read_cma_h5(filename):
+def read_cma_h5(filename, row_window=None):
+    rows = get_row_slice(row_window)
     h5file = h5py.File(filename, 'r')
     cma = CmaObj()
     if 'cma_extended' not in h5file.keys():
         if 'cloud_probability' in h5file.keys():
             logger.error("This CMA-file seem lika a CMAPROB file!")
-    cma.cma_ext = h5file['cma_extended'].value
+    cma.cma_ext = h5file['cma_extended'][rows]
     cma.cma_bin = np.int64(0*cma.cma_ext.copy())
     cma.cma_bin[cma.cma_ext == 1] = 1.0
     cma.cma_bin[cma.cma_ext == 2] = 1.0
@@ -375,7 +443,8 @@ def read_cma_h5(filename):
     return cma
 
 
-def read_cmaprob_h5(filename, cma):
+def read_cmaprob_h5(filename, cma, row_window=None):
+    rows = get_row_slice(row_window)
     h5file = h5py.File(filename, 'r')
     if cma is None:
         cma = CmaObj()
@@ -386,20 +455,21 @@ def read_cmaprob_h5(filename, cma):
     if name not in h5file.keys():
         logger.info("This CMA-file is old.")
         name = "cmaprob"
-    cma.cma_prob = h5file[name].value
+    cma.cma_prob = h5file[name][rows]
     h5file.close()
     return cma
 
 
-def read_cmaprob_nc(filename, cma):
+def read_cmaprob_nc(filename, cma, row_window=None):
     """Read for PPS cloud probability from netcdf file."""
+    rows = get_row_slice(row_window)
     pps_nc = netCDF4.Dataset(filename, 'r', format='NETCDF4')
     if cma is None:
         cma = CmaObj()
     if 'cma_extended' in pps_nc.variables.keys():
         if 'cmaprob' not in pps_nc.variables.keys():
             logger.error("\n This file looks not like a CMAPROB-file like a normal CMA-file %s", filename)
-    cma.cma_prob = pps_nc.variables['cmaprob'][0, :, :]
+    cma.cma_prob = pps_nc.variables['cmaprob'][0, rows, :]
     if np.ma.is_masked(cma.cma_prob):
         mask = cma.cma_prob.mask
         cma.cma_prob =  cma.cma_prob.data
@@ -408,20 +478,21 @@ def read_cmaprob_nc(filename, cma):
     return cma
 
 
-def read_cma_nc(filename):
+def read_cma_nc(filename, row_window=None):
     """Read for PPS cloud mask from netcdf file."""
+    rows = get_row_slice(row_window)
     pps_nc = netCDF4.Dataset(filename, 'r', format='NETCDF4')
     cma = CmaObj()
     if 'cma_extended' not in pps_nc.variables.keys():
         if 'cloud_probability' in pps_nc.variables.keys():
             logger.error("Probably you shold set CMAP_PROB_VALIDATION=True!")
-    cma.cma_ext = pps_nc.variables['cma_extended'][0, :, :]
+    cma.cma_ext = pps_nc.variables['cma_extended'][0, rows, :]
     cma.cma_bin = 0*np.int64(cma.cma_ext.copy())
     cma.cma_bin[cma.cma_ext == 1] = 1.0
     cma.cma_bin[cma.cma_ext == 2] = 1.0
     cma.cma_bin[cma.cma_ext < 0] = ATRAIN_MATCH_NODATA
     cma.cma_bin[cma.cma_ext > 10] = ATRAIN_MATCH_NODATA
-    cma.cma_quality = pps_nc.variables['cma_quality'][0, :, :]
+    cma.cma_quality = pps_nc.variables['cma_quality'][0, rows, :]
 
     # cma.cma_testlist0 = pps_nc.variables['cma_testlist0'][0, :, :]
     # cma.cma_testlist1 = pps_nc.variables['cma_testlist1'][0, :, :]
@@ -440,7 +511,7 @@ def read_cma_nc(filename):
             'cma_testlist4',
             'cma_testlist5']:
         if var_name in pps_nc.variables.keys():
-            array = pps_nc.variables[var_name][0, :, :]
+            array = pps_nc.variables[var_name][0, rows, :]
             atrain_name = var_name
             if var_name == 'cma_aerosol':
                 atrain_name = 'cma_aerosolflag'
@@ -457,13 +528,14 @@ def read_cma_nc(filename):
     return cma
 
 
-def read_imager_data_nc(pps_nc):
+def read_imager_data_nc(pps_nc, row_window=None):
     """Read for PPS level1c from netcdf file."""
+    rows = get_row_slice(row_window)
     imager_data = NewImagerData()
 
     bad = None
     if 'qual_flags' in pps_nc.variables.keys():
-        qual = pps_nc.variables['qual_flags'][0,:,:]
+        qual = pps_nc.variables['qual_flags'][0, rows, :]
         bad = np.sum(qual[:, 1:], axis=1) > 0
         
     for var in pps_nc.variables.keys():
@@ -479,7 +551,7 @@ def read_imager_data_nc(pps_nc):
             logger.debug("reading channel %s", id_tag)
             one_channel = ImagerChannelData()
             # channel = image.channel
-            data_temporary = image[0, :, :]
+            data_temporary = image[0, rows, :]
             if np.ma.is_masked(one_channel.data):
                 one_channel.data = data_temporary.data
                 one_channel.data[data_temporary.mask] = ATRAIN_MATCH_NODATA
@@ -506,8 +578,9 @@ def read_imager_data_nc(pps_nc):
     return imager_data
 
 
-def read_pps_angobj_nc(pps_nc):
+def read_pps_angobj_nc(pps_nc, row_window=None):
     """Read for PPS level1c from netcdf file."""
+    rows = get_row_slice(row_window)
     angle_obj = ImagerAngObj()
     for varname in pps_nc.variables.keys():
         this_is = "non_angle_variable"
@@ -524,27 +597,27 @@ def read_pps_angobj_nc(pps_nc):
                 this_is = pps_nc.variables[varname].id_tag
 
         if this_is in['satzenith']:
-            angle_obj.satz.data = pps_nc.variables[varname][0, :, :].astype(np.float)
+            angle_obj.satz.data = pps_nc.variables[varname][0, rows, :].astype(np.float)
             angle_obj.satz.no_data = pps_nc.variables[varname]._FillValue
             angle_obj.satz.intercept = pps_nc.variables[varname].add_offset
             angle_obj.satz.gain = pps_nc.variables[varname].scale_factor
         elif this_is in['sunzenith']:
-            angle_obj.sunz.data = pps_nc.variables[varname][0, :, :].astype(np.float)
+            angle_obj.sunz.data = pps_nc.variables[varname][0, rows, :].astype(np.float)
             angle_obj.sunz.no_data = pps_nc.variables[varname]._FillValue
             angle_obj.sunz.intercept = pps_nc.variables[varname].add_offset
             angle_obj.sunz.gain = pps_nc.variables[varname].scale_factor
         elif this_is in['azimuthdiff']:
-            angle_obj.azidiff.data = pps_nc.variables[varname][0, :, :].astype(np.float)
+            angle_obj.azidiff.data = pps_nc.variables[varname][0, rows, :].astype(np.float)
             angle_obj.azidiff.no_data = pps_nc.variables[varname]._FillValue
             angle_obj.azidiff.intercept = pps_nc.variables[varname].add_offset
             angle_obj.azidiff.gain = pps_nc.variables[varname].scale_factor
         elif this_is in['sunazimuth']:
-            angle_obj.sunazimuth.data = pps_nc.variables[varname][0, :, :].astype(np.float)
+            angle_obj.sunazimuth.data = pps_nc.variables[varname][0, rows, :].astype(np.float)
             angle_obj.sunazimuth.no_data = pps_nc.variables[varname]._FillValue
             angle_obj.sunazimuth.intercept = pps_nc.variables[varname].add_offset
             angle_obj.sunazimuth.gain = pps_nc.variables[varname].scale_factor
         elif this_is in['satazimuth']:
-            angle_obj.satazimuth.data = pps_nc.variables[varname][0, :, :].astype(np.float)
+            angle_obj.satazimuth.data = pps_nc.variables[varname][0, rows, :].astype(np.float)
             angle_obj.satazimuth.no_data = pps_nc.variables[varname]._FillValue
             angle_obj.satazimuth.intercept = pps_nc.variables[varname].add_offset
             angle_obj.satazimuth.gain = pps_nc.variables[varname].scale_factor
@@ -568,8 +641,9 @@ def read_pps_angobj_nc(pps_nc):
     return angle_obj
 
 
-def read_pps_angobj_h5(filename):
+def read_pps_angobj_h5(filename, row_window=None):
     """Read angles info from file filename."""
+    rows = get_row_slice(row_window)
     h5file = h5py.File(filename, 'r')
     angle_obj = ImagerAngObj()
 
@@ -579,14 +653,14 @@ def read_pps_angobj_h5(filename):
             if (image.attrs['description'] == "sun zenith angle" or
                     image.attrs['description'] == "Solar zenith angle"):
                 # print "reading sunz"
-                angle_obj.sunz.data = image['data'].value.astype(np.float)
+                angle_obj.sunz.data = image['data'][rows].astype(np.float)
                 angle_obj.sunz.gain = image['what'].attrs['gain']
                 angle_obj.sunz.intercept = image['what'].attrs['offset']
                 angle_obj.sunz.no_data = image['what'].attrs['nodata']
                 angle_obj.sunz.missing_data = image['what'].attrs['missingdata']
             elif (image.attrs['description'] == "satellite zenith angle" or
                   image.attrs['description'] == "Satellite zenith angle"):
-                angle_obj.satz.data = image['data'].value.astype(np.float)
+                angle_obj.satz.data = image['data'][rows].astype(np.float)
                 angle_obj.satz.gain = image['what'].attrs['gain']
                 angle_obj.satz.intercept = image['what'].attrs['offset']
                 angle_obj.satz.no_data = image['what'].attrs['nodata']
@@ -595,7 +669,7 @@ def read_pps_angobj_h5(filename):
                   "relative sun-satellite azimuth difference angle" or
                   image.attrs['description'] ==
                   "Relative satellite-sun azimuth angle"):
-                angle_obj.azidiff.data = image['data'].value.astype(np.float)
+                angle_obj.azidiff.data = image['data'][rows].astype(np.float)
                 angle_obj.azidiff.gain = image['what'].attrs['gain']
                 angle_obj.azidiff.intercept = image['what'].attrs['offset']
                 angle_obj.azidiff.no_data = image['what'].attrs['nodata']
@@ -697,12 +771,12 @@ def read_pps_geoobj_h5(filename):
     return all_imager_obj
 
 
-def read_cpp_h5(filename):
+def read_cpp_h5(filename, row_window=None):
     density = 1e3
     h5file = h5py.File(filename, 'r')
     cpp_obj = CppObj()
     for cpp_key in cpp_obj.__dict__.keys():
-        data = read_cpp_h5_one_var(h5file, cpp_key)
+        data = read_cpp_h5_one_var(h5file, cpp_key, row_window)
         if cpp_key in ["cpp_lwp"]:
             logger.debug("Convert from CPP-lwp from kg/m-2 to g/m-2")
             data[data > 0] = density * data[data > 0]
@@ -711,10 +785,11 @@ def read_cpp_h5(filename):
     return cpp_obj
 
 
-def read_cpp_h5_one_var(h5file, cpp_key):
+def read_cpp_h5_one_var(h5file, cpp_key, row_window=None):
+    rows = get_row_slice(row_window)
     if cpp_key in h5file.keys():
         logger.debug("Read %s", cpp_key)
-        cpp_var_value = h5file[cpp_key].value
+        cpp_var_value = h5file[cpp_key][rows]
         nodata = h5file[cpp_key].attrs['_FillValue']
         if cpp_key in ["cpp_phase", "cpp_phase_extended"]:
             gain = 1.0
@@ -732,12 +807,13 @@ def read_cpp_h5_one_var(h5file, cpp_key):
         return None
 
 
-def read_cpp_nc_one_var(ncFile, cpp_key):
+def read_cpp_nc_one_var(ncFile, cpp_key, row_window=None):
     """Read one CPP dataset from netcdf file."""
+    rows = get_row_slice(row_window)
     density = 1e3
     if cpp_key in ncFile.variables.keys():
         logger.debug("Read %s", cpp_key)
-        cpp_var = ncFile.variables[cpp_key][0, :, :]
+        cpp_var = ncFile.variables[cpp_key][0, rows, :]
         if np.ma.is_masked(cpp_var):
             cpp_data = cpp_var.data.astype(np.float)
             cpp_data[cpp_var.mask] = ATRAIN_MATCH_NODATA
@@ -752,16 +828,16 @@ def read_cpp_nc_one_var(ncFile, cpp_key):
         return None
 
 
-def read_cpp_nc(filename):
+def read_cpp_nc(filename, row_window=None):
     """Read all CPP datasets from netcdf file."""
     pps_nc_cpp = netCDF4.Dataset(filename, 'r', format='NETCDF4')
     cpp_obj = CppObj()
     for cpp_key in cpp_obj.__dict__.keys():
         cpp_key_new = cpp_key
-        data = read_cpp_nc_one_var(pps_nc_cpp, cpp_key)
+        data = read_cpp_nc_one_var(pps_nc_cpp, cpp_key, row_window)
         if data is None:    
             cpp_key_new = cpp_key.replace("cpp","cmic")
-            data = read_cpp_nc_one_var(pps_nc_cpp, cpp_key_new)    
+            data = read_cpp_nc_one_var(pps_nc_cpp, cpp_key_new, row_window)    
         setattr(cpp_obj, cpp_key, data)
         if data is not None:
             logger.debug("Read cpp_keys: %s, %s", cpp_key, cpp_key_new)
@@ -769,13 +845,14 @@ def read_cpp_nc(filename):
     return cpp_obj
 
 
-def read_nwp_h5(filename, nwp_key):
+def read_nwp_h5(filename, nwp_key, row_window=None):
+    rows = get_row_slice(row_window)
 
     import h5py
     h5file = h5py.File(filename, 'r')
     if nwp_key in h5file.keys():
         logger.debug("Read NWP %s", nwp_key)
-        value = h5file[nwp_key].value
+        value = h5file[nwp_key][rows]
         gain = h5file[nwp_key].attrs['gain']
         intercept = h5file[nwp_key].attrs['intercept']
         nodat = h5file[nwp_key].attrs['nodata']
@@ -787,11 +864,12 @@ def read_nwp_h5(filename, nwp_key):
         return None
 
 
-def read_etc_nc(ncFile, etc_key):
+def read_etc_nc(ncFile, etc_key, row_window=None):
     """Read a datasets from netcdf file."""
+    rows = get_row_slice(row_window)
     if etc_key in ncFile.variables.keys():
         logger.debug("Read %s", etc_key)
-        nwp_var = ncFile.variables[etc_key][0, :, :]
+        nwp_var = ncFile.variables[etc_key][0, rows, :]
         if np.ma.is_masked(nwp_var):
             if 'emis' in etc_key:
                 # set emissivity 1.0 where we miss data
@@ -803,6 +881,15 @@ def read_etc_nc(ncFile, etc_key):
         return None
 
 
+def read_etc_nc_file(filename, etc_key, row_window=None):
+    """Read a dataset from netcdf file *filename*."""
+    pps_nc = netCDF4.Dataset(filename, 'r', format='NETCDF4')
+    try:
+        return read_etc_nc(pps_nc, etc_key, row_window)
+    finally:
+        pps_nc.close()
+
+
 def read_segment_data(filename):
     import h5py
     product = {}
@@ -897,14 +984,15 @@ def read_segment_data(filename):
         return None
 
 
-def read_thr_h5(filename, h5_obj_type, thr_type):
+def read_thr_h5(filename, h5_obj_type, thr_type, row_window=None):
+    rows = get_row_slice(row_window)
     import h5py
     product = None
     if thr_type in ["emis1", "emis6", "emis8", "emis9"]:
         if filename is not None:
             h5file = h5py.File(filename, 'r')
             if 1 == 1:  # h5_obj_type in h5file.keys():
-                value = h5file[h5_obj_type].value
+                value = h5file[h5_obj_type][rows]
                 gain = h5file.attrs['gain']
                 intercept = h5file.attrs['intercept']
                 product = value * gain + intercept
@@ -920,7 +1008,7 @@ def read_thr_h5(filename, h5_obj_type, thr_type):
     if filename is not None:
         h5file = h5py.File(filename, 'r')
         if h5_obj_type in h5file.keys():
-            value = h5file[h5_obj_type].value
+            value = h5file[h5_obj_type][rows]
             gain = h5file[h5_obj_type].attrs['gain']
             intercept = h5file[h5_obj_type].attrs['intercept']
             product = value * gain + intercept
@@ -933,7 +1021,8 @@ def read_thr_h5(filename, h5_obj_type, thr_type):
     return product
 
 
-def read_imager_data_h5(filename):
+def read_imager_data_h5(filename, row_window=None):
+    rows = get_row_slice(row_window)
     h5file = h5py.File(filename, 'r')
     imager_data = NewImagerData()
     for var in h5file.keys():
@@ -945,7 +1034,7 @@ def read_imager_data_h5(filename):
                 my_description = image.attrs['description']
             logger.debug("reading channel %s", my_description)
             one_channel = ImagerChannelData()
-            one_channel.data = image['data'].value
+            one_channel.data = image['data'][rows]
             one_channel.des = my_description
             one_channel.gain = 1.0
             one_channel.intercept = 0.0
@@ -964,204 +1053,255 @@ def read_imager_data_h5(filename):
     return imager_data
 
 
-def read_all_intermediate_files(pps_files, SETTINGS):
-    """Read data sets from pps intermediate files."""
+def read_all_intermediate_files(pps_files, SETTINGS, row_window=None):
+    """Find data sets in pps intermediate files.
 
+    The data sets are read when used, see LazyAuxField. Only the fields
+    in SETTINGS['AUX_FIELDS'] are added, all if it is not set.
+
+    """
     CTTH_TYPES = SETTINGS['CTTH_TYPES']
+    wanted_fields = SETTINGS.get('AUX_FIELDS', None)
     aux_dict = {}
+
+    def add_field(name, read_function, *args):
+        if wanted_fields is None or name in wanted_fields:
+            aux_dict[name] = LazyAuxField(read_function, *args)
+
     if pps_files.nnextra is None:
         pass
     else:
         pps_nc_nnextra = netCDF4.Dataset(pps_files.nnextra, 'r', format='NETCDF4')
-        for item in pps_nc_nnextra.variables.keys():
-            if item[0:2] =='nn':
-                aux_dict[item] = read_etc_nc(pps_nc_nnextra, item)
+        nn_variables = [item for item in pps_nc_nnextra.variables.keys() if item[0:2] == 'nn']
         pps_nc_nnextra.close()
-        
+        for item in nn_variables:
+            add_field(item, read_etc_nc_file, pps_files.nnextra, item, row_window)
+
     if pps_files.seaice is None:
         pass
     elif '.nc' in pps_files.seaice:
-        pps_nc_seaice = netCDF4.Dataset(pps_files.seaice, 'r', format='NETCDF4')
-        aux_dict["seaice"] = read_etc_nc(pps_nc_seaice, "seaice")
-        pps_nc_seaice.close()
+        add_field("seaice", read_etc_nc_file, pps_files.seaice, "seaice", row_window)
     else:
         logger.info("Not reading PPS seaice data")
     if pps_files.physiography is None:
         logger.info("Not reading PPS physiography data")
     elif '.nc' in pps_files.physiography:
-        pps_nc_physiography = netCDF4.Dataset(pps_files.physiography, 'r', format='NETCDF4')
-        aux_dict["landuse"] = read_etc_nc(pps_nc_physiography, "landuse")
-        aux_dict["fractionofland"] = read_etc_nc(pps_nc_physiography, "fractionofland")
-        aux_dict["elevation"] = read_etc_nc(pps_nc_physiography, "elevation")
-        pps_nc_physiography.close()
+        for name in ["landuse", "fractionofland", "elevation"]:
+            add_field(name, read_etc_nc_file, pps_files.physiography, name, row_window)
     else:
         logger.info("Not reading PPS physiography data")
     if pps_files.r37 is None:
         pass
     else:
-        pps_nc_r37 = netCDF4.Dataset(pps_files.r37, 'r', format='NETCDF4')
-        aux_dict["r37_sza_correction_done"] = read_etc_nc(pps_nc_r37, "r37")
-        pps_nc_r37.close()
+        add_field("r37_sza_correction_done", read_etc_nc_file, pps_files.r37, "r37", row_window)
     if pps_files.nwp_tsur is None:
         pass
     elif '.nc' in pps_files.nwp_tsur:
-        pps_nc_nwp = netCDF4.Dataset(pps_files.nwp_tsur, 'r', format='NETCDF4')
-        aux_dict['surftemp'] = read_etc_nc(pps_nc_nwp, "tsur")
-        aux_dict['t500'] = read_etc_nc(pps_nc_nwp, "t500")
-        aux_dict['t700'] = read_etc_nc(pps_nc_nwp, "t700")
-        aux_dict['t850'] = read_etc_nc(pps_nc_nwp, "t850")
-        aux_dict['t950'] = read_etc_nc(pps_nc_nwp, "t950")
-        aux_dict['ttro'] = read_etc_nc(pps_nc_nwp, "ttro")
-        aux_dict['ciwv'] = read_etc_nc(pps_nc_nwp, "ciwv")
-        aux_dict['t1000'] = read_etc_nc(pps_nc_nwp, "t1000")
-        aux_dict['t900'] = read_etc_nc(pps_nc_nwp, "t900")
-        aux_dict['t800'] = read_etc_nc(pps_nc_nwp, "t800")
-        aux_dict['t250'] = read_etc_nc(pps_nc_nwp, "t250")
-        aux_dict['ptro'] = read_etc_nc(pps_nc_nwp, "ptro")
+        add_field('surftemp', read_etc_nc_file, pps_files.nwp_tsur, "tsur", row_window)
         # psur in in Pa, as ctth_pressure is in Pa
-        aux_dict['psur'] = read_etc_nc(pps_nc_nwp, "psur")
-        aux_dict['t2m'] = read_etc_nc(pps_nc_nwp, "t2m")
-        aux_dict['h2m'] = read_etc_nc(pps_nc_nwp, "h2m")
-        aux_dict['u10m'] = read_etc_nc(pps_nc_nwp, "u10m")
-        aux_dict['v10m'] = read_etc_nc(pps_nc_nwp, "v10m")
-        aux_dict['snowa'] = read_etc_nc(pps_nc_nwp, "snowa")
-        aux_dict['snowd'] = read_etc_nc(pps_nc_nwp, "snowd")
+        for name in ['t500', 't700', 't850', 't950', 'ttro', 'ciwv',
+                     't1000', 't900', 't800', 't250', 'ptro', 'psur',
+                     't2m', 'h2m', 'u10m', 'v10m', 'snowa', 'snowd']:
+            add_field(name, read_etc_nc_file, pps_files.nwp_tsur, name, row_window)
     else:
-        aux_dict['surftemp'] = read_nwp_h5(pps_files.nwp_tsur, "tsur")
-        aux_dict['t500'] = read_nwp_h5(pps_files.nwp_t500, "t500")
-        aux_dict['t700'] = read_nwp_h5(pps_files.nwp_t700, "t700")
-        aux_dict['t850'] = read_nwp_h5(pps_files.nwp_t850, "t850")
-        aux_dict['t950'] = read_nwp_h5(pps_files.nwp_t950, "t950")
-        aux_dict['ttro'] = read_nwp_h5(pps_files.nwp_ttro, "ttro")
-        aux_dict['ciwv'] = read_nwp_h5(pps_files.nwp_ciwv, "ciwv")
+        add_field('surftemp', read_nwp_h5, pps_files.nwp_tsur, "tsur", row_window)
+        for name in ['t500', 't700', 't850', 't950', 'ttro', 'ciwv']:
+            add_field(name, read_nwp_h5, getattr(pps_files, 'nwp_' + name), name, row_window)
     if pps_files.text_t11 is None:
         pass
         logger.info("Not reading PPS texture data")
     elif '.nc' in pps_files.text_t11:
-        pps_nc_txt = netCDF4.Dataset(pps_files.text_t11, 'r', format='NETCDF4')
         for ttype in ['r06', 't11', 't37t12', 't37', 't11t12']:
             text_type = 'text_' + ttype
-            aux_dict[text_type] = read_etc_nc(pps_nc_txt, ttype)
-        pps_nc_txt.close()
+            add_field(text_type, read_etc_nc_file, pps_files.text_t11, ttype, row_window)
     else:
         for ttype in ['r06', 't11', 't37t12', 't37']:
             h5_obj_type = ttype + '_text'
             text_type = 'text_' + ttype
-            aux_dict[text_type] = read_thr_h5(getattr(pps_files, text_type),
-                                              h5_obj_type, text_type)
+            add_field(text_type, read_thr_h5, getattr(pps_files, text_type),
+                      h5_obj_type, text_type, row_window)
     if pps_files.thr_t11ts is None:
         pass
         logger.info("Not reading PPS threshold data")
     elif '.nc' in pps_files.thr_t11ts:
-        pps_nc_thr = netCDF4.Dataset(pps_files.thr_t11ts, 'r', format='NETCDF4')
         for nc_obj_type in ['t11ts_inv', 't11t37_inv', 't37t12_inv', 't11t12_inv',
                             't11ts', 't11t37', 't37t12', 't11t12',
                             'r09', 'r06', 't85t11_inv', 't85t11']:
             thr_type = 'thr_' + nc_obj_type
-            aux_dict[thr_type] = read_etc_nc(pps_nc_thr, nc_obj_type)
-        pps_nc_thr.close()
+            add_field(thr_type, read_etc_nc_file, pps_files.thr_t11ts, nc_obj_type, row_window)
     else:
         for h5_obj_type in ['t11ts_inv', 't11t37_inv', 't37t12_inv', 't11t12_inv',
                             't11ts', 't11t37', 't37t12', 't11t12',
                             'r09', 'r06', 't85t11_inv', 't85t11']:
             thr_type = 'thr_' + h5_obj_type
-            aux_dict[thr_type] = read_thr_h5(getattr(pps_files, thr_type),
-                                             h5_obj_type, thr_type)
+            add_field(thr_type, read_thr_h5, getattr(pps_files, thr_type),
+                      h5_obj_type, thr_type, row_window)
     if pps_files.emis is None:
         pass
         logger.info("Not reading PPS Emissivity data")
     elif '.nc' in pps_files.emis:
-        pps_nc_thr = netCDF4.Dataset(pps_files.emis, 'r', format='NETCDF4')
         for emis_type in ['emis1', "emis6", 'emis8', 'emis9']:
-            aux_dict[emis_type] = read_etc_nc(pps_nc_thr, emis_type)
-        pps_nc_thr.close()
+            add_field(emis_type, read_etc_nc_file, pps_files.emis, emis_type, row_window)
     else:
         for h5_obj_type in ['emis1', "emis6", 'emis8', 'emis9']:
             emis_type = h5_obj_type
-            aux_dict[emis_type] = read_thr_h5(getattr(pps_files, "emis"),
-                                              h5_obj_type, emis_type)
+            add_field(emis_type, read_thr_h5, getattr(pps_files, "emis"),
+                      h5_obj_type, emis_type, row_window)
     if len(CTTH_TYPES) > 1:
         for ctth_type in CTTH_TYPES[1:]:  # already read first
-            aux_dict[ctth_type] = read_ctth_nc(pps_files.ctth[ctth_type])
+            aux_dict[ctth_type] = LazyAuxField(read_ctth_nc, pps_files.ctth[ctth_type], row_window)
     aux_obj = AuxiliaryObj(aux_dict)
     return aux_obj
 
 
-def pps_read_all(pps_files, imager_file, SETTINGS):
-    """Read all PPS data and return cloudproducts object."""
+def read_pps_geolocation(imager_file):
+    """Read imager geolocation and create time info for each line."""
     logger.info("Read Imager geolocation data")
     if '.nc' in imager_file:
         pps_nc = netCDF4.Dataset(imager_file, 'r', format='NETCDF4')
         cloudproducts = read_pps_geoobj_nc(pps_nc)
+        pps_nc.close()
     else:
         # use mpop?
         cloudproducts = read_pps_geoobj_h5(imager_file)
     # create time info for each pixel
     values = get_satid_datetime_orbit_from_fname_pps(imager_file)
     cloudproducts = create_imager_time(cloudproducts, values)
-    logger.info("Read sun and satellites angles data")
-    if '.nc' in pps_files.sunsatangles:
-        pps_nc_ang = netCDF4.Dataset(pps_files.sunsatangles, 'r', format='NETCDF4')
-        cloudproducts.imager_angles = read_pps_angobj_nc(pps_nc_ang)
+    return cloudproducts
+
+
+def read_pps_angobj(filename, row_window=None):
+    """Read sun and satellite angles from netcdf or hdf5 file *filename*."""
+    if '.nc' in filename:
+        pps_nc_ang = netCDF4.Dataset(filename, 'r', format='NETCDF4')
+        imager_angles = read_pps_angobj_nc(pps_nc_ang, row_window)
         pps_nc_ang.close()
     else:
         # use mpop?
-        cloudproducts.imager_angles = read_pps_angobj_h5(pps_files.sunsatangles)
-    logger.info("Read Imager data")
+        imager_angles = read_pps_angobj_h5(filename, row_window)
+    return imager_angles
+
+
+def read_imager_data(imager_file, row_window=None):
+    """Read imager channel data from netcdf or hdf5 file *imager_file*."""
     if '.nc' in imager_file:
-        cloudproducts.imager_channeldata = read_imager_data_nc(pps_nc)
+        pps_nc = netCDF4.Dataset(imager_file, 'r', format='NETCDF4')
+        imager_channeldata = read_imager_data_nc(pps_nc, row_window)
         pps_nc.close()
     else:
-        cloudproducts.imager_channeldata = read_imager_data_h5(imager_file)
-    for imager in ["avhrr", "viirs", "modis", "seviri"]:
-        if imager in os.path.basename(imager_file):
-            cloudproducts.instrument = imager
-    logger.debug("%s, %s, %s", pps_files.cloudtype, pps_files.ctth, pps_files.cma)
+        imager_channeldata = read_imager_data_h5(imager_file, row_window)
+    return imager_channeldata
 
-    # CPP
+
+def get_pps_read_tasks(pps_files, imager_file, SETTINGS, row_window=None):
+    """List the reads of PPS files as (name, function, args), in reading order."""
+    def nc_or_h5(filename, read_nc, read_h5):
+        return read_nc if '.nc' in filename else read_h5
+
+    tasks = [('imager_angles', read_pps_angobj, (pps_files.sunsatangles, row_window)),
+             ('imager_channeldata', read_imager_data, (imager_file, row_window))]
     if pps_files.cpp is not None:
-        logger.info("Read CPP data")
-        if '.nc' in pps_files.cpp:
-            cloudproducts.cpp = read_cpp_nc(pps_files.cpp)
-        else:
-            cloudproducts.cpp = read_cpp_h5(pps_files.cpp)
-    # CMA
+        tasks.append(('cpp', nc_or_h5(pps_files.cpp, read_cpp_nc, read_cpp_h5),
+                      (pps_files.cpp, row_window)))
     if pps_files.cma is not None:
-        logger.info("Read PPS Cloud mask")
-        logger.debug(pps_files.cma)
-        if '.nc' in pps_files.cma:
-            cloudproducts.cma = read_cma_nc(pps_files.cma)
-        else:
-            cloudproducts.cma = read_cma_h5(pps_files.cma)
-    # CMAPROB
+        tasks.append(('cma', nc_or_h5(pps_files.cma, read_cma_nc, read_cma_h5),
+                      (pps_files.cma, row_window)))
     if pps_files.cmaprob is not None:
-        logger.info("Read PPS Cloud mask prob")
-        if '.nc' in pps_files.cmaprob:
-            cloudproducts.cma = read_cmaprob_nc(pps_files.cmaprob, cloudproducts.cma)
-        else:
-            cloudproducts.cma = read_cmaprob_h5(pps_files.cmaprob, cloudproducts.cma)
-    # CTYPE
+        tasks.append(('cmaprob', nc_or_h5(pps_files.cmaprob, read_cmaprob_nc, read_cmaprob_h5),
+                      (pps_files.cmaprob, None, row_window)))
     if pps_files.cloudtype is not None:
-        logger.info("Read PPS Cloud type")
-        if '.nc' in pps_files.cloudtype:
-            cloudproducts.ctype = read_cloudtype_nc(pps_files.cloudtype)
-        else:
-            cloudproducts.ctype = read_cloudtype_h5(pps_files.cloudtype)
-    # CTTH
+        tasks.append(('ctype', nc_or_h5(pps_files.cloudtype, read_cloudtype_nc, read_cloudtype_h5),
+                      (pps_files.cloudtype, row_window)))
     CTTH_TYPES = SETTINGS["CTTH_TYPES"]
     if len(pps_files.ctth.keys()) >= 1:
-        logger.info("Read PPS CTTH")
-        if '.nc' in pps_files.ctth[CTTH_TYPES[0]]:
-            # read first ctth as primary one
-            cloudproducts.ctth = read_ctth_nc(pps_files.ctth[CTTH_TYPES[0]])
-        else:
-            cloudproducts.ctth = read_ctth_h5(pps_files.ctth[CTTH_TYPES[0]])
+        # read first ctth as primary one
+        filename = pps_files.ctth[CTTH_TYPES[0]]
+        tasks.append(('ctth', nc_or_h5(filename, read_ctth_nc, read_ctth_h5), (filename, row_window)))
+    tasks.append(('nwp_segments', read_segment_data, (getattr(pps_files, 'nwp_segments'),)))
+    return tasks
 
-    logger.info("Read PPS full resolution intermediate files")
-    cloudproducts.aux = read_all_intermediate_files(pps_files, SETTINGS)
 
-    logger.info("Read PPS NWP segment resolution data")
-    cloudproducts.nwp_segments = read_segment_data(getattr(pps_files, 'nwp_segments'))
+def run_read_tasks(tasks, workers=1):
+    """Run the read *tasks* (name, function, args) with *workers* processes.
+
+    Returns a dict with the result of each task. If reads fail all errors
+    are logged, and the error of the first failed task in *tasks* is
+    raised, independent of the order the reads finish.
+
+    """
+    if workers <= 1 or len(tasks) <= 1:
+        return dict((name, function(*args)) for name, function, args in tasks)
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+        futures = [(name, args, executor.submit(function, *args))
+                   for name, function, args in tasks]
+        results = {}
+        errors = []
+        for name, args, future in futures:
+            try:
+                results[name] = future.result()
+            except Exception as err:
+                logger.error("Could not read %s from %s: %s", name, args[0], err)
+                errors.append(err)
+    if len(errors) > 0:
+        raise errors[0]
+    return results
+
+
+def pps_read_all(pps_files, imager_file, SETTINGS, cloudproducts=None, row_window=None):
+    """Read all PPS data and return cloudproducts object.
+
+    The geolocation can be read before with read_pps_geolocation and given
+    as *cloudproducts*. If *row_window* (first_row, end_row) is given only
+    those rows are read from the products, and the geolocation and time
+    are cut to the same rows.
+
+    With SETTINGS['PPS_READ_WORKERS'] > 1 the files are read at the same
+    time in that many processes. The auxiliary fields are read in the pool
+    only if SETTINGS['AUX_FIELDS'] lists them, otherwise they are read when
+    used. Each process started with --workers has its own pool.
+
+    """
+    if cloudproducts is None:
+        cloudproducts = read_pps_geolocation(imager_file)
+    if row_window is not None:
+        logger.info("Read imager rows %d-%d of %d", row_window[0], row_window[1],
+                    cloudproducts.latitude.shape[0])
+        cloudproducts = crop_imager_rows(cloudproducts, row_window)
+    workers = int(SETTINGS.get('PPS_READ_WORKERS', 1))
+    logger.info("Read PPS products, intermediate files and NWP segment data")
+    logger.debug("%s, %s, %s", pps_files.cloudtype, pps_files.ctth, pps_files.cma)
+    aux = read_all_intermediate_files(pps_files, SETTINGS, row_window)
+    tasks = get_pps_read_tasks(pps_files, imager_file, SETTINGS, row_window)
+    if workers > 1 and SETTINGS.get('AUX_FIELDS', None) is not None:
+        tasks += [(('aux', name), lazy.read_function, lazy.args)
+                  for name, lazy in sorted(aux._lazy.items())]
+    results = run_read_tasks(tasks, workers=workers)
+
+    cloudproducts.imager_angles = results['imager_angles']
+    cloudproducts.imager_channeldata = results['imager_channeldata']
+    for imager in ["avhrr", "viirs", "modis", "seviri"]:
+        if imager in os.path.basename(imager_file):
+            cloudproducts.instrument = imager
+    if 'cpp' in results:
+        cloudproducts.cpp = results['cpp']
+    if 'cma' in results:
+        cloudproducts.cma = results['cma']
+    if 'cmaprob' in results:
+        if cloudproducts.cma is None:
+            cloudproducts.cma = results['cmaprob']
+        else:
+            cloudproducts.cma.cma_prob = results['cmaprob'].cma_prob
+    if 'ctype' in results:
+        cloudproducts.ctype = results['ctype']
+    if 'ctth' in results:
+        cloudproducts.ctth = results['ctth']
+    for name, result in results.items():
+        if isinstance(name, tuple):
+            del aux._lazy[name[1]]
+            setattr(aux, name[1], result)
+    cloudproducts.aux = aux
+    cloudproducts.nwp_segments = results['nwp_segments']
 
     return cloudproducts
 
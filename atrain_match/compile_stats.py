@@ -21,12 +21,25 @@ Created on Oct 13, 2010
 
 '''
 from atrain_match.config import (RESOLUTION, _validation_results_dir, SURFACES)
+from atrain_match.utils.stats_store import STATS_STORE_SUFFIX
+import os
 
 import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def find_results_files(indata_dir, truth_sat):
+    """Find results files, use the binary store if there is one, else the text file."""
+    from glob import glob
+    stores = glob("%s/*%skm*%s*%s" % (indata_dir, RESOLUTION, truth_sat.lower(), STATS_STORE_SUFFIX))
+    with_store = set([os.path.splitext(filename)[0] for filename in stores])
+    text_files = [filename for filename in
+                  glob("%s/*%skm*%s*.dat" % (indata_dir, RESOLUTION, truth_sat.lower()))
+                  if os.path.splitext(filename)[0] not in with_store]
+    return stores + text_files
+
+
 def compile_stats(results_files, write=True, outfile_cfc="merged_sat_file_cfc", truth_sat='calipso'):
     """Run through all summary statistics."""
 
@@ -69,9 +82,6 @@ def compile_stats(results_files, write=True, outfile_cfc="merged_sat_file_cfc",
 
 if __name__ == '__main__':
 
-    import os
-    from glob import glob
-
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('--nodnt', '-d', const=True, nargs='?',
@@ -205,7 +215,7 @@ if __name__ == '__main__':
                     basename="*",
                     truth_sat=truth_sat)
                 print("-> " + indata_dir)
-                results_files.extend(glob("%s/*%skm*%s*.dat" % (indata_dir, RESOLUTION, truth_sat.lower())))
+                results_files.extend(find_results_files(indata_dir, truth_sat))
                 results_files = list(set(results_files))
             if len(results_files) < 1:
                 logger.info("PROCESS MODE %s have no results files", process_mode_dnt)
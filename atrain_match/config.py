@@ -40,6 +40,33 @@ AREA_CONFIG_FILE_PLOTS_ON_AREA = os.environ.get('AREA_CONFIG_FILE_PLOTS_ON_AREA'
 _validation_results_dir = os.environ.get(
     'VALIDATION_RESULTS_DIR',
     "/nobackup/smhid12/atrain_match_test_CALIPSOv4")
+#  File with start/end time of CALIPSO granules, reused between runs.
+#  Set to an empty string to not save the index.
+CALIPSO_TIME_INDEX_FILE = os.environ.get(
+    'CALIPSO_TIME_INDEX_FILE',
+    os.path.join(_validation_results_dir, 'calipso_time_index.json'))
+#  Directory with decoded and combined CALIPSO data, reused between imager
+#  scenes. One file is written for each set of CALIPSO granules and is never
+#  removed, so clean the directory up when the run is done.
+#  Not used if empty (default).
+CALIPSO_CACHE_DIR = os.environ.get('CALIPSO_CACHE_DIR', '')
+#  NWP fields from GRIB files at the matchup positions of a scene, reused
+#  only when the same scene is processed again. Not used if empty (default).
+NWP_CACHE_DIR = os.environ.get('NWP_CACHE_DIR', '')
+#  Fibonacci lattices with kd-tree and the lattice cell of each matchup in
+#  reshaped files, reused when plotting scores on maps.
+#  Set to an empty string to not use the cache.
+LATTICE_CACHE_DIR = os.environ.get(
+    'LATTICE_CACHE_DIR',
+    os.path.join(_validation_results_dir, 'lattice_cache'))
+#  Status of each processed cross, used to resume interrupted runs.
+RUN_MANIFEST_FILE = os.environ.get(
+    'RUN_MANIFEST_FILE',
+    os.path.join(_validation_results_dir, 'run_manifest.jsonl'))
+#  Time and memory use of each processing stage, empty string to disable.
+STAGE_TIMING_FILE = os.environ.get(
+    'STAGE_TIMING_FILE',
+    os.path.join(_validation_results_dir, 'stage_timing.jsonl'))
 ATRAIN_MATCH_CONFIG_PATH = os.environ.get('ATRAINMATCH_CONFIG_DIR', './etc')
 ATRAIN_MATCH_CONFIG_FILE = os.environ.get('ATRAINMATCH_CONFIG_FILE', 'atrain_match.cfg')
 # All non-imager satellites need to be here. Imager is default.
@@ -98,6 +125,7 @@ for mode in MODES_NO_DNT:
 
 COMPRESS_LVL = 6  # : Compresssion level for generated matched files (h5)
 NODATA = -9
+IMAGER_ROW_WINDOW_MARGIN = 50  # : Extra imager rows read around the truth tracks
 #  Recommended cloud threshold for the CloudSat cloud mask. In 5km data this
 #  threshold has already been applied, so there is no reason to change it for
 #  this data set.
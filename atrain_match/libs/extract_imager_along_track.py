@@ -18,38 +18,78 @@
 import numpy as np
 import logging
 import os
+from atrain_match.utils.timing import timed
 logger = logging.getLogger(__name__)
 
+class AlongTrackGather(object):
+    """Extract imager data along the truth track.
+
+    Flat indices and the mask of valid (non-negative) row/col are computed
+    once, and then all 2-D (and 3-D, extra dimension last) imager arrays are
+    extracted with one np.take each. *rows* and *cols* can be 1-D (one
+    neighbour) or 2-D (several neighbours). Positions with row or col < 0 are
+    set to *nodata*.
+
+    """
+
+    def __init__(self, rows, cols, nodata=-9):
+        self.rows = np.asarray(rows).astype(np.int64)
+        self.cols = np.asarray(cols).astype(np.int64)
+        self.nodata = nodata
+        self.invalid = np.logical_or(self.rows < 0, self.cols < 0)
+        self.any_invalid = self.invalid.any()
+        self._rows_ok = np.where(self.invalid, 0, self.rows)
+        self._cols_ok = np.where(self.invalid, 0, self.cols)
+        self._flat_index = {}
+
+    def flat_index(self, shape):
+        """Flat index into arrays with *shape*, cached per number of columns."""
+        ncols = shape[1]
+        if ncols not in self._flat_index:
+            self._flat_index[ncols] = self._rows_ok * ncols + self._cols_ok
+        return self._flat_index[ncols]
+
+    def __call__(self, array):
+        """Get *array* values along track."""
+        if array is None:
+            return None
+        array = np.asarray(array)
+        flat = array.reshape((-1,) + array.shape[2:])
+        out = np.take(flat, self.flat_index(array.shape), axis=0)
+        if self.any_invalid:
+            if out.dtype.kind in 'ub':
+                # NODATA can not be represented
+                out = out.astype(np.float64)
+            out[self.invalid] = self.nodata
+        return out
+
+    def mean(self, array):
+        """Mean of the valid (>= 0) neighbour values of *array*."""
+        if array is None:
+            return None
+        out_all = self(array)
+        n_ok = np.sum(out_all >= 0, axis=-1)  # before
+        out_all = np.where(out_all < 0, 0, out_all)
+        sum_out_all = np.sum(out_all, axis=-1)
+        return sum_out_all * 1.0 / n_ok
+
+
 def get_data_from_array(array, matched):
     if array is None:
         return None
-    return np.array([array[matched['row'][idx], matched['col'][idx]]
-                     for idx in range(matched['row'].shape[0])])
+    return AlongTrackGather(matched['row'], matched['col'])(array)
 
 
 def get_data_from_array_nneigh(array, matched):
     if array is None:
         return None
-    out = np.zeros(matched['row'].shape)
-    for i in range(matched['row'].shape[1]):
-        nodata = matched['row'][:, i] < 0
-        matched_i = {'row': matched['row'][:, i].copy(),
-                     'col': matched['col'][:, i].copy()}
-        matched_i['row'][nodata] = 0
-        matched_i['col'][nodata] = 0
-        out[:, i] = get_data_from_array(array, matched_i)
-        out[nodata, i] = -9
-    return out
+    return AlongTrackGather(matched['row'], matched['col'])(array)
 
 
 def get_mean_data_from_array_nneigh(array, matched):
     if array is None:
         return None
-    out_all = get_data_from_array_nneigh(array, matched)
-    n_ok = np.sum(out_all >= 0, axis=-1)  # before
-    out_all[out_all < 0] = 0
-    sum_out_all = np.sum(out_all, axis=-1)
-    return sum_out_all * 1.0 / n_ok
+    return AlongTrackGather(matched['row'], matched['col']).mean(array)
 
 
 def get_atrain_name(ch):
@@ -72,12 +112,55 @@ def get_channel_data_from_object(imager_obj, chn_des, matched, nodata=-9):
 
 
 
+def interpolate_profiles_at_pressure(pressure_v, psur, levels, profiles, surface_values):
+    """Interpolate NWP profiles to pressure *levels*, linear in log pressure.
+
+    *pressure_v* (npix, nlev) has the level closest to ground first, with
+    surface pressure *psur* (npix). *levels* is a list of pressures used for
+    all pixels, or an array (npix, nlevels) with pressures for each pixel.
+    *profiles* is a list of (npix, nlev) arrays, e.g. height and temperature,
+    with values *surface_values* (npix) at the surface. Levels at higher
+    pressure than the first model level are interpolated between the
+    surface and the first level, and levels below the surface are
+    extrapolated along that line.
+    Returns a list with a (npix, nlevels) array for each profile.
+
+    """
+    nlev = pressure_v.shape[1]
+    npix = pressure_v.shape[0]
+    levels = np.asarray(levels, dtype=np.float64)
+    if levels.ndim < 2:
+        levels = np.broadcast_to(levels.reshape(1, -1), (npix, levels.size))
+    # Number of model levels below (higher pressure) each level
+    higher_index = np.sum(pressure_v[:, np.newaxis, :] > levels[:, :, np.newaxis], axis=2) - 1
+    higher_index = np.clip(higher_index, 0, nlev - 2)
+    lower_index = higher_index + 1
+    # update "lo" where level is between surface and first level in array
+    below_level_1 = levels > pressure_v[:, 0:1]
+    lower_index[below_level_1] = 0
+    k = np.arange(npix)[:, np.newaxis]
+    # log pressures for level below and above level
+    hi = np.log(np.where(below_level_1, psur[:, np.newaxis], pressure_v[k, higher_index]).astype(np.float64))
+    lo = np.log(pressure_v[k, lower_index].astype(np.float64))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight = (hi - np.log(levels)) / (hi - lo)
+    interpolated = []
+    for values, surface in zip(profiles, surface_values):
+        value_hi = np.where(below_level_1, surface[:, np.newaxis], values[k, higher_index])
+        value_lo = values[k, lower_index]
+        out = value_hi - weight * (value_hi - value_lo)
+        interpolated.append(out.astype(values.dtype))
+    return interpolated
+
+
 def _interpolate_height_and_temperature_from_pressure(imager_obj,
                                                       level, list_of_levels=None):
     """ Function to find height att pressure level (level)
     from segment_nwp, pressure and height vectors.
     High means high in pressure. The level closest to ground i hi, and lo is at lower
     pressure further up in atmosphere.
+    If *level* is a list, the heights for all levels are returned in
+    an array (npix, nlevels).
     """
     if hasattr(imager_obj, "nwp_height") and imager_obj.nwp_height is not None:
         values_h = imager_obj.nwp_height
@@ -91,44 +174,63 @@ def _interpolate_height_and_temperature_from_pressure(imager_obj,
         psur = imager_obj.segment_nwp_surfacePressure
     else:
         return None
-    # import pdb
-    # pdb.set_trace()
-    nlev = pressure_v.shape[1]
-    npix = pressure_v.shape[0]
-    k = np.arange(npix)
-    if list_of_levels is None:
-        higher_index = np.array([nlev - 1 - np.searchsorted(pressure_v[ind, :], level, side='right',
-                                                            sorter=range(nlev - 1, -1, -1))
-                                 for ind in range(npix)])
+    if list_of_levels is not None:
+        levels = np.asarray(list_of_levels).reshape(-1, 1)
     else:
-        higher_index = np.array([nlev - 1 - np.searchsorted(pressure_v[ind, :], list_of_levels[ind], side='right',
-                                                            sorter=range(nlev - 1, -1, -1))
-                                 for ind in range(npix)])
-        level = list_of_levels
-    higher_index[higher_index >= (nlev - 1)] = nlev - 2
-    lower_index = higher_index + 1
-    # update "lo" where level is between surface and first level in array
-    below_level_1 = level > pressure_v[:, 0]
-    lower_index[below_level_1] = 0
-    # get pressure and height for layer below and above level
-    hi = pressure_v[k, higher_index]
-    lo = pressure_v[k, lower_index]
-    height_hi_ = values_h[k, higher_index]*1.0
-    height_lo_ = values_h[k, lower_index]*1.0
-    # update "hi" where level is between surface and first level in array
-    hi[below_level_1] = psur[below_level_1]
-    height_hi_[below_level_1] = surface_h[below_level_1]
-    # log pressures
-    hi = np.log(hi)
-    lo = np.log(lo)
-    level = np.log(level)
-    # interpolate
-    out_h = height_hi_ - (hi - level) * (height_hi_ - height_lo_) / (hi - lo)
+        levels = np.atleast_1d(level)
+    out_h, = interpolate_profiles_at_pressure(pressure_v, psur, levels,
+                                              [values_h * 1.0], [surface_h])
+    if list_of_levels is not None or np.ndim(level) == 0:
+        return out_h[:, 0]
     return out_h
 
 
+def get_segment_row_col_idx(nwp_segments, row_matched, col_matched):
+    """Find the segment (row, col) index of each matched pixel.
+
+    A pixel belongs to the segment with center (rowidx, colidx) if it is
+    within half a segment size from the center. The centers are looked up with
+    np.searchsorted, instead of testing all pixels against each segment.
+    Pixels outside all segments get index -9.
+
+    """
+    segment_rowidx = np.asarray(nwp_segments['rowidx'])
+    segment_colidx = np.asarray(nwp_segments['colidx'])
+    half_x = nwp_segments['segSizeX']/2
+    half_y = nwp_segments['segSizeY']/2
+    # Same segments as when looping: for s_col in range(norows): for s_row in range(nocols)
+    s_row, s_col = np.meshgrid(np.arange(nwp_segments['nocols']),
+                               np.arange(nwp_segments['norows']))
+    s_row = s_row.ravel()
+    s_col = s_col.ravel()
+    centers_row = segment_rowidx[s_row, s_col]
+    centers_col = segment_colidx[s_row, s_col]
+    unique_row = np.unique(centers_row)
+    unique_col = np.unique(centers_col)
+    # Table from (center row, center col) to segment index, last segment wins
+    table_row = np.zeros((len(unique_row), len(unique_col)), dtype=np.int16) - 9
+    table_col = np.zeros((len(unique_row), len(unique_col)), dtype=np.int16) - 9
+    table_row[np.searchsorted(unique_row, centers_row),
+              np.searchsorted(unique_col, centers_col)] = s_row
+    table_col[np.searchsorted(unique_row, centers_row),
+              np.searchsorted(unique_col, centers_col)] = s_col
+
+    def nearest_center(centers, half_size, pixels):
+        # First center with center + half_size > pixel, check center - half_size <= pixel
+        ind = np.searchsorted(centers + half_size, pixels, side='right')
+        ind_ok = np.minimum(ind, len(centers) - 1)
+        inside = np.logical_and(ind < len(centers), centers[ind_ok] - half_size <= pixels)
+        return ind_ok, inside
+
+    row_ind, row_inside = nearest_center(unique_row, half_x, np.asarray(row_matched))
+    col_ind, col_inside = nearest_center(unique_col, half_y, np.asarray(col_matched))
+    inside = np.logical_and(row_inside, col_inside)
+    seg_row = np.where(inside, table_row[row_ind, col_ind], -9).astype(np.int16)
+    seg_col = np.where(inside, table_col[row_ind, col_ind], -9).astype(np.int16)
+    return seg_row, seg_col
+
+
 def insert_nwp_segments_data(nwp_segments, row_matched, col_matched, obt):
-    npix = row_matched.shape[0]
     """
         # obt.imager.segment_nwgeoheight
         obt.imager.segment_nwp_moist
@@ -151,27 +253,6 @@ def insert_nwp_segments_data(nwp_segments, row_matched, col_matched, obt):
         obt.imager.segment_tb11cloudy_surface
         obt.imager.segment_tb12cloudy_surface
         """
-    def get_segment_row_col_idx(nwp_segments, row_matched, col_matched):
-        segment_colidx = nwp_segments['colidx']
-        segment_rowidx = nwp_segments['rowidx']
-        seg_row = np.zeros(np.size(row_matched)) - 9
-        seg_col = np.zeros(np.size(col_matched)) - 9
-        for s_col in range(nwp_segments['norows']):
-            for s_row in range(nwp_segments['nocols']):
-                within_segment = np.logical_and(
-                    np.logical_and(
-                        row_matched >= (segment_rowidx[s_row, s_col]
-                                        - nwp_segments['segSizeX']/2),
-                        row_matched < (segment_rowidx[s_row, s_col]
-                                       + nwp_segments['segSizeX']/2)),
-                    np.logical_and(
-                        col_matched >= (segment_colidx[s_row, s_col]
-                                        - nwp_segments['segSizeY']/2),
-                        col_matched < (segment_colidx[s_row, s_col]
-                                       + nwp_segments['segSizeY']/2)))
-                seg_row[within_segment] = s_row
-                seg_col[within_segment] = s_col
-        return seg_row.astype(np.int16), seg_col.astype(np.int16)
     seg_row, seg_col = get_segment_row_col_idx(nwp_segments, row_matched, col_matched)
     for data_set in ['surfaceLandTemp',
                      'surfaceSeaTemp',
@@ -195,16 +276,14 @@ def insert_nwp_segments_data(nwp_segments, row_matched, col_matched, obt):
             # 'tb11cloudy_surface',
             # 'tb12cloudy_surface ',
             setattr(obt.imager, 'segment_nwp_' + data_set,
-                    np.array([nwp_segments[data_set][seg_row[idx], seg_col[idx]]
-                              for idx in range(npix)]))
+                    np.asarray(nwp_segments[data_set])[seg_row, seg_col])
         elif 'clfree' in data_set or 'lowcloud' in data_set:
             # these are nor always present
             pass
 
     for data_set in ['moist', 'pressure', 'geoheight', 'temp']:
         setattr(obt.imager, 'segment_nwp_' + data_set,
-                np.array([nwp_segments[data_set][seg_row[idx], seg_col[idx]]
-                          for idx in range(npix)]))
+                np.asarray(nwp_segments[data_set])[seg_row, seg_col])
     # Remove nodata and not used upper part of atmosphere
     N = obt.imager.segment_nwp_pressure.shape[1]
     pressure_n_to_keep = np.sum(np.max(obt.imager.segment_nwp_pressure, axis=0) > 50)
@@ -218,16 +297,20 @@ def insert_nwp_segments_data(nwp_segments, row_matched, col_matched, obt):
 
 
 def insert_nwp_h440_h680_data(obt):
-    data = _interpolate_height_and_temperature_from_pressure(obt.imager, 440)
-    setattr(obt.imager, 'segment_nwp_h440', data)
-    data = _interpolate_height_and_temperature_from_pressure(obt.imager, 680)
-    setattr(obt.imager, 'segment_nwp_h680', data)
+    data = _interpolate_height_and_temperature_from_pressure(obt.imager, [440, 680])
+    if data is None:
+        data = [None, None]
+    else:
+        data = [data[:, 0], data[:, 1]]
+    setattr(obt.imager, 'segment_nwp_h440', data[0])
+    setattr(obt.imager, 'segment_nwp_h680', data[1])
     return obt
 
 
 # ---------------------------------------------------------------------------
 
 from atrain_match.cloudproducts.read_oca import OCA_READ_EXTRA
+@timed('extract_along_track')
 def imager_track_from_matched(obt, SETTINGS, cloudproducts,
                               extract_radiances=True,
                               extract_cma=True,
@@ -255,8 +338,8 @@ def imager_track_from_matched(obt, SETTINGS, cloudproducts,
      # For amsr-E matching (many neighbors) use only the needed nwp data (aux_params != None)
     if aux_params is None:
         # aux_params = aux_params_all
-        aux_params = dir(aux_obj)
-        aux_params = [param for param in aux_params if '__' not in param]
+        # Only the fields used are read from file
+        aux_params = aux_obj.field_names()
 
     
     imager_obj = cloudproducts.imager_channeldata
@@ -271,28 +354,30 @@ def imager_track_from_matched(obt, SETTINGS, cloudproducts,
     row_matched = truth.imager_linnum
     col_matched = truth.imager_pixnum
     row_col = {'row': row_matched, 'col': col_matched}
+    # Indices are calculated once and used for all variables
+    gather = AlongTrackGather(row_matched, col_matched)
     if extract_some_data_for_x_neighbours or find_mean_data_for_x_neighbours:
         row_matched_nneigh = truth.imager_linnum_nneigh
         col_matched_nneigh = truth.imager_pixnum_nneigh
-        row_col_nneigh = {'row': row_matched_nneigh, 'col': col_matched_nneigh}
+        gather_nneigh = AlongTrackGather(row_matched_nneigh, col_matched_nneigh)
 
-    obt.imager.latitude = get_data_from_array(cloudproducts.latitude, row_col)
-    obt.imager.longitude = get_data_from_array(cloudproducts.longitude, row_col)
+    obt.imager.latitude = gather(cloudproducts.latitude)
+    obt.imager.longitude = gather(cloudproducts.longitude)
     if extract_ctype and ctype is not None:
-        obt.imager.cloudtype = get_data_from_array(ctype.cloudtype, row_col)
+        obt.imager.cloudtype = gather(ctype.cloudtype)
     if extract_cma and cma is not None:
-        obt.imager.cloudmask = get_data_from_array(cma.cma_ext, row_col)
-        obt.imager.cloudmask_bin = get_data_from_array(cma.cma_bin, row_col)
+        obt.imager.cloudmask = gather(cma.cma_ext)
+        obt.imager.cloudmask_bin = gather(cma.cma_bin)
         if find_mean_data_for_x_neighbours:
-            obt.imager.cfc_mean = get_mean_data_from_array_nneigh(cma.cma_bin, row_col_nneigh)
+            obt.imager.cfc_mean = gather_nneigh.mean(cma.cma_bin)
     for varname in ['cma_testlist0', 'cma_testlist1', 'cma_testlist2',
                     'cma_testlist3', 'cma_testlist4', 'cma_testlist5',
                     'cma_prob', 'cma_aerosolflag', 'cma_dust', 'cma_quality']:
         if extract_cma and hasattr(cma, varname):
             setattr(obt.imager, varname,
-                    get_data_from_array(getattr(cma, varname), row_col))
+                    gather(getattr(cma, varname)))
             if find_mean_data_for_x_neighbours and varname == 'cma_prob':
-                obt.imager.cma_prob_mean = get_mean_data_from_array_nneigh(cma.cma_prob, row_col_nneigh)
+                obt.imager.cma_prob_mean = gather_nneigh.mean(cma.cma_prob)
 
     # cloud-type flags
     if extract_ctype and SETTINGS["PPS_VALIDATION"]:
@@ -303,7 +388,7 @@ def imager_track_from_matched(obt, SETTINGS, cloudproducts,
                  'cloudtype_qflag', 'cloudtype_pflag']):
             if hasattr(ctype, variable):
                 setattr(obt.imager, outname,
-                        get_data_from_array(getattr(ctype, variable), row_col))
+                        gather(getattr(ctype, variable)))
                 
     # Emiss, threhsolds, texture, nwp etc
     for key in aux_params:
@@ -314,33 +399,29 @@ def imager_track_from_matched(obt, SETTINGS, cloudproducts,
                 for data_set in ["pressure", "temperature", "height"]:
                     data = getattr(ctth_obj, data_set)
                     name = "%s_%s" % (ctth_type.lower(), data_set)
-                    setattr(obt.imager, name, get_data_from_array(data, row_col))
+                    setattr(obt.imager, name, gather(data))
             else:    
                 data = getattr(aux_obj, key)
                 if data is not None:
-                    setattr(obt.imager, key, get_data_from_array(data, row_col))
+                    setattr(obt.imager, key, gather(data))
         else:
             logger.debug("missing {:s}".format(key))
   
-    from atrain_match.utils.pps_prototyping_util import (get_coldest_values,
-                                                         get_darkest_values,
-                                                         get_warmest_values)
+    from atrain_match.utils.pps_prototyping_util import get_warmest_coldest_darkest_values
 
     imager_channels = [key for key in imager_obj.channel if 'ch_' in key]
     if imager_obj is not None and SETTINGS["SAVE_NEIGHBOUR_INFO"]  and extract_radiances:
-        warm_row_col = get_warmest_values(imager_obj, row_col)
+        warm_row_col, cold_row_col, dark_row_col = get_warmest_coldest_darkest_values(imager_obj, row_col)
         for key in imager_channels:
             atrain_name = get_atrain_name(imager_obj.channel[key])
             atrain_name = 'warmest_'  +atrain_name.replace('micron',''). replace('b','')
             data = get_channel_data_from_object(imager_obj, key, warm_row_col)
             setattr(obt.imager, atrain_name, data)            
-        cold_row_col = get_coldest_values(imager_obj, row_col)
         for key in imager_channels:
             atrain_name = get_atrain_name(imager_obj.channel[key])
             atrain_name = 'coldest_'  + atrain_name.replace('micron',''). replace('b','')
             data = get_channel_data_from_object(imager_obj, key, cold_row_col)
             setattr(obt.imager, atrain_name, data)
-        dark_row_col = get_darkest_values(imager_obj, row_col)
         for key in imager_channels:
             atrain_name = get_atrain_name(imager_obj.channel[key])
             atrain_name = 'darkest_'  + atrain_name.replace('micron',''). replace('b','')
@@ -355,31 +436,33 @@ def imager_track_from_matched(obt, SETTINGS, cloudproducts,
     if imager_obj is not None and extract_radiances:
         for key in imager_channels:
             atrain_name = get_atrain_name(imager_obj.channel[key])
-            data = get_data_from_array(imager_obj.channel[key].data, row_col)
+            data = gather(imager_obj.channel[key].data)
             setattr(obt.imager, atrain_name, data)  
       
     # Angles, scale with gain and intercept when reading
     for angle in ['satz', 'sunz', 'azidiff', 'sunazimuth', 'satazimuth']:
         data = getattr(angle_obj, angle)
         if data is not None:
-            setattr(obt.imager, angle, get_data_from_array(data.data, row_col))
+            setattr(obt.imager, angle, gather(data.data))
     if ctth is None:
         logger.info("Not extracting ctth")
     elif extract_ctth:
         logger.debug("Extracting ctth along track ")
         if hasattr(ctth, 'ctth_statusflag') and SETTINGS["PPS_VALIDATION"]:
-            obt.imager.ctth_status = get_data_from_array(ctth.ctth_statusflag, row_col)
+            obt.imager.ctth_status = gather(ctth.ctth_statusflag)
         for ctth_product in ['height', 'temperature', 'pressure', 'height_corr']:
             data = getattr(ctth, ctth_product)
             if data is None:
                 continue
-            setattr(obt.imager, "ctth_" + ctth_product, get_data_from_array(data, row_col))
+            setattr(obt.imager, "ctth_" + ctth_product, gather(data))
         if (SETTINGS["PPS_VALIDATION"] and hasattr(ctth, 'processingflag')):
-            is_opaque = np.bitwise_and(np.right_shift(ctth.processingflag, 2), 1)
-            obt.imager.ctth_opaque = get_data_from_array(is_opaque, row_col)
+            obt.imager.ctth_opaque = np.bitwise_and(
+                np.right_shift(gather(ctth.processingflag), 2), 1)
     # NWP on ctth resolution
     if nwp_segments is not None:
-        obt = insert_nwp_segments_data(nwp_segments, row_matched, col_matched, obt)
+        # Segment row/col index are for the whole swath
+        obt = insert_nwp_segments_data(nwp_segments, row_matched + cloudproducts.row_offset,
+                                       col_matched, obt)
     if cpp is None or not extract_cpp:
         logger.debug("Not extracting cpp")
     elif extract_some_data_for_x_neighbours:
@@ -387,17 +470,17 @@ def imager_track_from_matched(obt, SETTINGS, cloudproducts,
             data = getattr(cpp, data_set_name)
             if data is not None:
                 setattr(obt.imager, data_set_name,
-                        get_data_from_array_nneigh(data, row_col_nneigh))
+                        gather_nneigh(data))
         for nwp_info in ["landuse", "fractionofland"]:
             data = getattr(aux_obj, nwp_info)
-            setattr(obt.imager, nwp_info, get_data_from_array_nneigh(data, row_col_nneigh))
+            setattr(obt.imager, nwp_info, gather_nneigh(data))
     else:
         logger.debug("Extracting cpp along track ")
         for data_set_name in cpp.__dict__.keys():
             data = getattr(cpp, data_set_name)
             if data is not None:
                 setattr(obt.imager, data_set_name,
-                        get_data_from_array(data, row_col))
+                        gather(data))
 
     obt = insert_nwp_h440_h680_data(obt)
 
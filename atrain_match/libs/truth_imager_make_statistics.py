@@ -25,6 +25,7 @@ import numpy as np
 import logging
 
 from atrain_match.utils.common import MatchupError
+from atrain_match.utils.timing import stage
 
 from atrain_match.libs.truth_imager_match import (get_matchups_from_data,
                                                   find_main_cloudproduct_file,
@@ -34,12 +35,12 @@ from atrain_match.libs.truth_imager_match import (get_matchups_from_data,
 
 from atrain_match.truths.cloudsat import (add_validation_ctth_cloudsat,
                                           add_cloudsat_cloud_fraction)
-from atrain_match.truths.calipso import (optical_depth_height_filtering,
+from atrain_match.truths.calipso import (optical_depth_height_filtering_batch,
                                          check_total_optical_depth_and_warn,
                                          add_validation_ctth_calipso,
                                          detection_height_filtering,
                                          set_thin_to_clear_filtering_1km)
-from atrain_match.libs.truth_imager_statistics_lib import (calculate_statistics)
+from atrain_match.libs.truth_imager_statistics_lib import calculate_statistics_for_modes
 from atrain_match.plotting.trajectory_plotting import plot_satellite_trajectory
 from atrain_match.plotting.along_track_plotting import (plot_cal_clsat_imager_time_diff,
                                                         plot_cal_clsat_geoprof_imager,
@@ -234,39 +235,71 @@ def split_process_mode_and_dnt_part(process_mode_dnt):
     return process_mode, dnt_flag
 
 
-def process_one_mode(process_mode_dnt, match_calipso, match_clsat, iss_obj, am_obj, sy_obj,
-                     min_optical_depth, values, AM_PATHS, SETTINGS, basename):
-    """Make plots and statistics for one imager cloudproduct matchup (with one or several truths)."""
+def process_modes(modes, match_calipso, match_clsat, iss_obj, am_obj, sy_obj,
+                  values, AM_PATHS, SETTINGS, basename):
+    """Make plots and statistics for several modes sharing the same truth filtering.
 
-    # Get result filename
-    process_mode, dnt_flag = split_process_mode_and_dnt_part(process_mode_dnt)
-    min_depth_to_file_name = ""
-    if process_mode == 'OPTICAL_DEPTH':
-        min_depth_to_file_name = "-%.2f" % (min_optical_depth)
-    values['mode'] = process_mode_dnt + min_depth_to_file_name
-    result_path = insert_info_in_filename_or_path(AM_PATHS['result_dir'],
-                                                  values,
-                                                  datetime_obj=values['date_time'])
-    if not os.path.exists(result_path):
-        os.makedirs(result_path)
-    result_file = AM_PATHS['result_file'].format(
-        resolution=str(config.RESOLUTION),
-        basename=values['basename'],
-        truth_sat="xxx")
-    statfilename = os.path.join(result_path, result_file)
-    # Draw plots
-    logger.debug("Plotting")
-    if process_mode_dnt in SETTINGS['PLOT_MODES']:
-        plot_some_figures(match_clsat, match_calipso, values, basename, process_mode,
-                          AM_PATHS, SETTINGS, am_obj=am_obj)
+    *modes* is a list of (process_mode_dnt, min_optical_depth).
+
+    """
+    modes_dnt = []
+    statfilenames = []
+    for process_mode_dnt, min_optical_depth in modes:
+        # Get result filename
+        process_mode, dnt_flag = split_process_mode_and_dnt_part(process_mode_dnt)
+        min_depth_to_file_name = ""
+        if process_mode == 'OPTICAL_DEPTH':
+            min_depth_to_file_name = "-%.2f" % (min_optical_depth)
+        values['mode'] = process_mode_dnt + min_depth_to_file_name
+        result_path = insert_info_in_filename_or_path(AM_PATHS['result_dir'],
+                                                      values,
+                                                      datetime_obj=values['date_time'])
+        if not os.path.exists(result_path):
+            os.makedirs(result_path)
+        result_file = AM_PATHS['result_file'].format(
+            resolution=str(config.RESOLUTION),
+            basename=values['basename'],
+            truth_sat="xxx")
+        statfilenames.append(os.path.join(result_path, result_file))
+        modes_dnt.append((process_mode, dnt_flag))
+        # Draw plots
+        logger.debug("Plotting")
+        if process_mode_dnt in SETTINGS['PLOT_MODES']:
+            plot_some_figures(match_clsat, match_calipso, values, basename, process_mode,
+                              AM_PATHS, SETTINGS, am_obj=am_obj)
     # Calculate Statistics
     logger.debug("Calculating statistics")
-    calculate_statistics(process_mode, statfilename, match_calipso, match_clsat,
-                         iss_obj, am_obj, sy_obj, SETTINGS, dnt_flag)
+    calculate_statistics_for_modes(modes_dnt, statfilenames, match_calipso, match_clsat,
+                                   iss_obj, am_obj, sy_obj, SETTINGS)
+    return statfilenames
+
+
+def get_written_statistics_files(statfilenames):
+    """Get the statistics files written for the file names in *statfilenames*."""
+    from atrain_match.utils.stats_store import get_stats_store_filename
+    written = []
+    for statfilename in statfilenames:
+        for truth in ['cloudsat', 'calipso', 'iss', 'amsr', 'synop']:
+            filename = statfilename.replace('xxx', truth)
+            for name in [get_stats_store_filename(filename), filename]:
+                if os.path.isfile(name):
+                    written.append(name)
+    return written
+
+
+def get_truth_filtering_key(process_mode, min_optical_depth):
+    """Modes with the same key use the same filtering of the CALIPSO data."""
+    if process_mode == 'OPTICAL_DEPTH':
+        return (process_mode, min_optical_depth)
+    if process_mode == 'OPTICAL_DEPTH_THIN_IS_CLEAR':
+        return (process_mode, None)
+    if 'STANDARD' in process_mode:
+        return ('STANDARD', None)
+    return (None, None)
 
 
 def run(cross, run_modes, AM_PATHS, SETTINGS, reprocess=False):
-    """The main work horse."""
+    """The main work horse, returns the list of written statistics files."""
     logger.info("Case: %s", str(cross))
     # sensor = INSTRUMENT.get(cross.satellite1.lower(), 'imager')
 
@@ -280,7 +313,8 @@ def run(cross, run_modes, AM_PATHS, SETTINGS, reprocess=False):
         raise MatchupError("Configure problems, see messages above.")
 
     # Get the data that we need:
-    matchup_results = get_matchups(cross, AM_PATHS, SETTINGS, reprocess)
+    with stage('read_matchups'):
+        matchup_results = get_matchups(cross, AM_PATHS, SETTINGS, reprocess)
     match_calipso = matchup_results['calipso']
     match_iss = matchup_results['iss']
     match_amsr = matchup_results['amsr']
@@ -319,8 +353,9 @@ def run(cross, run_modes, AM_PATHS, SETTINGS, reprocess=False):
                        "\n\t COMPILE_RESULTS_SEPARATELY_FOR_SINGLE_LAYERS_ETC=True"
                        "\n\t ALSO_USE_5KM_FILES=True or RESOLUTION==5")
 
+    # Group the modes so that each filtering of the CALIPSO data is only done once
+    modes_for_filtering = {}
     for process_mode_dnt in run_modes:
-        logger.info("Process mode: %s", process_mode_dnt)
         optical_depths = [None]         # Update this if you always want to do filtering!/Nina
         if process_mode_dnt in ["OPTICAL_DEPTH", "OPTICAL_DEPTH_DAY",
                                 "OPTICAL_DEPTH_NIGHT", "OPTICAL_DEPTH_TWILIGHT"]:
@@ -329,49 +364,64 @@ def run(cross, run_modes, AM_PATHS, SETTINGS, reprocess=False):
         # split process_mode_dnt into two parts. One with process_mode and one dnt_flag
         process_mode, dnt_flag = split_process_mode_and_dnt_part(process_mode_dnt)
         for min_optical_depth in optical_depths:
-            # For some modes these are updated, so reset calipso data to original
-            if match_calipso is not None:
-                # -------------------------------------------------------------
-                match_calipso.calipso.layer_top_altitude = calipso_original.layer_top_altitude.copy()
-                match_calipso.calipso.layer_base_altitude = calipso_original.layer_base_altitude.copy()
-                match_calipso.calipso.cloud_fraction = calipso_original.cloud_fraction.copy()
-                match_calipso.calipso.feature_classification_flags = calipso_original.feature_classification_flags.copy()
-                match_calipso.calipso.validation_height = calipso_original.validation_height.copy()
-                match_calipso.calipso.layer_top_pressure = calipso_original.layer_top_pressure.copy()
-                match_calipso.calipso.layer_base_pressure = calipso_original.layer_base_pressure.copy()
-                # -------------------------------------------------------------
-            # If mode = OPTICAL_DEPTH -> Change cloud -top and -base profile
-            if match_calipso is not None and process_mode == 'OPTICAL_DEPTH':
-                use_old_method = SETTINGS['KG_OLD_METHOD_CLOUD_CENTER_AS_HEIGHT']
-                retv = optical_depth_height_filtering(
-                    match_calipso.calipso,
-                    min_optical_depth,
-                    use_old_method=use_old_method,
-                    limit_ctop=SETTINGS['OPTICAL_LIMIT_CLOUD_TOP'])
-                match_calipso.calipso.layer_top_altitude = retv[0]
-                match_calipso.calipso.layer_base_altitude = retv[1]
-                match_calipso.calipso.cloud_fraction = retv[2]
-                match_calipso.calipso.feature_classification_flags = retv[3]
-                match_calipso.calipso.validation_height = retv[4]
-                match_calipso.calipso.layer_top_pressure = retv[5]
-                match_calipso.calipso.layer_base_pressure = retv[6]
-            if match_calipso is not None:
-                check_total_optical_depth_and_warn(match_calipso)
-                if 'STANDARD' in process_mode:
-                    match_calipso.calipso.validation_height = detection_height_filtering(match_calipso)
-            if match_calipso is not None and process_mode == 'OPTICAL_DEPTH_THIN_IS_CLEAR':
-                logger.info("Setting thin clouds to clear, "
-                            "using 5km data in mode OPTICAL_DEPTH_THIN_IS_CLEAR")
-                retv = set_thin_to_clear_filtering_1km(match_calipso, SETTINGS)
-                match_calipso.calipso.cloud_fraction = retv[0]
-                match_calipso.calipso.validation_height = retv[1]
-            # Time to process results files for one mode:
-            process_one_mode(process_mode_dnt,
-                             match_calipso, match_clsat, match_iss, match_amsr, match_synop,
-                             min_optical_depth, values,
-                             AM_PATHS, SETTINGS, basename)
+            key = get_truth_filtering_key(process_mode, min_optical_depth)
+            modes_for_filtering.setdefault(key, []).append((process_mode_dnt, min_optical_depth))
+
+    # Filter the CALIPSO data for all minimum optical depths at once
+    optical_depth_filtered = {}
+    min_optical_depths = [min_optical_depth for (filtering, min_optical_depth) in modes_for_filtering
+                          if filtering == 'OPTICAL_DEPTH']
+    if match_calipso is not None and len(min_optical_depths) > 0:
+        with stage('optical_depth_filtering', truth='calipso'):
+            retvs = optical_depth_height_filtering_batch(
+                match_calipso.calipso,
+                min_optical_depths,
+                use_old_method=SETTINGS['KG_OLD_METHOD_CLOUD_CENTER_AS_HEIGHT'],
+                limit_ctop=SETTINGS['OPTICAL_LIMIT_CLOUD_TOP'])
+        optical_depth_filtered = dict(zip(min_optical_depths, retvs))
+
+    statfilenames = []
+    for (filtering, min_optical_depth), modes in modes_for_filtering.items():
+        logger.info("Process modes: %s", ", ".join([mode for mode, dummy in modes]))
+        # For some modes these are updated, so reset calipso data to original
+        if match_calipso is not None:
+            # -------------------------------------------------------------
+            match_calipso.calipso.layer_top_altitude = calipso_original.layer_top_altitude.copy()
+            match_calipso.calipso.layer_base_altitude = calipso_original.layer_base_altitude.copy()
+            match_calipso.calipso.cloud_fraction = calipso_original.cloud_fraction.copy()
+            match_calipso.calipso.feature_classification_flags = calipso_original.feature_classification_flags.copy()
+            match_calipso.calipso.validation_height = calipso_original.validation_height.copy()
+            match_calipso.calipso.layer_top_pressure = calipso_original.layer_top_pressure.copy()
+            match_calipso.calipso.layer_base_pressure = calipso_original.layer_base_pressure.copy()
+            # -------------------------------------------------------------
+        # If mode = OPTICAL_DEPTH -> Change cloud -top and -base profile
+        if match_calipso is not None and filtering == 'OPTICAL_DEPTH':
+            retv = optical_depth_filtered.pop(min_optical_depth)
+            match_calipso.calipso.layer_top_altitude = retv[0]
+            match_calipso.calipso.layer_base_altitude = retv[1]
+            match_calipso.calipso.cloud_fraction = retv[2]
+            match_calipso.calipso.feature_classification_flags = retv[3]
+            match_calipso.calipso.validation_height = retv[4]
+            match_calipso.calipso.layer_top_pressure = retv[5]
+            match_calipso.calipso.layer_base_pressure = retv[6]
+        if match_calipso is not None:
+            check_total_optical_depth_and_warn(match_calipso)
+            if filtering == 'STANDARD':
+                match_calipso.calipso.validation_height = detection_height_filtering(match_calipso)
+        if match_calipso is not None and filtering == 'OPTICAL_DEPTH_THIN_IS_CLEAR':
+            logger.info("Setting thin clouds to clear, "
+                        "using 5km data in mode OPTICAL_DEPTH_THIN_IS_CLEAR")
+            retv = set_thin_to_clear_filtering_1km(match_calipso, SETTINGS)
+            match_calipso.calipso.cloud_fraction = retv[0]
+            match_calipso.calipso.validation_height = retv[1]
+        # Time to process results files for all modes with this filtering:
+        with stage('statistics'):
+            statfilenames += process_modes(modes,
+                                           match_calipso, match_clsat, match_iss, match_amsr, match_synop,
+                                           values, AM_PATHS, SETTINGS, basename)
     # We are done, free some memory:
     match_calipso = None
     match_clsat = None
     match_iss = None
     match_amsr = None
+    return get_written_statistics_files(statfilenames)
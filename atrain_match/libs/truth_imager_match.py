@@ -27,7 +27,10 @@ from atrain_match.truths.calipso import (
     add_1km_to_5km,
     add_singleshot_to5km,
     add_5km_variables_to_1km,
-    adjust_5km_to_1km_resolution)
+    adjust_5km_to_1km_resolution,
+    get_calipso_cache_filename,
+    read_calipso_cache,
+    write_calipso_cache)
 from atrain_match.truths.iss import reshape_iss, match_iss_imager
 from atrain_match.truths.synop import (reshape_synop, match_synop_imager)
 from atrain_match.truths.mora import (reshape_mora, match_mora_imager)
@@ -35,7 +38,9 @@ from atrain_match.truths.amsr import (reshape_amsr, match_amsr_imager)
 from atrain_match.truths.cloudsat import (reshapeCloudsat,
                                           match_cloudsat_imager,
                                           merge_cloudsat)
-from atrain_match.utils.common import MatchupError, ProcessingError
+from atrain_match.utils.common import (MatchupError, ProcessingError,
+                                       get_imager_neighbour_index)
+from atrain_match.utils.timing import stage
 from atrain_match.config import INSTRUMENT
 import atrain_match.config as config
 import os
@@ -503,6 +508,14 @@ def find_pps_files_from_imager_file(imager_file, AM_PATHS, SETTINGS, as_oldstyle
 
 def get_cloudsat_matchups(cloudsat_files, cloudsat_files_lwp, cloudproducts, SETTINGS):
     """Read Cloudsat data and match with the given PPS data."""
+    cloudsat = read_cloudsat_data(cloudsat_files, cloudsat_files_lwp, cloudproducts, SETTINGS)
+    logger.debug("Matching CloudSat with imager")
+    cl_matchup = match_cloudsat_imager(cloudsat, cloudproducts, SETTINGS)
+    return cl_matchup
+
+
+def read_cloudsat_data(cloudsat_files, cloudsat_files_lwp, cloudproducts, SETTINGS):
+    """Read Cloudsat GEOPROF and CWC-RVOD data and merge them."""
     cloudsat_lwp = None
     cloudsat = None
     if cloudsat_files is not None:
@@ -516,9 +529,7 @@ def get_cloudsat_matchups(cloudsat_files, cloudsat_files_lwp, cloudproducts, SET
         cloudsat = merge_cloudsat(cloudsat, cloudsat_lwp)
     elif cloudsat is None:
         cloudsat = cloudsat_lwp
-    logger.debug("Matching CloudSat with imager")
-    cl_matchup = match_cloudsat_imager(cloudsat, cloudproducts, SETTINGS)
-    return cl_matchup
+    return cloudsat
 
 
 def get_iss_matchups(iss_files, cloudproducts, SETTINGS):
@@ -555,6 +566,26 @@ def get_calipso_matchups(calipso_files, values,
                          cafiles1km=None, cafiles5km=None,
                          cafiles5km_aerosol=None):
     """Read Calipso data and match with the given PPS data."""
+    calipso, calipso_aerosol = read_calipso_data(calipso_files, values,
+                                                 cloudproducts,
+                                                 AM_PATHS, SETTINGS,
+                                                 cafiles1km, cafiles5km,
+                                                 cafiles5km_aerosol)
+    logger.debug("Matching CALIPSO with imager")
+    ca_matchup = match_calipso_imager(values, calipso, calipso_aerosol,
+                                      cloudproducts, SETTINGS)
+    return ca_matchup
+
+
+def read_calipso_data(calipso_files, values,
+                      cloudproducts,
+                      AM_PATHS, SETTINGS,
+                      cafiles1km=None, cafiles5km=None,
+                      cafiles5km_aerosol=None):
+    """Read Calipso data for the time of the imager data.
+
+    Returns the calipso and calipso aerosol (or None) objects.
+    """
     # First remove files clearly outside time limit from the lists
     # When combinating 5km and 1km data some expensive calculations are done
     # before cutting the data that fits the time condition.
@@ -574,21 +605,80 @@ def get_calipso_matchups(calipso_files, values,
     if len(calipso_files) > 0 and 'V3' in os.path.basename(calipso_files[0]):
         logger.info("CALIPSO version 3 data!")
         CALIPSO_version = 3
+    merge_method = get_calipso_merge_method(CALIPSO_version, SETTINGS,
+                                            cafiles1km, cafiles5km)
+
+    # The combined data do not depend on the imager scene,
+    # read it from the cache if another scene already combined these files.
+    cache_settings = {'method': merge_method,
+                      'resolution': config.RESOLUTION,
+                      'calipso_cloudy_min_cfc': SETTINGS.get('CALIPSO_CLOUDY_MIN_CFC'),
+                      'detection_height_from_5km': SETTINGS.get(
+                          'CALCULATE_DETECTION_HEIGHT_FROM_5KM_DATA'),
+                      'optical_limit_cloud_top': SETTINGS.get('OPTICAL_LIMIT_CLOUD_TOP')}
+    cache_file = get_calipso_cache_filename(
+        [calipso_files, cafiles1km, cafiles5km, cafiles5km_aerosol], cache_settings)
+    calipso_objs = read_calipso_cache(cache_file)
+    if calipso_objs is None:
+        calipso, calipso_aerosol = merge_calipso_files(
+            merge_method, calipso_files, SETTINGS, CALIPSO_version,
+            cafiles1km, cafiles5km, cafiles5km_aerosol)
+        write_calipso_cache(cache_file, {'calipso': calipso,
+                                         'calipso_aerosol': calipso_aerosol})
+    else:
+        calipso = calipso_objs['calipso']
+        calipso_aerosol = calipso_objs.get('calipso_aerosol', None)
 
-    calipso = reshape_calipso(calipso_files)
-    # find time breakpoints, but don't cut the data yet ..
+    # find time breakpoints and cut the data
     startBreak, endBreak = find_break_points(calipso, cloudproducts, SETTINGS)
+    calipso = calipso.extract_elements(starti=startBreak,
+                                       endi=endBreak)
+    if merge_method in ['1km_to_5km', 'singleshot_to_5km', '5km_only']:
+        calipso = total_and_top_layer_optical_depth_5km(calipso, SETTINGS, resolution=5)
+    if calipso_aerosol is not None:
+        calipso_aerosol = calipso_aerosol.extract_elements(starti=startBreak,
+                                                           endi=endBreak)
+    return calipso, calipso_aerosol
+
+
+def get_calipso_merge_method(CALIPSO_version, SETTINGS,
+                             cafiles1km=None, cafiles5km=None):
+    """Get the method used to combine CALIPSO data of different resolutions."""
     if cafiles1km is not None and CALIPSO_version == 3 and config.RESOLUTION == 5:
+        return '1km_to_5km'
+    elif cafiles5km is not None and CALIPSO_version == 4 and config.RESOLUTION == 1:
+        return 'singleshot_and_5km_to_1km'
+    elif cafiles5km is not None and CALIPSO_version == 3 and config.RESOLUTION == 1:
+        return '5km_to_1km'
+    elif CALIPSO_version == 4 and config.RESOLUTION == 5 and SETTINGS['ALSO_USE_SINGLE_SHOT_CLOUD_CLEARED']:
+        return 'singleshot_to_5km'
+    elif CALIPSO_version == 4 and config.RESOLUTION == 5 and SETTINGS['ALSO_USE_1KM_FILES']:
+        return '1km_to_5km'
+    elif config.RESOLUTION == 5:
+        return '5km_only'
+    return '1km_only'
+
+
+def merge_calipso_files(merge_method, calipso_files, SETTINGS, CALIPSO_version,
+                        cafiles1km=None, cafiles5km=None,
+                        cafiles5km_aerosol=None):
+    """Read and combine all CALIPSO files, before cutting to the imager time.
+
+    Returns the calipso and calipso aerosol (or None) objects.
+    """
+    calipso = reshape_calipso(calipso_files)
+    if merge_method == '1km_to_5km':
         # RESOLUTION 5km also have 1km data
-        logger.info("Calipso version 3 data used and old 1 km restore method!")
+        if CALIPSO_version == 3:
+            logger.info("Calipso version 3 data used and old 1 km restore method!")
+        else:
+            # RESOLUTION exclusively 5km data but additional clouds taken from 1 km data
+            logger.info("Calipso version 4 data used but old method combining 1 km and 5 km data!")
         calipso1km = reshape_calipso(cafiles1km, res=1)
-        calipso5km = calipso
+        calipso5km = calipso  # calipso_files already read above
         calipso = add_1km_to_5km(calipso1km, calipso5km)
-        calipso = calipso.extract_elements(starti=startBreak,
-                                           endi=endBreak)
-        calipso = total_and_top_layer_optical_depth_5km(calipso, SETTINGS, resolution=5)
 
-    elif cafiles5km is not None and CALIPSO_version == 4 and config.RESOLUTION == 1:
+    elif merge_method == 'singleshot_and_5km_to_1km':
         # RESOLUTION 1km also have 5km data calipso version 4
         logger.info("Calipso version 4, single shot fraction and "
                     "old 5km restored optical depth method used!")
@@ -596,47 +686,23 @@ def get_calipso_matchups(calipso_files, values,
         calipso5km = reshape_calipso(cafiles5km, res=5)
         calipso5km = add_singleshot_to5km(calipso5km, SETTINGS)
         calipso5km = total_and_top_layer_optical_depth_5km(calipso5km, SETTINGS, resolution=5)
-        calipso1km = add_5km_variables_to_1km(calipso1km, calipso5km, CALIPSO_version)
-        calipso = calipso1km.extract_elements(starti=startBreak,
-                                              endi=endBreak)
+        calipso = add_5km_variables_to_1km(calipso1km, calipso5km, CALIPSO_version)
 
-    elif cafiles5km is not None and CALIPSO_version == 3 and config.RESOLUTION == 1:
+    elif merge_method == '5km_to_1km':
         # RESOLUTION 1km also have 5km data calipso version 3
         logger.info("Calipso version 3 data used and old 5 km restored optical depth method!")
         calipso1km = calipso
         calipso5km = reshape_calipso(cafiles5km, res=5)
         calipso5km = total_and_top_layer_optical_depth_5km(calipso5km, SETTINGS, resolution=5)
-        calipso1km = add_5km_variables_to_1km(calipso1km, calipso5km, CALIPSO_version)
-        calipso = calipso1km.extract_elements(starti=startBreak,
-                                              endi=endBreak)
-    elif CALIPSO_version == 4 and config.RESOLUTION == 5 and SETTINGS['ALSO_USE_SINGLE_SHOT_CLOUD_CLEARED']:
+        calipso = add_5km_variables_to_1km(calipso1km, calipso5km, CALIPSO_version)
 
+    elif merge_method == 'singleshot_to_5km':
         # RESOLUTION exclusively 5km data but additional clouds taken from 330 m single shot resolution
         logger.info("Calipso version 4 data used and new single shot restore method!")
-        # calipso5km = reshape_calipso(cafiles5km, res=5)
-        calipso5km = reshape_calipso(calipso_files)
+        calipso5km = calipso  # calipso_files already read above
         calipso = add_singleshot_to5km(calipso5km, SETTINGS)
-
-        calipso = calipso.extract_elements(starti=startBreak,
-                                           endi=endBreak)
-        calipso = total_and_top_layer_optical_depth_5km(calipso, SETTINGS, resolution=5)
-    elif CALIPSO_version == 4 and config.RESOLUTION == 5 and SETTINGS['ALSO_USE_1KM_FILES']:
-
-        # RESOLUTION exclusively 5km data but additional clouds taken from 1 km data
-        logger.info("Calipso version 4 data used but old method combining 1 km and 5 km data!")
-        # calipso5km = reshape_calipso(cafiles5km, res=5)
-        calipso5km = reshape_calipso(calipso_files)
-        calipso1km = reshape_calipso(cafiles1km, res=1)
-        calipso = add_1km_to_5km(calipso1km, calipso5km)
-        calipso = calipso.extract_elements(starti=startBreak,
-                                           endi=endBreak)
-        calipso = total_and_top_layer_optical_depth_5km(calipso, SETTINGS, resolution=5)
     else:
         logger.warning("Old metod, only one resolution used, expect bad results!")
-        calipso = calipso.extract_elements(starti=startBreak,
-                                           endi=endBreak)
-        if config.RESOLUTION == 5:
-            calipso = total_and_top_layer_optical_depth_5km(calipso, SETTINGS, resolution=5)
 
     # aerosol-data
     calipso_aerosol = None
@@ -646,16 +712,10 @@ def get_calipso_matchups(calipso_files, values,
             calipso_aerosol = adjust_5km_to_1km_resolution(calipso5km_aerosol)
         elif config.RESOLUTION == 5:
             calipso_aerosol = calipso5km_aerosol
-        calipso_aerosol = calipso_aerosol.extract_elements(starti=startBreak,
-                                                           endi=endBreak)
     # free some memory
     calipso1km = None
     calipso5km = None
-
-    logger.debug("Matching CALIPSO with imager")
-    ca_matchup = match_calipso_imager(values, calipso, calipso_aerosol,
-                                      cloudproducts, SETTINGS)
-    return ca_matchup
+    return calipso, calipso_aerosol
 
 
 def read_cloud_cci(imager_file):
@@ -678,9 +738,40 @@ def read_cloud_patmosx(imager_file, cross, SETTINGS):
     return patmosx_read_all(imager_file, cross, SETTINGS)
 
 
-def read_pps_data(pps_files, imager_file, SETTINGS):
+def read_pps_data(pps_files, imager_file, SETTINGS, cloudproducts=None, row_window=None):
     from atrain_match.cloudproducts.read_pps import pps_read_all
-    return pps_read_all(pps_files, imager_file, SETTINGS)
+    return pps_read_all(pps_files, imager_file, SETTINGS,
+                        cloudproducts=cloudproducts, row_window=row_window)
+
+
+def read_pps_geolocation(imager_file):
+    from atrain_match.cloudproducts.read_pps import read_pps_geolocation
+    return read_pps_geolocation(imager_file)
+
+
+def get_truth_row_window(cloudproducts, truth_objs, SETTINGS):
+    """Find the imager rows needed to match the truths in *truth_objs*."""
+    from atrain_match.truths.amsr import AMSR_RADIUS
+    from atrain_match.utils.common import get_imager_row_window
+    # The largest radius used when matching any truth
+    radius_of_influence = max(config.RESOLUTION * 0.7 * 1000.0,
+                              AMSR_RADIUS, SETTINGS['SYNOP_RADIUS'])
+    lonlats = [(truth.longitude.ravel(), truth.latitude.ravel())
+               for truth in truth_objs if truth is not None]
+    return get_imager_row_window(cloudproducts, lonlats, radius_of_influence,
+                                 config.IMAGER_ROW_WINDOW_MARGIN)
+
+
+def add_row_offset_to_matchup(matchup, row_offset):
+    """Make the imager line numbers of *matchup* relative to the whole swath."""
+    if matchup is None or row_offset == 0:
+        return matchup
+    truth = getattr(matchup, matchup.truth_sat)
+    for name in ['imager_linnum', 'imager_linnum_nneigh']:
+        linnum = getattr(truth, name, None)
+        if linnum is not None:
+            setattr(truth, name, np.where(linnum >= 0, linnum + row_offset, linnum))
+    return matchup
 
 
 def get_additional_calipso_files_if_requested(calipso_files, SETTINGS):
@@ -787,19 +878,17 @@ def add_additional_clousat_calipso_index_vars(match_clsat, match_calipso):
     if match_clsat is not None and match_calipso is not None:
         match_calipso.calipso.cal_modis_cflag = None
         # map cloudsat to calipso and the other way around!
-        from atrain_match.utils.match import match_lonlat
-        source = (match_clsat.cloudsat.longitude.astype(np.float64).reshape(-1, 1),
-                  match_clsat.cloudsat.latitude.astype(np.float64).reshape(-1, 1))
-        target = (match_calipso.calipso.longitude.astype(np.float64).reshape(-1, 1),
-                  match_calipso.calipso.latitude.astype(np.float64).reshape(-1, 1))
-        mapper, dummy = match_lonlat(source, target, radius_of_influence=1000, n_neighbours=1)
-        match_calipso.calipso.cloudsat_index = mapper.rows.filled(config.NODATA).ravel()
-        target = (match_clsat.cloudsat.longitude.astype(np.float64).reshape(-1, 1),
-                  match_clsat.cloudsat.latitude.astype(np.float64).reshape(-1, 1))
-        source = (match_calipso.calipso.longitude.astype(np.float64).reshape(-1, 1),
-                  match_calipso.calipso.latitude.astype(np.float64).reshape(-1, 1))
-        mapper, dummy = match_lonlat(source, target, radius_of_influence=1000, n_neighbours=1)
-        match_clsat.cloudsat.calipso_index = mapper.rows.filled(config.NODATA).ravel()
+        from atrain_match.utils.match import match_along_track
+        cloudsat_lonlat = (match_clsat.cloudsat.longitude, match_clsat.cloudsat.latitude)
+        calipso_lonlat = (match_calipso.calipso.longitude, match_calipso.calipso.latitude)
+        match_calipso.calipso.cloudsat_index = match_along_track(
+            cloudsat_lonlat, calipso_lonlat,
+            match_clsat.cloudsat.sec_1970, match_calipso.calipso.sec_1970,
+            radius_of_influence=1000)
+        match_clsat.cloudsat.calipso_index = match_along_track(
+            calipso_lonlat, cloudsat_lonlat,
+            match_calipso.calipso.sec_1970, match_clsat.cloudsat.sec_1970,
+            radius_of_influence=1000)
 
         # Transfer CloudSat MODIS cloud flag to CALIPSO representation
         index = match_calipso.calipso.cloudsat_index.copy()
@@ -821,10 +910,9 @@ def add_additional_clousat_calipso_index_vars(match_clsat, match_calipso):
                 data_calipso = getattr(match_calipso.calipso, var_2d_name)
                 if data_calipso is None:
                     continue
-                temp_data = np.array([np.where(
-                    match_clsat.cloudsat.calipso_index >= 0,
-                    data_calipso[index, i], -9) for i in range(data_calipso.shape[1])])
-                setattr(match_clsat.cloudsat, 'calipso_{:s}'.format(var_2d_name), temp_data.transpose())
+                temp_data = np.where(match_clsat.cloudsat.calipso_index[:, np.newaxis] >= 0,
+                                     data_calipso[index, :], -9)
+                setattr(match_clsat.cloudsat, 'calipso_{:s}'.format(var_2d_name), temp_data)
 
         for var_1d_name in ['column_optical_depth_tropospheric_aerosols_532',
                             'column_optical_depth_tropospheric_aerosols_532_5km',
@@ -960,106 +1048,163 @@ def get_matchups_from_data(cross, AM_PATHS, SETTINGS):
     """Find files and retrieve matchup from data."""
 
     # STEP 1 get imager files
-    if SETTINGS['PPS_VALIDATION']:
-        pps_files, imager_file, tobj = find_pps_cloud_files(cross, AM_PATHS, SETTINGS)
-    if SETTINGS['CCI_CLOUD_VALIDATION']:
-        imager_file, tobj = find_cci_cloud_file(cross, AM_PATHS)
-    if SETTINGS['MAIA_VALIDATION']:
-        imager_file, tobj = find_maia_cloud_file(cross, AM_PATHS)
-    if SETTINGS['PATMOSX_VALIDATION']:
-        imager_file, tobj = find_patmosx_cloud_file(cross, AM_PATHS)
-    if SETTINGS['OCA_VALIDATION']:
-        imager_file, tobj = find_oca_cloud_file(cross, AM_PATHS)
-    if not imager_file:
-        raise MatchupError("No imager file found!\ncross = " + str(cross))
+    with stage('find_imager_files'):
+        if SETTINGS['PPS_VALIDATION']:
+            pps_files, imager_file, tobj = find_pps_cloud_files(cross, AM_PATHS, SETTINGS)
+        if SETTINGS['CCI_CLOUD_VALIDATION']:
+            imager_file, tobj = find_cci_cloud_file(cross, AM_PATHS)
+        if SETTINGS['MAIA_VALIDATION']:
+            imager_file, tobj = find_maia_cloud_file(cross, AM_PATHS)
+        if SETTINGS['PATMOSX_VALIDATION']:
+            imager_file, tobj = find_patmosx_cloud_file(cross, AM_PATHS)
+        if SETTINGS['OCA_VALIDATION']:
+            imager_file, tobj = find_oca_cloud_file(cross, AM_PATHS)
+        if not imager_file:
+            raise MatchupError("No imager file found!\ncross = " + str(cross))
     values = get_satid_datetime_orbit_from_fname(imager_file, SETTINGS, cross)
     date_time = values["date_time"]
 
     # Step 2 get truth satellite files
-    truth_files = {}
-    for truth in ['cloudsat', 'amsr', 'iss', 'synop', 'mora', 'cloudsat_lwp', 'calipso']:
-        truth_files[truth] = None
-        if (SETTINGS[truth.replace("_lwp", "").upper()+'_MATCHING'] and truth + '_file' in AM_PATHS.keys()):
-            truth_files[truth] = find_truth_files(date_time, AM_PATHS, SETTINGS, values, truth=truth)
-        elif not SETTINGS[truth.replace("_lwp", "").upper()+'_MATCHING']:
-            logger.info("NO {truth} File, {truth} matching not requested "
-                        "{truth}_MATCHING=False".format(truth=truth))
-        elif truth + '_file' not in AM_PATHS.keys():
-            logger.info("NO {truth}_file in atrain_match.cfg".format(truth=truth.lower()))
-    # CALIPSO get some extra files:
-    if truth_files['calipso'] is not None:
-        extra_files = get_additional_calipso_files_if_requested(truth_files['calipso'], SETTINGS)
-        calipso5km, calipso1km, calipso5km_aerosol = extra_files
-    if (all(truth_files_i is None for truth_files_i in truth_files.values())):
-        raise MatchupError(
-            "Couldn't find any matching CALIPSO/CLoudSat/ISS data")
+    with stage('find_truth_files'):
+        truth_files = {}
+        for truth in ['cloudsat', 'amsr', 'iss', 'synop', 'mora', 'cloudsat_lwp', 'calipso']:
+            truth_files[truth] = None
+            if (SETTINGS[truth.replace("_lwp", "").upper()+'_MATCHING'] and truth + '_file' in AM_PATHS.keys()):
+                truth_files[truth] = find_truth_files(date_time, AM_PATHS, SETTINGS, values, truth=truth)
+            elif not SETTINGS[truth.replace("_lwp", "").upper()+'_MATCHING']:
+                logger.info("NO {truth} File, {truth} matching not requested "
+                            "{truth}_MATCHING=False".format(truth=truth))
+            elif truth + '_file' not in AM_PATHS.keys():
+                logger.info("NO {truth}_file in atrain_match.cfg".format(truth=truth.lower()))
+        # CALIPSO get some extra files:
+        if truth_files['calipso'] is not None:
+            extra_files = get_additional_calipso_files_if_requested(truth_files['calipso'], SETTINGS)
+            calipso5km, calipso1km, calipso5km_aerosol = extra_files
+        if (all(truth_files_i is None for truth_files_i in truth_files.values())):
+            raise MatchupError(
+                "Couldn't find any matching CALIPSO/CLoudSat/ISS data")
 
     # STEP 3 Read imager data:
+    # For PPS read first only the geolocation, and the products
+    # only for the rows needed when the truth data is read.
+    read_track_rows_only = (SETTINGS['PPS_VALIDATION'] and
+                            SETTINGS.get('READ_IMAGER_TRACK_ROWS_ONLY', False))
+    with stage('read_imager'):
+        if read_track_rows_only:
+            cloudproducts = read_pps_geolocation(imager_file)
+        elif (SETTINGS['PPS_VALIDATION']):
+            cloudproducts = read_pps_data(pps_files, imager_file, SETTINGS)
+        if (SETTINGS['CCI_CLOUD_VALIDATION']):
+            cloudproducts = read_cloud_cci(imager_file)
+            cloudproducts.satellite = values["satellite"]
+        if (SETTINGS['MAIA_VALIDATION']):
+            cloudproducts = read_cloud_maia(imager_file)
+            cloudproducts.satellite = values["satellite"]
+        if (SETTINGS['PATMOSX_VALIDATION']):
+            cloudproducts = read_cloud_patmosx(imager_file, cross, SETTINGS)
+            cloudproducts.satellite = values["satellite"]
+        if (SETTINGS['OCA_VALIDATION']):
+            cloudproducts = read_cloud_oca(imager_file)
+            cloudproducts.satellite = values["satellite"]
+    # Build the kd-tree over the imager swath once, used by all truths
+    with stage('imager_kdtree'):
+        get_imager_neighbour_index(cloudproducts)
+
+    # STEP 4 read truth data
+    match_cloudsat = ((SETTINGS['PPS_VALIDATION'] or SETTINGS['OCA_VALIDATION']) and
+                      SETTINGS['CLOUDSAT_MATCHING'] and truth_files['cloudsat'] is not None)
+    match_iss = (SETTINGS['PPS_VALIDATION'] and SETTINGS['ISS_MATCHING'] and
+                 truth_files['iss'] is not None)
+    match_amsr = (SETTINGS['PPS_VALIDATION'] and SETTINGS['AMSR_MATCHING'] and
+                  truth_files['amsr'] is not None)
+    match_synop = (SETTINGS['PPS_VALIDATION'] and SETTINGS['SYNOP_MATCHING'] and
+                   truth_files['synop'] is not None)
+    match_mora = (SETTINGS['PPS_VALIDATION'] and SETTINGS['MORA_MATCHING'] and
+                  truth_files['mora'] is not None)
+    match_calipso = SETTINGS['CALIPSO_MATCHING'] and truth_files['calipso'] is not None
+    cloudsat = iss = amsr = synop = mora = calipso = calipso_aerosol = None
+    if match_cloudsat:
+        logger.info("Read CLOUDSAT data")
+        with stage('read_truth', truth='cloudsat'):
+            cloudsat = read_cloudsat_data(truth_files['cloudsat'],
+                                          truth_files['cloudsat_lwp'],
+                                          cloudproducts, SETTINGS)
+    if match_iss:
+        logger.info("Read ISS data")
+        with stage('read_truth', truth='iss'):
+            iss = reshape_iss(truth_files['iss'], cloudproducts, SETTINGS)
+    if match_amsr:
+        logger.info("Read AMSR data")
+        with stage('read_truth', truth='amsr'):
+            amsr = reshape_amsr(truth_files['amsr'], cloudproducts, SETTINGS)
+    if match_synop:
+        logger.info("Read SYNOP data")
+        with stage('read_truth', truth='synop'):
+            synop = reshape_synop(truth_files['synop'], cloudproducts, SETTINGS)
+    if match_mora:
+        logger.info("Read MORA data")
+        with stage('read_truth', truth='mora'):
+            mora = reshape_mora(truth_files['mora'], cloudproducts, SETTINGS)
+    if match_calipso:
+        logger.info("Read CALIPSO data")
+        with stage('read_truth', truth='calipso'):
+            calipso, calipso_aerosol = read_calipso_data(truth_files['calipso'],
+                                                         values,
+                                                         cloudproducts,
+                                                         AM_PATHS, SETTINGS,
+                                                         calipso1km, calipso5km, calipso5km_aerosol)
+
+    # STEP 5 read the PPS products for the rows near the truths
+    if read_track_rows_only:
+        with stage('read_pps_products'):
+            row_window = get_truth_row_window(cloudproducts,
+                                              [cloudsat, iss, amsr, synop, mora, calipso],
+                                              SETTINGS)
+            if row_window is None:
+                logger.info("No truth near the imager swath, read all rows")
+            cloudproducts = read_pps_data(pps_files, imager_file, SETTINGS,
+                                          cloudproducts=cloudproducts, row_window=row_window)
     if (SETTINGS['PPS_VALIDATION']):
-        cloudproducts = read_pps_data(pps_files, imager_file, SETTINGS)
         if os.path.isfile(SETTINGS['CNN_PCKL_PATH']):
-            from atrain_match.utils.pps_prototyping_util import add_cnn_features_full
-            cloudproducts.cnn_dict = add_cnn_features_full(cloudproducts.imager_channeldata,
-                                                           cloudproducts,
-                                                           SETTINGS)
-    if (SETTINGS['CCI_CLOUD_VALIDATION']):
-        cloudproducts = read_cloud_cci(imager_file)
-        cloudproducts.satellite = values["satellite"]
-    if (SETTINGS['MAIA_VALIDATION']):
-        cloudproducts = read_cloud_maia(imager_file)
-        cloudproducts.satellite = values["satellite"]
-    if (SETTINGS['PATMOSX_VALIDATION']):
-        cloudproducts = read_cloud_patmosx(imager_file, cross, SETTINGS)
-        cloudproducts.satellite = values["satellite"]
-    if (SETTINGS['OCA_VALIDATION']):
-        cloudproducts = read_cloud_oca(imager_file)
-        cloudproducts.satellite = values["satellite"]
-
-    # STEP 4 get matchups
-    # CloudSat
+            with stage('cnn_features'):
+                from atrain_match.utils.pps_prototyping_util import add_cnn_features_full
+                cloudproducts.cnn_dict = add_cnn_features_full(cloudproducts.imager_channeldata,
+                                                               cloudproducts,
+                                                               SETTINGS)
+
+    # STEP 6 get matchups
     cloudsat_matchup = None
-    if ((SETTINGS['PPS_VALIDATION'] or SETTINGS['OCA_VALIDATION'])  and SETTINGS['CLOUDSAT_MATCHING'] and
-            truth_files['cloudsat'] is not None):
-        logger.info("Read CLOUDSAT data")
-        cloudsat_matchup = get_cloudsat_matchups(truth_files['cloudsat'],
-                                                 truth_files['cloudsat_lwp'],
-                                                 cloudproducts, SETTINGS)
-    # ISS:
+    if match_cloudsat:
+        logger.debug("Matching CloudSat with imager")
+        with stage('match', truth='cloudsat'):
+            cloudsat_matchup = match_cloudsat_imager(cloudsat, cloudproducts, SETTINGS)
     iss_matchup = None
-    if (SETTINGS['PPS_VALIDATION'] and SETTINGS['ISS_MATCHING'] and
-            truth_files['iss'] is not None):
-        logger.info("Read ISS data")
-        iss_matchup = get_iss_matchups(truth_files['iss'],
-                                       cloudproducts, SETTINGS)
-    # AMSR
+    if match_iss:
+        with stage('match', truth='iss'):
+            iss_matchup = match_iss_imager(iss, cloudproducts, SETTINGS)
     amsr_matchup = None
-    if (SETTINGS['PPS_VALIDATION'] and SETTINGS['AMSR_MATCHING'] and
-            truth_files['amsr'] is not None):
-        logger.info("Read AMSR data")
-        amsr_matchup = get_amsr_matchups(truth_files['amsr'],
-                                         cloudproducts, SETTINGS)
-    # SYNOP
+    if match_amsr:
+        with stage('match', truth='amsr'):
+            amsr_matchup = match_amsr_imager(amsr, cloudproducts, SETTINGS)
     synop_matchup = None
-    if (SETTINGS['PPS_VALIDATION'] and SETTINGS['SYNOP_MATCHING'] and
-            truth_files['synop'] is not None):
-        logger.info("Read SYNOP data")
-        synop_matchup = get_synop_matchups(truth_files['synop'],
-                                           cloudproducts, SETTINGS)
-    # MORA
+    if match_synop:
+        with stage('match', truth='synop'):
+            synop_matchup = match_synop_imager(synop, cloudproducts, SETTINGS)
     mora_matchup = None
-    if (SETTINGS['PPS_VALIDATION'] and SETTINGS['MORA_MATCHING'] and truth_files['mora'] is not None):
-        logger.info("Read MORA data")
-        mora_matchup = get_mora_matchups(truth_files['mora'],
-                                         cloudproducts, SETTINGS)
-    # CALIPSO:
+    if match_mora:
+        with stage('match', truth='mora'):
+            mora_matchup = match_mora_imager(mora, cloudproducts, SETTINGS)
     calipso_matchup = None
-    if SETTINGS['CALIPSO_MATCHING'] and truth_files['calipso'] is not None:
-        logger.info("Read CALIPSO data")
-        calipso_matchup = get_calipso_matchups(truth_files['calipso'],
-                                               values,
-                                               cloudproducts,
-                                               AM_PATHS, SETTINGS,
-                                               calipso1km, calipso5km, calipso5km_aerosol)
+    if match_calipso:
+        logger.debug("Matching CALIPSO with imager")
+        with stage('match', truth='calipso'):
+            calipso_matchup = match_calipso_imager(values, calipso, calipso_aerosol,
+                                                   cloudproducts, SETTINGS)
+    # Store line numbers for the whole swath
+    cloudsat_matchup, iss_matchup, amsr_matchup, synop_matchup, mora_matchup, calipso_matchup = [
+        add_row_offset_to_matchup(matchup, cloudproducts.row_offset)
+        for matchup in [cloudsat_matchup, iss_matchup, amsr_matchup,
+                        synop_matchup, mora_matchup, calipso_matchup]]
 
     if calipso_matchup is None and SETTINGS['CALIPSO_REQUIRED']:
         raise MatchupError("No matches with CALIPSO.")
@@ -1111,58 +1256,30 @@ def get_matchups_from_data(cross, AM_PATHS, SETTINGS):
             continue
         # add modis lvl2
         if SETTINGS['MATCH_MODIS_LVL2']:
-            from atrain_match.cloudproducts.read_modis_products import add_modis_06
-            if matchup.imager_instrument in ['modis']:
-                matchup = add_modis_06(matchup, AM_PATHS, cross)
-        if SETTINGS['ADD_NWP']:
-            import pps_nwp
-            from atrain_match.libs.extract_imager_along_track import _interpolate_height_and_temperature_from_pressure
+            with stage('add_modis_lvl2', truth=matchup.truth_sat):
+                from atrain_match.cloudproducts.read_modis_products import add_modis_06
+                if matchup.imager_instrument in ['modis']:
+                    matchup = add_modis_06(matchup, AM_PATHS, cross)
+
+    if SETTINGS['ADD_NWP']:
+        # One GRIB decoding for all truths
+        with stage('add_nwp'):
+            from atrain_match.cloudproducts.read_nwp import add_nwp_to_matchups
             nwp_file = find_closest_nwp_file(cloudproducts, AM_PATHS,
                                              values, SETTINGS)
             logger.debug(nwp_file)
-            if pps_nwp is None:
-                continue
-            gribfile = pps_nwp.GRIBFile(nwp_file, (matchup.imager.longitude,
-                                                   matchup.imager.latitude))
-            setattr(matchup.imager, "nwp_height",
-                    gribfile.get_gh_vertical()[0, :, :].astype(np.float32).transpose())
-            setattr(matchup.imager, "nwp_surface_h",
-                    gribfile.get_gh_surface()[:].astype(np.float32))
-            setattr(matchup.imager, "nwp_temperature",
-                    gribfile.get_t_vertical()[0, :, :].astype(np.float32).transpose())
-            setattr(matchup.imager, "nwp_h2m",
-                    gribfile.get_h_2meter()[:].astype(np.float32))
-            setattr(matchup.imager, "nwp_t2m",
-                    gribfile.get_t_2meter()[:].astype(np.float32))
-            setattr(matchup.imager, "nwp_u10m",
-                    gribfile.get_u_10meter()[:].astype(np.float32))
-            setattr(matchup.imager, "nwp_v10m",
-                    gribfile.get_v_10meter()[:].astype(np.float32))
-            # get pressure variables in hPs
-            field = gribfile.get_p_vertical()
-            if field.units == 'Pa':
-                field = 0.01*field[:]
-                field.units = 'hPa'
-            matchup.imager.nwp_pressure = field[0, :, :].astype(np.float32).transpose()
-            field = gribfile.get_p_surface()
-            if field.units == 'Pa':
-                field = 0.01*field[:]
-                field.units = 'hPa'
-            matchup.imager.nwp_psur = field[:].astype(np.float32).transpose()
-            data = _interpolate_height_and_temperature_from_pressure(matchup.imager, 440)
-            setattr(matchup.imager, 'nwp_h440', data)
-            data = _interpolate_height_and_temperature_from_pressure(matchup.imager, 680)
-            setattr(matchup.imager, 'nwp_h680', data)
-            if SETTINGS['OCA_VALIDATION'] and matchup.imager.ctth_height is None:
-                data = _interpolate_height_and_temperature_from_pressure(matchup.imager, None,
-                                                                         list_of_levels=matchup.imager.ctth_pressure)
-                data[matchup.imager.ctth_pressure<0] = -9
-                setattr(matchup.imager, 'ctth_height', data)
+            if nwp_file is None:
+                logger.warning("No NWP file found for %s", basename)
+            else:
+                add_nwp_to_matchups([cloudsat_matchup, iss_matchup, amsr_matchup,
+                                     synop_matchup, mora_matchup, calipso_matchup],
+                                    nwp_file, SETTINGS)
 
     # add additional vars to cloudsat and calipso objects and print them to file:
-    cloudsat_matchup, calipso_matchup = add_additional_clousat_calipso_index_vars(cloudsat_matchup, calipso_matchup)
-    cloudsat_matchup, calipso_matchup, iss_matchup = add_elevation_corrected_imager_ctth(
-        cloudsat_matchup, calipso_matchup, iss_matchup, SETTINGS)
+    with stage('add_additional_vars'):
+        cloudsat_matchup, calipso_matchup = add_additional_clousat_calipso_index_vars(cloudsat_matchup, calipso_matchup)
+        cloudsat_matchup, calipso_matchup, iss_matchup = add_elevation_corrected_imager_ctth(
+            cloudsat_matchup, calipso_matchup, iss_matchup, SETTINGS)
 
     # imager_name
     imager_obj_name = 'pps'
@@ -1176,6 +1293,7 @@ def get_matchups_from_data(cross, AM_PATHS, SETTINGS):
         imager_obj_name = 'patmosx'
 
     # write matchups
+    match_files = []
     for matchup, name in zip([cloudsat_matchup, iss_matchup, amsr_matchup,
                               synop_matchup, mora_matchup, calipso_matchup],
                              ['CloudSat', 'ISS', 'AMSR-E',
@@ -1186,9 +1304,11 @@ def get_matchups_from_data(cross, AM_PATHS, SETTINGS):
             truth_sat = matchup.truth_sat
             match_file = rematched_file_base.replace(
                 'atrain_datatype', truth_sat)
-            write_truth_imager_match_obj(match_file, matchup,
-                                         SETTINGS,
-                                         imager_obj_name=imager_obj_name)
+            with stage('write_matchup', truth=truth_sat):
+                write_truth_imager_match_obj(match_file, matchup,
+                                             SETTINGS,
+                                             imager_obj_name=imager_obj_name)
+            match_files.append(match_file)
 
     # no longer return the matchup data?
     return {'cloudsat': cloudsat_matchup,
@@ -1198,7 +1318,8 @@ def get_matchups_from_data(cross, AM_PATHS, SETTINGS):
             'synop': synop_matchup,
             'mora': mora_matchup,
             'basename': basename,
-            'values': values}
+            'values': values,
+            'match_files': match_files}
 
 
 def check_if_got_all_match_files(cross, AM_PATHS, SETTINGS):
@@ -1224,10 +1345,12 @@ def check_if_got_all_match_files(cross, AM_PATHS, SETTINGS):
 
 
 def run(cross, AM_PATHS, SETTINGS, reprocess=False):
-    """The main work horse."""
+    """The main work horse, returns the list of written match files."""
 
     logger.info("Case: %s", str(cross))
     # sensor = INSTRUMENT.get(cross.satellite1.lower(), 'imager')
     # Match the data that we need:
     if reprocess or not check_if_got_all_match_files(cross, AM_PATHS, SETTINGS):
         matchup_results = get_matchups_from_data(cross, AM_PATHS, SETTINGS)
+        return matchup_results['match_files']
+    return []
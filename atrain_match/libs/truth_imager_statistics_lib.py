@@ -25,14 +25,19 @@ from atrain_match.utils.get_flag_info import (
     get_day_night_twilight_info_pps2012,
     get_day_night_twilight_info_cci2014)
 from atrain_match.utils.common import ProcessingError
+from atrain_match.utils.stats_store import StatisticsWriter
 import numpy as np
 import atrain_match.config as config
 import logging
 logger = logging.getLogger(__name__)
 
 
+# Text format of the values from calculate_ctth_stats
+CTTH_STATS_FORMAT = ["%3.2f", "%3.2f", "%3.2f", "%d", "%d", "%d", "%3.2f", "%d", "%d", "%d", "%d"]
+
+
 def calculate_ctth_stats(val_subset, imager_ctth_m_above_seasurface, truth_sat_validation_height, imager_is_cloudy):
-    """Calculate CTTH statistics."""
+    """Calculate CTTH statistics, a list of values with format CTTH_STATS_FORMAT."""
 
     imager_have_hight_for_selection = np.logical_and(
         val_subset,
@@ -86,7 +91,7 @@ def calculate_ctth_stats(val_subset, imager_ctth_m_above_seasurface, truth_sat_v
 #        RMS_difference_biascorr = np.sqrt(np.mean(diff_squared_biascorr))
 
     # return (corr_caliop_imager, bias, RMS_difference, imager_height_work, diff_squared_biascorr)
-    return "%3.2f %3.2f %3.2f %d %d %d %3.2f %d %d %d %d" % (
+    return [
         corr_caliop_imager,
         bias,
         RMS_difference,
@@ -98,7 +103,7 @@ def calculate_ctth_stats(val_subset, imager_ctth_m_above_seasurface, truth_sat_v
         n_above_500,
         n_above_1000,
         n_above_2500,
-    )
+    ]
 
 
 def get_subset_for_mode(match_obj, mode):
@@ -421,40 +426,48 @@ def print_cpp_lwp_stats(match_obj, statfile, val_subset):
         iqr_lo = -9
         median_lo = -9
 
-    statfile.write("CLOUD LWP %s-IMAGER TABLE: %3.2f %3.2f %d\n" % (
-        match_obj.truth_sat.upper(), bias, RMS_difference, N))
-    statfile.write("CLOUD LWP %s-IMAGER TABLE lo: %3.2f %3.2f %d\n" % (
-        match_obj.truth_sat.upper(), bias_lo, RMS_difference_lo, N_lo))
-    statfile.write("CLOUD LWP %s-IMAGER bias: %3.2f \n" % (
-        match_obj.truth_sat.upper(), bias))
-    statfile.write("CLOUD LWP %s-IMAGER median: %3.2f \n" % (
-        match_obj.truth_sat.upper(), median))
-    statfile.write("CLOUD LWP %s-IMAGER IQR: %3.2f \n" % (
-        match_obj.truth_sat.upper(), iqr))
-    statfile.write("CLOUD LWP %s-IMAGER std: %3.2f \n" % (
-        match_obj.truth_sat.upper(), RMS_difference))
-    statfile.write("CLOUD LWP %s-IMAGER bias lo: %3.2f \n" % (
-        match_obj.truth_sat.upper(), bias_lo))
-    statfile.write("CLOUD LWP %s-IMAGER median lo: %3.2f \n" % (
-        match_obj.truth_sat.upper(), median_lo))
-    statfile.write("CLOUD LWP %s-IMAGER IQR lo: %3.2f \n" % (
-        match_obj.truth_sat.upper(), iqr_lo))
-    statfile.write("CLOUD LWP %s-IMAGER std lo: %3.2f \n" % (
-        match_obj.truth_sat.upper(), RMS_difference_lo))
-
-
-def print_cpp_stats(match_obj, statfile, val_subset, SETTINGS):
-    """Print Cpp statistics for CALIOPSO."""
-    # CLOUD PHASE EVALUATION
-    # =======================
-    # CLOUD PHASE: CALIOP/ISS - IMAGER
+    truth_sat = match_obj.truth_sat.upper()
+    statfile.write_values("CLOUD LWP %s-IMAGER TABLE" % truth_sat,
+                          [bias, RMS_difference, N], ["%3.2f", "%3.2f", "%d"])
+    statfile.write_values("CLOUD LWP %s-IMAGER TABLE lo" % truth_sat,
+                          [bias_lo, RMS_difference_lo, N_lo], ["%3.2f", "%3.2f", "%d"])
+    statfile.write_values("CLOUD LWP %s-IMAGER bias" % truth_sat, [bias], "%3.2f")
+    statfile.write_values("CLOUD LWP %s-IMAGER median" % truth_sat, [median], "%3.2f")
+    statfile.write_values("CLOUD LWP %s-IMAGER IQR" % truth_sat, [iqr], "%3.2f")
+    statfile.write_values("CLOUD LWP %s-IMAGER std" % truth_sat, [RMS_difference], "%3.2f")
+    statfile.write_values("CLOUD LWP %s-IMAGER bias lo" % truth_sat, [bias_lo], "%3.2f")
+    statfile.write_values("CLOUD LWP %s-IMAGER median lo" % truth_sat, [median_lo], "%3.2f")
+    statfile.write_values("CLOUD LWP %s-IMAGER IQR lo" % truth_sat, [iqr_lo], "%3.2f")
+    statfile.write_values("CLOUD LWP %s-IMAGER std lo" % truth_sat, [RMS_difference_lo], "%3.2f")
+
+
+def count_for_modes(mode_subsets, truth_categories, imager_categories):
+    """Count pixels in each truth/imager category pair, for all modes at once.
+
+    *mode_subsets* is a boolean array (n_modes, n_pixels) with the selection
+    for each mode. Returns an array (n_modes, n_truth_categories,
+    n_imager_categories) of counts, calculated as one matrix product
+    instead of one np.sum per mode and category pair.
+
+    """
+    mode_subsets = np.asarray(mode_subsets, dtype=bool)
+    truth_categories = np.asarray(truth_categories, dtype=bool)
+    imager_categories = np.asarray(imager_categories, dtype=bool)
+    n_pixels = mode_subsets.shape[-1]
+    joint = np.logical_and(truth_categories[:, np.newaxis, :],
+                           imager_categories[np.newaxis, :, :]).reshape(-1, n_pixels)
+    counts = np.dot(mode_subsets.astype(np.float64), joint.T.astype(np.float64))
+    return np.rint(counts).astype(np.int64).reshape(
+        mode_subsets.shape[0], truth_categories.shape[0], imager_categories.shape[0])
+
+
+def count_cpp_stats(match_obj, mode_subsets, SETTINGS):
+    """Count cloud phase categories (CALIOP) for all modes."""
     if match_obj.imager.cpp_phase is None:
         logger.warning("There are no cpp data.")
-        return
+        return None
     from atrain_match.utils.validate_cph_util import get_calipso_phase_inner, CALIPSO_PHASE_VALUES
-    val_subset = np.logical_and(
-        val_subset,
-        match_obj.calipso.cloud_fraction >= SETTINGS["CALIPSO_CLOUDY_MIN_CFC"])
+    cal_cloudy = match_obj.calipso.cloud_fraction >= SETTINGS["CALIPSO_CLOUDY_MIN_CFC"]
     cal_phase = get_calipso_phase_inner(
         match_obj.calipso.feature_classification_flags,
         max_layers=10,
@@ -467,17 +480,16 @@ def print_cpp_stats(match_obj, statfile, val_subset, SETTINGS):
     truth_ice = np.logical_and(truth_ice.data, ~cal_phase.mask)
     pps_water = np.equal(match_obj.imager.cpp_phase, 1)
     pps_ice = np.equal(match_obj.imager.cpp_phase, 2)
-    pps_ice = np.logical_and(pps_ice, val_subset)
-    pps_water = np.logical_and(pps_water, val_subset)
-
-    n_ice_ice = np.sum(
-        np.logical_and(truth_ice, pps_ice))
-    n_water_water = np.sum(
-        np.logical_and(truth_water, pps_water))
-    n_ice_water = np.sum(
-        np.logical_and(truth_ice, pps_water))
-    n_water_ice = np.sum(
-        np.logical_and(truth_water, pps_ice))
+    return count_for_modes(mode_subsets,
+                           [np.logical_and(truth_ice, cal_cloudy),
+                            np.logical_and(truth_water, cal_cloudy)],
+                           [pps_ice, pps_water])
+
+
+def write_cpp_stats(match_obj, statfile, counts):
+    """Write cloud phase statistics from counts (see count_cpp_stats)."""
+    ((n_ice_ice, n_ice_water),
+     (n_water_ice, n_water_water)) = counts
 
     nice = n_ice_ice + n_ice_water
     nwater = n_water_water + n_water_ice
@@ -493,30 +505,27 @@ def print_cpp_stats(match_obj, statfile, val_subset, SETTINGS):
         pod_ice = 100*float(n_ice_ice)/nice
     if nice + nwater > 0:
         hitrate = (n_ice_ice + n_water_water)*1.0/(nice+nwater)
-    statfile.write("CLOUD PHASE %s-IMAGER TABLE: %s %s %s %s \n" %
-                   (match_obj.truth_sat.upper(), n_ice_ice, n_ice_water, n_water_ice, n_water_water))
-    statfile.write("CLOUD PHASE %s-IMAGER POD-WATER: %3.2f \n" % (match_obj.truth_sat.upper(), pod_water))
-    statfile.write("CLOUD PHASE %s-IMAGER POD-ICE: %3.2f \n" % (match_obj.truth_sat.upper(), pod_ice))
-    statfile.write("CLOUD PHASE %s-IMAGER Hitrate: %3.2f \n" % (match_obj.truth_sat.upper(), hitrate))
+    truth_sat = match_obj.truth_sat.upper()
+    statfile.write_values("CLOUD PHASE %s-IMAGER TABLE" % truth_sat,
+                          [n_ice_ice, n_ice_water, n_water_ice, n_water_water])
+    statfile.write_values("CLOUD PHASE %s-IMAGER POD-WATER" % truth_sat, [pod_water], "%3.2f")
+    statfile.write_values("CLOUD PHASE %s-IMAGER POD-ICE" % truth_sat, [pod_ice], "%3.2f")
+    statfile.write_values("CLOUD PHASE %s-IMAGER Hitrate" % truth_sat, [hitrate], "%3.2f")
 
 
-def print_cmask_stats(match_obj, statfile, val_subset, SETTINGS):
-    """Print cloudmask statistics."""
-    # CLOUD MASK EVALUATION
-    # =======================
-    # CORRELATION CLOUD MASK: CALIOP/ISS - IMAGER
-    truth_clear, truth_cloudy = find_truth_clear_cloudy(match_obj, val_subset, SETTINGS)
+def count_cmask_stats(match_obj, mode_subsets, SETTINGS):
+    """Count clear/cloudy truth and imager pixels for all modes."""
+    truth_clear, truth_cloudy = find_truth_clear_cloudy(match_obj, True, SETTINGS)
     pps_clear, pps_cloudy = find_imager_clear_cloudy(match_obj, SETTINGS)
-    pps_clear = np.logical_and(pps_clear, val_subset)
-    pps_cloudy = np.logical_and(pps_cloudy, val_subset)
-    n_clear_clear = np.repeat(
-        pps_clear, np.logical_and(truth_clear, pps_clear)).shape[0]
-    n_cloudy_cloudy = np.repeat(
-        pps_cloudy, np.logical_and(truth_cloudy, pps_cloudy)).shape[0]
-    n_clear_cloudy = np.repeat(
-        pps_cloudy, np.logical_and(truth_clear, pps_cloudy)).shape[0]
-    n_cloudy_clear = np.repeat(
-        pps_clear, np.logical_and(truth_cloudy, pps_clear)).shape[0]
+    return count_for_modes(mode_subsets,
+                           [truth_clear, truth_cloudy],
+                           [pps_clear, pps_cloudy])
+
+
+def write_cmask_stats(match_obj, statfile, counts):
+    """Write cloudmask statistics from counts (see count_cmask_stats)."""
+    ((n_clear_clear, n_clear_cloudy),
+     (n_cloudy_clear, n_cloudy_cloudy)) = counts
     nclear = n_clear_clear+n_clear_cloudy  # np.repeat(truth_clear, truth_clear).shape[0]
     ncloudy = n_cloudy_cloudy+n_cloudy_clear  # np.repeat(truth_cloudy, truth_cloudy).shape[0]
     ncloudy_pps = n_cloudy_cloudy+n_clear_cloudy
@@ -544,80 +553,70 @@ def print_cmask_stats(match_obj, statfile, val_subset, SETTINGS):
     else:
         bias = -9.0*0.01
 
-    statfile.write("CLOUD MASK %s-IMAGER TABLE: %s %s %s %s \n" %
-                   (match_obj.truth_sat.upper(), n_clear_clear, n_clear_cloudy, n_cloudy_clear, n_cloudy_cloudy))
-    statfile.write("CLOUD MASK %s-IMAGER POD-CLOUDY: %3.2f \n" % (match_obj.truth_sat.upper(), pod_cloudy*100))
-    statfile.write("CLOUD MASK %s-IMAGER POD-CLEAR:  %3.2f \n" % (match_obj.truth_sat.upper(), pod_clear*100))
-    statfile.write("CLOUD MASK %s-IMAGER FAR-CLOUDY: %3.2f \n" % (match_obj.truth_sat.upper(), far_cloudy*100))
-    statfile.write("CLOUD MASK %s-IMAGER FAR-CLEAR:  %3.2f \n" % (match_obj.truth_sat.upper(), far_clear*100))
-    statfile.write("CLOUD MASK %s-IMAGER BIAS percent: %3.2f \n" % (match_obj.truth_sat.upper(), bias*100))
+    truth_sat = match_obj.truth_sat.upper()
+    statfile.write_values("CLOUD MASK %s-IMAGER TABLE" % truth_sat,
+                          [n_clear_clear, n_clear_cloudy, n_cloudy_clear, n_cloudy_cloudy])
+    statfile.write_values("CLOUD MASK %s-IMAGER POD-CLOUDY" % truth_sat, [pod_cloudy*100], "%3.2f")
+    statfile.write_values("CLOUD MASK %s-IMAGER POD-CLEAR" % truth_sat, [pod_clear*100], "%3.2f")
+    statfile.write_values("CLOUD MASK %s-IMAGER FAR-CLOUDY" % truth_sat, [far_cloudy*100], "%3.2f")
+    statfile.write_values("CLOUD MASK %s-IMAGER FAR-CLEAR" % truth_sat, [far_clear*100], "%3.2f")
+    statfile.write_values("CLOUD MASK %s-IMAGER BIAS percent" % truth_sat, [bias*100], "%3.2f")
 
 
-def print_cmask_prob_stats(match_obj, statfile, val_subset, SETTINGS):
-    """Print cloud probability statistics."""
-    # CLOUD MASK PROB EVALUATION
-    # =======================
-    # CORRELATION CLOUD MASK: CALIOP/ISS - IMAGER
+CMA_PROB_STEP = 5  # percents
+
+
+def count_cmask_prob_stats(match_obj, mode_subsets, SETTINGS):
+    """Count clear/cloudy truth pixels in cloud probability intervals for all modes."""
     if match_obj.imager.cma_prob is None:
-        return
+        return None
     if 'SYNOP' in match_obj.truth_sat.upper():
         cma_prob = match_obj.imager.cma_prob_mean
     else:
         cma_prob = match_obj.imager.cma_prob
-    truth_clear, truth_cloudy = find_truth_clear_cloudy(match_obj, val_subset, SETTINGS)
-
-    # selection:
-    truth_clear = np.logical_and(truth_clear, val_subset)
-    truth_cloudy = np.logical_and(truth_cloudy, val_subset)
-    step = 5  # percents
-    clear_string = ""
-    cloudy_string = ""
-    for lower in range(0, 100, step):
-        upper = lower + step
+    truth_clear, truth_cloudy = find_truth_clear_cloudy(match_obj, True, SETTINGS)
+    pps_in_intervals = []
+    for lower in range(0, 100, CMA_PROB_STEP):
+        upper = lower + CMA_PROB_STEP
         if upper == 100:
             upper = 101
-        pps_in_interval = np.logical_and(cma_prob >= lower,
-                                         cma_prob < upper)
-        n_clear = np.sum(np.logical_and(truth_clear, pps_in_interval))
-        n_cloudy = np.sum(np.logical_and(truth_cloudy, pps_in_interval))
-        clear_string += "%s " % (n_clear)
-        cloudy_string += "%s " % (n_cloudy)
-    statfile.write("CLOUD MASK PROB %s-IMAGER TABLE STEP: %s \n" % (match_obj.truth_sat.upper(), step))
-    statfile.write("CLOUD MASK PROB %s-IMAGER TABLE CLEAR: %s \n" % (match_obj.truth_sat.upper(), clear_string))
-    statfile.write("CLOUD MASK PROB %s-IMAGER TABLE CLOUDY: %s \n" % (match_obj.truth_sat.upper(), cloudy_string))
-
-
-def print_modis_stats(match_obj, statfile, val_subset, cal_modis_cflag, SETTINGS):
-    """Print CPR (CloudSat) MODIS flag statistics compared to CALIOP or CPR (CloudSat)."""
+        pps_in_intervals.append(np.logical_and(cma_prob >= lower,
+                                               cma_prob < upper))
+    return count_for_modes(mode_subsets, [truth_clear, truth_cloudy], pps_in_intervals)
+
+
+def write_cmask_prob_stats(match_obj, statfile, counts):
+    """Write cloud probability statistics from counts (see count_cmask_prob_stats)."""
+    truth_sat = match_obj.truth_sat.upper()
+    statfile.write_values("CLOUD MASK PROB %s-IMAGER TABLE STEP" % truth_sat, [CMA_PROB_STEP])
+    statfile.write_values("CLOUD MASK PROB %s-IMAGER TABLE CLEAR" % truth_sat, counts[0])
+    statfile.write_values("CLOUD MASK PROB %s-IMAGER TABLE CLOUDY" % truth_sat, counts[1])
+
+
+def count_modis_stats(match_obj, mode_subsets, cal_modis_cflag, SETTINGS):
+    """Count clear/cloudy truth and MODIS flag pixels for all modes."""
     # CORRELATION CLOUD MASK: CALIOP - MODIS
-    truth_clear, truth_cloudy = find_truth_clear_cloudy(match_obj, val_subset, SETTINGS)
     if cal_modis_cflag is None:
-        return
-    if len(val_subset) != len(cal_modis_cflag):
+        return None
+    truth_clear, truth_cloudy = find_truth_clear_cloudy(match_obj, True, SETTINGS)
+    if len(truth_clear) != len(cal_modis_cflag):
         logger.error("Lenght mismatch error for cal_MODIS_cflag")
-        return
+        return None
 
-    modis_clear = np.logical_and(
-        np.logical_or(np.equal(cal_modis_cflag, 1),
-                      np.equal(cal_modis_cflag, 0)), val_subset)
-    modis_cloudy = np.logical_and(
-        np.logical_or(np.equal(cal_modis_cflag, 3),
-                      np.equal(cal_modis_cflag, 2)), val_subset)
-
-    n_clear_clear = np.repeat(
-        modis_clear,
-        np.logical_and(truth_clear, modis_clear)).shape[0]
-    n_cloudy_cloudy = np.repeat(
-        modis_cloudy,
-        np.logical_and(truth_cloudy, modis_cloudy)).shape[0]
-    n_clear_cloudy = np.repeat(
-        modis_cloudy,
-        np.logical_and(truth_clear, modis_cloudy)).shape[0]
-    n_cloudy_clear = np.repeat(
-        modis_clear,
-        np.logical_and(truth_cloudy, modis_clear)).shape[0]
-    nclear = np.repeat(truth_clear, truth_clear).shape[0]
-    ncloudy = np.repeat(truth_cloudy, truth_cloudy).shape[0]
+    modis_clear = np.logical_or(np.equal(cal_modis_cflag, 1),
+                                np.equal(cal_modis_cflag, 0))
+    modis_cloudy = np.logical_or(np.equal(cal_modis_cflag, 3),
+                                 np.equal(cal_modis_cflag, 2))
+    # Last category counts all truth pixels
+    return count_for_modes(mode_subsets,
+                           [truth_clear, truth_cloudy],
+                           [modis_clear, modis_cloudy, np.ones(modis_clear.shape, dtype=bool)])
+
+
+def write_modis_stats(match_obj, statfile, counts):
+    """Write MODIS flag statistics from counts (see count_modis_stats)."""
+    ((n_clear_clear, n_clear_cloudy, nclear),
+     (n_cloudy_clear, n_cloudy_cloudy, ncloudy)) = counts
     ncloudy_modis = n_cloudy_cloudy+n_clear_cloudy
     nclear_modis = n_cloudy_clear+n_clear_clear
 
@@ -646,145 +645,74 @@ def print_modis_stats(match_obj, statfile, val_subset, cal_modis_cflag, SETTINGS
         bias = mean_modis-mean_caliop
     else:
         bias = -9.0
-    statfile.write("CLOUD MASK %s-MODIS TABLE: %s %s %s %s \n" %
-                   (match_obj.truth_sat.upper(), n_clear_clear, n_clear_cloudy, n_cloudy_clear, n_cloudy_cloudy))
-
-    statfile.write("CLOUD MASK %s-MODIS FROM CLOUDSAT FLAG POD-CLOUDY:  %3.2f \n" %
-                   (match_obj.truth_sat.upper(), pod_cloudy*100))
-    statfile.write("CLOUD MASK %s-MODIS FROM CLOUDSAT FLAG POD-CLEAR:   %3.2f \n" %
-                   (match_obj.truth_sat.upper(), pod_clear*100))
-    statfile.write("CLOUD MASK %s-MODIS FROM CLOUDSAT FLAG FAR-CLOUDY:  %3.2f \n" %
-                   (match_obj.truth_sat.upper(), far_cloudy*100))
-    statfile.write("CLOUD MASK %s-MODIS FROM CLOUDSAT FLAG FAR-CLEAR:   %3.2f \n" %
-                   (match_obj.truth_sat.upper(), far_clear*100))
-    statfile.write("CLOUD MASK %s-MODIS FROM CLOUDSAT FLAG BIAS percent: %3.2f \n" %
-                   (match_obj.truth_sat.upper(), bias*100))
-
-
-def print_calipso_stats_ctype(match_calipso, statfile, val_subset, low_medium_high_class, SETTINGS):
-    """Print cloud type statistics (CALIOP)."""
+    truth_sat = match_obj.truth_sat.upper()
+    statfile.write_values("CLOUD MASK %s-MODIS TABLE" % truth_sat,
+                          [n_clear_clear, n_clear_cloudy, n_cloudy_clear, n_cloudy_cloudy])
+    statfile.write_values("CLOUD MASK %s-MODIS FROM CLOUDSAT FLAG POD-CLOUDY" % truth_sat,
+                          [pod_cloudy*100], "%3.2f")
+    statfile.write_values("CLOUD MASK %s-MODIS FROM CLOUDSAT FLAG POD-CLEAR" % truth_sat,
+                          [pod_clear*100], "%3.2f")
+    statfile.write_values("CLOUD MASK %s-MODIS FROM CLOUDSAT FLAG FAR-CLOUDY" % truth_sat,
+                          [far_cloudy*100], "%3.2f")
+    statfile.write_values("CLOUD MASK %s-MODIS FROM CLOUDSAT FLAG FAR-CLEAR" % truth_sat,
+                          [far_clear*100], "%3.2f")
+    statfile.write_values("CLOUD MASK %s-MODIS FROM CLOUDSAT FLAG BIAS percent" % truth_sat,
+                          [bias*100], "%3.2f")
+
+
+def count_calipso_stats_ctype(match_calipso, mode_subsets, low_medium_high_class, SETTINGS):
+    """Count cloud type categories (CALIOP) for all modes.
+
+    Truth categories are low, medium, high, medium_tp, high_tp, medium_op,
+    high_op and clear. Imager categories are low, medium, high, cirrus and clear.
+
+    """
     if SETTINGS["CCI_CLOUD_VALIDATION"]:
         logger.info("Cloudtype validation not useful for CCI validation")
-        return
+        return None
     if match_calipso.imager.cloudtype is None:
         logger.warning("There are no cloudtype data.")
-        return
+        return None
+    if match_calipso.imager.cloudtype_conditions is None:
+        logger.error("Assuming cloudtype structure from pps v2012")
+        return None
     # CLOUD TYPE EVALUATION - Based exclusively on CALIPSO data (Vertical Feature Mask)
     # =======================
-    calipso_low = np.logical_and(low_medium_high_class['low_clouds'],
-                                 val_subset)
-    calipso_medium = np.logical_and(low_medium_high_class['medium_clouds'],
-                                    val_subset)
-    calipso_high = np.logical_and(low_medium_high_class['high_clouds'],
-                                  val_subset)
-    calipso_medium_tp = np.logical_and(low_medium_high_class['medium_clouds_tp'],
-                                       val_subset)
-    calipso_high_tp = np.logical_and(low_medium_high_class['high_clouds_tp'],
-                                     val_subset)
-    calipso_medium_op = np.logical_and(low_medium_high_class['medium_clouds_op'],
-                                       val_subset)
-    calipso_high_op = np.logical_and(low_medium_high_class['high_clouds_op'],
-                                     val_subset)
-
-    if match_calipso.imager.cloudtype_conditions is not None:
-        logger.debug("Assuming cloudtype structure from pps v2014")
-        imager_low = np.logical_and(
-            np.logical_and(np.greater_equal(match_calipso.imager.cloudtype, 5),
-                           np.less_equal(match_calipso.imager.cloudtype, 6)),
-            val_subset)
-        imager_medium = np.logical_and(
-            np.equal(match_calipso.imager.cloudtype, 7), val_subset)
-        imager_high_op = np.logical_and(
-            np.logical_and(np.greater_equal(match_calipso.imager.cloudtype, 8),
-                           np.less_equal(match_calipso.imager.cloudtype, 9)),
-            val_subset)
-        imager_cirrus = np.logical_and(
-            np.logical_and(np.greater_equal(match_calipso.imager.cloudtype, 11),
-                           np.less_equal(match_calipso.imager.cloudtype, 15)),
-            val_subset)
-        imager_high = imager_high_op  # np.logical_or(imager_high_op, imager_high_semi)
-        imager_frac = np.logical_and(np.equal(match_calipso.imager.cloudtype, 10),
-                                     val_subset)
-        imager_low = np.logical_or(imager_low, imager_frac)
-
-    else:
-        logger.error("Assuming cloudtype structure from pps v2012")
-
-    calipso_clear = np.logical_and(
-        np.less(match_calipso.calipso.cloud_fraction, SETTINGS["CALIPSO_CLEAR_MAX_CFC"]), val_subset)
-    calipso_cloudy = np.logical_and(
-        np.greater_equal(match_calipso.calipso.cloud_fraction, SETTINGS["CALIPSO_CLOUDY_MIN_CFC"]), val_subset)
-    imager_clear = np.logical_and(
-        np.logical_and(np.less_equal(match_calipso.imager.cloudtype, 4),
-                       np.greater(match_calipso.imager.cloudtype, 0)),
-        val_subset)
-
+    logger.debug("Assuming cloudtype structure from pps v2014")
+    cloudtype = match_calipso.imager.cloudtype
+    imager_low = np.logical_and(np.greater_equal(cloudtype, 5),
+                                np.less_equal(cloudtype, 6))
+    imager_medium = np.equal(cloudtype, 7)
+    imager_high_op = np.logical_and(np.greater_equal(cloudtype, 8),
+                                    np.less_equal(cloudtype, 9))
+    imager_cirrus = np.logical_and(np.greater_equal(cloudtype, 11),
+                                   np.less_equal(cloudtype, 15))
+    imager_high = imager_high_op  # np.logical_or(imager_high_op, imager_high_semi)
+    imager_frac = np.equal(cloudtype, 10)
+    imager_low = np.logical_or(imager_low, imager_frac)
+    imager_clear = np.logical_and(np.less_equal(cloudtype, 4),
+                                  np.greater(cloudtype, 0))
+    calipso_clear = np.less(match_calipso.calipso.cloud_fraction, SETTINGS["CALIPSO_CLEAR_MAX_CFC"])
+    truth_categories = [low_medium_high_class[name] for name in [
+        'low_clouds', 'medium_clouds', 'high_clouds',
+        'medium_clouds_tp', 'high_clouds_tp',
+        'medium_clouds_op', 'high_clouds_op']] + [calipso_clear]
+    return count_for_modes(mode_subsets, truth_categories,
+                           [imager_low, imager_medium, imager_high, imager_cirrus, imager_clear])
+
+
+def write_calipso_stats_ctype(match_calipso, statfile, counts):
+    """Write cloud type statistics from counts (see count_calipso_stats_ctype)."""
     # Notice that we have unfortunately changed order in notation compared to cloud mask
     # Here the PPS category is mentioned first and then the CALIOP category
-
-    n_low_low = np.repeat(
-        imager_low,
-        np.logical_and(calipso_low, imager_low)).shape[0]
-    n_low_medium = np.repeat(
-        imager_low,
-        np.logical_and(calipso_medium, imager_low)).shape[0]
-    n_low_high = np.repeat(
-        imager_low,
-        np.logical_and(calipso_high, imager_low)).shape[0]
-    n_medium_low = np.repeat(
-        imager_medium,
-        np.logical_and(calipso_low, imager_medium)).shape[0]
-    n_medium_medium = np.repeat(
-        imager_medium,
-        np.logical_and(calipso_medium, imager_medium)).shape[0]
-    n_medium_high = np.repeat(
-        imager_medium,
-        np.logical_and(calipso_high, imager_medium)).shape[0]
-    n_high_low = np.repeat(
-        imager_high,
-        np.logical_and(calipso_low, imager_high)).shape[0]
-    n_high_medium = np.repeat(
-        imager_high,
-        np.logical_and(calipso_medium, imager_high)).shape[0]
-    n_high_high = np.repeat(
-        imager_high,
-        np.logical_and(calipso_high, imager_high)).shape[0]
-    n_cirrus_low = np.repeat(
-        imager_cirrus,
-        np.logical_and(calipso_low, imager_cirrus)).shape[0]
-    n_cirrus_medium_tp = np.repeat(
-        imager_cirrus,
-        np.logical_and(calipso_medium_tp, imager_cirrus)).shape[0]
-    n_cirrus_high_tp = np.repeat(
-        imager_cirrus,
-        np.logical_and(calipso_high_tp, imager_cirrus)).shape[0]
-    n_cirrus_medium_op = np.repeat(
-        imager_cirrus,
-        np.logical_and(calipso_medium_op, imager_cirrus)).shape[0]
-    n_cirrus_high_op = np.repeat(
-        imager_cirrus,
-        np.logical_and(calipso_high_op, imager_cirrus)).shape[0]
-    n_clear_low = np.repeat(
-        imager_clear,
-        np.logical_and(calipso_low, imager_clear)).shape[0]
-    n_clear_medium = np.repeat(
-        imager_clear,
-        np.logical_and(calipso_medium, imager_clear)).shape[0]
-    n_clear_high = np.repeat(
-        imager_clear,
-        np.logical_and(calipso_high, imager_clear)).shape[0]
-    n_low_clear = np.repeat(
-        imager_low,
-        np.logical_and(calipso_clear, imager_low)).shape[0]
-    n_medium_clear = np.repeat(
-        imager_medium,
-        np.logical_and(calipso_clear, imager_medium)).shape[0]
-    n_high_clear = np.repeat(
-        imager_high,
-        np.logical_and(calipso_clear, imager_high)).shape[0]
-    n_cirrus_clear = np.repeat(
-        imager_cirrus,
-        np.logical_and(calipso_clear, imager_cirrus)).shape[0]
+    (n_low_low, n_medium_low, n_high_low, n_cirrus_low, n_clear_low) = counts[0]
+    (n_low_medium, n_medium_medium, n_high_medium, dummy, n_clear_medium) = counts[1]
+    (n_low_high, n_medium_high, n_high_high, dummy, n_clear_high) = counts[2]
+    n_cirrus_medium_tp = counts[3][3]
+    n_cirrus_high_tp = counts[4][3]
+    n_cirrus_medium_op = counts[5][3]
+    n_cirrus_high_op = counts[6][3]
+    (n_low_clear, n_medium_clear, n_high_clear, n_cirrus_clear, dummy) = counts[7]
 
     pod_low = -9.0
     far_low = -9.0
@@ -817,21 +745,19 @@ def print_calipso_stats_ctype(match_calipso, statfile, val_subset, low_medium_hi
     if N_pps_cirrus > 0:
         far_cirrus = float(n_cirrus_low+n_cirrus_medium_op + n_cirrus_high_op)/N_pps_cirrus
 
-    statfile.write("CLOUD TYPE %s-IMAGER TABLE: %s %s %s %s %s %s %s %s %s %s %s %s %s %s\n" % (
-        match_calipso.truth_sat.upper(),
+    truth_sat = match_calipso.truth_sat.upper()
+    statfile.write_values("CLOUD TYPE %s-IMAGER TABLE" % truth_sat, [
         n_low_low, n_low_medium, n_low_high,
         n_medium_low, n_medium_medium, n_medium_high,
         n_high_low, n_high_medium, n_high_high,
         n_cirrus_low,
         n_cirrus_medium_tp, n_cirrus_high_tp,
-        n_cirrus_medium_op, n_cirrus_high_op))
-    statfile.write("CLOUD TYPE %s-IMAGER PROB: %0.2f %0.2f %0.2f %0.2f %0.2f %0.2f %0.2f \n" % (
-        match_calipso.truth_sat.upper(),
-        pod_low, pod_medium, pod_high, far_low, far_medium, far_high, far_cirrus))
-    statfile.write("CLOUD TYPE %s-IMAGER TABLE MISSED: %s %s %s %s %s %s %s \n" % (
-        match_calipso.truth_sat.upper(),
+        n_cirrus_medium_op, n_cirrus_high_op])
+    statfile.write_values("CLOUD TYPE %s-IMAGER PROB" % truth_sat, [
+        pod_low, pod_medium, pod_high, far_low, far_medium, far_high, far_cirrus], "%0.2f")
+    statfile.write_values("CLOUD TYPE %s-IMAGER TABLE MISSED" % truth_sat, [
         n_clear_low, n_clear_medium, n_clear_high,
-        n_low_clear, n_medium_clear, n_high_clear, n_cirrus_clear))
+        n_low_clear, n_medium_clear, n_high_clear, n_cirrus_clear])
 
 
 def print_height_all_low_medium_high(NAME, val_subset, statfile,
@@ -840,7 +766,7 @@ def print_height_all_low_medium_high(NAME, val_subset, statfile,
     """Print all CTTH statistics for one case (thin/thick/geostyle etc.)."""
     out_stats = calculate_ctth_stats(val_subset, imager_ctth_m_above_seasurface,
                                      truth_sat_validation_height, imager_is_cloudy)
-    statfile.write("CLOUD HEIGHT %s ALL: %s\n" % (NAME, out_stats))
+    statfile.write_values("CLOUD HEIGHT %s ALL" % (NAME), out_stats, CTTH_STATS_FORMAT)
     if low_medium_high_class is None:
         # Nothing more can be done!
         return
@@ -851,17 +777,17 @@ def print_height_all_low_medium_high(NAME, val_subset, statfile,
                                 val_subset)
     out_stats = calculate_ctth_stats(cal_low_ok, imager_ctth_m_above_seasurface,
                                      truth_sat_validation_height, imager_is_cloudy)
-    statfile.write("CLOUD HEIGHT %s LOW: %s \n" % (NAME, out_stats))
+    statfile.write_values("CLOUD HEIGHT %s LOW" % (NAME), out_stats, CTTH_STATS_FORMAT)
     cal_mid_ok = np.logical_and(low_medium_high_class['medium_clouds'],
                                 val_subset)
     out_stats = calculate_ctth_stats(cal_mid_ok, imager_ctth_m_above_seasurface,
                                      truth_sat_validation_height, imager_is_cloudy)
-    statfile.write("CLOUD HEIGHT %s MEDIUM: %s \n" % (NAME, out_stats))
+    statfile.write_values("CLOUD HEIGHT %s MEDIUM" % (NAME), out_stats, CTTH_STATS_FORMAT)
     cal_high_ok = np.logical_and(low_medium_high_class['high_clouds'],
                                  val_subset)
     out_stats = calculate_ctth_stats(cal_high_ok, imager_ctth_m_above_seasurface,
                                      truth_sat_validation_height, imager_is_cloudy)
-    statfile.write("CLOUD HEIGHT %s HIGH: %s \n" % (NAME, out_stats))
+    statfile.write_values("CLOUD HEIGHT %s HIGH" % (NAME), out_stats, CTTH_STATS_FORMAT)
 
 
 def print_stats_ctop(match_obj, statfile, val_subset, low_medium_high_class, SETTINGS):
@@ -1004,60 +930,108 @@ def print_main_stats(match_obj, statfile):
     """Print some geolocation and time information about the match."""
     val_object = getattr(match_obj, match_obj.truth_sat)
     num_val_data_ok = len(match_obj.diff_sec_1970)
-    statfile.write("%s min and max time diff: %3.2f %3.2f \n" % (
-        match_obj.truth_sat.upper(),
-        match_obj.diff_sec_1970.min(),
-        match_obj.diff_sec_1970.max()))
-    statfile.write("%s start and stop Latitude: %3.2f %3.2f \n" % (
-        match_obj.truth_sat.upper(),
-        val_object.latitude[0],
-        val_object.latitude[-1]))
-    statfile.write("%s start and stop Longitude: %3.2f %3.2f \n" % (
-        match_obj.truth_sat.upper(),
-        val_object.longitude[0],
-        val_object.longitude[-1]))
-    statfile.write("%s-IMAGER number of matches: %d\n" % (
-        match_obj.truth_sat.upper(),
-        num_val_data_ok))
+    truth_sat = match_obj.truth_sat.upper()
+    statfile.write_values("%s min and max time diff" % truth_sat,
+                          [match_obj.diff_sec_1970.min(), match_obj.diff_sec_1970.max()], "%3.2f")
+    statfile.write_values("%s start and stop Latitude" % truth_sat,
+                          [val_object.latitude[0], val_object.latitude[-1]], "%3.2f")
+    statfile.write_values("%s start and stop Longitude" % truth_sat,
+                          [val_object.longitude[0], val_object.longitude[-1]], "%3.2f")
+    statfile.write_values("%s-IMAGER number of matches" % truth_sat, [num_val_data_ok], "%d")
+
+
+def open_statistics_file(statfilename, SETTINGS):
+    """Open statistics file, stored as binary and also as text if WRITE_STATISTICS_TEXT_FILES."""
+    return StatisticsWriter(statfilename,
+                            write_text=SETTINGS.get('WRITE_STATISTICS_TEXT_FILES', False))
+
+
+def get_day_night_subset(daynight_flags, val_subset, dnt_flag=None):
+    """Combine *val_subset* with the day/night/twilight selection *dnt_flag*."""
+    (no_qflag, night_flag, twilight_flag,
+     day_flag, all_dnt_flag) = daynight_flags
+
+    if dnt_flag is None:
+        logger.debug('dnt_flag = %s', 'ALL PIXELS')
+        dnt_subset = np.logical_and(val_subset, all_dnt_flag)
+    elif dnt_flag.upper() == 'DAY':
+        logger.debug('dnt_flag = %s', dnt_flag.upper())
+        dnt_subset = np.logical_and(val_subset, day_flag)
+    elif dnt_flag.upper() == 'NIGHT':
+        logger.debug('dnt_flag = %s', dnt_flag.upper())
+        dnt_subset = np.logical_and(val_subset, night_flag)
+    elif dnt_flag.upper() == 'TWILIGHT':
+        logger.debug('dnt_flag = %s', dnt_flag.upper())
+        dnt_subset = np.logical_and(val_subset, twilight_flag)
+    else:
+        raise ProcessingError("Unknown DNT-flag %s" % (dnt_flag.upper()))
+    return dnt_subset
+
+
+def get_subsets_for_modes(match_obj, modes_dnt, SETTINGS):
+    """Find the selection of pixels for several (mode, dnt_flag) pairs.
+
+    Returns the indices in *modes_dnt* of the modes that could be run,
+    and a boolean mask matrix (n_modes_ok, n_pixels) with their selection.
+    Each mode and the day/night information are only calculated once.
+
+    """
+    subsets = {}
+    daynight_flags = None
+    modes_ok = []
+    mode_subsets = []
+    for ind, (mode, dnt_flag) in enumerate(modes_dnt):
+        if mode not in subsets:
+            subsets[mode] = get_subset_for_mode(match_obj, mode)
+        if subsets[mode] is None:
+            continue
+        if daynight_flags is None:
+            daynight_flags = get_day_night_info(match_obj, SETTINGS)
+        modes_ok.append(ind)
+        mode_subsets.append(get_day_night_subset(daynight_flags, subsets[mode], dnt_flag))
+    return modes_ok, np.array(mode_subsets, dtype=bool)
 
 
 def calculate_statistics(mode, statfilename, match_calipso, match_clsat, match_iss, match_amsr, match_synop,
                          SETTINGS,
                          dnt_flag=None):
     """Calculate all requested statistics, for all matches with one imager cloudproduct file (main function)."""
+    calculate_statistics_for_modes([(mode, dnt_flag)], [statfilename],
+                                   match_calipso, match_clsat, match_iss, match_amsr, match_synop,
+                                   SETTINGS)
 
-    def get_day_night_subset(match_obj, val_subset, SETTINGS):
-        (no_qflag, night_flag, twilight_flag,
-         day_flag, all_dnt_flag) = get_day_night_info(match_obj, SETTINGS)
-
-        if dnt_flag is None:
-            logger.debug('dnt_flag = %s', 'ALL PIXELS')
-            dnt_subset = np.logical_and(val_subset, all_dnt_flag)
-        elif dnt_flag.upper() == 'DAY':
-            logger.debug('dnt_flag = %s', dnt_flag.upper())
-            dnt_subset = np.logical_and(val_subset, day_flag)
-        elif dnt_flag.upper() == 'NIGHT':
-            logger.debug('dnt_flag = %s', dnt_flag.upper())
-            dnt_subset = np.logical_and(val_subset, night_flag)
-        elif dnt_flag.upper() == 'TWILIGHT':
-            logger.debug('dnt_flag = %s', dnt_flag.upper())
-            dnt_subset = np.logical_and(val_subset, twilight_flag)
-        else:
-            raise ProcessingError("Unknown DNT-flag %s" % (dnt_flag.upper()))
-        return dnt_subset
+
+def calculate_statistics_for_modes(modes_dnt, statfilenames,
+                                   match_calipso, match_clsat, match_iss, match_amsr, match_synop,
+                                   SETTINGS):
+    """Calculate all requested statistics for several modes.
+
+    *modes_dnt* is a list of (mode, dnt_flag) and *statfilenames* the
+    corresponding result files. The pixel selections for all modes are
+    built once, and the cloud mask, cloud type and cloud phase tables
+    for all modes are counted in one pass.
+
+    """
 
     if match_clsat is not None:
         logger.info("Cloudsat Statistics")
-        val_subset = get_subset_for_mode(match_clsat, mode)
-        if val_subset is not None:
-            val_subset = get_day_night_subset(match_clsat, val_subset, SETTINGS)
-            statfile = open(statfilename.replace('xxx', 'cloudsat'), "w")
+        modes_ok, mode_subsets = get_subsets_for_modes(match_clsat, modes_dnt, SETTINGS)
+        if len(modes_ok) > 0 and match_clsat.cloudsat.all_arrays['cloud_fraction'] is not None:
+            low_medium_high_class = get_cloudsat_low_medium_high_classification(match_clsat)
+            cmask_counts = count_cmask_stats(match_clsat, mode_subsets, SETTINGS)
+            cmask_prob_counts = count_cmask_prob_stats(match_clsat, mode_subsets, SETTINGS)
+            modis_counts = count_modis_stats(match_clsat, mode_subsets,
+                                             match_clsat.cloudsat.MODIS_cloud_flag, SETTINGS)
+        for ind_ok, ind in enumerate(modes_ok):
+            val_subset = mode_subsets[ind_ok]
+            statfile = open_statistics_file(statfilenames[ind].replace('xxx', 'cloudsat'), SETTINGS)
             if match_clsat.cloudsat.all_arrays['cloud_fraction'] is not None:
-                low_medium_high_class = get_cloudsat_low_medium_high_classification(match_clsat)
                 print_main_stats(match_clsat, statfile)
-                print_cmask_stats(match_clsat, statfile, val_subset, SETTINGS)
-                print_cmask_prob_stats(match_clsat, statfile, val_subset, SETTINGS)
-                print_modis_stats(match_clsat, statfile, val_subset, match_clsat.cloudsat.MODIS_cloud_flag, SETTINGS)
+                write_cmask_stats(match_clsat, statfile, cmask_counts[ind_ok])
+                if cmask_prob_counts is not None:
+                    write_cmask_prob_stats(match_clsat, statfile, cmask_prob_counts[ind_ok])
+                if modis_counts is not None:
+                    write_modis_stats(match_clsat, statfile, modis_counts[ind_ok])
                 print_stats_ctop(match_clsat, statfile, val_subset, low_medium_high_class, SETTINGS)
             if match_clsat.cloudsat.all_arrays['RVOD_liq_water_path'] is not None:
                 print_cpp_lwp_stats(match_clsat, statfile, val_subset)
@@ -1065,50 +1039,67 @@ def calculate_statistics(mode, statfilename, match_calipso, match_clsat, match_i
 
     if match_calipso is not None:
         logger.info("Calipo Statistics")
-        val_subset = get_subset_for_mode(match_calipso, mode)
-        if val_subset is not None:
-            statfile = open(statfilename.replace('xxx', 'calipso'), "w")
+        modes_ok, mode_subsets = get_subsets_for_modes(match_calipso, modes_dnt, SETTINGS)
+        if len(modes_ok) > 0:
             low_medium_high_class = get_calipso_low_medium_high_classification(match_calipso)
             # semi_flag, opaque_flag = get_semi_opaque_info(match_calipso)
-            val_subset = get_day_night_subset(match_calipso, val_subset, SETTINGS)
+            cmask_counts = count_cmask_stats(match_calipso, mode_subsets, SETTINGS)
+            cmask_prob_counts = count_cmask_prob_stats(match_calipso, mode_subsets, SETTINGS)
+            modis_counts = count_modis_stats(match_calipso, mode_subsets,
+                                             match_calipso.calipso.cal_modis_cflag, SETTINGS)
+            ctype_counts = count_calipso_stats_ctype(match_calipso, mode_subsets,
+                                                     low_medium_high_class, SETTINGS)
+            cpp_counts = count_cpp_stats(match_calipso, mode_subsets, SETTINGS)
+        for ind_ok, ind in enumerate(modes_ok):
+            val_subset = mode_subsets[ind_ok]
+            statfile = open_statistics_file(statfilenames[ind].replace('xxx', 'calipso'), SETTINGS)
             print_main_stats(match_calipso, statfile)
-            print_cmask_stats(match_calipso, statfile, val_subset, SETTINGS)
-            print_cmask_prob_stats(match_calipso, statfile, val_subset, SETTINGS)
-            print_modis_stats(match_calipso, statfile, val_subset, match_calipso.calipso.cal_modis_cflag, SETTINGS)
-            print_calipso_stats_ctype(match_calipso, statfile, val_subset, low_medium_high_class, SETTINGS)
+            write_cmask_stats(match_calipso, statfile, cmask_counts[ind_ok])
+            if cmask_prob_counts is not None:
+                write_cmask_prob_stats(match_calipso, statfile, cmask_prob_counts[ind_ok])
+            if modis_counts is not None:
+                write_modis_stats(match_calipso, statfile, modis_counts[ind_ok])
+            if ctype_counts is not None:
+                write_calipso_stats_ctype(match_calipso, statfile, ctype_counts[ind_ok])
             print_stats_ctop(match_calipso, statfile, val_subset, low_medium_high_class, SETTINGS)
-            print_cpp_stats(match_calipso, statfile, val_subset, SETTINGS)
+            if cpp_counts is not None:
+                write_cpp_stats(match_calipso, statfile, cpp_counts[ind_ok])
             statfile.close()
 
     if match_iss is not None:
-        val_subset = get_subset_for_mode(match_iss, mode)
-        if val_subset is not None:
-            statfile = open(statfilename.replace('xxx', 'iss'), "w")
-            val_subset = get_day_night_subset(match_iss, val_subset, SETTINGS)
+        modes_ok, mode_subsets = get_subsets_for_modes(match_iss, modes_dnt, SETTINGS)
+        if len(modes_ok) > 0:
+            cmask_counts = count_cmask_stats(match_iss, mode_subsets, SETTINGS)
+            cmask_prob_counts = count_cmask_prob_stats(match_iss, mode_subsets, SETTINGS)
+        for ind_ok, ind in enumerate(modes_ok):
+            statfile = open_statistics_file(statfilenames[ind].replace('xxx', 'iss'), SETTINGS)
             print_main_stats(match_iss, statfile)
-            print_cmask_stats(match_iss, statfile, val_subset, SETTINGS)
-            print_cmask_prob_stats(match_iss, statfile, val_subset, SETTINGS)
-            # print_calipso_stats_ctype(match_iss, statfile, val_subset, cal_vert_feature)
-            print_stats_ctop(match_iss, statfile, val_subset, None, SETTINGS)
+            write_cmask_stats(match_iss, statfile, cmask_counts[ind_ok])
+            if cmask_prob_counts is not None:
+                write_cmask_prob_stats(match_iss, statfile, cmask_prob_counts[ind_ok])
+            # write_calipso_stats_ctype(match_iss, statfile, ctype_counts[ind_ok])
+            print_stats_ctop(match_iss, statfile, mode_subsets[ind_ok], None, SETTINGS)
             statfile.close()
 
     if match_amsr is not None:
         logger.info("AMSR-E Statistics")
-        val_subset = get_subset_for_mode(match_amsr, mode)
-        if val_subset is not None:
-            val_subset = get_day_night_subset(match_amsr, val_subset, SETTINGS)
-            statfile = open(statfilename.replace('xxx', 'amsr'), "w")
+        modes_ok, mode_subsets = get_subsets_for_modes(match_amsr, modes_dnt, SETTINGS)
+        for ind_ok, ind in enumerate(modes_ok):
+            statfile = open_statistics_file(statfilenames[ind].replace('xxx', 'amsr'), SETTINGS)
             print_main_stats(match_amsr, statfile)
-            print_cpp_lwp_stats(match_amsr, statfile, val_subset)
+            print_cpp_lwp_stats(match_amsr, statfile, mode_subsets[ind_ok])
             statfile.close()
 
     if match_synop is not None:
         logger.info("SYNOP Statistics")
-        val_subset = get_subset_for_mode(match_synop, mode)
-        if val_subset is not None:
-            val_subset = get_day_night_subset(match_synop, val_subset, SETTINGS)
-            statfile = open(statfilename.replace('xxx', 'synop'), "w")
+        modes_ok, mode_subsets = get_subsets_for_modes(match_synop, modes_dnt, SETTINGS)
+        if len(modes_ok) > 0:
+            cmask_counts = count_cmask_stats(match_synop, mode_subsets, SETTINGS)
+            cmask_prob_counts = count_cmask_prob_stats(match_synop, mode_subsets, SETTINGS)
+        for ind_ok, ind in enumerate(modes_ok):
+            statfile = open_statistics_file(statfilenames[ind].replace('xxx', 'synop'), SETTINGS)
             print_main_stats(match_synop, statfile)
-            print_cmask_stats(match_synop, statfile, val_subset, SETTINGS)
-            print_cmask_prob_stats(match_synop, statfile, val_subset, SETTINGS)
+            write_cmask_stats(match_synop, statfile, cmask_counts[ind_ok])
+            if cmask_prob_counts is not None:
+                write_cmask_prob_stats(match_synop, statfile, cmask_prob_counts[ind_ok])
             statfile.close()
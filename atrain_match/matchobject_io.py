@@ -50,18 +50,18 @@ class DataObject(object):
         else:
             self.all_arrays[name] = value
 
-    def __add__(self, other):
-        """Adding two objects together"""
-        # Check if we have an empty object
+    def is_empty(self):
+        """Check if we have an empty object."""
         # modis objects does not have longitude attribute
-        is_empty_self = True
-        is_empty_other = True
         for key in self.all_arrays.keys():
             if self.all_arrays[key] is not None and len(self.all_arrays[key]) > 0:
-                is_empty_self = False
-        for key in other.all_arrays.keys():
-            if other.all_arrays[key] is not None and len(other.all_arrays[key]) > 0:
-                is_empty_other = False
+                return False
+        return True
+
+    def __add__(self, other):
+        """Adding two objects together"""
+        is_empty_self = self.is_empty()
+        is_empty_other = other.is_empty()
         if is_empty_self:
             # print("First object is None!, returning second object")
             return other
@@ -424,6 +424,60 @@ class TruthImagerTrackObject:
         return self
 
 
+def concatenate_arrays(values):
+    """Concatenate *values* once, with the same result as adding them pairwise.
+
+    Adding objects one by one copies all data already concatenated each time,
+    this collects the chunks and calls np.concatenate only once. The rules
+    of DataObject.__add__ are kept: values that can not be concatenated
+    replace what was collected so far, and arrays with more than two
+    dimensions are not concatenated.
+
+    """
+    chunks = [values[0]]
+    for value in values[1:]:
+        first = chunks[0]
+        if not hasattr(first, 'ndim'):
+            chunks = [value]
+        elif first.ndim not in [1, 2]:
+            continue
+        elif (hasattr(value, 'ndim') and value.ndim == first.ndim and
+              value.shape[1:] == first.shape[1:]):
+            chunks.append(value)
+        else:
+            chunks = [value]
+    if len(chunks) == 1:
+        return chunks[0]
+    return np.concatenate(chunks, 0)
+
+
+def concatenate_data_objects(data_objects):
+    """Concatenate a list of DataObjects, same as sum(data_objects)."""
+    data_objects = [obj for obj in data_objects if not obj.is_empty()] or data_objects[-1:]
+    retv = data_objects[0]
+    for key in retv.all_arrays:
+        retv.all_arrays[key] = concatenate_arrays(
+            [obj.all_arrays.get(key) for obj in data_objects])
+    return retv
+
+
+def concatenate_truth_imager_match_objs(match_objs):
+    """Concatenate a list of TruthImagerTrackObjects.
+
+    Gives the same result as adding them together one by one, but each
+    array is only copied once.
+
+    """
+    retv = match_objs[0]
+    for object_name in ['imager', 'calipso', 'calipso_aerosol', 'amsr',
+                        'cloudsat', 'iss', 'mora', 'synop', 'modis_lvl2', 'modis', 'extra']:
+        if hasattr(retv, object_name):
+            setattr(retv, object_name, concatenate_data_objects(
+                [getattr(obj, object_name) for obj in match_objs]))
+    retv.diff_sec_1970 = concatenate_arrays([obj.diff_sec_1970 for obj in match_objs])
+    return retv
+
+
 def get_stuff_to_read_from_a_reshaped_file(h5file, retv):
     h5_groups = []
     data_objects = []
@@ -474,35 +528,147 @@ def get_stuff_to_read_from_a_reshaped_file(h5file, retv):
     return (h5_groups, data_objects)
 
 
+# Groups in reshaped files that hold the imager data
+IMAGER_GROUP_NAMES = ['pps', 'cci', 'maia', 'oca', 'patmosx']
+
+
+def get_h5_group_name(h5file, group_name):
+    """Name of *group_name* in *h5file*, 'imager' is any of the imager groups."""
+    if group_name == 'imager':
+        for imager_group_name in IMAGER_GROUP_NAMES:
+            if imager_group_name in h5file:
+                return imager_group_name
+    return group_name
+
+
+class MatchRowFilter(object):
+    """Selection of rows when reading reshaped matchup files.
+
+    Each condition is a range or a list of allowed values for a dataset in
+    a group of the file. The group 'imager' is any of the imager groups.
+    Ranges include their limits, a range with min_value > max_value wraps
+    around (e.g. longitudes across the date line).
+    Only the datasets in the conditions are read to find the rows.
+
+    """
+
+    def __init__(self, truth='calipso', time_range=None, lat_range=None, lon_range=None,
+                 sunz_range=None, surface_type=None):
+        self.conditions = []
+        if time_range is not None:
+            self.add_range(truth, 'sec_1970', *time_range)
+        if lat_range is not None:
+            self.add_range(truth, 'latitude', *lat_range)
+        if lon_range is not None:
+            self.add_range(truth, 'longitude', *lon_range)
+        if sunz_range is not None:
+            self.add_range('imager', 'sunz', *sunz_range)
+        if surface_type is not None:
+            # surface_type is (dataset, list of surface types)
+            self.add_values(truth, *surface_type)
+
+    def add_range(self, group, dataset, min_value=None, max_value=None):
+        self.conditions.append((group, dataset, 'range', (min_value, max_value)))
+
+    def add_values(self, group, dataset, values):
+        self.conditions.append((group, dataset, 'values', list(values)))
+
+    def get_rows(self, h5file):
+        """Get index of the selected rows in *h5file*."""
+        selected = None
+        for group, dataset, kind, limits in self.conditions:
+            data = h5file[get_h5_group_name(h5file, group)][dataset][...]
+            if kind == 'values':
+                selection = np.in1d(data, limits)
+            else:
+                min_value, max_value = limits
+                over_min = np.ones(data.shape, dtype=bool) if min_value is None else data >= min_value
+                under_max = np.ones(data.shape, dtype=bool) if max_value is None else data <= max_value
+                if None not in limits and min_value > max_value:
+                    selection = np.logical_or(over_min, under_max)
+                else:
+                    selection = np.logical_and(over_min, under_max)
+            if selected is None:
+                selected = selection
+            else:
+                selected = np.logical_and(selected, selection)
+        if selected is None:
+            return None
+        return np.flatnonzero(selected)
+
+
+def read_h5_rows(h5_dataset, rows=None):
+    """Read the *rows* (sorted index, None for all) of *h5_dataset*.
+
+    A contiguous selection, or a dense one, is read as one hyperslab,
+    a sparse selection with HDF5 point selection.
+
+    """
+    if rows is None or h5_dataset.ndim == 0:
+        return h5_dataset[...]
+    if len(rows) == 0:
+        return h5_dataset[0:0]
+    first, last = rows[0], rows[-1] + 1
+    if last - first == len(rows):
+        return h5_dataset[first:last]
+    if len(rows) > 0.1 * (last - first):
+        return h5_dataset[first:last][rows - first]
+    return h5_dataset[rows]
+
+
 def read_truth_imager_match_obj(filename, truth='calipso',
                                 read_all=True,
                                 read_var=[],
-                                skip_var=[]):
+                                skip_var=[],
+                                columns=None,
+                                row_filter=None):
+    """Read a reshaped matchup file.
+
+    *columns* is a dict with a list of datasets to read for each group,
+    groups not in *columns* are not read (None reads all groups). The group
+    'imager' is any of the imager groups. With a `MatchRowFilter`
+    *row_filter* only the selected rows are read.
+
+    """
     retv = TruthImagerTrackObject(truth=truth)
     h5file = h5py.File(filename, 'r')
+    rows = None
+    if row_filter is not None:
+        rows = row_filter.get_rows(h5file)
+    if columns is not None:
+        columns = dict((get_h5_group_name(h5file, group_name), group_columns)
+                       for group_name, group_columns in columns.items())
     (h5_groups, data_objects) = get_stuff_to_read_from_a_reshaped_file(h5file, retv)
     for group, data_obj in zip(h5_groups, data_objects):
+        group_name = group.name.strip('/')
+        if columns is not None and group_name not in columns:
+            continue
         for dataset in group.keys():
             if dataset in skip_var:
                 continue
+            if columns is not None and dataset not in columns[group_name]:
+                continue
             if (read_all or dataset in read_var or
                     (len(read_var) == 0 and dataset.data_obj.all_arrays.keys())):
                 atrain_match_name = dataset
                 if atrain_match_name in ["snow_ice_surface_type"]:
                     atrain_match_name = "nsidc_surface_type"
-                setattr(data_obj, atrain_match_name, group[dataset][...])
-    retv.diff_sec_1970 = h5file['diff_sec_1970'][...]
+                setattr(data_obj, atrain_match_name, read_h5_rows(group[dataset], rows))
+    retv.diff_sec_1970 = read_h5_rows(h5file['diff_sec_1970'], rows)
     h5file.close()
     return retv
 
 
-def read_files(files, truth='calipso', read_all=True, read_var=[], skip_var=[]):
-    my_files = files.copy()
-    tObj = read_truth_imager_match_obj(my_files.pop(), truth=truth, read_all=read_all, read_var=read_var, skip_var=skip_var)
-    if len(my_files) > 0:
-        for filename in my_files:
-            tObj += read_truth_imager_match_obj(filename, truth=truth, read_all=read_all, read_var=read_var, skip_var=skip_var)
-    return tObj
+def read_files(files, truth='calipso', read_all=True, read_var=[], skip_var=[],
+               columns=None, row_filter=None):
+    my_files = list(files)
+    # Last file first, as always done
+    my_files = [my_files.pop()] + my_files
+    match_objs = [read_truth_imager_match_obj(filename, truth=truth, read_all=read_all,
+                                              read_var=read_var, skip_var=skip_var,
+                                              columns=columns, row_filter=row_filter)
+                  for filename in my_files]
+    return concatenate_truth_imager_match_objs(match_objs)
 
 
 # write matchup files
@@ -29,7 +29,7 @@ from atrain_match.utils.runutils import parse_scenesfile_reshaped
 from atrain_match.utils.common import Cross
 from atrain_match.libs import truth_imager_match
 import atrain_match.config as config
-from atrain_match.utils.common import MatchupError
+from atrain_match.utils.scheduler import run_crosses, log_run_summary, RunManifest, get_manifest_task
 import logging
 logging.basicConfig(
     format='%(levelname)s |%(asctime)s|: %(message)s',
@@ -39,7 +39,8 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def process_matchups(matchups, reprocess=False, debug=False):
+def process_matchups(matchups, reprocess=False, debug=False, workers=1, log_dir=None,
+                     resume=False):
     """
     Run the given *matchups* through the validation system.
 
@@ -47,42 +48,25 @@ def process_matchups(matchups, reprocess=False, debug=False):
 
     If *reprocess* is True, disregard any previously generated matchup files.
 
+    The crosses are processed in *workers* parallel processes. If *log_dir*
+    is given, the log for each cross is written to a file in *log_dir*.
+
+    The result of each cross is recorded in the run manifest
+    (config.RUN_MANIFEST_FILE). With *resume*, crosses that are already
+    done according to the manifest are skipped. The time and memory use of
+    each processing stage is written to config.STAGE_TIMING_FILE.
+
     """
 
     from atrain_match.utils.runutils import read_config_info
     AM_PATHS, SETTINGS = read_config_info()
 
-    problematic = set()
-    no_matchup_files = []
-    outstatus = 0
-    for match in matchups:
-        try:
-            truth_imager_match.run(match, AM_PATHS, SETTINGS, reprocess)
-        except MatchupError as err:
-            logger.warning("Matchup problem: %s", str(err))
-            import traceback
-            traceback.print_exc()
-            no_matchup_files.append(match)
-            outstatus = 5
-        except:
-            import traceback
-            outstatus = 5
-            traceback.print_exc()
-            problematic.add(match)
-            logger.warning("Couldn't run truth_imager_match.")
-            if debug is True:
-                raise
-
-    if len(no_matchup_files) > 0:
-        logger.warning(
-            "%d of %d cases had no matchups in region, within the time window:\n%s",
-            len(no_matchup_files), len(matchups),
-            '\n'.join([str(m) for m in no_matchup_files]))
-    if len(problematic) > 0:
-        logger.warning("%d of %d cases had unknown problems:\n%s",
-                       len(problematic), len(matchups),
-                       '\n'.join([str(m) for m in problematic]))
-    return outstatus
+    manifest = RunManifest(config.RUN_MANIFEST_FILE, get_manifest_task('match', AM_PATHS, SETTINGS))
+    results = run_crosses(truth_imager_match.run, matchups, (AM_PATHS, SETTINGS, reprocess),
+                          workers=workers, log_dir=log_dir, debug=debug,
+                          manifest=manifest, resume=resume,
+                          timing_file=config.STAGE_TIMING_FILE)
+    return log_run_summary(results)
 
 
 def main():
@@ -103,6 +87,13 @@ def main():
                         "Calipso-IMAGER matchup files.")
     parser.add_argument('-d', '--debug', const=True, nargs='?', required=False,
                         help="Get debug logging")
+    parser.add_argument('--workers', '-w', type=int, default=1, required=False,
+                        help="Number of crosses to process in parallel")
+    parser.add_argument('--log_dir', '-l', type=str, required=False,
+                        help="Write the log for each cross to a file in LOG_DIR")
+    parser.add_argument('--resume', const=True, nargs='?', required=False,
+                        help="Skip crosses already done according to the run manifest, "
+                        "only run new and failed crosses")
     group.add_argument('--pps_okay_scene', '-os',
                        help="Interpret arguments noaa19_20101201_1345_27891")
     group.add_argument('--pps_product_file', '-pf',
@@ -170,7 +161,9 @@ def main():
                 # print time
                 matchups.append(Cross(satname, time))
 
-    process_matchups(matchups, reprocess, options.debug)
+    process_matchups(matchups, reprocess, options.debug,
+                     workers=options.workers, log_dir=options.log_dir,
+                     resume=options.resume is not None)
 
     return 0
 
@@ -264,6 +264,7 @@ temp_obj.cotfilt_value = pplot_obj.flattice.cotfilt_value
 temp_obj.isGAC = pplot_obj.flattice.isGAC
 
 num = 0
+cells = np.zeros(0, dtype=np.int32)
 for filename in files:
     print(os.path.basename(filename))
 
@@ -291,29 +292,33 @@ for filename in files:
     except:
         print("skipping file %s" % (filename))
         continue
+    # Lattice cells are cached for each file
+    cells_new = pplot_obj.get_lattice_cells(match_calipso_new, filename)
     if num_files_to_read == 1:
         print("Get info from one file!")
         temp_obj.get_some_info_from_caobj(match_calipso_new, PROCES_FOR_ART=PROCES_FOR_ART,
                                           PROCES_FOR_PRESSENTATIONS=PROCES_FOR_PRESSENTATIONS)
         print("Got info, now remap to the lattice")
-        pplot_obj.add_detection_stats_on_fib_lattice(temp_obj)
+        pplot_obj.add_detection_stats_on_fib_lattice(temp_obj, cells=cells_new)
     elif num > num_files_to_read:
         print("Get info from some %d files!" % (num_files_to_read))
         temp_obj.get_some_info_from_caobj(match_calipso, PROCES_FOR_ART=PROCES_FOR_ART,
                                           PROCES_FOR_PRESSENTATIONS=PROCES_FOR_PRESSENTATIONS)
         print("got info, now remap to the lattice")
-        pplot_obj.add_detection_stats_on_fib_lattice(temp_obj)
+        pplot_obj.add_detection_stats_on_fib_lattice(temp_obj, cells=cells)
         print("Got info from some files!")
         match_calipso = match_calipso_new
+        cells = cells_new
         num = 0
     else:
         match_calipso = match_calipso + match_calipso_new
+        cells = np.concatenate([cells, cells_new])
 
 # Get info from the last files too
 if num_files_to_read != 1:
     print("Get info from last files!")
     temp_obj.get_some_info_from_caobj(match_calipso, PROCES_FOR_ART=PROCES_FOR_ART)
-    pplot_obj.add_detection_stats_on_fib_lattice(temp_obj)
+    pplot_obj.add_detection_stats_on_fib_lattice(temp_obj, cells=cells)
 
 pplot_obj.flattice.calculate_ctth_pe1()
 pplot_obj.flattice.remap_and_plot_score_on_several_areas(vmin=0, vmax=100.0, score='ctth_pe1')
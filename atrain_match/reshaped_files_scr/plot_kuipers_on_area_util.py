@@ -17,14 +17,15 @@
 # along with atrain_match.  If not, see <http://www.gnu.org/licenses/>.
 import numpy as np
 import copy
+import json
+import hashlib
+import logging
 import h5py
-from pyresample.geometry import SwathDefinition
-from pyresample.kd_tree import get_neighbour_info
-from pyresample.kd_tree import get_sample_from_neighbour_info
 from pyresample.kd_tree import resample_nearest
 from pyresample import geometry
 from pyresample.geometry import AreaDefinition
 import cartopy.crs as ccrs
+import atrain_match.config as config
 from atrain_match.config import AREA_CONFIG_FILE_PLOTS_ON_AREA
 from pyresample import load_area
 # import pyresample as pr
@@ -32,6 +33,7 @@ import os
 import matplotlib
 from scipy.interpolate import griddata
 from scipy import ndimage
+from scipy.spatial import cKDTree
 import matplotlib.pyplot as plt
 # matplotlib.use("TkAgg")
 from atrain_match.matchobject_io import DataObject
@@ -41,6 +43,8 @@ from atrain_match.utils.get_flag_info import (get_calipso_low_clouds,
                                               get_calipso_high_clouds)
 matplotlib.rcParams.update({'font.size': 30})
 
+logger = logging.getLogger(__name__)
+
 COMPRESS_LVL = 6
 cots = [0.0, 0.05, 0.10, 0.15, 0.20, 0.25, 0.30, 0.35, 0.40,
         0.45, 0.50, 0.60, 0.70, 0.80, 0.90, 1.0, 2.0, 3.0, 4.0, 5.0]
@@ -573,7 +577,8 @@ class StatsOnFibonacciLattice(DataObject):
 
     def set_flattice(self, radius_km=200):
         self.radius_km = radius_km
-        self.lons, self.lats = get_fibonacci_spread_points_on_earth(radius_km=radius_km)
+        lattice_index = get_lattice_index(radius_km)
+        self.lons, self.lats = lattice_index.lons, lattice_index.lats
         fig = plt.figure(figsize=(36, 18))
         #ax = fig.add_subplot(111)
         #plt.plot(self.lons, self.lats, 'b*')
@@ -1126,24 +1131,39 @@ class PerformancePlottingObject:
     def __init__(self):
         self.flattice = StatsOnFibonacciLattice()
 
-    def add_detection_stats_on_fib_lattice(self, my_obj):
+    def get_lattice_cells(self, match_obj, filename=None):
+        """Get the lattice cell of each matchup in *match_obj*.
+
+        If the matchups are read from reshaped file *filename* the cells
+        are cached for the file, and reused for other scores and methods.
+
+        """
+        lattice_index = get_lattice_index(self.flattice.radius_km)
+        lons = match_obj.imager.longitude
+        lats = match_obj.imager.latitude
+        if filename is None:
+            return lattice_index.get_cells(lons, lats)
+        return lattice_index.get_cells_for_file(filename, lons, lats)
+
+    def add_detection_stats_on_fib_lattice(self, my_obj, cells=None):
+        """Add the stats in *my_obj* to the lattice.
+
+        *cells* are the lattice cells of the match object my_obj was
+        made from, see get_lattice_cells. If None they are calculated.
+
+        """
         # Start with the area and get lat and lon to calculate the stats:
         if len(my_obj.longitude) == 0:
             print("Skipping file, no matches !")
             return
         lats = self.flattice.lats[:]
-        max_distance = self.flattice.radius_km*1000*2.5
-        area_def = SwathDefinition(*(self.flattice.lons,
-                                     self.flattice.lats))
-        target_def = SwathDefinition(*(my_obj.longitude,
-                                       my_obj.latitude))
-        valid_in, valid_out, indices, distances = get_neighbour_info(
-            area_def, target_def, radius_of_influence=max_distance,
-            epsilon=100, neighbours=1)
-        cols = get_sample_from_neighbour_info('nn', target_def.shape,
-                                              np.array(range(0, len(lats))),
-                                              valid_in, valid_out,
-                                              indices)
+        if cells is None:
+            cols = get_lattice_index(self.flattice.radius_km).get_cells(my_obj.longitude,
+                                                                         my_obj.latitude)
+        else:
+            cols = cells[my_obj.use]
+        # Pixels not matched to the lattice are not used
+        valid_out = cols >= 0
         cols = cols[valid_out]
         detected_clouds = my_obj.detected_clouds[valid_out]
         detected_clear = my_obj.detected_clear[valid_out]
@@ -1175,79 +1195,81 @@ class PerformancePlottingObject:
         height_bias_high = my_obj.height_bias_high[valid_out]
         lapse_bias_high = my_obj.lapse_bias_high[valid_out]
         is_clear = np.logical_or(detected_clear, false_clouds)
-        # lets make things faster, I'm tired of waiting!
-        cols[distances > max_distance] = -9  # don't use pixles matched too far away!
         import time
         tic = time.time()
-        arr, counts = np.unique(cols, return_index=False, return_counts=True)
-        for d in arr[arr > 0]:
-            use = cols == d
-            ind = np.where(use)[0]
-            # if ind.any():
-            self.flattice.num_false_clouds[d] += np.sum(false_clouds[ind])
-            self.flattice.num_detected_clouds[d] += np.sum(detected_clouds[ind])
-            self.flattice.num_detected_clear[d] += np.sum(detected_clear[ind])
-            self.flattice.num_undetected_clouds[d] += np.sum(undetected_clouds[ind])
-            self.flattice.num_new_false_clouds[d] += np.sum(new_false_clouds[ind])
-            self.flattice.num_new_detected_clouds[d] += np.sum(new_detected_clouds[ind])
-            self.flattice.num_detected_height_low[d] += np.sum(detected_height_low[ind])
-            self.flattice.num_detected_height_high[d] += np.sum(detected_height_high[ind])
-            self.flattice.num_detected_height[d] += np.sum(detected_height[ind])
-            self.flattice.num_detected_height_both[d] += np.sum(detected_height_both[ind])
-            self.flattice.sum_ctth_bias_low[d] += np.sum(height_bias_low[ind])
-            self.flattice.sum_ctth_mae_low[d] += np.sum(np.abs(height_bias_low[ind]))
-            self.flattice.sum_ctth_mae[d] += np.sum(np.abs(height_bias[ind]))
-            self.flattice.num_ctth_error_above_1km[d] += np.sum(np.abs(height_bias[ind]) > 1000)
-            self.flattice.sum_ctth_mae_diff[d] += np.sum(height_mae_diff[ind])
-            self.flattice.sum_lapse_bias_low[d] += np.sum(lapse_bias_low[ind])
-            self.flattice.sum_ctth_bias_high[d] += np.sum(height_bias_high[ind])
-            self.flattice.sum_ctth_mae_high[d] += np.sum(np.abs(height_bias_high[ind]))
-            self.flattice.sum_lapse_bias_high[d] += np.sum(lapse_bias_high[ind])
-            self.flattice.sum_ctth_bias_temperature_low[d] += np.sum(temperature_bias_low[ind])
-            self.flattice.sum_ctth_bias_temperature_low_t11[d] += np.sum(temperature_bias_low_t11[ind])
-            self.flattice.Min_lapse_rate[d] = np.min([self.flattice.Min_lapse_rate[d],
-                                                      np.min(lapse_rate[ind])])
-            if np.sum(is_clear[ind]) > 0:
-                self.flattice.Min_t11ts_offset[d] = np.min([self.flattice.Min_t11ts_offset[d],
-                                                            np.percentile(t11ts_offset[ind][is_clear[ind]], 5)])
-                self.flattice.Max_t11t12_offset[d] = np.max([self.flattice.Max_t11t12_offset[d],
-                                                             np.percentile(t11t12_offset[ind][is_clear[ind]], 95)])
-                self.flattice.Max_t37t12_offset[d] = np.max([self.flattice.Max_t37t12_offset[d],
-                                                             np.percentile(t37t12_offset[ind][is_clear[ind]], 95)])
-                self.flattice.Max_t11t37_offset[d] = np.max([self.flattice.Max_t11t37_offset[d],
-                                                             np.percentile(t11t37_offset[ind][is_clear[ind]], 95)])
-            cc_type = 0
-            self.flattice.sum_height_bias_type[cc_type][d] += np.sum(my_obj.height_bias_type[cc_type][ind])
-            self.flattice.num_detected_height_type[cc_type][d] += np.sum(my_obj.detected_height_type[cc_type][ind])
-            cc_type = 1
-            self.flattice.sum_height_bias_type[cc_type][d] += np.sum(my_obj.height_bias_type[cc_type][ind])
-            self.flattice.num_detected_height_type[cc_type][d] += np.sum(my_obj.detected_height_type[cc_type][ind])
-            cc_type = 2
-            self.flattice.sum_height_bias_type[cc_type][d] += np.sum(my_obj.height_bias_type[cc_type][ind])
-            self.flattice.num_detected_height_type[cc_type][d] += np.sum(my_obj.detected_height_type[cc_type][ind])
-            cc_type = 3
-            self.flattice.sum_height_bias_type[cc_type][d] += np.sum(my_obj.height_bias_type[cc_type][ind])
-            self.flattice.num_detected_height_type[cc_type][d] += np.sum(my_obj.detected_height_type[cc_type][ind])
-            cc_type = 4
-            self.flattice.sum_height_bias_type[cc_type][d] += np.sum(my_obj.height_bias_type[cc_type][ind])
-            self.flattice.num_detected_height_type[cc_type][d] += np.sum(my_obj.detected_height_type[cc_type][ind])
-            cc_type = 5
-            self.flattice.sum_height_bias_type[cc_type][d] += np.sum(my_obj.height_bias_type[cc_type][ind])
-            self.flattice.num_detected_height_type[cc_type][d] += np.sum(my_obj.detected_height_type[cc_type][ind])
-            cc_type = 6
-            self.flattice.sum_height_bias_type[cc_type][d] += np.sum(my_obj.height_bias_type[cc_type][ind])
-            self.flattice.num_detected_height_type[cc_type][d] += np.sum(my_obj.detected_height_type[cc_type][ind])
-            cc_type = 7
-            self.flattice.sum_height_bias_type[cc_type][d] += np.sum(my_obj.height_bias_type[cc_type][ind])
-            self.flattice.num_detected_height_type[cc_type][d] += np.sum(my_obj.detected_height_type[cc_type][ind])
-
-            for cot in cots_mid:
-                self.flattice.num_detected_clouds_filtcot[cot][d] += np.sum(detected_clouds_filtcot[cot][ind])
-                self.flattice.num_undetected_clouds_filtcot[cot][d] += np.sum(undetected_clouds_filtcot[cot][ind])
+        # Accumulate all lattice points at once
+        n_cells = len(lats)
+        flattice = self.flattice
+
+        def cell_sum(data):
+            return np.bincount(cols, weights=data, minlength=n_cells)
+
+        flattice.num_false_clouds += cell_sum(false_clouds)
+        flattice.num_detected_clouds += cell_sum(detected_clouds)
+        flattice.num_detected_clear += cell_sum(detected_clear)
+        flattice.num_undetected_clouds += cell_sum(undetected_clouds)
+        flattice.num_new_false_clouds += cell_sum(new_false_clouds)
+        flattice.num_new_detected_clouds += cell_sum(new_detected_clouds)
+        flattice.num_detected_height_low += cell_sum(detected_height_low)
+        flattice.num_detected_height_high += cell_sum(detected_height_high)
+        flattice.num_detected_height += cell_sum(detected_height)
+        flattice.num_detected_height_both += cell_sum(detected_height_both)
+        flattice.sum_ctth_bias_low += cell_sum(height_bias_low)
+        flattice.sum_ctth_mae_low += cell_sum(np.abs(height_bias_low))
+        flattice.sum_ctth_mae += cell_sum(np.abs(height_bias))
+        flattice.num_ctth_error_above_1km += cell_sum(np.abs(height_bias) > 1000)
+        flattice.sum_ctth_mae_diff += cell_sum(height_mae_diff)
+        flattice.sum_lapse_bias_low += cell_sum(lapse_bias_low)
+        flattice.sum_ctth_bias_high += cell_sum(height_bias_high)
+        flattice.sum_ctth_mae_high += cell_sum(np.abs(height_bias_high))
+        flattice.sum_lapse_bias_high += cell_sum(lapse_bias_high)
+        flattice.sum_ctth_bias_temperature_low += cell_sum(temperature_bias_low)
+        flattice.sum_ctth_bias_temperature_low_t11 += cell_sum(temperature_bias_low_t11)
+        np.minimum.at(flattice.Min_lapse_rate, cols, lapse_rate)
+
+        # Offsets are percentiles of the clear pixels in each lattice point
+        clear_cols = cols[is_clear]
+        np.minimum.at(flattice.Min_t11ts_offset, *percentile_per_cell(
+            clear_cols, t11ts_offset[is_clear], 5, n_cells))
+        np.maximum.at(flattice.Max_t11t12_offset, *percentile_per_cell(
+            clear_cols, t11t12_offset[is_clear], 95, n_cells))
+        np.maximum.at(flattice.Max_t37t12_offset, *percentile_per_cell(
+            clear_cols, t37t12_offset[is_clear], 95, n_cells))
+        np.maximum.at(flattice.Max_t11t37_offset, *percentile_per_cell(
+            clear_cols, t11t37_offset[is_clear], 95, n_cells))
+
+        for cc_type in range(8):
+            flattice.sum_height_bias_type[cc_type] += cell_sum(my_obj.height_bias_type[cc_type][valid_out])
+            flattice.num_detected_height_type[cc_type] += cell_sum(my_obj.detected_height_type[cc_type][valid_out])
+
+        for cot in cots_mid:
+            flattice.num_detected_clouds_filtcot[cot] += cell_sum(detected_clouds_filtcot[cot])
+            flattice.num_undetected_clouds_filtcot[cot] += cell_sum(undetected_clouds_filtcot[cot])
 
         print("mapping took %1.4f seconds" % (time.time()-tic))
 
 
+def percentile_per_cell(cols, data, percentile, n_cells):
+    """Calculate the percentile of *data* for each lattice point in *cols*.
+
+    Uses one sort by lattice point and value instead of one np.percentile
+    per lattice point. Returns the lattice points with data and the
+    percentiles (linear interpolation, as np.percentile).
+
+    """
+    order = np.lexsort((data, cols))
+    sorted_data = data[order]
+    counts = np.bincount(cols, minlength=n_cells)
+    cells = np.flatnonzero(counts)
+    starts = np.cumsum(counts)[cells] - counts[cells]
+    position = starts + (counts[cells] - 1) * percentile / 100.0
+    lower = np.floor(position).astype(np.int64)
+    upper = np.ceil(position).astype(np.int64)
+    fraction = position - lower
+    values = sorted_data[lower] + (sorted_data[upper] - sorted_data[lower]) * fraction
+    return cells, values
+
+
 def get_fibonacci_spread_points_on_earth(radius_km, num_points=None):
     # Earth area = 510072000km2
     # 4000 point with radius~200km
@@ -1283,3 +1305,138 @@ def get_fibonacci_spread_points_on_earth(radius_km, num_points=None):
     if np.isnan(np.max(latitude)):
         raise ValueError
     return longitude, latitude
+
+
+# Update if the lattice or the cell assignment change
+LATTICE_CACHE_VERSION = 2
+# Earth radius used by pyresample for the kd-tree distances
+EARTH_RADIUS_M = 6370997.0
+_LATTICE_INDEX = {}
+
+
+def get_cartesian_coords(lons, lats):
+    """Earth centered coordinates (m) of *lons*, *lats*, as used in pyresample."""
+    lons = np.deg2rad(np.asarray(lons, dtype=np.float64))
+    lats = np.deg2rad(np.asarray(lats, dtype=np.float64))
+    return np.column_stack((EARTH_RADIUS_M * np.cos(lats) * np.cos(lons),
+                            EARTH_RADIUS_M * np.cos(lats) * np.sin(lons),
+                            EARTH_RADIUS_M * np.sin(lats)))
+
+
+class FibonacciLatticeIndex(object):
+    """Fibonacci lattice for *radius_km* with a kd-tree over the lattice points.
+
+    Matchups further than 2.5 * radius_km from the nearest lattice point
+    are not in any cell (-9). The lattice points can be given as *lons*,
+    *lats*, e.g. read from the cache, only the kd-tree is then built.
+
+    """
+
+    def __init__(self, radius_km, lons=None, lats=None):
+        self.radius_km = radius_km
+        if lons is None or lats is None:
+            lons, lats = get_fibonacci_spread_points_on_earth(radius_km=radius_km)
+        self.lons, self.lats = lons, lats
+        self.tree = cKDTree(get_cartesian_coords(self.lons, self.lats))
+        self.max_distance = radius_km * 1000 * 2.5
+
+    @property
+    def name(self):
+        return "r{:s}km_n{:d}".format(str(self.radius_km), len(self.lats))
+
+    def get_cells(self, lons, lats):
+        """Get the lattice cell (int32) of each point, -9 for no cell."""
+        lons = np.asarray(lons).ravel()
+        lats = np.asarray(lats).ravel()
+        cells = np.full(lats.shape, -9, dtype=np.int32)
+        valid = np.logical_and(np.abs(lats) <= 90, np.abs(lons) <= 180)
+        if not np.any(valid):
+            return cells
+        distances, indices = self.tree.query(get_cartesian_coords(lons[valid], lats[valid]),
+                                             k=1, distance_upper_bound=self.max_distance)
+        indices[~np.isfinite(distances)] = -9
+        cells[valid] = indices
+        return cells
+
+    def get_cells_filename(self, filename, cache_dir=None):
+        """Get the cache file for the cells of the matchups in *filename*.
+
+        The name is a hash of the path and mtime of *filename* and of the
+        lattice. Returns None if no cache directory is configured.
+
+        """
+        if cache_dir is None:
+            cache_dir = config.LATTICE_CACHE_DIR
+        if not cache_dir:
+            return None
+        key = json.dumps([LATTICE_CACHE_VERSION, os.path.abspath(filename),
+                          os.path.getmtime(filename), self.name])
+        return os.path.join(cache_dir, "cells_{:s}".format(self.name),
+                            "{:s}.npy".format(hashlib.sha1(key.encode('utf-8')).hexdigest()))
+
+    def get_cells_for_file(self, filename, lons, lats, cache_dir=None):
+        """Get the lattice cells of the matchups read from *filename*.
+
+        The cells are read from the cache, or calculated and cached.
+
+        """
+        cells_filename = self.get_cells_filename(filename, cache_dir=cache_dir)
+        if cells_filename is not None and os.path.isfile(cells_filename):
+            try:
+                cells = np.load(cells_filename)
+            except (IOError, OSError, ValueError):
+                logger.warning("Could not read lattice cells %s", cells_filename)
+            else:
+                if cells.shape == (np.size(lats),):
+                    return cells
+        cells = self.get_cells(lons, lats)
+        if cells_filename is not None:
+            write_cache_file(cells_filename, lambda fhandle: np.save(fhandle, cells))
+        return cells
+
+
+def write_cache_file(filename, write):
+    """Write *filename* with function *write*, via a temporary file."""
+    tmp_filename = "{:s}.{:d}.tmp".format(filename, os.getpid())
+    try:
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with open(tmp_filename, 'wb') as fhandle:
+            write(fhandle)
+        os.replace(tmp_filename, filename)
+    except (IOError, OSError, ValueError):
+        logger.warning("Could not write lattice cache %s", filename)
+        if os.path.isfile(tmp_filename):
+            os.remove(tmp_filename)
+
+
+def get_lattice_index(radius_km, cache_dir=None):
+    """Get the FibonacciLatticeIndex for *radius_km*.
+
+    The lattice points are calculated once and kept in *cache_dir*
+    (default config.LATTICE_CACHE_DIR), the kd-tree is built when read.
+
+    """
+    if cache_dir is None:
+        cache_dir = config.LATTICE_CACHE_DIR
+    if (radius_km, cache_dir) in _LATTICE_INDEX:
+        return _LATTICE_INDEX[(radius_km, cache_dir)]
+    lattice_index = None
+    filename = None
+    if cache_dir:
+        filename = os.path.join(cache_dir, "fibonacci_lattice_v{:d}_r{:s}km.npz".format(
+            LATTICE_CACHE_VERSION, str(radius_km)))
+    if filename is not None and os.path.isfile(filename):
+        try:
+            with np.load(filename) as lattice:
+                lattice_index = FibonacciLatticeIndex(radius_km, lons=lattice['lons'],
+                                                      lats=lattice['lats'])
+        except (IOError, OSError, EOFError, KeyError, ValueError):
+            logger.warning("Could not read lattice %s", filename)
+    if lattice_index is None:
+        lattice_index = FibonacciLatticeIndex(radius_km)
+        if filename is not None:
+            write_cache_file(filename, lambda fhandle: np.savez(fhandle, lons=lattice_index.lons,
+                                                                 lats=lattice_index.lats))
+    _LATTICE_INDEX[(radius_km, cache_dir)] = lattice_index
+    return lattice_index
@@ -0,0 +1,56 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2019 atrain_match developers
+#
+# This file is part of atrain_match.
+#
+# atrain_match is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# atrain_match is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with atrain_match.  If not, see <http://www.gnu.org/licenses/>.
+"""Summarize the time and memory use of the processing stages of a run.
+
+The stage timing is written by process_master.py and
+process_atrain_match.py to config.STAGE_TIMING_FILE.
+
+"""
+import json
+import argparse
+import atrain_match.config as config
+from atrain_match.utils.timing import (read_timing_records, summarize_timing,
+                                       format_timing_summary)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('files', metavar='timing_file', type=str, nargs='*',
+                        default=[config.STAGE_TIMING_FILE],
+                        help='Stage timing files (default: config.STAGE_TIMING_FILE)')
+    parser.add_argument('--cross', '-c', metavar='noaa18_20080101', type=str,
+                        help='Only crosses starting with this string')
+    parser.add_argument('--json', '-j', const=True, nargs='?', required=False,
+                        help='Write the summary as json')
+    options = parser.parse_args()
+
+    records = read_timing_records(options.files)
+    if options.cross:
+        records = [record for record in records
+                   if (record['cross'] or "").startswith(options.cross)]
+    summary = summarize_timing(records)
+    if options.json:
+        print(json.dumps(summary, indent=1))
+    else:
+        print("{:d} crosses".format(len(set(record['cross'] for record in records))))
+        print(format_timing_summary(summary))
+
+
+if __name__ == '__main__':
+    main()
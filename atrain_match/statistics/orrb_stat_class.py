@@ -18,7 +18,9 @@
 
 # Created on Oct 18, 2010
 
-import numpy as np
+from atrain_match.utils.stats_store import (STATS_STORE_SUFFIX,
+                                             parse_stats_line,
+                                             read_stats_store)
 
 
 class OrrbStats():
@@ -36,6 +38,8 @@ class OrrbStats():
 
     def read_one_file(self, datafile):
         # print(datafile)
+        if datafile.endswith(STATS_STORE_SUFFIX):
+            return self.read_one_store(datafile)
         data_dict = {}
         current_datafile = open(datafile, "r")
         for line in current_datafile:
@@ -46,8 +50,7 @@ class OrrbStats():
             # Note both CALIPSO and CALIOP where used
             if self.truth_sat.upper() not in line:
                 continue
-            what, data = line.rstrip().split(':')
-            data = np.array([np.float(item) for item in data.lstrip().split(" ")])
+            what, data = parse_stats_line(line)
             if what in data_dict.keys():
                 print(what)
                 raise KeyError("Key should not be already in list")
@@ -55,6 +58,19 @@ class OrrbStats():
         current_datafile.close()
         return data_dict
 
+    def read_one_store(self, datafile):
+        """Read statistics from a binary store, same result as read_one_file."""
+        data_dict = {}
+        for what, data in read_stats_store(datafile):
+            what = what.replace('CALIOP', 'CALIPSO')
+            if self.truth_sat.upper() not in what:
+                continue
+            if what in data_dict.keys():
+                print(what)
+                raise KeyError("Key should not be already in list")
+            data_dict[what] = data
+        return data_dict
+
     def accumulate_data(self, results_files):
         print("reading data")
         acu = {}
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2019 atrain_match developers
+#
+# This file is part of atrain_match.
+#
+# atrain_match is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# atrain_match is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+#
+
+"""Test the synthetic scenes and the benchmarks."""
+
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from datetime import datetime
+import atrain_match.config as config
+from atrain_match.benchmarks.synthetic import make_synthetic_swath
+from atrain_match.benchmarks.run_benchmarks import make_scene, run_benchmarks, BENCHMARKS
+
+
+class test_synthetic_scene(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.calipso_cache_dir = config.CALIPSO_CACHE_DIR
+        self.calipso_time_index_file = config.CALIPSO_TIME_INDEX_FILE
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        config.CALIPSO_CACHE_DIR = self.calipso_cache_dir
+        config.CALIPSO_TIME_INDEX_FILE = self.calipso_time_index_file
+
+    def test_swath(self):
+        swath = make_synthetic_swath(datetime(2012, 6, 1, 12), resolution=5, orbit_fraction=0.02)
+        n_lines, n_pixels = swath.latitude.shape
+        self.assertEqual(n_pixels, 409)
+        self.assertEqual(swath.time.shape, (n_lines,))
+        self.assertTrue(np.all(np.diff(swath.time) > 0))
+        self.assertTrue(np.all(np.abs(swath.latitude) <= 90))
+        self.assertEqual(swath.cma.cma_ext.shape, swath.latitude.shape)
+
+    def test_run_benchmarks(self):
+        scene = make_scene(self.tmpdir, config.RESOLUTION, 0.01)
+        results = run_benchmarks(scene, repeat=1)
+        self.assertEqual([result.name for result in results], BENCHMARKS)
+        for result in results:
+            self.assertGreater(result.n_items, 0)
+            self.assertEqual(len(result.times), 1)
+            self.assertGreater(result.throughput, 0)
+
+
+def suite():
+    """The suite for test_benchmarks."""
+    loader = unittest.TestLoader()
+    mysuite = unittest.TestSuite()
+    mysuite.addTest(loader.loadTestsFromTestCase(test_synthetic_scene))
+
+    return mysuite
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2019 atrain_match developers
+#
+# This file is part of atrain_match.
+#
+# atrain_match is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# atrain_match is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+#
+
+"""Test the cache of decoded CALIPSO data."""
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from atrain_match.truths.calipso import (CalipsoObject,
+                                         get_calipso_cache_filename,
+                                         read_calipso_cache,
+                                         write_calipso_cache)
+
+
+class test_calipso_cache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmpdir, "cache")
+        self.files = []
+        for i in range(2):
+            filename = os.path.join(self.tmpdir, "CAL_LID_L2_05kmCLay_{:d}.h5".format(i))
+            open(filename, 'w').close()
+            self.files.append(filename)
+        self.settings = {'method': '5km_only', 'resolution': 5}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_cache_filename(self):
+        filename = get_calipso_cache_filename([self.files, None], self.settings, self.cache_dir)
+        self.assertEqual(os.path.dirname(filename), self.cache_dir)
+        self.assertEqual(
+            filename, get_calipso_cache_filename([self.files, None], self.settings, self.cache_dir))
+        self.assertNotEqual(
+            filename, get_calipso_cache_filename([self.files[:1], None], self.settings, self.cache_dir))
+        self.assertNotEqual(
+            filename, get_calipso_cache_filename([self.files, None], {'method': '1km_only', 'resolution': 5},
+                                                 self.cache_dir))
+        os.utime(self.files[1], (1, 1))
+        self.assertNotEqual(
+            filename, get_calipso_cache_filename([self.files, None], self.settings, self.cache_dir))
+        self.assertIsNone(get_calipso_cache_filename([self.files, None], self.settings, ""))
+
+    def test_write_read_cache(self):
+        filename = get_calipso_cache_filename([self.files, None], self.settings, self.cache_dir)
+        self.assertIsNone(read_calipso_cache(filename))
+        calipso = CalipsoObject()
+        calipso.sec_1970 = np.arange(5, dtype=np.float64)
+        calipso.layer_top_altitude = np.ones((5, 10), dtype=np.float32)
+        calipso.detection_height_5km = None
+        write_calipso_cache(filename, {'calipso': calipso, 'calipso_aerosol': None})
+        calipso_objs = read_calipso_cache(filename)
+        self.assertEqual(list(calipso_objs.keys()), ['calipso'])
+        cached = calipso_objs['calipso']
+        np.testing.assert_array_equal(cached.sec_1970, calipso.sec_1970)
+        np.testing.assert_array_equal(cached.layer_top_altitude, calipso.layer_top_altitude)
+        self.assertEqual(cached.layer_top_altitude.dtype, np.float32)
+        self.assertIsNone(cached.detection_height_5km)
+        self.assertIsNone(cached.all_arrays['cal_modis_cflag'])
+        cut = cached.extract_elements(starti=1, endi=3)
+        np.testing.assert_array_equal(cut.sec_1970, [1, 2])
+
+
+def suite():
+    """Create the suite for test_calipso_cache."""
+    loader = unittest.TestLoader()
+    mysuite = unittest.TestSuite()
+    mysuite.addTest(loader.loadTestsFromTestCase(test_calipso_cache))
+    return mysuite
+
+
+if __name__ == "__main__":
+    unittest.TextTestRunner(verbosity=2).run(suite())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2019 atrain_match developers
+#
+# This file is part of atrain_match.
+#
+# atrain_match is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# atrain_match is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+#
+
+"""Test the CALIPSO granule time index."""
+
+import os
+import shutil
+import tempfile
+import unittest
+import h5py
+import numpy as np
+from atrain_match.truths.calipso import (CalipsoTimeIndex,
+                                         read_calipso_time_range,
+                                         discard_calipso_files_outside_time_range)
+
+
+class FakeImager(object):
+    def __init__(self, start, end):
+        self.sec1970_start = start
+        self.sec1970_end = end
+
+
+class test_calipso_time_index(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.files = []
+        for i in range(3):
+            filename = os.path.join(self.tmpdir, "CAL_LID_L2_05kmCLay_{:d}.h5".format(i))
+            profile_time = 1000.0 * i + np.arange(30).reshape(10, 3) * 10.0
+            with h5py.File(filename, 'w') as h5file:
+                h5file.create_dataset("Profile_Time", data=profile_time)
+            self.files.append(filename)
+        self.dsec = read_calipso_time_range(self.files[0])[0]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read_calipso_time_range(self):
+        start, end = read_calipso_time_range(self.files[1])
+        self.assertEqual(start - self.dsec, 1000.0)
+        self.assertEqual(end - self.dsec, 1290.0)
+
+    def test_index_saved_and_reused(self):
+        index_file = os.path.join(self.tmpdir, "index.json")
+        time_index = CalipsoTimeIndex(index_file)
+        time_index.get_time_range(self.files[2])
+        time_index.save()
+        self.assertTrue(os.path.isfile(index_file))
+        time_index = CalipsoTimeIndex(index_file)
+        self.assertFalse(time_index.updated)
+        start, end = time_index.get_time_range(self.files[2])
+        self.assertFalse(time_index.updated)
+        self.assertEqual(start - self.dsec, 2000.0)
+        # A changed file is probed again
+        os.utime(self.files[2], (1, 1))
+        time_index.get_time_range(self.files[2])
+        self.assertTrue(time_index.updated)
+
+    def test_discard_files(self):
+        imager = FakeImager(self.dsec + 1100, self.dsec + 1200)
+        kept = discard_calipso_files_outside_time_range(
+            self.files, imager, None, {"sec_timeThr": 300})
+        self.assertEqual(kept, [self.files[1]])
+        kept = discard_calipso_files_outside_time_range(
+            self.files, imager, None, {"sec_timeThr": 900})
+        self.assertEqual(kept, self.files)
+
+
+def suite():
+    """Create the suite for test_calipso_time_index."""
+    loader = unittest.TestLoader()
+    mysuite = unittest.TestSuite()
+    mysuite.addTest(loader.loadTestsFromTestCase(test_calipso_time_index))
+    return mysuite
+
+
+if __name__ == "__main__":
+    unittest.TextTestRunner(verbosity=2).run(suite())
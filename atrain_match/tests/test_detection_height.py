@@ -20,6 +20,8 @@
 import numpy as np
 import unittest
 from atrain_match.truths.calipso import (optical_depth_height_filtering,
+                                         optical_depth_height_filtering_batch,
+                                         get_first_detected_layer,
                                          detection_height_filtering)
 from atrain_match.matchobject_io import CalipsoObject
 
@@ -55,6 +57,20 @@ def CalipsoCloudOpticalDepth(cloud_top, cloud_base, optical_depth, cloud_fractio
     return new_cloud_top, new_cloud_base, new_cloud_fraction, new_fcf, new_validation_height
 
 
+def get_first_detected_layer_loop(calipso, min_optical_depth):
+    """The top most detected layer, summing the optical depth as optical_depth_height_filtering used to."""
+    first_layer = np.zeros(calipso.cloud_fraction.shape, dtype=int) - 1
+    depthsum = 0.0 * np.zeros(calipso.cloud_fraction.shape)
+    already_detected = depthsum > 99999
+    already_detected[calipso.layer_top_altitude[:, 0] < 0] = True
+    for layer_j in range(calipso.feature_optical_depth_532.shape[1]):
+        depthsum += calipso.feature_optical_depth_532[:, layer_j].ravel()
+        update = np.logical_and(depthsum >= min_optical_depth, np.equal(already_detected, False))
+        first_layer[update] = layer_j
+        already_detected[update] = True
+    return first_layer
+
+
 class test_detection_height(unittest.TestCase):
 
     def setUp(self):
@@ -138,6 +154,46 @@ class test_detection_height(unittest.TestCase):
         self.assertTrue((np.equal(out1[4], out_old[4])).all())
         self.assertTrue((np.equal(out1[1], out_old[1])).all())
 
+    def test_several_optical_depths(self):
+        min_optical_depths = [0.0, 0.15, 0.5, 2.0, 20.0]
+        for use_old_method in [True, False]:
+            retvs = optical_depth_height_filtering_batch(
+                self.obt5, min_optical_depths, use_old_method=use_old_method, limit_ctop=0.2)
+            self.assertEqual(len(retvs), len(min_optical_depths))
+            for min_optical_depth, retv in zip(min_optical_depths, retvs):
+                expected = CalipsoCloudOpticalDepth(self.obt5.layer_top_altitude,
+                                                    self.obt5.layer_base_altitude,
+                                                    self.obt5.feature_optical_depth_532,
+                                                    self.obt5.cloud_fraction,
+                                                    self.obt5.feature_classification_flags,
+                                                    min_optical_depth)
+                np.testing.assert_array_equal(retv[2], expected[2])
+                np.testing.assert_array_equal(retv[3], expected[3])
+                if use_old_method:
+                    np.testing.assert_array_equal(retv[4], expected[4])
+                single = optical_depth_height_filtering(
+                    self.obt5, min_optical_depth, use_old_method=use_old_method, limit_ctop=0.2)
+                for data, data_single in zip(retv, single):
+                    np.testing.assert_array_equal(data, data_single)
+        # Nothing is thick enough for the largest optical depth
+        self.assertTrue((retvs[-1][4] == -9).all())
+
+    def test_first_detected_layer_float32(self):
+        # CALIPSO optical depths are float32, given with two decimals
+        rng = np.random.RandomState(1)
+        calipso = CalipsoObject()
+        n_layers = rng.randint(1, 6, size=20000)
+        optical_depth = np.round(rng.exponential(0.3, size=(20000, 10)), 2)
+        optical_depth[np.arange(10)[np.newaxis, :] >= n_layers[:, np.newaxis]] = -9
+        calipso.feature_optical_depth_532 = optical_depth.astype(np.float32)
+        calipso.layer_top_altitude = np.where(optical_depth >= 0, 10.0, -9.0).astype(np.float32)
+        calipso.cloud_fraction = np.ones(20000, dtype=np.float32)
+        min_optical_depths = [0.35, 0.45, 1.0, 2.0]
+        first_layer = get_first_detected_layer(calipso, min_optical_depths)
+        for ind, min_optical_depth in enumerate(min_optical_depths):
+            np.testing.assert_array_equal(first_layer[:, ind],
+                                          get_first_detected_layer_loop(calipso, min_optical_depth))
+
 
 def suite():
     """The suite for test_utils.
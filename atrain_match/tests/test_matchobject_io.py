@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2019 atrain_match developers
+#
+# This file is part of atrain_match.
+#
+# atrain_match is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# atrain_match is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+#
+
+"""Test reading and concatenating matchup objects."""
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from atrain_match.matchobject_io import (TruthImagerTrackObject,
+                                         MatchRowFilter,
+                                         concatenate_arrays,
+                                         concatenate_truth_imager_match_objs,
+                                         read_truth_imager_match_obj,
+                                         write_truth_imager_match_obj)
+
+
+def make_match_obj(npix, seed):
+    rng = np.random.RandomState(seed)
+    match_obj = TruthImagerTrackObject(truth='calipso')
+    match_obj.imager.longitude = rng.uniform(-180, 180, npix)
+    match_obj.imager.latitude = rng.uniform(-90, 90, npix)
+    match_obj.imager.cloudtype = rng.randint(0, 15, npix).astype(np.uint8)
+    match_obj.calipso.longitude = match_obj.imager.longitude
+    match_obj.calipso.latitude = match_obj.imager.latitude
+    match_obj.calipso.layer_top_altitude = rng.uniform(0, 20, (npix, 10))
+    match_obj.diff_sec_1970 = rng.uniform(-100, 100, npix)
+    return match_obj
+
+
+class test_concatenate_match_objs(unittest.TestCase):
+
+    def make_objs(self):
+        objs = [make_match_obj(npix, seed)
+                for seed, npix in enumerate([5, 0, 7, 1, 3])]
+        objs[1] = TruthImagerTrackObject(truth='calipso')
+        # A variable missing in one file
+        objs[3].imager.cloudtype = None
+        return objs
+
+    def test_same_as_adding(self):
+        added_objs = self.make_objs()
+        added = added_objs[0]
+        for obj in added_objs[1:]:
+            added += obj
+        objs = self.make_objs()
+        concatenated = concatenate_truth_imager_match_objs(objs)
+        for name in ['imager', 'calipso', 'extra']:
+            added_arrays = getattr(added, name).all_arrays
+            conc_arrays = getattr(concatenated, name).all_arrays
+            self.assertEqual(sorted(added_arrays.keys()), sorted(conc_arrays.keys()))
+            for key in added_arrays:
+                if added_arrays[key] is None:
+                    self.assertIsNone(conc_arrays[key])
+                else:
+                    np.testing.assert_array_equal(added_arrays[key], conc_arrays[key])
+        self.assertEqual(concatenated.imager.longitude.shape, (16,))
+        self.assertEqual(concatenated.calipso.layer_top_altitude.shape, (16, 10))
+        np.testing.assert_array_equal(added.diff_sec_1970, concatenated.diff_sec_1970)
+
+    def test_concatenate_arrays(self):
+        one_d = np.arange(3)
+        two_d = np.ones((2, 4))
+        np.testing.assert_array_equal(concatenate_arrays([one_d, one_d, one_d]),
+                                      np.tile(one_d, 3))
+        np.testing.assert_array_equal(concatenate_arrays([None, one_d, one_d]),
+                                      np.tile(one_d, 2))
+        self.assertEqual(concatenate_arrays([two_d, two_d]).shape, (4, 4))
+        # Not matching shapes, as for addition the last one is kept
+        self.assertEqual(concatenate_arrays([two_d, np.ones((2, 3))]).shape, (2, 3))
+        self.assertIsNone(concatenate_arrays([one_d, None]))
+
+
+class test_read_columns_and_rows(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "5km_noaa18_20080101_1200_99999_calipso_avhrr_match.h5")
+        self.match_obj = make_match_obj(200, 1)
+        self.match_obj.imager.sunz = np.linspace(0, 180, 200)
+        self.match_obj.calipso.sec_1970 = np.arange(200) + 1.0e9
+        write_truth_imager_match_obj(self.filename, self.match_obj)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read_columns(self):
+        retv = read_truth_imager_match_obj(self.filename,
+                                           columns={'imager': ['cloudtype'],
+                                                    'calipso': ['latitude']})
+        np.testing.assert_array_equal(retv.imager.cloudtype, self.match_obj.imager.cloudtype)
+        np.testing.assert_array_equal(retv.calipso.latitude, self.match_obj.calipso.latitude)
+        self.assertIsNone(retv.imager.longitude)
+        self.assertIsNone(retv.calipso.layer_top_altitude)
+        self.assertEqual(retv.diff_sec_1970.shape, (200,))
+
+    def test_read_rows(self):
+        row_filter = MatchRowFilter(time_range=(1.0e9 + 10, 1.0e9 + 150),
+                                    lat_range=(-30, 60),
+                                    sunz_range=(0, 95))
+        retv = read_truth_imager_match_obj(self.filename,
+                                           columns={'imager': ['cloudtype', 'sunz'],
+                                                    'calipso': ['latitude', 'layer_top_altitude']},
+                                           row_filter=row_filter)
+        selected = np.logical_and(np.logical_and(np.arange(200) >= 10, np.arange(200) <= 150),
+                                  np.logical_and(self.match_obj.calipso.latitude >= -30,
+                                                 self.match_obj.calipso.latitude <= 60))
+        selected = np.logical_and(selected, self.match_obj.imager.sunz <= 95)
+        np.testing.assert_array_equal(retv.imager.cloudtype, self.match_obj.imager.cloudtype[selected])
+        np.testing.assert_array_equal(retv.calipso.layer_top_altitude,
+                                      self.match_obj.calipso.layer_top_altitude[selected])
+        np.testing.assert_array_equal(retv.diff_sec_1970, self.match_obj.diff_sec_1970[selected])
+
+    def test_read_rows_sparse_and_empty(self):
+        row_filter = MatchRowFilter()
+        row_filter.add_values('imager', 'cloudtype', [3])
+        retv = read_truth_imager_match_obj(self.filename, row_filter=row_filter)
+        selected = self.match_obj.imager.cloudtype == 3
+        np.testing.assert_array_equal(retv.calipso.latitude, self.match_obj.calipso.latitude[selected])
+        # Longitudes across the date line
+        row_filter = MatchRowFilter(lon_range=(170, -170))
+        retv = read_truth_imager_match_obj(self.filename, row_filter=row_filter)
+        self.assertTrue((np.abs(retv.calipso.longitude) >= 170).all())
+        row_filter = MatchRowFilter(time_range=(0, 1))
+        retv = read_truth_imager_match_obj(self.filename, row_filter=row_filter)
+        self.assertEqual(retv.calipso.layer_top_altitude.shape, (0, 10))
+
+
+def suite():
+    """Create the test suite for test_matchobject_io."""
+    loader = unittest.TestLoader()
+    mysuite = unittest.TestSuite()
+    mysuite.addTest(loader.loadTestsFromTestCase(test_concatenate_match_objs))
+    mysuite.addTest(loader.loadTestsFromTestCase(test_read_columns_and_rows))
+
+    return mysuite
+
+
+if __name__ == "__main__":
+    unittest.main()
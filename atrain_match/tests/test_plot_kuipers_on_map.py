@@ -19,9 +19,17 @@
 """Tests for the calculation measurements on fibonacci grid."""
 
 
+import os
+import shutil
+import tempfile
 import numpy as np
 import unittest
-from atrain_match.reshaped_files_scr.plot_kuipers_on_area_util import StatsOnFibonacciLattice
+from pyresample.geometry import SwathDefinition
+from pyresample.kd_tree import get_neighbour_info, get_sample_from_neighbour_info
+from atrain_match.reshaped_files_scr.plot_kuipers_on_area_util import (StatsOnFibonacciLattice,
+                                                                      percentile_per_cell,
+                                                                      get_lattice_index,
+                                                                      _LATTICE_INDEX)
 
 
 class test_kuipers_plot_on_map(unittest.TestCase):
@@ -62,11 +70,95 @@ class test_kuipers_plot_on_map(unittest.TestCase):
         self.assertTrue(np.abs(self.lattice.Kuipers[5] - 0.15) < 0.01)
 
 
+class test_percentile_per_cell(unittest.TestCase):
+    """Test percentiles for all lattice points at once."""
+
+    def test_percentile_per_cell(self):
+        """Compare with np.percentile for each lattice point."""
+        rng = np.random.RandomState(1)
+        cols = rng.randint(0, 10, 300)
+        cols[cols == 4] = 5
+        data = rng.normal(0, 10, 300)
+        for percentile in [5, 50, 95]:
+            cells, values = percentile_per_cell(cols, data, percentile, 12)
+            self.assertEqual(list(cells), [0, 1, 2, 3, 5, 6, 7, 8, 9])
+            for cell, value in zip(cells, values):
+                self.assertAlmostEqual(value, np.percentile(data[cols == cell], percentile))
+
+
+class test_lattice_index(unittest.TestCase):
+    """Test the cached lattice kd-tree and cell assignment."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        rng = np.random.RandomState(1)
+        self.lons = rng.uniform(-180, 180, 2000)
+        self.lats = rng.uniform(-90, 90, 2000)
+        self.lats[:3] = -999
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        _LATTICE_INDEX.clear()
+
+    def test_get_cells(self):
+        """Compare with the pyresample nearest neighbour."""
+        lattice_index = get_lattice_index(500, cache_dir='')
+        cells = lattice_index.get_cells(self.lons, self.lats)
+        self.assertEqual(cells.dtype, np.int32)
+        self.assertTrue(np.all(cells[:3] == -9))
+        target_def = SwathDefinition(self.lons, self.lats)
+        valid_in, valid_out, indices, distances = get_neighbour_info(
+            SwathDefinition(lattice_index.lons, lattice_index.lats), target_def,
+            radius_of_influence=lattice_index.max_distance, neighbours=1)
+        cols = get_sample_from_neighbour_info('nn', target_def.shape,
+                                              np.arange(len(lattice_index.lats)),
+                                              valid_in, valid_out, indices)
+        expected = np.full(self.lats.shape, -9)
+        expected[valid_out] = np.where(distances > lattice_index.max_distance, -9, cols[valid_out])
+        np.testing.assert_array_equal(cells, expected)
+
+    def test_cache(self):
+        """Lattice and cells are written once and reused."""
+        filename = os.path.join(self.tmpdir, "match.h5")
+        with open(filename, 'w') as fhandle:
+            fhandle.write("match")
+        cache_dir = os.path.join(self.tmpdir, "cache")
+        lattice_index = get_lattice_index(500, cache_dir=cache_dir)
+        self.assertIs(get_lattice_index(500, cache_dir=cache_dir), lattice_index)
+        cells = lattice_index.get_cells_for_file(filename, self.lons, self.lats, cache_dir=cache_dir)
+        cells_filename = lattice_index.get_cells_filename(filename, cache_dir=cache_dir)
+        self.assertTrue(os.path.isfile(cells_filename))
+        _LATTICE_INDEX.clear()
+        cached_index = get_lattice_index(500, cache_dir=cache_dir)
+        self.assertIsNot(cached_index, lattice_index)
+        np.testing.assert_array_equal(cached_index.lats, lattice_index.lats)
+        # Reading the cells does not need the positions
+        cached_cells = cached_index.get_cells_for_file(filename, self.lons * 0, self.lats * 0,
+                                                       cache_dir=cache_dir)
+        np.testing.assert_array_equal(cached_cells, cells)
+
+    def test_broken_cache(self):
+        """A lattice cache that can not be read is rebuilt."""
+        cache_dir = os.path.join(self.tmpdir, "cache")
+        lattice_index = get_lattice_index(500, cache_dir=cache_dir)
+        lattice_files = os.listdir(cache_dir)
+        self.assertEqual(len(lattice_files), 1)
+        with open(os.path.join(cache_dir, lattice_files[0]), 'wb') as fhandle:
+            fhandle.write(b"not a lattice")
+        _LATTICE_INDEX.clear()
+        rebuilt_index = get_lattice_index(500, cache_dir=cache_dir)
+        np.testing.assert_array_equal(rebuilt_index.lats, lattice_index.lats)
+        np.testing.assert_array_equal(rebuilt_index.get_cells(self.lons, self.lats),
+                                      lattice_index.get_cells(self.lons, self.lats))
+
+
 def suite():
     """Test suite for test remap measurements on fibonacci grid."""
     loader = unittest.TestLoader()
     mysuite = unittest.TestSuite()
     mysuite.addTest(loader.loadTestsFromTestCase(test_kuipers_plot_on_map))
+    mysuite.addTest(loader.loadTestsFromTestCase(test_percentile_per_cell))
+    mysuite.addTest(loader.loadTestsFromTestCase(test_lattice_index))
     return mysuite
 
 
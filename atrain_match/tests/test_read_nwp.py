@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2019 atrain_match developers
+#
+# This file is part of atrain_match.
+#
+# atrain_match is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# atrain_match is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+#
+
+"""Test adding NWP data to the matchups of all truths at once."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from atrain_match.matchobject_io import TruthImagerTrackObject
+from atrain_match.cloudproducts import read_nwp
+
+PRESSURE_LEVELS = np.array([100.0, 300.0, 500.0, 700.0, 850.0, 1000.0])
+
+
+class NWPField(np.ndarray):
+    """Field as returned by pps_nwp, with units."""
+
+    def __new__(cls, data, units):
+        field = np.asarray(data).view(cls)
+        field.units = units
+        return field
+
+
+class FakeGRIBFile(object):
+    """pps_nwp.GRIBFile with fields depending on the position."""
+
+    opened = []
+
+    def __init__(self, nwp_file, lonlat):
+        self.lons, self.lats = lonlat
+        FakeGRIBFile.opened.append(nwp_file)
+
+    def vertical(self, data, units):
+        # pps_nwp profiles are (1, nlevels, npoints)
+        return NWPField(data[np.newaxis, :, :], units)
+
+    def get_p_vertical(self):
+        return self.vertical(100.0 * PRESSURE_LEVELS[:, np.newaxis] + 0 * self.lons, 'Pa')
+
+    def get_gh_vertical(self):
+        height = 8000.0 * np.log(1013.0 / PRESSURE_LEVELS)
+        return self.vertical(height[:, np.newaxis] + self.lats, 'm')
+
+    def get_t_vertical(self):
+        return self.vertical(250.0 + 0 * PRESSURE_LEVELS[:, np.newaxis] + self.lons, 'K')
+
+    def get_p_surface(self):
+        return NWPField(101300.0 + 0 * self.lons, 'Pa')
+
+    def get_gh_surface(self):
+        return NWPField(self.lats * 1.0, 'm')
+
+    def get_h_2meter(self):
+        return NWPField(self.lons * 0.01, '1')
+
+    def get_t_2meter(self):
+        return NWPField(self.lons + 270.0, 'K')
+
+    def get_u_10meter(self):
+        return NWPField(self.lons * 1.0, 'm/s')
+
+    def get_v_10meter(self):
+        return NWPField(self.lats * 1.0, 'm/s')
+
+
+def get_matchup(truth, lons, lats):
+    matchup = TruthImagerTrackObject(truth=truth)
+    matchup.imager.longitude = np.array(lons, dtype=np.float32)
+    matchup.imager.latitude = np.array(lats, dtype=np.float32)
+    return matchup
+
+
+class test_add_nwp_to_matchups(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.nwp_file = os.path.join(self.tmpdir, "GRIB_20100101_0000+003H00M")
+        with open(self.nwp_file, 'w') as fhandle:
+            fhandle.write("grib")
+        self.cache_dir = os.path.join(self.tmpdir, "cache")
+        self.settings = {'OCA_VALIDATION': False}
+        FakeGRIBFile.opened = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def get_matchups(self):
+        return [get_matchup('calipso', [10, 11, 12], [50, 51, 52]),
+                None,
+                get_matchup('cloudsat', [20, 21], [-10, -11])]
+
+    def test_one_decoding(self):
+        calipso, dummy, cloudsat = matchups = self.get_matchups()
+        with mock.patch.object(read_nwp, 'get_gribfile', FakeGRIBFile):
+            read_nwp.add_nwp_to_matchups(matchups, self.nwp_file, self.settings,
+                                         cache_dir=self.cache_dir)
+        self.assertEqual(FakeGRIBFile.opened, [self.nwp_file])
+        for matchup in [calipso, cloudsat]:
+            imager = matchup.imager
+            np.testing.assert_allclose(imager.nwp_t2m, imager.longitude + 270.0)
+            np.testing.assert_allclose(imager.nwp_surface_h, imager.latitude)
+            np.testing.assert_allclose(imager.nwp_psur, 1013.0)
+            self.assertEqual(imager.nwp_pressure.shape, (len(imager.latitude), len(PRESSURE_LEVELS)))
+            np.testing.assert_allclose(imager.nwp_pressure[:, 2], 500.0)
+            np.testing.assert_allclose(imager.nwp_temperature[:, 0], imager.longitude + 250.0)
+            self.assertEqual(imager.nwp_h440.shape, imager.latitude.shape)
+            self.assertTrue(np.all(imager.nwp_h440 > imager.nwp_h680))
+
+    def test_cache(self):
+        matchups = self.get_matchups()
+        with mock.patch.object(read_nwp, 'get_gribfile', FakeGRIBFile):
+            read_nwp.add_nwp_to_matchups(matchups, self.nwp_file, self.settings,
+                                         cache_dir=self.cache_dir)
+        # One file, no temporary files left
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        self.assertTrue(os.listdir(self.cache_dir)[0].endswith('.h5'))
+        cached_matchups = self.get_matchups()
+        with mock.patch.object(read_nwp, 'get_gribfile', FakeGRIBFile):
+            read_nwp.add_nwp_to_matchups(cached_matchups, self.nwp_file, self.settings,
+                                         cache_dir=self.cache_dir)
+        self.assertEqual(len(FakeGRIBFile.opened), 1)
+        for matchup, cached in zip(matchups, cached_matchups):
+            if matchup is None:
+                continue
+            for name in read_nwp.NWP_FIELDS:
+                np.testing.assert_array_equal(getattr(matchup.imager, name),
+                                              getattr(cached.imager, name))
+        # Other positions are not in the cache
+        with mock.patch.object(read_nwp, 'get_gribfile', FakeGRIBFile):
+            read_nwp.add_nwp_to_matchups([get_matchup('iss', [0], [0])], self.nwp_file,
+                                         self.settings, cache_dir=self.cache_dir)
+        self.assertEqual(len(FakeGRIBFile.opened), 2)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_no_cache_dir(self):
+        with mock.patch.object(read_nwp, 'get_gribfile', FakeGRIBFile):
+            read_nwp.add_nwp_to_matchups(self.get_matchups(), self.nwp_file, self.settings,
+                                         cache_dir='')
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+
+def suite():
+    """The suite for test_read_nwp."""
+    loader = unittest.TestLoader()
+    mysuite = unittest.TestSuite()
+    mysuite.addTest(loader.loadTestsFromTestCase(test_add_nwp_to_matchups))
+
+    return mysuite
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2019 atrain_match developers
+#
+# This file is part of atrain_match.
+#
+# atrain_match is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# atrain_match is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+#
+
+"""Test reading only some rows of the PPS data."""
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import netCDF4
+from atrain_match.cloudproducts.read_pps import (AllImagerData, crop_imager_rows,
+                                                 read_cma_nc, read_all_intermediate_files,
+                                                 run_read_tasks)
+from atrain_match.libs.truth_imager_match import ppsFiles
+from atrain_match.utils.common import map_imager, get_imager_row_window
+
+
+def get_swath(num_rows=200, num_cols=50):
+    """Imager swath with about 1 km pixels."""
+    imager = AllImagerData()
+    rows, cols = np.meshgrid(np.arange(num_rows), np.arange(num_cols), indexing='ij')
+    imager.latitude = 50.0 + rows * 0.009
+    imager.longitude = 10.0 + cols * 0.014
+    imager.time = np.arange(num_rows, dtype=np.float64)
+    return imager
+
+
+class test_read_track_rows(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        # Truth track crossing rows 60-100
+        self.lat = np.linspace(50.0 + 60 * 0.009, 50.0 + 100 * 0.009, 30)
+        self.lon = np.linspace(10.1, 10.5, 30)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_row_window(self):
+        imager = get_swath()
+        window = get_imager_row_window(imager, [(self.lon, self.lat), (np.array([0.0]), np.array([0.0]))],
+                                       1000.0, 10)
+        self.assertEqual(window, (50, 111))
+        self.assertIsNone(get_imager_row_window(imager, [(np.array([0.0]), np.array([0.0]))],
+                                                1000.0, 10))
+        window = get_imager_row_window(imager, [(self.lon, self.lat)], 1000.0, 100)
+        self.assertEqual(window, (0, 200))
+
+    def test_match_cropped_swath(self):
+        cal, cap = map_imager(get_swath(), self.lon, self.lat, radius_of_influence=700.0)
+        imager = get_swath()
+        window = get_imager_row_window(imager, [(self.lon, self.lat)], 700.0, 10)
+        imager = crop_imager_rows(imager, window)
+        self.assertEqual(imager.latitude.shape[0], window[1] - window[0])
+        self.assertEqual(imager.time[0], window[0])
+        cal_w, cap_w = map_imager(imager, self.lon, self.lat, radius_of_influence=700.0)
+        self.assertTrue((cal_w + imager.row_offset == cal).all())
+        self.assertTrue((cap_w == cap).all())
+
+    def test_read_cma_rows(self):
+        filename = os.path.join(self.tmpdir, 'S_NWC_CMA_test.nc')
+        cma_ext = np.arange(200 * 50).reshape(1, 200, 50) % 4
+        pps_nc = netCDF4.Dataset(filename, 'w', format='NETCDF4')
+        pps_nc.createDimension('time', 1)
+        pps_nc.createDimension('ny', 200)
+        pps_nc.createDimension('nx', 50)
+        for name in ['cma_extended', 'cma_quality']:
+            var = pps_nc.createVariable(name, 'i1', ('time', 'ny', 'nx'))
+            var[:] = cma_ext
+        pps_nc.close()
+        cma = read_cma_nc(filename)
+        cma_rows = read_cma_nc(filename, row_window=(50, 111))
+        self.assertEqual(cma_rows.cma_ext.shape, (61, 50))
+        self.assertTrue((cma_rows.cma_ext == cma.cma_ext[50:111]).all())
+        self.assertTrue((cma_rows.cma_bin == cma.cma_bin[50:111]).all())
+
+
+class test_lazy_aux(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.field = np.arange(200 * 50, dtype=np.float32).reshape(1, 200, 50)
+        self.pps_files = ppsFiles({'physiography': self.write_nc('S_NWC_physiography_test.nc',
+                                                                ['landuse', 'elevation']),
+                                   'nwp_tsur': self.write_nc('S_NWC_nwp_test.nc', ['tsur', 't500']),
+                                   'seaice': None, 'r37': None, 'emis': None, 'ctth': {}})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_nc(self, basename, names):
+        filename = os.path.join(self.tmpdir, basename)
+        pps_nc = netCDF4.Dataset(filename, 'w', format='NETCDF4')
+        pps_nc.createDimension('time', 1)
+        pps_nc.createDimension('ny', 200)
+        pps_nc.createDimension('nx', 50)
+        for name in names:
+            var = pps_nc.createVariable(name, 'f4', ('time', 'ny', 'nx'))
+            var[:] = self.field
+        pps_nc.close()
+        return filename
+
+    def test_read_when_used(self):
+        aux = read_all_intermediate_files(self.pps_files, {'CTTH_TYPES': ['CTTHnn']},
+                                          row_window=(50, 111))
+        self.assertIn('landuse', aux.field_names())
+        self.assertIn('surftemp', aux.field_names())
+        self.assertIn('t850', aux.field_names())
+        self.assertNotIn('landuse', aux.__dict__)
+        np.testing.assert_array_equal(aux.landuse, self.field[0, 50:111])
+        self.assertIn('landuse', aux.__dict__)
+        self.assertNotIn('elevation', aux.__dict__)
+        np.testing.assert_array_equal(aux.surftemp, self.field[0, 50:111])
+        # Not in the file
+        self.assertIsNone(aux.t850)
+        self.assertIsNone(aux.fractionofland)
+        self.assertIsNone(aux.snowa)
+
+    def test_wanted_fields(self):
+        aux = read_all_intermediate_files(self.pps_files, {'CTTH_TYPES': ['CTTHnn'],
+                                                           'AUX_FIELDS': ['elevation', 't500']})
+        self.assertEqual(aux.__dict__['_lazy'].keys(), set(['elevation', 't500']))
+        self.assertIsNone(aux.landuse)
+        np.testing.assert_array_equal(aux.t500, self.field[0])
+
+
+class test_run_read_tasks(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filenames = []
+        for ind in range(3):
+            filename = os.path.join(self.tmpdir, 'S_NWC_CMA_{:d}.nc'.format(ind))
+            pps_nc = netCDF4.Dataset(filename, 'w', format='NETCDF4')
+            pps_nc.createDimension('time', 1)
+            pps_nc.createDimension('ny', 20)
+            pps_nc.createDimension('nx', 10)
+            for name in ['cma_extended', 'cma_quality']:
+                var = pps_nc.createVariable(name, 'i1', ('time', 'ny', 'nx'))
+                var[:] = (np.arange(200).reshape(1, 20, 10) + ind) % 4
+            pps_nc.close()
+            self.filenames.append(filename)
+        self.corrupt = os.path.join(self.tmpdir, 'S_NWC_CMA_corrupt.nc')
+        with open(self.corrupt, 'w') as fhandle:
+            fhandle.write("not netcdf")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_same_result(self):
+        tasks = [(ind, read_cma_nc, (filename, (5, 15)))
+                 for ind, filename in enumerate(self.filenames)]
+        results = run_read_tasks(tasks, workers=1)
+        results_parallel = run_read_tasks(tasks, workers=3)
+        self.assertEqual(sorted(results_parallel.keys()), [0, 1, 2])
+        for ind in range(3):
+            np.testing.assert_array_equal(results[ind].cma_ext, results_parallel[ind].cma_ext)
+            self.assertEqual(results_parallel[ind].cma_ext.shape, (10, 10))
+
+    def test_first_error_raised(self):
+        missing = os.path.join(self.tmpdir, 'S_NWC_CMA_missing.nc')
+        tasks = [('cma', read_cma_nc, (self.filenames[0],)),
+                 ('corrupt', read_cma_nc, (self.corrupt,)),
+                 ('missing', read_cma_nc, (missing,))]
+        for workers in [1, 3]:
+            with self.assertRaises(OSError) as context:
+                run_read_tasks(tasks, workers=workers)
+            self.assertIn('S_NWC_CMA_corrupt.nc', str(context.exception))
+
+
+def suite():
+    """Create the test suite for test_read_pps."""
+    loader = unittest.TestLoader()
+    mysuite = unittest.TestSuite()
+    mysuite.addTest(loader.loadTestsFromTestCase(test_read_track_rows))
+    mysuite.addTest(loader.loadTestsFromTestCase(test_lazy_aux))
+    mysuite.addTest(loader.loadTestsFromTestCase(test_run_read_tasks))
+    return mysuite
+
+
+if __name__ == "__main__":
+    unittest.TextTestRunner(verbosity=2).run(suite())
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2019 atrain_match developers
+#
+# This file is part of atrain_match.
+#
+# atrain_match is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# atrain_match is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+#
+
+"""Test running crosses in parallel."""
+
+import os
+import shutil
+import tempfile
+import unittest
+import logging
+from datetime import datetime, timedelta
+from atrain_match.utils.common import Cross, MatchupError, TimeMatchError
+from atrain_match.utils.scheduler import (run_crosses, log_run_summary, get_cross_log_filename,
+                                          RunManifest, get_manifest_task)
+from atrain_match.utils.timing import stage, read_timing_records, summarize_timing
+
+logger = logging.getLogger(__name__)
+
+
+def fake_run(cross, outdir):
+    logger.warning("Running %s", cross)
+    if cross.time.minute == 1:
+        raise MatchupError("No matchups")
+    if cross.time.minute == 2:
+        raise TimeMatchError("Wrong time")
+    if cross.time.minute == 3:
+        raise ValueError("Unknown problem")
+    filename = os.path.join(outdir, cross.time.strftime("%M.txt"))
+    with stage('write', truth='calipso'):
+        with open(filename, 'w') as fhandle:
+            fhandle.write(str(cross))
+    return [filename]
+
+
+class test_run_crosses(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        start = datetime(2010, 1, 1, 12, 0)
+        self.crosses = [Cross('noaa18', start + timedelta(minutes=minute))
+                        for minute in [4, 1, 0, 2, 3, 5]]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def check_results(self, results):
+        self.assertEqual([result.cross for result in results], self.crosses)
+        self.assertEqual([result.status for result in results],
+                         ['ok', 'no_matchup', 'ok', 'time_match', 'problem', 'ok'])
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ['00.txt', '04.txt', '05.txt', 'logs'])
+        self.assertEqual(log_run_summary(results), 5)
+
+    def test_serial(self):
+        os.makedirs(os.path.join(self.tmpdir, 'logs'))
+        results = run_crosses(fake_run, self.crosses, (self.tmpdir,), workers=1)
+        self.check_results(results)
+
+    def test_parallel(self):
+        log_dir = os.path.join(self.tmpdir, 'logs')
+        results = run_crosses(fake_run, self.crosses, (self.tmpdir,), workers=3, log_dir=log_dir)
+        self.check_results(results)
+        for cross in self.crosses:
+            with open(get_cross_log_filename(log_dir, cross)) as fhandle:
+                self.assertIn("Running %s" % cross, fhandle.read())
+
+
+class test_run_manifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.outdir = os.path.join(self.tmpdir, 'out')
+        os.makedirs(self.outdir)
+        self.manifest_file = os.path.join(self.tmpdir, 'manifest', 'run_manifest.jsonl')
+        start = datetime(2010, 1, 1, 12, 0)
+        self.crosses = [Cross('noaa18', start + timedelta(minutes=minute))
+                        for minute in [4, 1, 0, 3]]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_resume(self):
+        manifest = RunManifest(self.manifest_file, 'test')
+        results = run_crosses(fake_run, self.crosses, (self.outdir,), workers=2, manifest=manifest)
+        self.assertEqual([result.status for result in results], ['ok', 'no_matchup', 'ok', 'problem'])
+        self.assertEqual(results[0].output_files, [os.path.join(self.outdir, '04.txt')])
+        # A new run only runs the cross with problems
+        for filename in os.listdir(self.outdir):
+            os.remove(os.path.join(self.outdir, filename))
+        manifest = RunManifest(self.manifest_file, 'test')
+        self.assertTrue(manifest.is_done(self.crosses[1]))
+        self.assertFalse(manifest.is_done(self.crosses[3]))
+        self.assertEqual(manifest.records[manifest.get_cross_key(self.crosses[0])]['output_files'],
+                         [os.path.join(self.outdir, '04.txt')])
+        results = run_crosses(fake_run, self.crosses, (self.outdir,), manifest=manifest, resume=True)
+        self.assertEqual([result.status for result in results], ['ok', 'no_matchup', 'ok', 'problem'])
+        self.assertEqual(os.listdir(self.outdir), [])
+        with open(self.manifest_file) as fhandle:
+            self.assertEqual(len(fhandle.readlines()), 5)
+        # Other tasks are not affected
+        manifest = RunManifest(self.manifest_file, 'other_test')
+        self.assertIsNone(manifest.get_status(self.crosses[0]))
+
+    def test_manifest_task(self):
+        import atrain_match.config as config
+        SETTINGS = {'CALIPSO_MATCHING': True, 'CLOUDSAT_MATCHING': False}
+        task = get_manifest_task('match', {}, SETTINGS)
+        self.assertEqual(task, get_manifest_task('match', {}, dict(SETTINGS)))
+        self.assertTrue(task.startswith('match:{:d}km:'.format(int(config.RESOLUTION))))
+        self.assertNotEqual(task, get_manifest_task('match', {}, dict(SETTINGS, CLOUDSAT_MATCHING=True)))
+        self.assertNotEqual(task, get_manifest_task('statistics:BASIC', {}, SETTINGS))
+        resolution = config.RESOLUTION
+        try:
+            config.RESOLUTION = 5 if resolution == 1 else 1
+            self.assertNotEqual(task, get_manifest_task('match', {}, SETTINGS))
+        finally:
+            config.RESOLUTION = resolution
+
+
+class test_stage_timing(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.timing_file = os.path.join(self.tmpdir, 'timing', 'stage_timing.jsonl')
+        start = datetime(2010, 1, 1, 12, 0)
+        self.crosses = [Cross('noaa18', start + timedelta(minutes=minute))
+                        for minute in [4, 1, 0]]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_timing(self):
+        run_crosses(fake_run, self.crosses, (self.tmpdir,), workers=2,
+                    timing_file=self.timing_file)
+        records = read_timing_records([self.timing_file])
+        self.assertEqual(len(records), 5)
+        cross_key = RunManifest.get_cross_key(self.crosses[1])
+        self.assertEqual([record['status'] for record in records if record['cross'] == cross_key],
+                         ['error'])
+        write_records = [record for record in records if record['stage'] == 'write']
+        self.assertEqual(len(write_records), 2)
+        self.assertEqual(write_records[0]['parent'], 'test_scheduler')
+        self.assertEqual(write_records[0]['truth'], 'calipso')
+        for record in records:
+            self.assertGreaterEqual(record['wall'], 0)
+            self.assertGreaterEqual(record['cpu'], 0)
+        summary = summarize_timing(records)
+        self.assertEqual([(item['stage'], item['truth'], item['count'], item['errors'], item['crosses'])
+                          for item in summary],
+                         [('test_scheduler', '', 3, 1, 3),
+                          ('test_scheduler/write', 'calipso', 2, 0, 2)])
+        # Nothing recorded outside the crosses
+        with stage('write'):
+            pass
+        self.assertEqual(len(read_timing_records([self.timing_file])), 5)
+
+
+def suite():
+    """Create the test suite for test_scheduler."""
+    loader = unittest.TestLoader()
+    mysuite = unittest.TestSuite()
+    mysuite.addTest(loader.loadTestsFromTestCase(test_run_crosses))
+    mysuite.addTest(loader.loadTestsFromTestCase(test_run_manifest))
+    mysuite.addTest(loader.loadTestsFromTestCase(test_stage_timing))
+
+    return mysuite
+
+
+if __name__ == "__main__":
+    unittest.main()
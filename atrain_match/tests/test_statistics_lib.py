@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2019 atrain_match developers
+#
+# This file is part of atrain_match.
+#
+# atrain_match is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# atrain_match is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+#
+
+"""Test the statistics counting for several modes."""
+
+import unittest
+import numpy as np
+from atrain_match.libs.truth_imager_statistics_lib import count_for_modes
+
+
+class test_count_for_modes(unittest.TestCase):
+
+    def test_same_as_counting_each_mode(self):
+        rng = np.random.RandomState(3)
+        npix = 500
+        mode_subsets = rng.uniform(size=(4, npix)) > 0.3
+        truth_categories = [rng.uniform(size=npix) > 0.5 for i in range(3)]
+        imager_categories = [rng.uniform(size=npix) > 0.5 for i in range(2)]
+        counts = count_for_modes(mode_subsets, truth_categories, imager_categories)
+        self.assertEqual(counts.shape, (4, 3, 2))
+        for mode in range(4):
+            for truth in range(3):
+                for imager in range(2):
+                    expected = np.sum(np.logical_and(
+                        mode_subsets[mode],
+                        np.logical_and(truth_categories[truth], imager_categories[imager])))
+                    self.assertEqual(counts[mode, truth, imager], expected)
+
+    def test_one_mode(self):
+        counts = count_for_modes([np.array([True, True, False])],
+                                 [np.array([True, False, True])],
+                                 [np.array([True, True, True])])
+        self.assertEqual(counts[0, 0, 0], 1)
+
+
+def suite():
+    """Create the test suite for test_statistics_lib."""
+    loader = unittest.TestLoader()
+    mysuite = unittest.TestSuite()
+    mysuite.addTest(loader.loadTestsFromTestCase(test_count_for_modes))
+
+    return mysuite
+
+
+if __name__ == "__main__":
+    unittest.main()
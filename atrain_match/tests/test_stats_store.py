@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2019 atrain_match developers
+#
+# This file is part of atrain_match.
+#
+# atrain_match is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# atrain_match is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+#
+
+"""Test the binary statistics store."""
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from atrain_match.utils.stats_store import (StatisticsWriter,
+                                            get_stats_store_filename,
+                                            read_stats_store)
+from atrain_match.statistics.orrb_stat_class import OrrbStats
+
+STAT_LINES = [
+    "CALIPSO min and max time diff: -100.00 99.99 \n",
+    "CLOUD MASK CALIPSO-IMAGER TABLE: 10 15 18 17 \n",
+    "CLOUD MASK CALIPSO-IMAGER POD-CLEAR:  40.00 \n",
+    "CLOUD MASK PROB CALIPSO-IMAGER TABLE CLEAR: 1 1 0 3  \n",
+    "CLOUD HEIGHT GEO-STYLE\n",
+    "CLOUD HEIGHT CALIOP-SINGLE-LAYER>0.400000 ALL: -99.00 -8947.42 8947.42 1 1 0\n",
+    "CLOUD MASK CLOUDSAT-IMAGER TABLE: 1 2 3 4 \n"]
+
+
+class test_stats_store(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.statfilename = os.path.join(self.tmpdir, "1km_test_calipso_imager_stat.dat")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, write_text):
+        statfile = StatisticsWriter(self.statfilename, write_text=write_text)
+        for line in STAT_LINES:
+            statfile.write(line)
+        statfile.close()
+
+    def test_store(self):
+        self.write(write_text=False)
+        self.assertFalse(os.path.exists(self.statfilename))
+        stored = read_stats_store(get_stats_store_filename(self.statfilename))
+        self.assertEqual(len(stored), 6)
+        self.assertEqual(stored[1][0], "CLOUD MASK CALIPSO-IMAGER TABLE")
+        np.testing.assert_array_equal(stored[1][1], [10, 15, 18, 17])
+
+    def test_read_same_as_text(self):
+        self.write(write_text=True)
+        stats = OrrbStats(truth_sat='calipso')
+        from_text = stats.read_one_file(self.statfilename)
+        from_store = stats.read_one_file(get_stats_store_filename(self.statfilename))
+        self.assertEqual(sorted(from_text.keys()), sorted(from_store.keys()))
+        self.assertNotIn("CLOUD MASK CLOUDSAT-IMAGER TABLE", from_store)
+        for key in from_text:
+            np.testing.assert_array_equal(from_text[key], from_store[key])
+
+    def test_write_values(self):
+        statfile = StatisticsWriter(self.statfilename, write_text=True)
+        statfile.write_values("CALIPSO min and max time diff", [-100.004, 99.987], "%3.2f")
+        statfile.write_values("CLOUD MASK CALIPSO-IMAGER TABLE", np.array([10, 15, 18, 17]))
+        statfile.write("CLOUD HEIGHT GEO-STYLE\n")
+        statfile.write_values("CLOUD HEIGHT CALIPSO ALL", [0.12345, 7.9, 3],
+                              ["%3.2f", "%d", "%d"])
+        statfile.close()
+        stored = read_stats_store(get_stats_store_filename(self.statfilename))
+        self.assertEqual([label for label, dummy in stored],
+                         ["CALIPSO min and max time diff", "CLOUD MASK CALIPSO-IMAGER TABLE",
+                          "CLOUD HEIGHT CALIPSO ALL"])
+        np.testing.assert_array_equal(stored[0][1], [-100.0, 99.99])
+        np.testing.assert_array_equal(stored[2][1], [0.12, 7, 3])
+        stats = OrrbStats(truth_sat='calipso')
+        from_text = stats.read_one_file(self.statfilename)
+        from_store = stats.read_one_file(get_stats_store_filename(self.statfilename))
+        self.assertEqual(sorted(from_text.keys()), sorted(from_store.keys()))
+        for key in from_text:
+            np.testing.assert_array_equal(from_text[key], from_store[key])
+
+
+def suite():
+    """Create the test suite for test_stats_store."""
+    loader = unittest.TestLoader()
+    mysuite = unittest.TestSuite()
+    mysuite.addTest(loader.loadTestsFromTestCase(test_stats_store))
+
+    return mysuite
+
+
+if __name__ == "__main__":
+    unittest.main()
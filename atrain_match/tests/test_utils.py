@@ -22,8 +22,17 @@
 
 import numpy as np
 import unittest
-from atrain_match.utils.pps_prototyping_util import (get_warmest_or_coldest_index)
+from atrain_match.utils.pps_prototyping_util import (get_warmest_or_coldest_index,
+                                                     get_extreme_neighbour_index)
 from atrain_match.utils import match
+from atrain_match.utils.common import (get_imager_sec_1970, split_imager_time,
+                                       map_imager, map_imager_distances,
+                                       get_truth_candidates, get_imager_time_range)
+from atrain_match.cloudproducts.read_pps import AllImagerData
+from atrain_match.config import NODATA
+from atrain_match.libs.extract_imager_along_track import (AlongTrackGather,
+                                                          get_segment_row_col_idx,
+                                                          interpolate_profiles_at_pressure)
 
 
 def get_warmest_index_old(t11, matched):
@@ -47,6 +56,28 @@ def get_warmest_index_old(t11, matched):
     return new_row_matched, new_col_matched
 
 
+def get_warmest_or_coldest_index_loop(t11, matched, warmest=True):
+    from atrain_match.utils.pps_prototyping_util import get_data_from_array_fill_outside
+    FILL = 999999.9  # coldest
+    if warmest:
+        FILL = -99
+    steps = [(i, j) for i in [-2, -1, 0, 1, 2] for j in [-2, -1, 0, 1, 2]]
+    t11_neighbour_i = np.zeros((25, matched['row'].shape[0]))
+    for i, (step_r, step_c) in enumerate(steps):
+        new_row_col = {'row': matched['row'] + step_r,
+                       'col': matched['col'] + step_c}
+        t11_neighbour_i[i, :] = get_data_from_array_fill_outside(t11, new_row_col, Fill=FILL)
+    if warmest:
+        neigbour_index = np.argmax(t11_neighbour_i, axis=0)
+    else:
+        neigbour_index = np.argmin(t11_neighbour_i, axis=0)
+    new_row_matched = np.array([matched['row'][idx] + steps[neigbour_index[idx]][0]
+                                for idx in range(matched['row'].shape[0])])
+    new_col_matched = np.array([matched['col'][idx] + steps[neigbour_index[idx]][1]
+                                for idx in range(matched['row'].shape[0])])
+    return new_row_matched, new_col_matched
+
+
 class test_prototyping_utils(unittest.TestCase):
 
     def setUp(self):
@@ -74,6 +105,19 @@ class test_prototyping_utils(unittest.TestCase):
         self.assertTrue((out_c == out_c2).all())
         self.assertTrue((out_r == out_r2).all())
 
+    def test_several_arrays(self):
+        rng = np.random.RandomState(3)
+        # Integer values to get ties
+        t11 = rng.randint(200, 210, size=(30, 20)).astype(np.float32)
+        r06 = rng.randint(0, 5, size=(30, 20)).astype(np.float32)
+        matched = {'row': rng.randint(0, 30, size=200),
+                   'col': rng.randint(0, 20, size=200)}
+        retv = get_extreme_neighbour_index([t11, t11, r06], matched, [True, False, False])
+        for new_row_col, data, warmest in zip(retv, [t11, t11, r06], [True, False, False]):
+            out_r, out_c = get_warmest_or_coldest_index_loop(data, matched, warmest=warmest)
+            self.assertTrue((new_row_col['row'] == out_r).all())
+            self.assertTrue((new_row_col['col'] == out_c).all())
+
 class test_match_lon_lat(unittest.TestCase):
 
     def setUp(self):
@@ -119,12 +163,306 @@ class test_match_lon_lat(unittest.TestCase):
                                        n_neighbours=1)
         self.assertEqual(mapper.cols.data[1], 1)
 
+    def test_neighbour_index_reused(self):
+        index = match.SwathNeighbourIndex(*self.source3)
+        mapper, dist = match.match_lonlat(self.source3, self.target,
+                                          radius_of_influence=0.7 * 5 * 1000.0,
+                                          n_neighbours=1)
+        for dummy in range(2):
+            mapper_i, dist_i = match.match_lonlat(None, self.target,
+                                                  radius_of_influence=0.7 * 5 * 1000.0,
+                                                  n_neighbours=1,
+                                                  neighbour_index=index)
+            self.assertTrue((mapper_i.rows.data == mapper.rows.data).all())
+            self.assertTrue((mapper_i.cols.data == mapper.cols.data).all())
+            np.testing.assert_allclose(dist_i, dist)
+        self.assertEqual(mapper_i.rows.data[2], 1)
+        self.assertEqual(mapper_i.cols.data[2], 2)
+        self.assertEqual(dist_i[0], -9)
+
+    def test_neighbour_index_several_neighbours(self):
+        index = match.SwathNeighbourIndex(*self.source)
+        mapper, dist = index.match(self.target, radius_of_influence=2000000.0,
+                                   n_neighbours=3)
+        self.assertEqual(mapper.rows.shape, (3, 3))
+        # Invalid source lat/lon are never neighbours
+        self.assertFalse(((mapper.rows.data == 0) & (mapper.cols.data == 0)).any())
+        self.assertFalse(((mapper.rows.data == 1) & (mapper.cols.data == 0)).any())
+        self.assertTrue((dist[:, 0] <= dist[:, 1]).all())
+
+    def test_match_along_track(self):
+        # Two tracks along the same ground track, the target 12.7 s behind
+        sec = np.arange(2000) * 0.15
+        lat = -60 + sec * 0.0063
+        lon = 10 + sec * 0.002
+        lon[100] = -999
+        sec_t = np.arange(1500) * 0.2 + 3
+        lat_t = -60 + (sec_t + 12.7) * 0.0063 + np.random.RandomState(1).normal(0, 0.001, 1500)
+        lon_t = 10 + (sec_t + 12.7) * 0.002
+        lat_t[5] = -999
+        mapper, _ = match.match_lonlat((lon.reshape(-1, 1), lat.reshape(-1, 1)),
+                                       (lon_t.reshape(-1, 1), lat_t.reshape(-1, 1)),
+                                       radius_of_influence=1000, n_neighbours=1)
+        index = match.match_along_track((lon, lat), (lon_t, lat_t), sec, sec_t,
+                                        radius_of_influence=1000)
+        self.assertTrue((index == mapper.rows.filled(-9).ravel()).all())
+        self.assertEqual(index[5], -9)
+        self.assertTrue((index[-50:] == -9).all())
+        self.assertTrue((index != 100).all())
+
+    def test_match_along_track_unsorted(self):
+        # Unsorted or missing time falls back to match_lonlat
+        sec = np.arange(200) * 0.15
+        lat = -60 + sec * 0.0063
+        lon = 10 + sec * 0.002
+        lat_t = lat[::-1].copy() + 0.001
+        lon_t = lon[::-1].copy()
+        mapper, _ = match.match_lonlat((lon.reshape(-1, 1), lat.reshape(-1, 1)),
+                                       (lon_t.reshape(-1, 1), lat_t.reshape(-1, 1)),
+                                       radius_of_influence=1000, n_neighbours=1)
+        expected = mapper.rows.filled(-9).ravel()
+        unsorted_sec = sec[::-1].copy()
+        index = match.match_along_track((lon, lat), (lon_t, lat_t), unsorted_sec, sec,
+                                        radius_of_influence=1000)
+        np.testing.assert_array_equal(index, expected)
+        nan_sec = sec.copy()
+        nan_sec[7] = np.nan
+        index = match.match_along_track((lon, lat), (lon_t, lat_t), nan_sec, sec,
+                                        radius_of_influence=1000)
+        np.testing.assert_array_equal(index, expected)
+
+
+class test_along_track_gather(unittest.TestCase):
+
+    def setUp(self):
+        self.data = np.arange(20, dtype=np.int16).reshape(4, 5)
+        self.data3d = np.arange(60, dtype=np.float32).reshape(4, 5, 3)
+        self.rows = np.array([0, 3, 2, 1])
+        self.cols = np.array([4, 0, 2, 1])
+
+    def test_gather(self):
+        gather = AlongTrackGather(self.rows, self.cols)
+        out = gather(self.data)
+        self.assertEqual(out.dtype, np.int16)
+        self.assertTrue((out == [4, 15, 12, 6]).all())
+        out = gather(self.data3d)
+        self.assertEqual(out.shape, (4, 3))
+        self.assertTrue((out == self.data3d[self.rows, self.cols, :]).all())
+        self.assertIsNone(gather(None))
+
+    def test_gather_nneigh(self):
+        rows = np.array([[0, -9], [3, 2]])
+        cols = np.array([[4, -9], [0, 2]])
+        gather = AlongTrackGather(rows, cols)
+        out = gather(self.data)
+        self.assertTrue((out == [[4, -9], [15, 12]]).all())
+        self.assertTrue((gather.mean(self.data) == [4, 13.5]).all())
+        out = gather(self.data.astype(np.uint8))
+        self.assertEqual(out[0, 1], -9)
+
+
+def get_segment_row_col_idx_old(nwp_segments, row_matched, col_matched):
+    segment_colidx = nwp_segments['colidx']
+    segment_rowidx = nwp_segments['rowidx']
+    seg_row = np.zeros(np.size(row_matched)) - 9
+    seg_col = np.zeros(np.size(col_matched)) - 9
+    for s_col in range(nwp_segments['norows']):
+        for s_row in range(nwp_segments['nocols']):
+            within_segment = np.logical_and(
+                np.logical_and(
+                    row_matched >= (segment_rowidx[s_row, s_col] - nwp_segments['segSizeX']/2),
+                    row_matched < (segment_rowidx[s_row, s_col] + nwp_segments['segSizeX']/2)),
+                np.logical_and(
+                    col_matched >= (segment_colidx[s_row, s_col] - nwp_segments['segSizeY']/2),
+                    col_matched < (segment_colidx[s_row, s_col] + nwp_segments['segSizeY']/2)))
+            seg_row[within_segment] = s_row
+            seg_col[within_segment] = s_col
+    return seg_row.astype(np.int16), seg_col.astype(np.int16)
+
+
+class test_nwp_segment_index(unittest.TestCase):
+
+    def setUp(self):
+        s_row, s_col = np.meshgrid(np.arange(3), np.arange(4), indexing='ij')
+        self.nwp_segments = {'nocols': 3, 'norows': 4,
+                             'segSizeX': 8, 'segSizeY': 6,
+                             'rowidx': s_row * 8 + 4,
+                             'colidx': s_col * 6 + 3}
+
+    def test_segment_index(self):
+        rng = np.random.RandomState(1)
+        # Some pixels are outside all segments
+        row_matched = rng.randint(-2, 27, size=500)
+        col_matched = rng.randint(-2, 27, size=500)
+        seg_row, seg_col = get_segment_row_col_idx(self.nwp_segments, row_matched, col_matched)
+        seg_row_old, seg_col_old = get_segment_row_col_idx_old(self.nwp_segments,
+                                                               row_matched, col_matched)
+        self.assertEqual(seg_row.dtype, np.int16)
+        self.assertTrue((seg_row == seg_row_old).all())
+        self.assertTrue((seg_col == seg_col_old).all())
+        self.assertTrue((seg_row == -9).any())
+        seg_row, seg_col = get_segment_row_col_idx(self.nwp_segments,
+                                                   np.array([8, 7]), np.array([6, 5]))
+        self.assertTrue((seg_row == [1, 0]).all())
+        self.assertTrue((seg_col == [1, 0]).all())
+
+
+class test_nwp_interpolation(unittest.TestCase):
+
+    def setUp(self):
+        # Two pixels, the first model level is below the surface for the second
+        self.pressure = np.array([[950.0, 800.0, 500.0, 300.0],
+                                  [1000.0, 700.0, 400.0, 200.0]])
+        self.psur = np.array([1000.0, 900.0])
+        self.height = -7000.0 * np.log(self.pressure / 1000.0)
+        self.surface_h = -7000.0 * np.log(self.psur / 1000.0)
+        self.temperature = 290.0 + 0.006 * 7000.0 * np.log(self.pressure / 1000.0)
+        self.surface_t = 290.0 + 0.006 * 7000.0 * np.log(self.psur / 1000.0)
+
+    def test_interpolate_levels(self):
+        levels = [440.0, 680.0, 980.0]
+        height, temperature = interpolate_profiles_at_pressure(
+            self.pressure, self.psur, levels,
+            [self.height, self.temperature], [self.surface_h, self.surface_t])
+        self.assertEqual(height.shape, (2, 3))
+        # Profiles linear in log pressure are reproduced exactly
+        expected_h = -7000.0 * np.log(np.array([levels, levels]) / 1000.0)
+        np.testing.assert_allclose(height, expected_h)
+        np.testing.assert_allclose(temperature, 290.0 - 0.006 * expected_h)
+
+    def test_interpolate_level_for_each_pixel(self):
+        levels = np.array([[350.0], [950.0]])
+        height, = interpolate_profiles_at_pressure(
+            self.pressure, self.psur, levels, [self.height], [self.surface_h])
+        np.testing.assert_allclose(height, -7000.0 * np.log(levels / 1000.0))
+
+
+class test_imager_time(unittest.TestCase):
+
+    def setUp(self):
+        # Scan of 0.1 s per column, 2 s per line
+        self.imager = AllImagerData()
+        self.imager.time = (1.0e9 + 2.0 * np.arange(20)[:, np.newaxis] +
+                            0.1 * np.arange(30)[np.newaxis, :])
+        self.rows = np.array([0, 5, NODATA, 19])
+        self.cols = np.array([3, 29, NODATA, 0])
+
+    def get_time_old(self):
+        imager_time_vector = [self.imager.time[line, pixel] for line, pixel in zip(self.rows, self.cols)]
+        return np.where(self.rows != NODATA, imager_time_vector, np.nan)
+
+    def test_pixel_time(self):
+        np.testing.assert_array_equal(get_imager_sec_1970(self.imager, self.rows, self.cols),
+                                      self.get_time_old())
+
+    def test_line_time(self):
+        self.imager.time = self.imager.time[:, 0]
+        np.testing.assert_array_equal(get_imager_sec_1970(self.imager, self.rows, self.cols),
+                                      np.where(self.rows != NODATA, self.imager.time[self.rows], np.nan))
+
+    def test_split_time(self):
+        expected = self.get_time_old()
+        split_imager_time(self.imager)
+        self.assertEqual(self.imager.time.shape, (20,))
+        self.assertEqual(self.imager.time_column_offset.shape, (30,))
+        np.testing.assert_allclose(get_imager_sec_1970(self.imager, self.rows, self.cols),
+                                   expected, atol=1e-3)
+
+    def test_split_time_masked(self):
+        time = np.ma.masked_array(self.imager.time, mask=False)
+        time[:5, :10] = np.ma.masked
+        self.imager.time = time
+        expected = self.get_time_old()
+        self.assertTrue(np.isnan(expected[0]))
+        split_imager_time(self.imager)
+        self.assertEqual(self.imager.time.shape, (20, 30))
+        np.testing.assert_array_equal(get_imager_sec_1970(self.imager, self.rows, self.cols),
+                                      expected)
+
+    def test_nan_time(self):
+        self.imager.time[0, 3] = np.nan
+        split_imager_time(self.imager)
+        self.assertEqual(self.imager.time.shape, (20, 30))
+        sec_1970 = get_imager_sec_1970(self.imager, self.rows, self.cols)
+        self.assertTrue(np.isnan(sec_1970[0]))
+        np.testing.assert_array_equal(sec_1970[1:], self.get_time_old()[1:])
+
+    def test_keep_irregular_time(self):
+        self.imager.time[3, 3] += 60.0
+        split_imager_time(self.imager)
+        self.assertEqual(self.imager.time.shape, (20, 30))
+        self.assertIsNone(getattr(self.imager, "time_column_offset", None))
+
+
+class test_truth_candidates(unittest.TestCase):
+
+    def setUp(self):
+        # Truth track crossing rows 60-100
+        self.lat = np.linspace(50.0 + 60 * 0.009, 50.0 + 100 * 0.009, 30)
+        self.lon = np.linspace(10.1, 10.5, 30)
+
+    def get_swath(self, num_rows=200, num_cols=50):
+        """Imager swath with about 1 km pixels."""
+        imager = AllImagerData()
+        rows, cols = np.meshgrid(np.arange(num_rows), np.arange(num_cols), indexing='ij')
+        imager.latitude = 50.0 + rows * 0.009
+        imager.longitude = 10.0 + cols * 0.014
+        imager.time = np.arange(num_rows, dtype=np.float64)
+        return imager
+
+    def test_truth_candidates(self):
+        imager = self.get_swath()
+        imager.sec1970_start = 0.0
+        imager.sec1970_end = 199.0
+        # Track far from the swath, and outside the swath time
+        lon = np.concatenate([self.lon, [-60.0, 10.2, 10.3]])
+        lat = np.concatenate([self.lat, [-30.0, 50.5, 50.6]])
+        sec_1970 = np.concatenate([np.linspace(60, 100, 30), [80.0, 1000.0, -1000.0]])
+        candidates = get_truth_candidates(imager, lon, lat, 700.0,
+                                          sec_1970=sec_1970, time_threshold=300)
+        self.assertTrue(candidates[:30].all())
+        self.assertFalse(candidates[30:].any())
+        self.assertTrue(get_truth_candidates(imager, lon, lat, 700.0)[31:].all())
+        cal, cap = map_imager(self.get_swath(), lon, lat, radius_of_influence=700.0)
+        cal_c, cap_c = map_imager(imager, lon, lat, radius_of_influence=700.0,
+                                  sec_1970=sec_1970, time_threshold=300)
+        self.assertTrue((cal_c[:31] == cal[:31]).all())
+        self.assertTrue((cap_c[:31] == cap[:31]).all())
+        self.assertTrue((cal_c[31:] == NODATA).all())
+        self.assertTrue((cal[31:] != NODATA).all())
+        retv = map_imager_distances(imager, lon, lat, 700.0, n_neighbours=4,
+                                    sec_1970=sec_1970, time_threshold=300)
+        self.assertEqual(retv["distances"].shape, (33, 4))
+        self.assertTrue((retv["mapper"][0][30:] == NODATA).all())
+
+    def test_truth_candidates_pixel_time(self):
+        imager = self.get_swath()
+        # Nominal time range narrower than the time of the pixels
+        imager.sec1970_start = 0.0
+        imager.sec1970_end = 20.0
+        sec_1970 = np.linspace(60, 100, 30)
+        candidates = get_truth_candidates(imager, self.lon, self.lat, 700.0,
+                                          sec_1970=sec_1970, time_threshold=10)
+        self.assertTrue(candidates.all())
+        cal, cap = map_imager(imager, self.lon, self.lat, radius_of_influence=700.0,
+                              sec_1970=sec_1970, time_threshold=10)
+        self.assertTrue((cal != NODATA).all())
+        self.assertEqual(get_imager_time_range(imager), (0.0, 199.0))
+        imager.time_column_offset = np.linspace(-5, 5, 50).astype(np.float32)
+        self.assertEqual(get_imager_time_range(imager), (-5.0, 204.0))
+
+
 def suite():
     """Create the suite for test_utils."""
     loader = unittest.TestLoader()
     mysuite = unittest.TestSuite()
     mysuite.addTest(loader.loadTestsFromTestCase(test_prototyping_utils))
     mysuite.addTest(loader.loadTestsFromTestCase(test_match_lon_lat))
+    mysuite.addTest(loader.loadTestsFromTestCase(test_along_track_gather))
+    mysuite.addTest(loader.loadTestsFromTestCase(test_nwp_segment_index))
+    mysuite.addTest(loader.loadTestsFromTestCase(test_nwp_interpolation))
+    mysuite.addTest(loader.loadTestsFromTestCase(test_imager_time))
+    mysuite.addTest(loader.loadTestsFromTestCase(test_truth_candidates))
     return mysuite
 
 
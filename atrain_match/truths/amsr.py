@@ -18,7 +18,7 @@
 import logging
 from atrain_match.utils.validate_lwp_util import LWP_THRESHOLD
 from atrain_match.libs.extract_imager_along_track import imager_track_from_matched
-from atrain_match.utils.common import (ProcessingError, elements_within_range)
+from atrain_match.utils.common import (ProcessingError, elements_within_range, get_imager_sec_1970)
 from atrain_match.utils.runutils import do_some_logging
 from atrain_match.truths.calipso import find_break_points
 from atrain_match.matchobject_io import (TruthImagerTrackObject,
@@ -159,7 +159,9 @@ def match_amsr_imager(amsr, cloudproducts, SETTINGS):
                                            amsr.longitude.ravel(),
                                            amsr.latitude.ravel(),
                                            radius_of_influence=AMSR_RADIUS,
-                                           n_neighbours=n_neighbours)
+                                           n_neighbours=n_neighbours,
+                                           sec_1970=amsr.sec_1970,
+                                           time_threshold=SETTINGS["sec_timeThr"])
     cal, cap = mapper_and_dist["mapper"]
     distances = mapper_and_dist["distances"]
     cal_1 = cal[:, 0]
@@ -170,14 +172,9 @@ def match_amsr_imager(amsr, cloudproducts, SETTINGS):
         logger.warning("No matches within region.")
         return None
     # check if it is within time limits:
-    if len(cloudproducts.time.shape) > 1:
-        imager_time_vector = [cloudproducts.time[line, pixel] for line, pixel in zip(cal_1, cap_1)]
-        imager_lines_sec_1970 = np.where(cal_1 != config.NODATA, imager_time_vector, np.nan)
-    else:
-        imager_lines_sec_1970 = np.where(cal_1 != config.NODATA, cloudproducts.time[cal_1], np.nan)
+    imager_lines_sec_1970 = get_imager_sec_1970(cloudproducts, cal_1, cap_1)
     # Find all matching Amsr pixels within +/- sec_timeThr from the IMAGER data
-    imager_sunz_vector = np.array([cloudproducts.imager_angles.sunz.data[line, pixel]
-                                   for line, pixel in zip(cal_1, cap_1)])
+    imager_sunz_vector = cloudproducts.imager_angles.sunz.data[cal_1, cap_1]
     idx_match = np.logical_and(
         elements_within_range(amsr.sec_1970, imager_lines_sec_1970, SETTINGS["sec_timeThr"]),
         imager_sunz_vector <= 84)  # something larger than 84 (max for lwp)
@@ -19,9 +19,11 @@ from atrain_match.utils.runutils import do_some_logging
 from atrain_match.matchobject_io import (TruthImagerTrackObject,
                                          CalipsoObject)
 from atrain_match.utils.common import (InputError, ProcessingError,
-                                       elements_within_range)
+                                       elements_within_range, get_imager_sec_1970)
 import atrain_match.config as config
 import os
+import json
+import hashlib
 import numpy as np
 import time as tm
 from datetime import datetime
@@ -50,18 +52,16 @@ def match_calipso_imager(values,
     cal, cap = map_imager(cloudproducts,
                           calipso.longitude.ravel(),
                           calipso.latitude.ravel(),
-                          radius_of_influence=config.RESOLUTION * 0.7 * 1000.0)  # somewhat larger than radius...
+                          radius_of_influence=config.RESOLUTION * 0.7 * 1000.0,  # somewhat larger than radius...
+                          sec_1970=calipso.sec_1970,
+                          time_threshold=SETTINGS["sec_timeThr"])
     # warn if no matches
     calnan = np.where(cal == config.NODATA, np.nan, cal)
     if (~np.isnan(calnan)).sum() == 0:
         logger.warning("No matches within region.")
         return None
     # check if it is within time limits:
-    if len(cloudproducts.time.shape) > 1:
-        imager_time_vector = [cloudproducts.time[line, pixel] for line, pixel in zip(cal, cap)]
-        imager_lines_sec_1970 = np.where(cal != config.NODATA, imager_time_vector, np.nan)
-    else:
-        imager_lines_sec_1970 = np.where(cal != config.NODATA, cloudproducts.time[cal], np.nan)
+    imager_lines_sec_1970 = get_imager_sec_1970(cloudproducts, cal, cap)
     idx_match = elements_within_range(calipso.sec_1970, imager_lines_sec_1970, SETTINGS["sec_timeThr"])
     if idx_match.sum() == 0:
         logger.warning("No matches in region within time threshold %d s.", SETTINGS["sec_timeThr"])
@@ -299,10 +299,10 @@ def read_calipso_h5(filename, retv):
             logger.info("Reading single shot information")
             retv = rearrange_calipso_the_single_shot_info(
                 retv,
-                {"ssNumber_Layers_Found": h5file["Single_Shot_Detection/ssNumber_Layers_Found"].value,
-                 "ssLayer_Base_Altitude": h5file["Single_Shot_Detection/ssLayer_Base_Altitude"].value,
-                 "ssLayer_Top_Pressure": h5file["Single_Shot_Detection/ssLayer_Top_Pressure"].value,
-                 "ssLayer_Top_Altitude": h5file["Single_Shot_Detection/ssLayer_Top_Altitude"].value})
+                {"ssNumber_Layers_Found": h5file["Single_Shot_Detection/ssNumber_Layers_Found"][()],
+                 "ssLayer_Base_Altitude": h5file["Single_Shot_Detection/ssLayer_Base_Altitude"][()],
+                 "ssLayer_Top_Pressure": h5file["Single_Shot_Detection/ssLayer_Top_Pressure"][()],
+                 "ssLayer_Top_Altitude": h5file["Single_Shot_Detection/ssLayer_Top_Altitude"][()]})
         for dataset in h5file.keys():
             if dataset in ["Single_Shot_Detection"]:
                 # Handeled above
@@ -319,28 +319,194 @@ def read_calipso_h5(filename, retv):
             name = dataset.lower()
             if dataset in atrain_match_names.keys():
                 name = atrain_match_names[dataset]
-            data = h5file[dataset].value
+            data = h5file[dataset][()]
             data = np.array(data)
             setattr(retv, name, data)
         h5file.close()
     return retv
 
 
+def read_calipso_time_range(filename):
+    """Read time (sec1970) of first and last profile, without reading the whole file."""
+    if "hdf" in filename:
+        from pyhdf.SD import SD, SDC
+        h4file = SD(filename, SDC.READ)
+        sds = h4file.select("Profile_Time")
+        dims = sds.info()[2]
+        if not isinstance(dims, list):
+            dims = [dims]
+        ncols = dims[1] if len(dims) > 1 else 1
+        first = np.array(sds.get(start=(0, 0), count=(1, ncols)))
+        last = np.array(sds.get(start=(dims[0] - 1, 0), count=(1, ncols)))
+        sds.endaccess()
+        h4file.end()
+    else:
+        import h5py
+        with h5py.File(filename, 'r') as h5file:
+            profile_time = h5file["Profile_Time"]
+            first = np.array(profile_time[0])
+            last = np.array(profile_time[-1])
+    dsec = tm.mktime((1993, 1, 1, 0, 0, 0, 0, 0, 0)) - tm.timezone
+    return float(np.min(first)) + dsec, float(np.max(last)) + dsec
+
+
+class CalipsoTimeIndex(object):
+    """Start and end time of CALIPSO granules, keyed by path and mtime.
+
+    The index is saved as json in *filename*, so that each granule only needs
+    to be probed once, also between runs.
+
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.granules = {}
+        self.updated = False
+        if filename and os.path.isfile(filename):
+            try:
+                with open(filename, 'r') as fh:
+                    self.granules = json.load(fh)
+            except (IOError, ValueError):
+                logger.warning("Could not read CALIPSO time index %s", filename)
+
+    def get_time_range(self, calipso_file):
+        """Get start and end time (sec1970) for *calipso_file*."""
+        key = os.path.abspath(calipso_file)
+        mtime = os.path.getmtime(calipso_file)
+        granule = self.granules.get(key)
+        if granule is None or granule['mtime'] != mtime:
+            start, end = read_calipso_time_range(calipso_file)
+            granule = {'mtime': mtime, 'start': start, 'end': end}
+            self.granules[key] = granule
+            self.updated = True
+        return granule['start'], granule['end']
+
+    def save(self):
+        """Write the index to file if there are new granules."""
+        if not self.filename or not self.updated:
+            return
+        tmp_filename = "{:s}.{:d}.tmp".format(self.filename, os.getpid())
+        try:
+            with open(tmp_filename, 'w') as fh:
+                json.dump(self.granules, fh)
+            os.replace(tmp_filename, self.filename)
+            self.updated = False
+        except (IOError, OSError):
+            logger.warning("Could not write CALIPSO time index %s", self.filename)
+
+
+_CALIPSO_TIME_INDEX = {}
+
+
+def get_calipso_time_index(filename=None):
+    """Get the CALIPSO time index, it is only read from file once."""
+    if filename is None:
+        filename = config.CALIPSO_TIME_INDEX_FILE
+    if filename not in _CALIPSO_TIME_INDEX:
+        _CALIPSO_TIME_INDEX[filename] = CalipsoTimeIndex(filename)
+    return _CALIPSO_TIME_INDEX[filename]
+
+
+# Update if the content of the CALIPSO cache files change
+CALIPSO_CACHE_VERSION = 1
+
+
+def get_calipso_cache_filename(file_lists, settings, cache_dir=None):
+    """Get the cache file for decoded CALIPSO data.
+
+    The name is a hash of the path and mtime of all files in *file_lists*
+    and of the *settings* (dict) used when combining them.
+    Returns None if no cache directory is configured.
+
+    """
+    if cache_dir is None:
+        cache_dir = config.CALIPSO_CACHE_DIR
+    if not cache_dir:
+        return None
+    granules = []
+    for files in file_lists:
+        if files is None:
+            granules.append(None)
+        else:
+            granules.append([(os.path.abspath(filename), os.path.getmtime(filename))
+                             for filename in files])
+    key = json.dumps([CALIPSO_CACHE_VERSION, granules, settings], sort_keys=True)
+    return os.path.join(cache_dir,
+                        "calipso_{:s}.h5".format(hashlib.sha1(key.encode('utf-8')).hexdigest()))
+
+
+def write_calipso_cache(filename, calipso_objs):
+    """Write the CALIPSO objects in dict *calipso_objs* to cache *filename*."""
+    import h5py
+    if filename is None:
+        return
+    tmp_filename = "{:s}.{:d}.tmp".format(filename, os.getpid())
+    try:
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with h5py.File(tmp_filename, 'w') as h5file:
+            for group_name, calipso in calipso_objs.items():
+                if calipso is None:
+                    continue
+                group = h5file.create_group(group_name)
+                none_arrays = []
+                for name, array in calipso.all_arrays.items():
+                    if array is None:
+                        none_arrays.append(name)
+                        continue
+                    array = np.asarray(array)
+                    if array.ndim == 0:
+                        group.create_dataset(name, data=array)
+                    else:
+                        group.create_dataset(name, data=array,
+                                             compression=config.COMPRESS_LVL)
+                group.attrs['none_arrays'] = json.dumps(none_arrays)
+        os.replace(tmp_filename, filename)
+    except (IOError, OSError, TypeError, ValueError):
+        logger.warning("Could not write CALIPSO cache %s", filename)
+        if os.path.isfile(tmp_filename):
+            os.remove(tmp_filename)
+
+
+def read_calipso_cache(filename):
+    """Read CALIPSO objects from cache *filename*, None if not cached."""
+    import h5py
+    if filename is None or not os.path.isfile(filename):
+        return None
+    calipso_objs = {}
+    try:
+        with h5py.File(filename, 'r') as h5file:
+            for group_name in h5file.keys():
+                group = h5file[group_name]
+                calipso = CalipsoObject()
+                for name in json.loads(group.attrs['none_arrays']):
+                    setattr(calipso, name, None)
+                for name in group.keys():
+                    setattr(calipso, name, group[name][...])
+                calipso_objs[group_name] = calipso
+    except (IOError, OSError, KeyError, ValueError):
+        logger.warning("Could not read CALIPSO cache %s", filename)
+        return None
+    logger.info("Read decoded CALIPSO data from cache %s", filename)
+    return calipso_objs
+
+
 def discard_calipso_files_outside_time_range(calipsofiles_list, cloudproducts, values,
                                              SETTINGS, res=config.RESOLUTION, ALAY=False):
     imager_end = cloudproducts.sec1970_end
     imager_start = cloudproducts.sec1970_start
+    time_index = get_calipso_time_index()
     calipso_within_time_range = []
     for current_file in calipsofiles_list:
-        new_calipso = get_calipso(current_file, res, ALAY=ALAY)
-        cal_new_all = new_calipso.sec_1970
-        if (cal_new_all[0] > imager_end + SETTINGS["sec_timeThr"] or
-                cal_new_all[-1] + SETTINGS["sec_timeThr"] < imager_start):
+        cal_start, cal_end = time_index.get_time_range(current_file)
+        if (cal_start > imager_end + SETTINGS["sec_timeThr"] or
+                cal_end + SETTINGS["sec_timeThr"] < imager_start):
             pass
             # print "skipping file %s outside time_limits"%(current_file)
         else:
             logger.debug("Keeping file %s inside time_limits", os.path.basename(current_file))
             calipso_within_time_range.append(current_file)
+    time_index.save()
     return calipso_within_time_range
 
 
@@ -622,80 +788,108 @@ def add_singleshot_to5km(calipso5km, SETTINGS):  # Valid only for CALIPSO-CALIOP
     return calipso5km
 
 
-def optical_depth_height_filtering(calipso, min_optical_depth, use_old_method=False,
-                                   limit_ctop=0.2):
-    new_cloud_top = np.ones(calipso.layer_top_altitude.shape)*config.NODATA*1.0
-    new_cloud_base = np.ones(calipso.layer_base_altitude.shape)*config.NODATA*1.0
-    new_cloud_top_pressure = np.ones(calipso.layer_top_altitude.shape)*config.NODATA*1.0
-    new_cloud_base_pressure = np.ones(calipso.layer_base_altitude.shape)*config.NODATA*1.0
-    distance_down_in_cloud_we_see = np.ones(calipso.layer_base_altitude.shape)*config.NODATA*1.0
-    new_cloud_fraction = np.zeros(calipso.cloud_fraction.shape)
-    new_fcf = np.ones(calipso.feature_classification_flags.shape).astype(calipso.feature_classification_flags.dtype)
-    depthsum = 0.0*new_cloud_fraction.copy()
-    already_detected = depthsum > 99999  # None from the start! All False
-    already_detected[calipso.layer_top_altitude[:, 0] < 0] = True  # don't bother with clear pixels
-    # to_thin_to_see_at_all = calipso.total_optical_depth_5km < min_optical_depth
-    N10 = new_cloud_top.shape[1]
-    for layer_j in range(N10):
-        # Filter OPTICAL_LIMIT_CLOUD_TOP down in EACH layer
-        # Notice even if top of layer i is always above layer i-1,
-        # it is NOT the case that base of layer i is always above layer i-1!
-        # We could have the situation:
-        # layer 0 base at 2km top at 0km optical thickness 0.1
-        # layer 1 base at 8km top at 9km optical thickness 10
-        # Or the situation:
-        # layer 0 base at 2km top at 0km optical thickness 0.5
-        # layer 1 base at 8km top at 9km optical thickness 0.5
-        this_layer_optical_depth = calipso.feature_optical_depth_532[:, layer_j].ravel()
-        cloud_base = calipso.layer_base_altitude[:, layer_j]
-        cloud_top = calipso.layer_top_altitude[:, layer_j]
-        geometrical_distance_cloud = cloud_top-cloud_base
-        geometrical_distance_cloud[cloud_base < 0] = 0
-        geometrical_distance_cloud[cloud_top < 0] = 0
-        fraction_into_cloud = (limit_ctop*1.0)/this_layer_optical_depth
-        fraction_into_cloud[fraction_into_cloud < 0] = 0
-        fraction_into_cloud[fraction_into_cloud > 1.0] = 1.0
-        if use_old_method:
-            fraction_into_cloud = 0.5
-        # For KGs method set fraction_into_cloud = 0.5 always
-        distance_down_in_cloud_we_see[:, layer_j] = geometrical_distance_cloud*fraction_into_cloud
-    for layer_j in range(N10):
-        # total_optical_depth_layers_above = depthsum.copy()
-        this_layer_optical_depth = calipso.feature_optical_depth_532[:, layer_j].ravel()
-        depthsum += this_layer_optical_depth
-        # this_is_the_top_most_layer_we_detect
-        update = np.logical_and(
-            depthsum >= min_optical_depth,
-            np.equal(already_detected, False))
-        new_cloud_top[update, 0:(N10-layer_j)] = (calipso.layer_top_altitude[update, layer_j:] -
-                                                  distance_down_in_cloud_we_see[update, layer_j:])
-        new_cloud_base[update, 0:(N10-layer_j)] = calipso.layer_base_altitude[update, layer_j:]
-        new_cloud_top_pressure[update, 0:(N10-layer_j)] = (calipso.layer_top_pressure[update, layer_j:])
-        new_cloud_base_pressure[update, 0:(N10-layer_j)] = calipso.layer_base_pressure[update, layer_j:]
-        new_fcf[update, 0:(N10-layer_j)] = calipso.feature_classification_flags[update, layer_j:]
-        new_cloud_fraction[update] = calipso.cloud_fraction[update]
-        already_detected[update] = True
+def get_first_detected_layer(calipso, min_optical_depths):
+    """Find the top most layer detected for each of the *min_optical_depths*.
+
+    A layer is detected when the optical depth summed from the top down to
+    and including the layer reaches the minimum optical depth.
+    Returns an array (n_pixels, n_thresholds), -1 for clear pixels and
+    pixels where no layer is detected.
+
+    """
+    depthsum = np.cumsum(calipso.feature_optical_depth_532, axis=1, dtype=np.float64)
+    min_optical_depths = np.asarray(min_optical_depths, dtype=np.float64).reshape(1, -1, 1)
+    detected = depthsum[:, np.newaxis, :] >= min_optical_depths
+    first_layer = np.argmax(detected, axis=2)
+    first_layer[~detected.any(axis=2)] = -1
+    first_layer[calipso.layer_top_altitude[:, 0] < 0, :] = -1  # don't bother with clear pixels
+    return first_layer
+
+
+def optical_depth_height_filtering_batch(calipso, min_optical_depths, use_old_method=False,
+                                         limit_ctop=0.2):
+    """Run `optical_depth_height_filtering` for several minimum optical depths.
+
+    The summed optical depth and the distance into the clouds are calculated
+    once for all *min_optical_depths*. Returns a list with the result for
+    each of the *min_optical_depths*.
+
+    """
+    N10 = calipso.layer_top_altitude.shape[1]
+    # Filter OPTICAL_LIMIT_CLOUD_TOP down in EACH layer
+    # Notice even if top of layer i is always above layer i-1,
+    # it is NOT the case that base of layer i is always above layer i-1!
+    # We could have the situation:
+    # layer 0 base at 2km top at 0km optical thickness 0.1
+    # layer 1 base at 8km top at 9km optical thickness 10
+    # Or the situation:
+    # layer 0 base at 2km top at 0km optical thickness 0.5
+    # layer 1 base at 8km top at 9km optical thickness 0.5
+    cloud_base = calipso.layer_base_altitude
+    cloud_top = calipso.layer_top_altitude
+    geometrical_distance_cloud = cloud_top - cloud_base
+    geometrical_distance_cloud[cloud_base < 0] = 0
+    geometrical_distance_cloud[cloud_top < 0] = 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction_into_cloud = (limit_ctop*1.0)/calipso.feature_optical_depth_532
+    fraction_into_cloud[fraction_into_cloud < 0] = 0
+    fraction_into_cloud[fraction_into_cloud > 1.0] = 1.0
     if use_old_method:
-        pass
-    else:
-        for layer_j in range(N10):
-            filtered_to_low = new_cloud_top[:, 0] < new_cloud_top[:, layer_j]
-            new_cloud_top[filtered_to_low, 0] = new_cloud_top[filtered_to_low, layer_j]
+        # For KGs method set fraction_into_cloud = 0.5 always
+        fraction_into_cloud = 0.5
+    distance_down_in_cloud_we_see = (geometrical_distance_cloud*fraction_into_cloud).astype(np.float64)
+    cloud_top_seen = cloud_top - distance_down_in_cloud_we_see
 
     lowest_positive_cloud_base = calipso.layer_base_altitude.copy()
     lowest_positive_cloud_base[lowest_positive_cloud_base < 0] = 99999
     lowest_positive_cloud_base = np.min(lowest_positive_cloud_base, axis=1)
     lowest_positive_cloud_base[lowest_positive_cloud_base == 99999] = -9
 
-    new_validation_height = new_cloud_top[:, 0].copy()
-    new_validation_height[new_validation_height >= 0] = new_validation_height[new_validation_height >= 0]*1000
-    new_validation_height[new_validation_height < 0] = -9
+    first_layers = get_first_detected_layer(calipso, min_optical_depths)
+    results = []
+    for ind in range(first_layers.shape[1]):
+        first_layer = first_layers[:, ind]
+        update = first_layer >= 0
+        # Move the top most detected layer to layer 0, and the layers below it up
+        layers = first_layer[:, np.newaxis] + np.arange(N10)
+        update_layers = np.logical_and(update[:, np.newaxis], layers < N10)
+        rows = np.nonzero(update_layers)[0]
+        layers = layers[update_layers]
+
+        def shift_layers(data, fill_value, dtype=np.float64):
+            new_data = np.full(data.shape, fill_value, dtype=dtype)
+            new_data[update_layers] = data[rows, layers]
+            return new_data
+        new_cloud_top = shift_layers(cloud_top_seen, config.NODATA*1.0)
+        new_cloud_base = shift_layers(calipso.layer_base_altitude, config.NODATA*1.0)
+        new_cloud_top_pressure = shift_layers(calipso.layer_top_pressure, config.NODATA*1.0)
+        new_cloud_base_pressure = shift_layers(calipso.layer_base_pressure, config.NODATA*1.0)
+        new_fcf = shift_layers(calipso.feature_classification_flags, 1,
+                               dtype=calipso.feature_classification_flags.dtype)
+        new_cloud_fraction = np.zeros(calipso.cloud_fraction.shape)
+        new_cloud_fraction[update] = calipso.cloud_fraction[update]
+        if not use_old_method:
+            for layer_j in range(N10):
+                filtered_to_low = new_cloud_top[:, 0] < new_cloud_top[:, layer_j]
+                new_cloud_top[filtered_to_low, 0] = new_cloud_top[filtered_to_low, layer_j]
+
+        new_validation_height = new_cloud_top[:, 0].copy()
+        new_validation_height[new_validation_height >= 0] = new_validation_height[new_validation_height >= 0]*1000
+        new_validation_height[new_validation_height < 0] = -9
+
+        detection_height = new_validation_height.copy()
+        detection_height[detection_height < 0] = lowest_positive_cloud_base[detection_height < 0] * 1000.0  #ok in val h?
+        detection_height[detection_height < 0] = -9
+        results.append((new_cloud_top, new_cloud_base, new_cloud_fraction, new_fcf, new_validation_height,
+                        new_cloud_top_pressure, new_cloud_base_pressure, detection_height))
+    return results
+
 
-    detection_height = new_validation_height.copy()
-    detection_height[detection_height < 0] = lowest_positive_cloud_base[detection_height < 0] * 1000.0  #ok in val h?
-    detection_height[detection_height < 0] = -9
-    return (new_cloud_top, new_cloud_base, new_cloud_fraction, new_fcf, new_validation_height,
-            new_cloud_top_pressure, new_cloud_base_pressure, detection_height)
+def optical_depth_height_filtering(calipso, min_optical_depth, use_old_method=False,
+                                   limit_ctop=0.2):
+    return optical_depth_height_filtering_batch(calipso, [min_optical_depth],
+                                                use_old_method=use_old_method,
+                                                limit_ctop=limit_ctop)[0]
 
 
 def check_total_optical_depth_and_warn(match_calipso):
@@ -20,7 +20,7 @@ from atrain_match.utils.runutils import do_some_logging
 from atrain_match.truths.calipso import (find_break_points)
 from atrain_match.libs.extract_imager_along_track import imager_track_from_matched
 from atrain_match.utils.common import (MatchupError, ProcessingError,
-                                       elements_within_range)
+                                       elements_within_range, get_imager_sec_1970)
 import atrain_match.config as config
 from atrain_match.matchobject_io import (CloudsatObject,
                                          TruthImagerTrackObject)
@@ -206,17 +206,15 @@ def match_cloudsat_imager(cloudsat, cloudproducts, SETTINGS):
     cal, cap = map_imager(cloudproducts,
                           cloudsat.longitude.ravel(),
                           cloudsat.latitude.ravel(),
-                          radius_of_influence=config.RESOLUTION * 0.7 * 1000.0)  # somewhat larger than radius...
+                          radius_of_influence=config.RESOLUTION * 0.7 * 1000.0,  # somewhat larger than radius...
+                          sec_1970=cloudsat.sec_1970,
+                          time_threshold=SETTINGS["sec_timeThr"])
     calnan = np.where(cal == config.NODATA, np.nan, cal)
     if (~np.isnan(calnan)).sum() == 0:
         logger.warning("No matches within region.")
         return None
     # check if it is within time limits:
-    if len(cloudproducts.time.shape) > 1:
-        imager_time_vector = [cloudproducts.time[line, pixel] for line, pixel in zip(cal, cap)]
-        imager_lines_sec_1970 = np.where(cal != config.NODATA, imager_time_vector, np.nan)
-    else:
-        imager_lines_sec_1970 = np.where(cal != config.NODATA, cloudproducts.time[cal], np.nan)
+    imager_lines_sec_1970 = get_imager_sec_1970(cloudproducts, cal, cap)
     # Find all matching Cloudsat pixels within +/- sec_timeThr from the IMAGER data
     idx_match = elements_within_range(cloudsat.sec_1970, imager_lines_sec_1970, SETTINGS["sec_timeThr"])
 
@@ -241,13 +239,12 @@ def match_cloudsat_imager(cloudsat, cloudproducts, SETTINGS):
 
 def merge_cloudsat(cloudsat, cloudsatlwp):
     # map cloudsat_lwp to cloudsat
-    from atrain_match.utils.match import match_lonlat
-    source = (cloudsatlwp.longitude.astype(np.float64).reshape(-1, 1),
-              cloudsatlwp.latitude.astype(np.float64).reshape(-1, 1))
-    target = (cloudsat.longitude.astype(np.float64).reshape(-1, 1),
-              cloudsat.latitude.astype(np.float64).reshape(-1, 1))
-    mapper, dummy = match_lonlat(source, target, radius_of_influence=10, n_neighbours=1)
-    cloudsat_lwp_index = mapper.rows.filled(config.NODATA).ravel()
+    from atrain_match.utils.match import match_along_track
+    cloudsat_lwp_index = match_along_track(
+        (cloudsatlwp.longitude, cloudsatlwp.latitude),
+        (cloudsat.longitude, cloudsat.latitude),
+        cloudsatlwp.sec_1970, cloudsat.sec_1970,
+        radius_of_influence=10)
     # Transfer CloudSat LWP to ordinary cloudsat obj
     index = cloudsat_lwp_index.copy()
     index[index < 0] = 0
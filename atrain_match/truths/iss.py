@@ -24,7 +24,7 @@ from atrain_match.utils.runutils import do_some_logging
 from atrain_match.truths.calipso import find_break_points
 from atrain_match.libs.extract_imager_along_track import imager_track_from_matched
 from atrain_match.utils.common import (ProcessingError,
-                                       elements_within_range)
+                                       elements_within_range, get_imager_sec_1970)
 import atrain_match.config as config
 from atrain_match.matchobject_io import (IssObject,
                                          TruthImagerTrackObject)
@@ -150,19 +150,16 @@ def match_iss_imager(iss, cloudproducts, SETTINGS):
     from atrain_match.utils.common import map_imager
     cal, cap = map_imager(cloudproducts, iss.longitude.ravel(),
                           iss.latitude.ravel(),
-                          radius_of_influence=config.RESOLUTION * 0.7 * 1000.0)  # larger than radius...
+                          radius_of_influence=config.RESOLUTION * 0.7 * 1000.0,  # larger than radius...
+                          sec_1970=iss.sec_1970,
+                          time_threshold=SETTINGS["sec_timeThr"])
     calnan = np.where(cal == config.NODATA, np.nan, cal)
 
     if (~np.isnan(calnan)).sum() == 0:
         logger.warning("No matches within region.")
         return None
     # check if it is within time limits:
-    if len(cloudproducts.time.shape) > 1:
-        imager_time_vector = [cloudproducts.time[line, pixel] for line, pixel
-                              in zip(cal, cap)]
-        imager_lines_sec_1970 = np.where(cal != config.NODATA, imager_time_vector, np.nan)
-    else:
-        imager_lines_sec_1970 = np.where(cal != config.NODATA, cloudproducts.time[cal], np.nan)
+    imager_lines_sec_1970 = get_imager_sec_1970(cloudproducts, cal, cap)
     # Find all matching Iss pixels within +/- sec_timeThr from the IMAGER data
     idx_match = elements_within_range(iss.sec_1970, imager_lines_sec_1970, SETTINGS["sec_timeThr"])
 
@@ -17,7 +17,7 @@
 # along with atrain_match.  If not, see <http://www.gnu.org/licenses/>.
 import logging
 from atrain_match.libs.extract_imager_along_track import imager_track_from_matched
-from atrain_match.utils.common import elements_within_range
+from atrain_match.utils.common import elements_within_range, get_imager_sec_1970
 import atrain_match.config as config
 from atrain_match.utils.runutils import do_some_logging
 from atrain_match.matchobject_io import (TruthImagerTrackObject,
@@ -108,11 +108,7 @@ def match_mora_imager(mora, cloudproducts, SETTINGS):
         logger.warning("No matches within region.")
         return None
     # check if it is within time limits:
-    if len(cloudproducts.time.shape) > 1:
-        imager_time_vector = [cloudproducts.time[line, pixel] for line, pixel in zip(cal, cap)]
-        imager_lines_sec_1970 = np.where(cal != config.NODATA, imager_time_vector, np.nan)
-    else:
-        imager_lines_sec_1970 = np.where(cal != config.NODATA, cloudproducts.time[cal], np.nan)
+    imager_lines_sec_1970 = get_imager_sec_1970(cloudproducts, cal, cap)
     idx_match = elements_within_range(mora.sec_1970, imager_lines_sec_1970, SETTINGS["sec_timeThr_synop"])
     if idx_match.sum() == 0:
         logger.warning("No matches in region within time threshold %d s.", SETTINGS["sec_timeThr_synop"])
@@ -17,7 +17,7 @@
 # along with atrain_match.  If not, see <http://www.gnu.org/licenses/>.
 import logging
 from atrain_match.libs.extract_imager_along_track import imager_track_from_matched
-from atrain_match.utils.common import elements_within_range
+from atrain_match.utils.common import elements_within_range, get_imager_sec_1970
 from atrain_match.utils.runutils import do_some_logging
 from atrain_match.matchobject_io import (TruthImagerTrackObject,
                                          SynopObject)
@@ -82,11 +82,7 @@ def match_synop_imager(synop, cloudproducts, SETTINGS):
         logger.warning("No matches within region.")
         return None
     # check if it is within time limits:
-    if len(cloudproducts.time.shape) > 1:
-        imager_time_vector = [cloudproducts.time[line, pixel] for line, pixel in zip(cal_1, cap_1)]
-        imager_lines_sec_1970 = np.where(cal_1 != config.NODATA, imager_time_vector, np.nan)
-    else:
-        imager_lines_sec_1970 = np.where(cal_1 != config.NODATA, cloudproducts.time[cal_1], np.nan)
+    imager_lines_sec_1970 = get_imager_sec_1970(cloudproducts, cal_1, cap_1)
     idx_match = elements_within_range(synop.sec_1970, imager_lines_sec_1970, SETTINGS["sec_timeThr_synop"])
     if idx_match.sum() == 0:
         logger.warning("No  matches in region within time threshold %d s.", SETTINGS["sec_timeThr_synop"])
@@ -73,24 +73,176 @@ def elements_within_range(compare, base, _range):
     return np.logical_and(c > b - _range, c < b + _range)
 
 
-def map_imager_distances(imager, lon, lat, radius_of_influence, n_neighbours=1):
+def get_imager_sec_1970(imager, rows, cols):
+    """Get the time of the matched IMAGER pixels (*rows*, *cols*).
+
+    imager.time is the time of each scanline (1-D) or of each pixel (2-D,
+    e.g. CCI and PATMOS-x). For scanline time, imager.time_column_offset
+    (see `split_imager_time`) is added if present. Returns NaN where *rows*
+    is NODATA and where the imager time is masked or not finite.
+
+    """
+    from atrain_match.config import NODATA
+    rows = np.asarray(rows)
+    cols = np.asarray(cols)
+    matched = rows != NODATA
+    sec_1970 = np.full(rows.shape, np.nan)
+    time = np.ma.filled(np.ma.masked_invalid(imager.time), np.nan)
+    if time.ndim > 1:
+        sec_1970[matched] = time[rows[matched], cols[matched]]
+    else:
+        sec_1970[matched] = time[rows[matched]]
+        column_offset = getattr(imager, "time_column_offset", None)
+        if column_offset is not None:
+            sec_1970[matched] += column_offset[cols[matched]]
+    return sec_1970
+
+
+def split_imager_time(imager, tolerance=1.0):
+    """Store 2-D imager.time as scanline time and a time offset for each column.
+
+    The scanline time replaces imager.time and the offsets are stored as
+    imager.time_column_offset. Nothing is changed if any time is masked or
+    not finite, or if the 2-D time can not be reproduced within *tolerance*
+    seconds.
+
+    """
+    time = np.ma.masked_invalid(np.ma.asarray(imager.time, dtype=np.float64))
+    if time.ndim < 2:
+        return imager
+    if np.ma.is_masked(time):
+        logger.debug("Imager time has masked pixels, keeping per pixel time")
+        return imager
+    time = np.ma.getdata(time)
+    column_offset = np.zeros(time.shape[1])
+    for dummy in range(2):
+        line_time = np.mean(time - column_offset[np.newaxis, :], axis=1)
+        column_offset = np.mean(time - line_time[:, np.newaxis], axis=0)
+    residual = np.abs(time - line_time[:, np.newaxis] - column_offset[np.newaxis, :])
+    if np.max(residual) > tolerance:
+        logger.debug("Imager time varies too much along the columns, keeping per pixel time")
+        return imager
+    imager.time = line_time
+    imager.time_column_offset = column_offset.astype(np.float32)
+    return imager
+
+
+def get_imager_neighbour_index(imager):
+    """Get the neighbour index for the IMAGER swath, build it if needed.
+
+    The index is stored on the IMAGER object so that all truths matched with
+    the same scene share one kd-tree.
+
+    """
+    from atrain_match.utils.match import SwathNeighbourIndex
+    neighbour_index = getattr(imager, "neighbour_index", None)
+    if neighbour_index is None:
+        logger.debug("Building neighbour index for imager swath")
+        neighbour_index = SwathNeighbourIndex(imager.longitude.astype(np.float64),
+                                              imager.latitude.astype(np.float64))
+        imager.neighbour_index = neighbour_index
+    return neighbour_index
+
+
+def get_imager_row_window(imager, lonlats, radius_of_influence, margin):
+    """Find the rows of the IMAGER swath near the truth tracks.
+
+    *lonlats* is a list of (lon, lat) of the truths. Returns (first_row,
+    end_row) of the rows with a nearest neighbour within *radius_of_influence*
+    extended with *margin* rows, or None if no truth is near the swath.
+
+    """
+    neighbour_index = get_imager_neighbour_index(imager)
+    source_size = int(np.prod(neighbour_index.shape))
+    first_row = None
+    end_row = None
+    for lon, lat in lonlats:
+        indices, dummy = neighbour_index.query((lon, lat), radius_of_influence)
+        indices = indices[indices < source_size]
+        if indices.size == 0:
+            continue
+        rows = indices // int(np.prod(neighbour_index.shape[1:]))
+        first_row = rows.min() if first_row is None else min(first_row, rows.min())
+        end_row = rows.max() + 1 if end_row is None else max(end_row, rows.max() + 1)
+    if first_row is None:
+        return None
+    return (int(max(first_row - margin, 0)),
+            int(min(end_row + margin, neighbour_index.shape[0])))
+
+
+def get_imager_time_range(imager):
+    """Get (first, last) time of the IMAGER pixels, None if no valid time.
+
+    The time of the pixels is used, not the nominal
+    imager.sec1970_start/sec1970_end which some readers only estimate.
+
+    """
+    time = getattr(imager, "time", None)
+    if time is None:
+        return None
+    time = np.ma.masked_invalid(np.ma.asarray(time, dtype=np.float64))
+    if time.size == 0 or time.mask.all():
+        return None
+    first = time.min()
+    last = time.max()
+    column_offset = getattr(imager, "time_column_offset", None)
+    if column_offset is not None and time.ndim == 1:
+        first += np.min(column_offset)
+        last += np.max(column_offset)
+    return float(first), float(last)
+
+
+def get_truth_candidates(imager, lon, lat, radius_of_influence, sec_1970=None, time_threshold=None):
+    """Mask of the truth points (lon, lat) that can be matched with the IMAGER swath.
+
+    Points outside a spherical cap around the swath are discarded. If
+    *sec_1970* and *time_threshold* are given, also points more than
+    *time_threshold* outside the time of the IMAGER pixels.
+
+    """
+    neighbour_index = get_imager_neighbour_index(imager)
+    candidates = neighbour_index.near_swath((lon, lat), radius_of_influence)
+    if sec_1970 is None or time_threshold is None:
+        return candidates
+    time_range = get_imager_time_range(imager)
+    sec_1970 = np.asarray(sec_1970).ravel()
+    if time_range is not None and sec_1970.size == candidates.size:
+        start, end = time_range
+        candidates = np.logical_and(candidates,
+                                    np.logical_and(sec_1970 >= start - time_threshold,
+                                                   sec_1970 <= end + time_threshold))
+    return candidates
+
+
+def map_imager_distances(imager, lon, lat, radius_of_influence, n_neighbours=1,
+                         sec_1970=None, time_threshold=None):
     """Map IMAGER object to (lon, lat).
 
+    If the IMAGER object has a *neighbour_index* (see
+    `get_imager_neighbour_index`) it is reused, otherwise a new kd-tree is
+    built over the imager swath.
+
+    Only the truth points selected by `get_truth_candidates` are searched
+    for neighbours, the other points get NODATA. Give *sec_1970* of the
+    truth and *time_threshold* to also discard points outside the time of
+    the swath.
+
     A better use of this function would be to return *mapper*! But the calling
     functions would need some adjustment...
 
     """
     from atrain_match.config import NODATA
     from atrain_match.utils.match import match_lonlat
-    source = (imager.longitude, imager.latitude)
-    target = (lon, lat)
-    # if imager.longitude.dtype != lon.dtype or  imager.latitude.dtype != lat.dtype:
-    source = (imager.longitude.astype(np.float64),
-              imager.latitude.astype(np.float64))
-    target = (lon.astype(np.float64), lat.astype(np.float64))
-    # print imager.longitude.dtype, lon.dtype, imager.latitude.dtype, lat.dtype
-    mapper, distances = match_lonlat(source, target, radius_of_influence,
-                                     n_neighbours=n_neighbours)
+    neighbour_index = get_imager_neighbour_index(imager)
+    lon = np.asarray(lon).ravel()
+    lat = np.asarray(lat).ravel()
+    candidates = get_truth_candidates(imager, lon, lat, radius_of_influence,
+                                      sec_1970=sec_1970, time_threshold=time_threshold)
+    logger.debug("Searching neighbours for %d of %d truth points", candidates.sum(), lon.size)
+    target = (lon[candidates].astype(np.float64), lat[candidates].astype(np.float64))
+    mapper, candidate_distances = match_lonlat(None, target, radius_of_influence,
+                                               n_neighbours=n_neighbours,
+                                               neighbour_index=neighbour_index)
     # Return the nearest (and the only calculated) neighbour
     # return mapper.rows.filled(NODATA)[:, 0], mapper.cols.filled(NODATA)[:, 0]
     # Nina 2016-01-19 changed mapper.rows to be 1D arrays not 2D-arrays with
@@ -99,13 +251,33 @@ def map_imager_distances(imager, lon, lat, radius_of_influence, n_neighbours=1):
     # Note that ravel() transform array (n, 1) array to (n, )
     # Array2D[:, 0] gives (n, )
     # np.logical_and(array_of_size(n, 1), array_of_size(n, )) => (n, n)
-    out = {"mapper": (mapper.rows.filled(NODATA)[:], mapper.cols.filled(NODATA)[:]),
+    # Put the candidates back at their index in the truth track
+    out_shape = (lon.size,) + candidate_distances.shape[1:]
+    rows = np.full(out_shape, NODATA, dtype=np.int64)
+    cols = np.full(out_shape, NODATA, dtype=np.int64)
+    distances = np.full(out_shape, NODATA, dtype=candidate_distances.dtype)
+    rows[candidates] = mapper.rows.filled(NODATA)[:]
+    cols[candidates] = mapper.cols.filled(NODATA)[:]
+    distances[candidates] = candidate_distances
+    # Only some rows read (see read_pps.crop_imager_rows), the kd-tree is for the whole swath
+    row_offset = getattr(imager, "row_offset", 0)
+    if row_offset != 0 or imager.latitude.shape[0] != neighbour_index.shape[0]:
+        rows = np.where(rows != NODATA, rows - row_offset, NODATA)
+        outside = np.logical_and(rows != NODATA,
+                                 np.logical_or(rows < 0, rows >= imager.latitude.shape[0]))
+        if outside.any():
+            logger.warning("Matched %d pixels outside the rows read", outside.sum())
+            rows[outside] = NODATA
+            cols[outside] = NODATA
+            distances[outside] = NODATA
+    out = {"mapper": (rows, cols),
            "distances": distances}
 
     return out
 
 
-def map_imager(imager, lon, lat, radius_of_influence, n_neighbours=1):
+def map_imager(imager, lon, lat, radius_of_influence, n_neighbours=1,
+               sec_1970=None, time_threshold=None):
     """
     Map IMAGER object *imager* to (lon, lat).
 
@@ -113,7 +285,8 @@ def map_imager(imager, lon, lat, radius_of_influence, n_neighbours=1):
     functions would need some adjustment...
 
     """
-    retv = map_imager_distances(imager, lon, lat, radius_of_influence, n_neighbours=1)
+    retv = map_imager_distances(imager, lon, lat, radius_of_influence, n_neighbours=1,
+                                sec_1970=sec_1970, time_threshold=time_threshold)
     return retv["mapper"]
 
 
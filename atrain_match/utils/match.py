@@ -23,6 +23,9 @@ import logging
 from atrain_match.config import RESOLUTION, NODATA
 logger = logging.getLogger(__name__)
 
+# Same earth radius as pyresample
+EARTH_RADIUS = 6370997.0
+
 
 class MatchMapper(object):
     """
@@ -34,8 +37,8 @@ class MatchMapper(object):
 
     def __init__(self, rows, cols, pixel_mask, time_diff=None,
                  time_threshold=None):
-        self._rows = np.array(rows).astype(np.int)
-        self._cols = np.array(cols).astype(np.int)
+        self._rows = np.array(rows).astype(np.int64)
+        self._cols = np.array(cols).astype(np.int64)
         self._pixel_mask = pixel_mask
         self._time_diff = time_diff
         self.time_threshold = time_threshold
@@ -78,14 +81,224 @@ class MatchMapper(object):
         return self._pixel_mask
 
 
+class SwathNeighbourIndex(object):
+    """
+    Nearest neighbour index (kd-tree) over one source swath.
+
+    The tree is built once from the *source* (lon, lat) and can then be
+    queried by any number of targets, e.g. all truths matched with the same
+    imager scene. The results are the same as from pyresample
+    `get_neighbour_info`, which builds a new tree on every call.
+
+    """
+
+    def __init__(self, lon, lat):
+        try:
+            from pykdtree.kdtree import KDTree
+        except ImportError:
+            from scipy.spatial import cKDTree as KDTree
+        lon = np.asanyarray(lon, dtype=np.float64)
+        lat = np.asanyarray(lat, dtype=np.float64)
+        if lon.shape != lat.shape:
+            raise ValueError('Mismatch between lons and lats')
+        self.shape = lat.shape
+        valid = _valid_lonlat(lon, lat).ravel()
+        if isinstance(lon, np.ma.MaskedArray) or isinstance(lat, np.ma.MaskedArray):
+            valid = np.logical_and(valid, ~np.ma.getmaskarray(lon).ravel())
+            valid = np.logical_and(valid, ~np.ma.getmaskarray(lat).ravel())
+        self.valid_index = np.flatnonzero(valid)
+        if self.valid_index.size == 0:
+            raise ValueError('No valid data points in source swath')
+        xyz = _lonlat2xyz(np.ma.getdata(lon).ravel()[self.valid_index],
+                          np.ma.getdata(lat).ravel()[self.valid_index])
+        self._kdtree = KDTree(xyz)
+        # Spherical cap around the swath: centre and angular radius
+        centre = xyz.mean(axis=0)
+        norm = np.linalg.norm(centre)
+        if norm > 0:
+            self.cap_centre = centre / norm
+            self.cap_angle = np.arccos(np.clip(np.min(xyz.dot(self.cap_centre)) / EARTH_RADIUS, -1, 1))
+        else:
+            self.cap_centre = np.array([0.0, 0.0, 1.0])
+            self.cap_angle = np.pi
+
+    def near_swath(self, target, radius_of_influence):
+        """Mask of the *target* (lon, lat) points that can have a neighbour in the swath.
+
+        Points outside the spherical cap around the swath, extended with
+        *radius_of_influence*, and invalid points are False.
+
+        """
+        lon, lat = target
+        lon = np.asarray(lon, dtype=np.float64).ravel()
+        lat = np.asarray(lat, dtype=np.float64).ravel()
+        near = _valid_lonlat(lon, lat)
+        # The kd-tree distances are chord lengths
+        max_angle = self.cap_angle + 2 * np.arcsin(min(radius_of_influence / (2 * EARTH_RADIUS), 1.0))
+        if max_angle >= np.pi or not near.any():
+            return near
+        cos_angle = _lonlat2xyz(lon[near], lat[near]).dot(self.cap_centre) / EARTH_RADIUS
+        # Small margin for rounding errors
+        near[near] = cos_angle >= np.cos(max_angle) - 1e-9
+        return near
+
+    def query(self, target, radius_of_influence, n_neighbours=1):
+        """Return indices and distances of the nearest neighbours.
+
+        Indices are flat indices into the source swath, set to the size of the
+        source for target points without a neighbour within
+        *radius_of_influence*. Those points have distance inf.
+
+        """
+        lon, lat = target
+        lon = np.asarray(lon, dtype=np.float64).ravel()
+        lat = np.asarray(lat, dtype=np.float64).ravel()
+        valid_out = _valid_lonlat(lon, lat)
+        source_size = int(np.prod(self.shape))
+        if n_neighbours == 1:
+            out_shape = (lon.size,)
+        else:
+            out_shape = (lon.size, n_neighbours)
+        indices = np.full(out_shape, source_size, dtype=np.int64)
+        distances = np.full(out_shape, np.inf, dtype=np.float64)
+        if valid_out.any():
+            dist_valid, idx_valid = self._kdtree.query(
+                _lonlat2xyz(lon[valid_out], lat[valid_out]),
+                k=n_neighbours, eps=0,
+                distance_upper_bound=radius_of_influence)
+            idx_valid = np.asarray(idx_valid, dtype=np.int64)
+            found = idx_valid < self.valid_index.size
+            idx_valid[found] = self.valid_index[idx_valid[found]]
+            idx_valid[~found] = source_size
+            indices[valid_out] = idx_valid
+            distances[valid_out] = dist_valid
+        return indices, distances
+
+    def match(self, target, radius_of_influence=0.7*RESOLUTION*1000.0,
+              n_neighbours=1):
+        """Match *target* (lon, lat) to the source swath, see `match_lonlat`."""
+        indices, distances = self.query(target, radius_of_influence,
+                                        n_neighbours=n_neighbours)
+        if n_neighbours > 1:
+            with np.errstate(invalid='ignore'):
+                test = (distances[:, 0:1] - distances[:, 1:])
+            test = test[np.isfinite(test)]
+            if test.size > 0 and np.max(test) > 0:
+                raise ValueError(
+                    'We count on the first neighbour beeing the closest')
+        mask = np.logical_or(distances > radius_of_influence,
+                             indices >= int(np.prod(self.shape)))
+        indices[mask] = 0
+        rows, cols = np.unravel_index(indices, self.shape[0:2]
+                                      if len(self.shape) > 1 else (self.shape[0], 1))
+        rows = np.array(rows, dtype=np.int64)
+        cols = np.array(cols, dtype=np.int64)
+        distances[distances > radius_of_influence] = -9
+        rows[mask] = NODATA
+        cols[mask] = NODATA
+        return MatchMapper(rows, cols, mask), distances
+
+
+def _valid_lonlat(lon, lat):
+    """Mask for legal longitude and latitude values."""
+    return ((lon >= -180) & (lon <= 180) & (lat <= 90) & (lat >= -90))
+
+
+def _lonlat2xyz(lon, lat):
+    """Cartesian coordinates on a spherical earth, same as pyresample."""
+    earth_radius = EARTH_RADIUS
+    coords = np.zeros((lon.size, 3), dtype=np.float64)
+    coords[:, 0] = earth_radius * np.cos(np.deg2rad(lat)) * np.cos(np.deg2rad(lon))
+    coords[:, 1] = earth_radius * np.cos(np.deg2rad(lat)) * np.sin(np.deg2rad(lon))
+    coords[:, 2] = earth_radius * np.sin(np.deg2rad(lat))
+    return coords
+
+
+def match_along_track(source, target, source_sec, target_sec,
+                      radius_of_influence, n_candidates=2):
+    """Nearest neighbours in the *source* track for each point of the *target* track.
+
+    Both tracks are time ordered and follow the same ground track,
+    e.g. two A-Train satellites. Each target point is looked up in
+    *source_sec* with a merge join on time, shifted with the median time
+    lag between the tracks, and the closest of the *n_candidates* source
+    points on each side is used. The search is widened for points where
+    the closest candidate is at the edge of the search window. For
+    co-located tracks with monotonic time the result is the same as from
+    `match_lonlat`, without building a kd-tree. If either time is not
+    sorted or not finite `match_lonlat` is used instead.
+
+    Returns an array with the index in *source* for each target point,
+    NODATA where no source point is within *radius_of_influence*.
+
+    """
+    source_xyz = _lonlat2xyz(*[np.asarray(data, dtype=np.float64).ravel() for data in source])
+    target_xyz = _lonlat2xyz(*[np.asarray(data, dtype=np.float64).ravel() for data in target])
+    source_xyz[~_valid_lonlat(*[np.asarray(data).ravel() for data in source])] = np.inf
+    valid_target = _valid_lonlat(*[np.asarray(data).ravel() for data in target])
+    source_sec = np.asarray(source_sec, dtype=np.float64).ravel()
+    target_sec = np.asarray(target_sec, dtype=np.float64).ravel()
+    n_source = source_sec.size
+    index = np.full(target_sec.shape, NODATA, dtype=np.int64)
+    if n_source == 0 or not valid_target.any():
+        return index
+    if (not np.isfinite(source_sec).all() or not np.isfinite(target_sec[valid_target]).all() or
+            np.any(np.diff(source_sec) < 0)):
+        logger.warning("Track time not sorted or not finite, matching on lat/lon only")
+        mapper, dummy = match_lonlat(
+            tuple(np.asarray(data, dtype=np.float64).reshape(-1, 1) for data in source),
+            tuple(np.asarray(data, dtype=np.float64).reshape(-1, 1) for data in target),
+            radius_of_influence=radius_of_influence, n_neighbours=1)
+        return mapper.rows.filled(NODATA).ravel()
+
+    # Time lag between the tracks, from the nearest neighbours of a sample
+    sample = np.flatnonzero(valid_target)
+    sample = sample[np.linspace(0, sample.size - 1, min(16, sample.size)).astype(np.int64)]
+    sample_dist = np.array([np.linalg.norm(source_xyz - target_xyz[ind], axis=1) for ind in sample])
+    sample_nearest = np.argmin(sample_dist, axis=1)
+    lags = source_sec[sample_nearest] - target_sec[sample]
+    within = sample_dist[np.arange(sample.size), sample_nearest] <= radius_of_influence
+    if within.any():
+        lags = lags[within]
+    time_lag = np.median(lags)
+
+    # Merge join on time, then pick the closest of the candidates
+    todo = np.flatnonzero(valid_target)
+    centre = np.searchsorted(source_sec, target_sec[todo] + time_lag)
+    best = np.zeros(target_sec.shape, dtype=np.int64)
+    best_dist = np.full(target_sec.shape, np.inf)
+    while todo.size > 0:
+        first = np.clip(centre - n_candidates, 0, n_source - 1)
+        last = np.clip(centre + n_candidates, 0, n_source - 1)
+        candidates = np.clip(centre[:, np.newaxis] + np.arange(-n_candidates, n_candidates + 1),
+                             0, n_source - 1)
+        dist = np.linalg.norm(source_xyz[candidates] - target_xyz[todo, np.newaxis, :], axis=2)
+        nearest = np.argmin(dist, axis=1)
+        best[todo] = candidates[np.arange(todo.size), nearest]
+        best_dist[todo] = dist[np.arange(todo.size), nearest]
+        at_edge = np.logical_or(np.logical_and(best[todo] == first, first > 0),
+                                np.logical_and(best[todo] == last, last < n_source - 1))
+        if n_candidates >= n_source:
+            break
+        todo = todo[at_edge]
+        centre = centre[at_edge]
+        n_candidates = 2 * n_candidates
+    found = best_dist <= radius_of_influence
+    index[found] = best[found]
+    return index
+
+
 def match_lonlat(source, target,
                  radius_of_influence=0.7*RESOLUTION*1000.0,
-                 n_neighbours=1):
+                 n_neighbours=1, neighbour_index=None):
     """
     Produce a masked array of the same shape as the arrays in *target*, with
     indices of nearest neighbours in *source*. *source* and *target* should be
     tuples (lon, lat) of the source and target swaths, respectively.
 
+    If a `SwathNeighbourIndex` for *source* is given as *neighbour_index*
+    it is used instead of building a new kd-tree, and *source* is ignored.
+
     Note::
 
         * Fastest matching is obtained when *target* has lower resolution than
@@ -94,82 +307,8 @@ def match_lonlat(source, target,
         * *source* should have 2-dimensional lon and lat arrays.
 
     """
-    from pyresample.geometry import SwathDefinition
-    from pyresample.kd_tree import get_neighbour_info
-    from pyresample.kd_tree import get_sample_from_neighbour_info
-
-    lon, lat = source
-    mask_out_lat = np.logical_or(lat < -90, lat > 90)
-    mask_out_lon = np.logical_or(lon > 180, lon < -180)
-    mask_out = np.logical_or(mask_out_lat, mask_out_lon)
-    lat = np.ma.masked_array(lat, mask=mask_out)
-    lon = np.ma.masked_array(lon, mask=mask_out)
-    # lat = np.around(lat, decimals=4)
-    # lon = np.around(lon, decimals=4)
-    source_def = SwathDefinition(*(lon, lat))
-    target_def = SwathDefinition(*target)
+    if neighbour_index is None:
+        neighbour_index = SwathNeighbourIndex(*source)
     logger.debug("Matching %d nearest neighbours", n_neighbours)
-    valid_in, valid_out, indices, distances = get_neighbour_info(
-        source_def, target_def, radius_of_influence, neighbours=n_neighbours)
-    # import pdb; pdb.set_trace()
-    # Use pyresampe code to find colmun and row numbers for each pixel
-    # This is works also with no-data in imager lat/lon.
-    cols_matrix, rows_matrix = np.meshgrid(np.array(range(0, lat.shape[1])),
-                                           np.array(range(0, lat.shape[0])))
-    if n_neighbours == 1:
-        first_indices = indices
-    else:
-        first_indices = indices[:, 0]
-
-    cols = get_sample_from_neighbour_info('nn', target_def.shape,
-                                          cols_matrix,
-                                          valid_in,
-                                          valid_out,
-                                          first_indices)
-    rows = get_sample_from_neighbour_info('nn', target_def.shape,
-                                          rows_matrix,
-                                          valid_in, valid_out,
-                                          first_indices)
-    if n_neighbours > 1:
-        rows_0 = rows.copy()
-        cols_0 = cols.copy()
-        rows = NODATA + np.zeros((len(rows_0), n_neighbours))
-        cols = NODATA + np.zeros((len(cols_0), n_neighbours))
-        rows[:, 0] = rows_0
-        cols[:, 0] = cols_0
-        for i in range(1, n_neighbours):
-            cols[:, i] = get_sample_from_neighbour_info('nn', target_def.shape,
-                                                        cols_matrix,
-                                                        valid_in, valid_out,
-                                                        indices[:, i])
-            rows[:, i] = get_sample_from_neighbour_info('nn', target_def.shape,
-                                                        rows_matrix,
-                                                        valid_in, valid_out,
-                                                        indices[:, i])
-            test = (distances[:, 0] - distances[:, i])
-            if sum(~np.isnan(test)) > 0 and np.max(test[~np.isnan(test)]) > 0:
-                raise ValueError(
-                    'We count on the first neighbour beeing the closest')
-
-    rows = np.array(rows)
-    cols = np.array(cols)
-    # import pdb; pdb.set_trace()
-    """ Code used during debugging, leaving it here for now
-    if indices.dtype in ['uint32']:
-        # With pykdtree installed get_neighbour_info returns indices
-        # as type uint32
-        # This does not combine well with a nodata value of -9.
-        indices = np.array(indices, dtype=np.int64)
-    """
-    # Make sure all indices are valid
-    # import pdb; pdb.set_trace()
-    rows[rows >= source_def.shape[0]] = NODATA
-    cols[cols >= source_def.shape[1]] = NODATA
-    mask = np.logical_or(distances > radius_of_influence,
-                         indices >= len(valid_in))
-    distances[distances > radius_of_influence] = -9
-    # import pdb; ipdb.set_trace()
-    rows[mask] = NODATA
-    cols[mask] = NODATA
-    # import pdb; pdb.set_trace()
-    return MatchMapper(rows, cols, mask), distances
+    return neighbour_index.match(target, radius_of_influence,
+                                 n_neighbours=n_neighbours)
@@ -72,42 +72,58 @@ def get_data_from_array_fill_outside(array, matched, Fill=0):
                                           col_index >= col_lim))
     row_index[outside] = 0
     col_index[outside] = 0
-    temp = np.array([array[row_index[idx], col_index[idx]]
-                     for idx in range(matched['row'].shape[0])])
+    temp = np.take(np.asarray(array).ravel(), row_index * col_lim + col_index)
     return np.where(outside, Fill, temp)
 
 
+def get_extreme_neighbour_index(arrays, matched, warmest, size=5):
+    """Get index for warmest/coldest pixel in size x size neighbourhood.
+
+    *arrays* is a list of 2D arrays (e.g. channels) of the same shape and
+    *warmest* a list with True (find max) or False (find min) for each array.
+    The neighbourhoods of all matched pixels are gathered at once for each
+    array, and the offsets of the extreme values are found with one argmax.
+    Returns a list with the matched neighbour {'row', 'col'} for each array.
+
+    """
+    half = size // 2
+    step_r, step_c = np.divmod(np.arange(size * size), size)
+    rows = matched['row'][:, np.newaxis] + (step_r - half)
+    cols = matched['col'][:, np.newaxis] + (step_c - half)
+    row_lim, col_lim = np.shape(arrays[0])
+    outside = np.logical_or(np.logical_or(rows < 0, rows >= row_lim),
+                            np.logical_or(cols < 0, cols >= col_lim))
+    flat_index = np.where(outside, 0, rows * col_lim + cols)
+    neighbours = np.zeros((len(arrays),) + flat_index.shape)
+    for ind, (array, find_max) in enumerate(zip(arrays, warmest)):
+        FILL = 999999.9  # coldest
+        if find_max:
+            FILL = -99
+        neighbours[ind] = np.where(outside, FILL, np.take(np.asarray(array).ravel(), flat_index))
+        if not find_max:
+            # argmax of -data is the (first) argmin of data
+            neighbours[ind] = -neighbours[ind]
+    neigbour_index = np.argmax(neighbours, axis=2)
+    return [{'row': matched['row'] + step_r[index] - half,
+             'col': matched['col'] + step_c[index] - half} for index in neigbour_index]
+
+
 def get_warmest_or_coldest_index(t11, matched, warmest=True):
     """Get index for coldedest pixel in 5x5 neighbourhood."""
-    FILL = 999999.9  # coldest
-    if warmest:
-        FILL = -99
-
-    steps = [(i, j) for i in [-2, -1, 0, 1, 2] for j in [-2, -1, 0, 1, 2]]
-    t11_neighbour_i = np.zeros((25, matched['row'].shape[0]))
-    for i, (step_r, step_c) in enumerate(steps):
-        new_row_col = {'row': matched['row'] + step_r,
-                       'col': matched['col'] + step_c}
-        t11_neighbour_i[i, :] = get_data_from_array_fill_outside(t11,
-                                                                 new_row_col,
-                                                                 Fill=FILL)
-    if warmest:
-        neigbour_index = np.argmax(t11_neighbour_i, axis=0)
-    else:  # coldest
-        neigbour_index = np.argmin(t11_neighbour_i, axis=0)
-    new_row_matched = np.array(
-        [matched['row'][idx] + steps[neigbour_index[idx]][0]
-         for idx in range(matched['row'].shape[0])])
-    new_col_matched = np.array(
-        [matched['col'][idx] + steps[neigbour_index[idx]][1]
-         for idx in range(matched['row'].shape[0])])
-    new_row_col = {'row': new_row_matched, 'col': new_col_matched}
-    return new_row_col
+    return get_extreme_neighbour_index([t11], matched, [warmest])[0]
+
+
+def get_warmest_coldest_darkest_values(imager_obj, matched):
+    """Get index for neighbours that are warmest, coldest (channel 11) and darkest (channel 0.6 or 0.9)."""
+    t11 = get_channel_data_from_objectfull_resolution(imager_obj, 'ch_tb11', nodata=-9)
+    r09 = get_channel_data_from_objectfull_resolution(imager_obj, 'ch_r09', nodata=-9)
+    r06 = get_channel_data_from_objectfull_resolution(imager_obj, 'ch_r06', nodata=-9)
+    darkest = np.where(r09 > r06, r06, r09)
+    return get_extreme_neighbour_index([t11, t11, darkest], matched, [True, False, False])
 
 
 def get_warmest_values(imager_obj, matched):
     """Get channel values for neighbour that is warmest (channel 11)."""
-    nobj = NeighbourObj()
     t11 = get_channel_data_from_objectfull_resolution(imager_obj, 'ch_tb11', nodata=-9)
     new_row_col = get_warmest_or_coldest_index(t11, matched)
     return new_row_col
@@ -115,15 +131,13 @@ def get_warmest_values(imager_obj, matched):
 
 def get_coldest_values(imager_obj, matched):
     """Get channel values for neighbour that is coldest (channel 11)."""
-    nobj = NeighbourObj()
     t11 = get_channel_data_from_objectfull_resolution(imager_obj, 'ch_tb11', nodata=-9)
     new_row_col = get_warmest_or_coldest_index(t11, matched, warmest=False)
-    return new_row_col 
+    return new_row_col
 
 
 def get_darkest_values(imager_obj, matched):
     """Get channel values for neighbour that is darkest (channel 0.6 or 0.9)."""
-    nobj = NeighbourObj()
     r09 = get_channel_data_from_objectfull_resolution(imager_obj, 'ch_r09', nodata=-9)
     r06 = get_channel_data_from_objectfull_resolution(imager_obj, 'ch_r06', nodata=-9)
     darkest = np.where(r09 > r06, r06, r09)
@@ -132,6 +146,7 @@ def get_darkest_values(imager_obj, matched):
 
 
 def add_cnn_features_full(imager_obj, imagerGeoObj, SETTINGS):
+    from atrain_match.utils.match import SwathNeighbourIndex
     from cloud_collocations.cloud_net import CloudNetBase
     from cloud_collocations.cloud_net import FeatureModel
     print(SETTINGS['CNN_PCKL_PATH'])
@@ -142,7 +157,10 @@ def add_cnn_features_full(imager_obj, imagerGeoObj, SETTINGS):
     filter_response = m.apply(np.array([im11, im12]))
     lats_f = m.resample_coordinates(imagerGeoObj.latitude)
     lons_f = m.resample_coordinates(imagerGeoObj.longitude)
-    return {'filter_response': filter_response, 'lats_f': lats_f, 'lons_f': lons_f}
+    neighbour_index = SwathNeighbourIndex(lons_f.astype(np.float64),
+                                          lats_f.astype(np.float64))
+    return {'filter_response': filter_response, 'lats_f': lats_f, 'lons_f': lons_f,
+            'neighbour_index': neighbour_index}
 
 
 def add_cnn_features(cnn_dict, matched, lats_matched, lons_matched, SETTINGS):
@@ -159,7 +177,8 @@ def add_cnn_features(cnn_dict, matched, lats_matched, lons_matched, SETTINGS):
               lats_matched.astype(np.float64).reshape(-1, 1))
     source = (lons_f.astype(np.float64),
               lats_f.astype(np.float64))
-    mapper, dummy = match_lonlat(source, target, radius_of_influence=10000, n_neighbours=1)
+    mapper, dummy = match_lonlat(source, target, radius_of_influence=10000, n_neighbours=1,
+                                 neighbour_index=cnn_dict.get('neighbour_index'))
     cnn_feature_index_R = mapper.rows.filled(config.NODATA).ravel()  # i.e rows, cols!
     cnn_feature_index_C = mapper.cols.filled(config.NODATA).ravel()  # i.e rows, cols!
     for feature_index in range(32):
@@ -49,9 +49,9 @@ def read_config_info():
             value = value.replace(' ', '')
         values = value.split(',')
         if name in ['MIN_OPTICAL_DEPTH']:
-            value_ = [np.float(val_i) for val_i in values]
+            value_ = [float(val_i) for val_i in values]
         elif name in ["COMPILE_STATISTICS_TRUTH", "PLOT_MODES",
-                      "PLOT_TYPES", "CTTH_TYPES",
+                      "PLOT_TYPES", "CTTH_TYPES", "AUX_FIELDS",
                       'SATELLITES', 'YEARS', 'MONTHS']:
             value_ = values
         elif name in ['CNN_PCKL_PATH']:
@@ -62,7 +62,7 @@ def read_config_info():
         elif len(values) == 1 and 'false' in values[0].lower():
             value_ = False
         elif len(values) == 1 and re.match(r"\d+.*\d*", values[0]):
-            value_ = np.float(values[0])
+            value_ = float(values[0])
 
         SETTINGS[name.upper()] = value_
 
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2019 atrain_match developers
+#
+# This file is part of atrain_match.
+#
+# atrain_match is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# atrain_match is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with atrain_match.  If not, see <http://www.gnu.org/licenses/>.
+"""Run independent crosses (scenes) in parallel worker processes."""
+
+import os
+import json
+import hashlib
+import time
+import logging
+import traceback
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from atrain_match.utils.common import MatchupError, TimeMatchError
+from atrain_match.utils.timing import set_timing_context, stage
+
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT = '%(levelname)s |%(asctime)s|: %(message)s'
+LOG_DATEFMT = '%H:%M:%S'
+
+
+class CrossResult(object):
+    """The result of running one cross."""
+
+    def __init__(self, index, cross, status, message="", duration=None, output_files=None):
+        self.index = index
+        self.cross = cross
+        self.status = status  # 'ok', 'no_matchup', 'time_match' or 'problem'
+        self.message = message
+        self.duration = duration
+        self.output_files = output_files or []
+
+
+def get_manifest_task(task, AM_PATHS, SETTINGS):
+    """Get the task name for the run manifest.
+
+    The name has the resolution and a hash of the config file, the paths
+    and the settings, so that crosses run with other settings, e.g. other
+    truths, are not taken as done.
+
+    """
+    import atrain_match.config as config
+    config_file = os.path.join(config.ATRAIN_MATCH_CONFIG_PATH, config.ATRAIN_MATCH_CONFIG_FILE)
+    run_info = json.dumps([config.RESOLUTION, os.path.abspath(config_file), AM_PATHS, SETTINGS],
+                          sort_keys=True, default=str)
+    return "{:s}:{:d}km:{:s}".format(task, int(config.RESOLUTION),
+                                     hashlib.sha1(run_info.encode('utf-8')).hexdigest()[:12])
+
+
+class RunManifest(object):
+    """Record of the crosses run for a task, in a JSON-lines file.
+
+    One line is appended (and flushed to disk) for each finished cross,
+    with the status, duration, output files and error message. The last
+    line for a cross is its current status, so an interrupted run can be
+    resumed: crosses that were ok, or had no matchups, are done and only
+    the other crosses need to be run again.
+
+    """
+
+    DONE_STATUS = ['ok', 'no_matchup']
+
+    def __init__(self, filename, task):
+        self.filename = filename
+        self.task = task
+        self.records = {}
+        if os.path.isfile(filename):
+            with open(filename) as fhandle:
+                for line in fhandle:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Last line not complete if the run was killed while writing
+                        continue
+                    if record.get('task') == task:
+                        self.records[record['cross']] = record
+
+    @staticmethod
+    def get_cross_key(cross):
+        return "{:s}_{:s}".format(cross.satellite1, cross.time.strftime('%Y%m%d_%H%M%S'))
+
+    def get_status(self, cross):
+        """Get the last recorded status of *cross*, None if it was never run."""
+        record = self.records.get(self.get_cross_key(cross))
+        if record is None:
+            return None
+        return record['status']
+
+    def is_done(self, cross):
+        return self.get_status(cross) in self.DONE_STATUS
+
+    def record(self, result):
+        """Add the CrossResult *result* to the manifest file."""
+        record = {'task': self.task,
+                  'cross': self.get_cross_key(result.cross),
+                  'status': result.status,
+                  'duration': result.duration,
+                  'output_files': list(result.output_files),
+                  'message': result.message,
+                  'finished': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S')}
+        self.records[record['cross']] = record
+        dirname = os.path.dirname(self.filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        with open(self.filename, 'a') as fhandle:
+            fhandle.write(json.dumps(record) + "\n")
+            fhandle.flush()
+            os.fsync(fhandle.fileno())
+
+
+def get_cross_log_filename(log_dir, cross):
+    """Get the name of the log file for *cross*."""
+    return os.path.join(log_dir, "{:s}_{:s}.log".format(
+        cross.satellite1, cross.time.strftime('%Y%m%d_%H%M%S')))
+
+
+def run_one_cross(index, func, cross, args, log_dir=None, debug=False, timing_file=None):
+    """Run func(cross, *args), catch and return the problems as a CrossResult.
+
+    With a *timing_file* the time and memory use of the processing stages
+    are written to it, see utils/timing.py.
+
+    """
+    handler = None
+    if log_dir is not None:
+        # Logging for each cross to a separate file
+        handler = logging.FileHandler(get_cross_log_filename(log_dir, cross), mode='w')
+        handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=LOG_DATEFMT))
+        logging.getLogger().addHandler(handler)
+    start_time = time.time()
+    set_timing_context(RunManifest.get_cross_key(cross), timing_file)
+    try:
+        with stage(func.__module__.split('.')[-1]):
+            output_files = func(cross, *args)
+        if not isinstance(output_files, list):
+            output_files = []
+        result = CrossResult(index, cross, 'ok', output_files=output_files)
+    except MatchupError as err:
+        logger.warning("Matchup problem: %s", str(err))
+        traceback.print_exc()
+        result = CrossResult(index, cross, 'no_matchup', str(err))
+    except TimeMatchError as err:
+        logger.warning("Time match problem: %s", str(err))
+        traceback.print_exc()
+        result = CrossResult(index, cross, 'time_match', str(err))
+    except Exception:
+        traceback.print_exc()
+        logger.warning("Couldn't run %s.", func.__module__)
+        if debug is True:
+            raise
+        result = CrossResult(index, cross, 'problem', traceback.format_exc())
+    finally:
+        set_timing_context(None, None)
+        if handler is not None:
+            logging.getLogger().removeHandler(handler)
+            handler.close()
+    result.duration = time.time() - start_time
+    return result
+
+
+def _init_worker(log_dir):
+    """Set up logging for a worker process.
+
+    With a *log_dir* the workers only log to the log files of the crosses,
+    otherwise the process name is added to each message.
+
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if log_dir is not None:
+            root.removeHandler(handler)
+        else:
+            handler.setFormatter(logging.Formatter('%(processName)s ' + LOG_FORMAT,
+                                                   datefmt=LOG_DATEFMT))
+
+
+def run_crosses(func, crosses, args=(), workers=1, log_dir=None, debug=False,
+                manifest=None, resume=False, timing_file=None):
+    """Run func(cross, *args) for all *crosses*, in *workers* processes.
+
+    Returns a list of CrossResult in the same order as *crosses*, independent
+    of the order in which the crosses were finished. With debug, or only one
+    worker, the crosses are run one by one in this process.
+
+    The result of each cross is added to the RunManifest *manifest*, as soon
+    as it is finished. With *resume* the crosses that are already done
+    according to the manifest are not run again. The stage timing of all
+    crosses is written to *timing_file*.
+
+    """
+    if log_dir is not None and not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+    results = [None] * len(crosses)
+    todo = []
+    for index, cross in enumerate(crosses):
+        if resume and manifest is not None and manifest.is_done(cross):
+            results[index] = CrossResult(index, cross, manifest.get_status(cross),
+                                         "Done in earlier run")
+        else:
+            todo.append(index)
+    if resume and len(todo) < len(crosses):
+        logger.info("Skipping %d crosses done in earlier runs", len(crosses) - len(todo))
+
+    def add_result(result):
+        results[result.index] = result
+        if manifest is not None:
+            manifest.record(result)
+
+    if workers <= 1 or debug is True or len(todo) <= 1:
+        for index in todo:
+            add_result(run_one_cross(index, func, crosses[index], args, log_dir=log_dir, debug=debug,
+                                     timing_file=timing_file))
+        return results
+    logger.info("Running %d crosses in %d processes", len(todo), workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(log_dir,)) as executor:
+        futures = dict((executor.submit(run_one_cross, index, func, crosses[index], args, log_dir,
+                                        False, timing_file), index)
+                       for index in todo)
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                result = future.result()
+                # Keep the callers cross objects, not copies from the workers
+                result.cross = crosses[index]
+            except Exception:
+                # The worker process died, e.g. out of memory
+                logger.warning("Worker failed for %s", crosses[index])
+                result = CrossResult(index, crosses[index], 'problem',
+                                     traceback.format_exc())
+            add_result(result)
+    return results
+
+
+def log_run_summary(results):
+    """Log a summary of the run, returns the exit status (0 if all crosses were ok)."""
+    outstatus = 0
+    n_crosses = len(results)
+    for status, text in [('no_matchup', "had no matchups in region, within the time window"),
+                         ('time_match', "had time match problems"),
+                         ('problem', "had unknown problems")]:
+        crosses = [str(result.cross) for result in results if result.status == status]
+        if len(crosses) > 0:
+            outstatus = 5
+            logger.warning("%d of %d cases %s:\n%s",
+                           len(crosses), n_crosses, text, '\n'.join(crosses))
+    logger.info("%d of %d cases processed ok",
+                len([result for result in results if result.status == 'ok']), n_crosses)
+    return outstatus
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2019 atrain_match developers
+#
+# This file is part of atrain_match.
+#
+# atrain_match is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# atrain_match is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with atrain_match.  If not, see <http://www.gnu.org/licenses/>.
+"""Binary store for the statistics of one matchup file.
+
+The statistics are lines "LABEL: value value ...". Instead of keeping them
+only as text (.dat) files, that have to be parsed line by line when
+compiling statistics, the values are stored in a npz file with a fixed
+layout: the labels, all values as one float64 array and the offsets of the
+values for each label.
+"""
+
+import os
+import re
+import numpy as np
+import logging
+logger = logging.getLogger(__name__)
+
+STATS_STORE_SUFFIX = '.npz'
+
+
+def get_stats_store_filename(statfilename):
+    """Get the binary store filename for the text statistics file *statfilename*."""
+    return os.path.splitext(statfilename)[0] + STATS_STORE_SUFFIX
+
+
+def parse_stats_line(line):
+    """Get label and values from one statistics line, None if no values."""
+    if ":" not in line:
+        return None, None
+    what, data = line.rstrip().split(':')
+    data = np.array([float(item) for item in data.lstrip().split(" ")])
+    return what, data
+
+
+def get_stored_value(fmt, value):
+    """Get *value* as it is read back from the text written with format *fmt*."""
+    if fmt == "%d":
+        return float(int(value))
+    decimals = re.match(r"%\d*\.(\d+)f$", fmt)
+    if decimals is not None:
+        return round(float(value), int(decimals.group(1)))
+    return float(value)
+
+
+class StatisticsWriter(object):
+    """File like object for the statistics of one matchup file.
+
+    Statistics are added with write_values() and stored in a binary store
+    on close(). The text file is also written if *write_text* is True, it
+    can have lines without values, added with write().
+    """
+
+    def __init__(self, statfilename, write_text=False):
+        self.statfilename = statfilename
+        self.write_text = write_text
+        self.lines = []
+        self.labels = []
+        self.values = []
+
+    def write(self, line):
+        """Add text *line*, values in "LABEL: values" lines are also stored."""
+        self.lines.append(line)
+        for one_line in line.splitlines():
+            what, data = parse_stats_line(one_line)
+            if what is not None:
+                self.labels.append(what)
+                self.values.append(data)
+
+    def write_values(self, label, values, fmt="%s"):
+        """Add the statistics *values* for *label*.
+
+        *fmt* is the text format of each value, or a list with one format
+        for each value. The stored values are the same as if the text was
+        read back.
+
+        """
+        if isinstance(fmt, str):
+            fmt = [fmt] * len(values)
+        self.labels.append(label)
+        self.values.append(np.array([get_stored_value(fmt_i, value)
+                                     for fmt_i, value in zip(fmt, values)]))
+        if self.write_text:
+            self.lines.append("{:s}: {:s}\n".format(
+                label, " ".join(fmt_i % value for fmt_i, value in zip(fmt, values))))
+
+    def close(self):
+        write_stats_store(get_stats_store_filename(self.statfilename), self.labels, self.values)
+        if self.write_text:
+            with open(self.statfilename, "w") as statfile:
+                statfile.write("".join(self.lines))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def write_stats_store(filename, labels, values):
+    """Write *labels* and the list of arrays *values* to *filename*."""
+    offsets = np.cumsum([0] + [len(data) for data in values]).astype(np.int64)
+    if len(values) > 0:
+        all_values = np.concatenate(values).astype(np.float64)
+    else:
+        all_values = np.zeros(0, dtype=np.float64)
+    with open(filename, 'wb') as fhandle:
+        np.savez(fhandle,
+                 labels=np.array(labels, dtype=np.str_),
+                 values=all_values,
+                 offsets=offsets)
+
+
+def read_stats_store(filename):
+    """Read a statistics store, returns a list of (label, values)."""
+    with np.load(filename) as store:
+        labels = store['labels']
+        all_values = store['values']
+        offsets = store['offsets']
+    return [(str(label), all_values[offsets[ind]:offsets[ind + 1]])
+            for ind, label in enumerate(labels)]
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2009-2019 atrain_match developers
+#
+# This file is part of atrain_match.
+#
+# atrain_match is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# atrain_match is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with atrain_match.  If not, see <http://www.gnu.org/licenses/>.
+"""Wall time, CPU time and memory use of the processing stages.
+
+Each stage is a span:
+
+    >>> with stage('read_truth', truth='calipso'):
+    ...     calipso = read_calipso_data(...)
+
+When a cross is processed by the scheduler, one JSON line is written to
+config.STAGE_TIMING_FILE for each stage, tagged with the cross. Outside
+a cross, or with an empty STAGE_TIMING_FILE, nothing is recorded.
+
+"""
+
+import os
+import json
+import time
+import logging
+import functools
+from contextlib import contextmanager
+from datetime import datetime
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+_context = {'cross': None, 'filename': None, 'stages': []}
+
+
+def set_timing_context(cross_key, filename):
+    """Record the stages for *cross_key* in *filename*, None to stop recording."""
+    _context['cross'] = cross_key
+    _context['filename'] = filename or None
+    _context['stages'] = []
+
+
+def get_max_rss_mb():
+    """Peak resident memory of this process in MB."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def write_timing_record(filename, record):
+    dirname = os.path.dirname(filename)
+    try:
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        # One write per line, lines from several processes are not mixed
+        with open(filename, 'a') as fhandle:
+            fhandle.write(json.dumps(record) + "\n")
+    except (IOError, OSError):
+        logger.warning("Could not write timing to %s", filename)
+
+
+@contextmanager
+def stage(name, truth=None):
+    """Measure the processing stage *name* (for *truth*).
+
+    Stages can be nested, a nested stage is recorded with the names of
+    the enclosing stages as parent, and by default for the same truth.
+
+    """
+    if _context['filename'] is None:
+        yield
+        return
+    parent = "/".join([stage_name for stage_name, dummy in _context['stages']])
+    if truth is None and len(_context['stages']) > 0:
+        truth = _context['stages'][-1][1]
+    _context['stages'].append((name, truth))
+    start = datetime.utcnow()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    rss_start = get_max_rss_mb()
+    status = 'ok'
+    try:
+        yield
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        _context['stages'].pop()
+        max_rss = get_max_rss_mb()
+        record = {'cross': _context['cross'],
+                  'stage': name,
+                  'parent': parent,
+                  'truth': truth,
+                  'status': status,
+                  'start': start.strftime('%Y-%m-%dT%H:%M:%S'),
+                  'wall': time.perf_counter() - wall_start,
+                  'cpu': time.process_time() - cpu_start,
+                  'max_rss_mb': max_rss,
+                  'rss_increase_mb': None if max_rss is None else max_rss - rss_start,
+                  'pid': os.getpid()}
+        write_timing_record(_context['filename'], record)
+
+
+def timed(name):
+    """Decorator, measure each call of the function as stage *name*."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def read_timing_records(filenames):
+    records = []
+    for filename in filenames:
+        with open(filename) as fhandle:
+            for line in fhandle:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    return records
+
+
+def summarize_timing(records):
+    """Sum the timing *records* for each stage (and truth).
+
+    Returns a list of dicts, sorted with the stages taking the most
+    wall time first.
+
+    """
+    summary = {}
+    for record in records:
+        stage_name = record['stage']
+        if record['parent']:
+            stage_name = record['parent'] + "/" + stage_name
+        key = (stage_name, record['truth'] or "")
+        if key not in summary:
+            summary[key] = {'stage': key[0], 'truth': key[1], 'count': 0, 'crosses': set(),
+                            'errors': 0, 'wall': 0.0, 'cpu': 0.0, 'max_wall': 0.0,
+                            'max_rss_mb': 0.0, 'max_rss_increase_mb': 0.0}
+        item = summary[key]
+        item['count'] += 1
+        item['crosses'].add(record['cross'])
+        item['errors'] += record['status'] != 'ok'
+        item['wall'] += record['wall']
+        item['cpu'] += record['cpu']
+        item['max_wall'] = max(item['max_wall'], record['wall'])
+        item['max_rss_mb'] = max(item['max_rss_mb'], record['max_rss_mb'] or 0)
+        item['max_rss_increase_mb'] = max(item['max_rss_increase_mb'], record['rss_increase_mb'] or 0)
+    retv = []
+    for item in sorted(summary.values(), key=lambda item: -item['wall']):
+        item['crosses'] = len(item['crosses'])
+        item['mean_wall'] = item['wall'] / item['count']
+        retv.append(item)
+    return retv
+
+
+def format_timing_summary(summary):
+    lines = ["{:40s} {:8s} {:>6s} {:>7s} {:>10s} {:>9s} {:>9s} {:>10s} {:>9s}".format(
+        "stage", "truth", "count", "errors", "wall [s]", "mean [s]", "max [s]", "cpu [s]", "rss [MB]")]
+    for item in summary:
+        lines.append("{:40s} {:8s} {:6d} {:7d} {:10.1f} {:9.2f} {:9.2f} {:10.1f} {:9.0f}".format(
+            item['stage'], item['truth'], item['count'], item['errors'], item['wall'],
+            item['mean_wall'], item['max_wall'], item['cpu'], item['max_rss_mb']))
+    return "\n".join(lines)
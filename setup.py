@@ -36,7 +36,8 @@ setup(name=NAME,
       packages=find_packages(),
       scripts=['atrain_match/process_master.py', #
                'atrain_match/compile_stats.py', #
-               'atrain_match/process_atrain_match.py', ],
+               'atrain_match/process_atrain_match.py', #
+               'atrain_match/stage_timing_report.py', ],
       data_files=[('cfg', ['atrain_match/etc/atrain_match.cfg']),],
       zip_safe=False,
       use_scm_version=True,